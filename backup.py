@@ -0,0 +1,279 @@
+"""
+Incremental backups of the database file.
+
+A base snapshot is a full copy of the database, uploaded as `<prefix>_<timestamp>.db` like the full backups.
+Each following backup is a delta, `<prefix>_delta_<timestamp>.delta`: the gzipped pages that changed since
+the previous backup, found by comparing the hash of every page with the ones kept in a local manifest.
+A restore downloads the latest base and replays its deltas in sequence, up to a point in time if needed.
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+from contextlib import contextmanager
+import logging
+logger = logging.getLogger(__name__)
+
+# Backups between two base snapshots, 143 deltas and a base make a day of 10-minute backups. 0 uploads full copies only.
+BACKUP_DELTAS_PER_BASE = int(os.environ.get('BACKUP_DELTAS_PER_BASE', '143'))
+DELTA_MAGIC = b'maestro-page-delta-1\n'
+DELTA_EXTENSION = '.delta'
+PAGE_HASH_SIZE = 16
+PAGE_NUMBER = struct.Struct('>I')
+# The delta is compressed while the database is read locked: level 1 is 25 times faster than 9, for deltas 15% larger
+DELTA_COMPRESSION_LEVEL = 1
+# Checkpoints of the write-ahead log tried before a backup gives up, it is retried with the next backup
+WAL_CHECKPOINT_ATTEMPTS = 3
+
+
+def get_manifest_name(db_name):
+    """The local manifest of the last backup, the page hashes of the uploaded state and its position in the chain."""
+    return f"{db_name}.backup.json"
+
+def get_delta_base_name(db_prefix):
+    return f"{db_prefix}_delta"
+
+def hash_page(page):
+    return hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest()
+
+def load_manifest(db_name):
+    try:
+        with open(get_manifest_name(db_name)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring the unreadable backup manifest of %s: %s", db_name, e)
+        return None
+    hashes = base64.b64decode(manifest['hashes'])
+    manifest['hashes'] = [hashes[i:i + PAGE_HASH_SIZE] for i in range(0, len(hashes), PAGE_HASH_SIZE)]
+    return manifest
+
+def save_manifest(db_name, manifest):
+    manifest_name = get_manifest_name(db_name)
+    with open(manifest_name + '.tmp', 'w') as manifest_file:
+        json.dump({**manifest, 'hashes': base64.b64encode(b''.join(manifest['hashes'])).decode('ascii')}, manifest_file)
+    os.replace(manifest_name + '.tmp', manifest_name)
+
+def remove_manifest(db_name):
+    try:
+        os.remove(get_manifest_name(db_name))
+    except FileNotFoundError:
+        pass
+
+@contextmanager
+def read_locked_pages(db_name):
+    """
+    Read the pages of the database file while holding a lock, so no transaction commits meanwhile.
+
+    In rollback journal mode the committed pages are all in the file, a read lock is enough. In WAL mode
+    the log is first checkpointed into the file, then the write lock keeps new commits out of the log
+    (readers go on) while the file is read. A checkpoint kept from completing by a reader, or a write
+    committed before the lock is taken, is retried up to WAL_CHECKPOINT_ATTEMPTS times.
+
+    :return: A context manager of the page size and a generator of the pages.
+    """
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    try:
+        if conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+            for attempt in range(WAL_CHECKPOINT_ATTEMPTS):
+                busy, _, _ = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+                conn.execute('BEGIN IMMEDIATE')
+                if not busy and os.path.getsize(db_name + '-wal') == 0:
+                    break
+                conn.execute('ROLLBACK')
+            else:
+                raise sqlite3.OperationalError(f"Could not checkpoint the write-ahead log of {db_name} in {WAL_CHECKPOINT_ATTEMPTS} attempts.")
+        else:
+            conn.execute('BEGIN')
+            conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        with open(db_name, 'rb') as db_file:
+            yield page_size, iter(lambda: db_file.read(page_size), b'')
+        conn.execute('ROLLBACK')
+    finally:
+        conn.close()
+
+def prepare_backup(db_name, staging_dir, deltas_per_base=BACKUP_DELTAS_PER_BASE):
+    """
+    Write the next backup of the database in the staging directory: a base snapshot, or the delta since the last backup.
+
+    The manifest is only saved by commit_backup once the file is uploaded, so a failed upload is
+    included in the next delta.
+
+    :return: A dictionary with the kind ('base' or 'delta') and path of the file to upload, None if nothing
+             changed since the last backup, the number of pages it holds and the manifest to commit.
+    """
+    manifest = load_manifest(db_name)
+    is_base = manifest is None or manifest['sequence'] >= deltas_per_base
+    hashes = []
+    changed_pages = 0
+
+    with read_locked_pages(db_name) as (page_size, pages):
+        if manifest and manifest['page_size'] != page_size:
+            is_base = True
+        if is_base:
+            path = os.path.join(staging_dir, 'base.db')
+            with open(path, 'wb') as base_file:
+                for page in pages:
+                    base_file.write(page)
+                    hashes.append(hash_page(page))
+            changed_pages = len(hashes)
+        else:
+            sequence = manifest['sequence'] + 1
+            path = os.path.join(staging_dir, 'backup.delta')
+            with gzip.open(path, 'wb', compresslevel=DELTA_COMPRESSION_LEVEL) as delta_file:
+                delta_file.write(DELTA_MAGIC)
+                # The page count is only known at the end, so it follows the pages
+                delta_file.write(json.dumps({'base': manifest['base'], 'sequence': sequence, 'page_size': page_size}).encode('utf-8') + b'\n')
+                for index, page in enumerate(pages):
+                    page_hash = hash_page(page)
+                    hashes.append(page_hash)
+                    if index >= len(manifest['hashes']) or manifest['hashes'][index] != page_hash:
+                        delta_file.write(PAGE_NUMBER.pack(index + 1) + page)
+                        changed_pages += 1
+                delta_file.write(PAGE_NUMBER.pack(0) + PAGE_NUMBER.pack(len(hashes)))
+
+    if is_base:
+        new_manifest = {'base': None, 'sequence': 0, 'page_size': page_size, 'hashes': hashes}
+        return {'kind': 'base', 'path': path, 'pages': changed_pages, 'manifest': new_manifest}
+    if not changed_pages and len(hashes) == len(manifest['hashes']):
+        return {'kind': 'delta', 'path': None, 'pages': 0, 'manifest': manifest}
+    new_manifest = {'base': manifest['base'], 'sequence': sequence, 'page_size': page_size, 'hashes': hashes}
+    return {'kind': 'delta', 'path': path, 'pages': changed_pages, 'manifest': new_manifest}
+
+def commit_backup(db_name, prepared, uploaded_name):
+    """Save the manifest of an uploaded backup, the next delta is relative to it."""
+    manifest = prepared['manifest']
+    if prepared['kind'] == 'base':
+        manifest = {**manifest, 'base': uploaded_name}
+    save_manifest(db_name, manifest)
+
+def read_delta_header(delta_file, path):
+    if delta_file.readline() != DELTA_MAGIC:
+        raise ValueError(f"{path} is not a database delta.")
+    return json.loads(delta_file.readline())
+
+def iter_delta_pages(path, page_size):
+    """Yield the (page number, page) records of a delta file, then (0, page count)."""
+    with gzip.open(path, 'rb') as delta_file:
+        read_delta_header(delta_file, path)
+        while True:
+            page_number, = PAGE_NUMBER.unpack(delta_file.read(PAGE_NUMBER.size))
+            if page_number == 0:
+                yield 0, PAGE_NUMBER.unpack(delta_file.read(PAGE_NUMBER.size))[0]
+                return
+            yield page_number, delta_file.read(page_size)
+
+def apply_delta(db_name, records, page_size):
+    with open(db_name, 'r+b') as db_file:
+        for page_number, page in records:
+            if page_number == 0:
+                # The database shrinks after a VACUUM
+                db_file.truncate(page * page_size)
+                break
+            db_file.seek((page_number - 1) * page_size)
+            db_file.write(page)
+
+def rebuild_database(base_path, base_name, delta_paths, db_name):
+    """
+    Replay the deltas of a base snapshot onto a copy of it.
+
+    Deltas of other bases are ignored. When a sequence number was uploaded twice (an upload whose manifest
+    was not saved), the last one is the delta from the previous state, so it replaces the first one.
+    The replay stops at the first missing sequence number.
+
+    :param delta_paths: The delta files, in upload order.
+    :return: The sequence number of the last replayed delta.
+    """
+    deltas = {}
+    for path in delta_paths:
+        with gzip.open(path, 'rb') as delta_file:
+            header = read_delta_header(delta_file, path)
+        if header['base'] == base_name:
+            deltas[header['sequence']] = header, path
+
+    # A write-ahead log left by an earlier database would be replayed onto the restored one
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_name + suffix):
+            os.remove(db_name + suffix)
+    shutil.copyfile(base_path, db_name)
+    sequence = 0
+    while sequence + 1 in deltas:
+        header, path = deltas[sequence + 1]
+        apply_delta(db_name, iter_delta_pages(path, header['page_size']), header['page_size'])
+        sequence += 1
+    if any(delta_sequence > sequence for delta_sequence in deltas):
+        logger.warning("Delta %s of %s is missing, the later deltas were not replayed.", sequence + 1, base_name)
+
+    conn = sqlite3.connect(db_name)
+    try:
+        result = conn.execute('PRAGMA quick_check').fetchone()[0]
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise ValueError(f"The restored database failed its integrity check: {result}")
+    return sequence
+
+def restore_database(folder_id, db_prefix, db_name, until=None):
+    """
+    Download the latest base snapshot from Google Drive and replay its deltas.
+
+    :param until: A timestamp in the '%Y-%m-%d_%H-%M-%S' format of the backup names, to restore the database
+                  as it was at that time. The latest state if None.
+    """
+    import drive
+
+    bases = [(file, timestamp) for file, timestamp in drive.list_timestamped_files(folder_id, db_prefix) if not until or timestamp <= until]
+    if not bases:
+        raise FileNotFoundError("No base snapshot of the database found in the drive folder.")
+    base_file, base_timestamp = bases[-1]
+    deltas = [
+        file for file, timestamp in drive.list_timestamped_files(folder_id, get_delta_base_name(db_prefix), DELTA_EXTENSION)
+        if timestamp >= base_timestamp and (not until or timestamp <= until)
+    ]
+
+    with tempfile.TemporaryDirectory() as download_dir:
+        base_path = os.path.join(download_dir, 'base.db')
+        drive.download_file(base_file['id'], base_path)
+        delta_paths = []
+        for index, delta_file in enumerate(deltas):
+            delta_paths.append(os.path.join(download_dir, f"{index}.delta"))
+            drive.download_file(delta_file['id'], delta_paths[-1])
+        sequence = rebuild_database(base_path, base_file['name'], delta_paths, db_name + '.restoring')
+    os.replace(db_name + '.restoring', db_name)
+    # The next backup is a new base snapshot of the restored database
+    remove_manifest(db_name)
+    logger.info("Restored %s from %s and %s deltas.", db_name, base_file['name'], sequence)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Restore the database from its base snapshots and deltas in Google Drive.")
+    parser.add_argument('db_name', help="Path of the restored database.")
+    parser.add_argument('--until', help="Restore the database as it was at this time, e.g. 2024-10-19_12-00-00.")
+    parser.add_argument('--prefix', default=os.environ.get('DISCORD_BOT_DB_PREFIX'), help="Base name of the backups.")
+    parser.add_argument('--folder-id', default=os.environ.get('DRIVE_FOLDER_ID'))
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    from dotenv import load_dotenv
+    load_dotenv()
+    from monitoring.logging_setup import configure_logging, stop_logging
+    args = parse_args(argv)
+    # Same format as the bot, from LOG_LEVEL and LOG_FORMAT
+    configure_logging()
+    try:
+        if os.path.exists(args.db_name):
+            raise SystemExit(f"{args.db_name} already exists.")
+        restore_database(args.folder_id, args.prefix, args.db_name, until=args.until)
+    finally:
+        stop_logging()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+"""
+In-process stand-in for the parts of discord.py the bot uses.
+
+Every API call sleeps for a configurable latency and goes through rate limit buckets modelled on
+Discord's (a global bucket plus per-route buckets keyed by their major parameter). A request that
+finds its bucket empty is counted as a 429 and waits for the bucket to reset, like discord.py does,
+so fan-out paths can be measured offline against thousands of simulated members.
+"""
+import asyncio
+import itertools
+import random
+import time
+from collections import defaultdict
+
+import discord
+
+FIRST_SNOWFLAKE = 1200000000000000000
+
+# (requests, per seconds), the documented or commonly observed limits
+GLOBAL_RATE_LIMIT = (50, 1.0)
+DEFAULT_RATE_LIMITS = {
+    'POST /channels/{channel_id}/messages': (5, 5.0),
+    'PATCH /channels/{channel_id}/messages/{message_id}': (5, 5.0),
+    'GET /channels/{channel_id}/messages/{message_id}': (50, 1.0),
+    'GET /channels/{channel_id}': (50, 1.0),
+    'POST /guilds/{guild_id}/channels': (10, 10.0),
+    'PATCH /channels/{channel_id}': (2, 600.0),
+    'DELETE /channels/{channel_id}': (5, 5.0),
+    'POST /guilds/{guild_id}/roles': (10, 10.0),
+    'PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}': (10, 10.0),
+    'GET /guilds/{guild_id}/members/{user_id}': (10, 10.0),
+    'GATEWAY REQUEST_GUILD_MEMBERS': (120, 60.0),
+}
+# Interaction responses are not subject to the global rate limit
+UNLIMITED_ROUTES = {'POST /interactions/{interaction_id}/{token}/callback', 'POST /webhooks/{application_id}/{token}'}
+
+
+class FakeResponse:
+    def __init__(self, status, reason):
+        self.status = status
+        self.reason = reason
+
+
+class RateLimitBucket:
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def acquire(self, now):
+        """Take a slot from the bucket and return 0, or return the seconds until it resets."""
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.per
+        if self.remaining > 0:
+            self.remaining -= 1
+            return 0.0
+        return self.reset_at - now
+
+
+class FakeDiscordAPI:
+    """
+    Simulated Discord backend shared by every fake object.
+
+    :param latency: Mean latency of a request in seconds.
+    :param jitter: Relative spread of the latency, 0.2 meaning +-20%.
+    :param rate_limits: Per-route (requests, per seconds) limits, None to disable rate limiting.
+    :param time_scale: Factor applied to every simulated duration, to run long scenarios quickly.
+    """
+    def __init__(self, latency=0.05, jitter=0.2, rate_limits=DEFAULT_RATE_LIMITS, global_rate_limit=GLOBAL_RATE_LIMIT,
+                 time_scale=1.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limits = rate_limits
+        self.global_rate_limit = global_rate_limit
+        self.time_scale = time_scale
+        self.rng = random.Random(seed)
+        self._snowflakes = itertools.count(FIRST_SNOWFLAKE)
+        self._buckets = {}
+        self.request_durations = defaultdict(list)  # route -> [seconds]
+        self.rate_limit_hits = defaultdict(int)  # route -> 429 responses
+
+    def next_id(self):
+        return next(self._snowflakes)
+
+    async def request(self, route, major_id=None):
+        """Simulate one API call on `route`, waiting for its rate limit buckets and latency."""
+        loop = asyncio.get_running_loop()
+        start_time = time.perf_counter()
+
+        buckets = []
+        if route not in UNLIMITED_ROUTES:
+            if self.rate_limits and route in self.rate_limits:
+                buckets.append(self._get_bucket((route, major_id), self.rate_limits[route]))
+            if self.global_rate_limit and not route.startswith('GATEWAY'):
+                buckets.append(self._get_bucket('global', self.global_rate_limit))
+
+        for bucket in buckets:
+            while (retry_after := bucket.acquire(loop.time())) > 0:
+                self.rate_limit_hits[route] += 1
+                await asyncio.sleep(retry_after)
+
+        latency = self.latency * (1 + self.rng.uniform(-self.jitter, self.jitter))
+        await asyncio.sleep(latency * self.time_scale)
+        self.request_durations[route].append(time.perf_counter() - start_time)
+
+    def _get_bucket(self, key, rate_limit):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            limit, per = rate_limit
+            bucket = self._buckets[key] = RateLimitBucket(limit, per * self.time_scale)
+        return bucket
+
+    def stats(self):
+        """Per-route request counts, 429 counts and latency percentiles in simulated milliseconds."""
+        routes = {}
+        for route, durations in sorted(self.request_durations.items()):
+            ordered = sorted(duration / self.time_scale for duration in durations)
+            routes[route] = {
+                'requests': len(ordered),
+                'rate_limited': self.rate_limit_hits.get(route, 0),
+                'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+                'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+                'max_ms': round(ordered[-1] * 1000, 3),
+            }
+        return routes
+
+    def reset_stats(self):
+        self.request_durations.clear()
+        self.rate_limit_hits.clear()
+
+
+class FakeRole:
+    def __init__(self, guild, role_id, name):
+        self.guild = guild
+        self.id = role_id
+        self.name = name
+        self.members = []
+
+    @property
+    def mention(self):
+        return f"<@&{self.id}>"
+
+
+class FakeMember:
+    def __init__(self, guild, user_id, name):
+        self.guild = guild
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.roles = []
+        self.bot = False
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    async def add_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.guild.api.request('PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}', self.guild.id)
+            if role not in self.roles:
+                self.roles.append(role)
+                role.members.append(self)
+
+
+class FakeMessage:
+    def __init__(self, channel, message_id, content=None, embed=None, embeds=None, view=None):
+        self.channel = channel
+        self.id = message_id
+        self.content = content
+        self.embeds = embeds or ([embed] if embed else [])
+        self.view = view
+
+    async def edit(self, **fields):
+        await self.channel.guild.api.request('PATCH /channels/{channel_id}/messages/{message_id}', self.channel.id)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return self
+
+
+class FakePartialMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, **fields):
+        message = self.channel.messages.get(self.id)
+        if message is None:
+            await self.channel.guild.api.request('PATCH /channels/{channel_id}/messages/{message_id}', self.channel.id)
+            raise discord.NotFound(FakeResponse(404, 'Not Found'), 'Unknown Message')
+        return await message.edit(**fields)
+
+    async def fetch(self):
+        return await self.channel.fetch_message(self.id)
+
+
+class FakeTextChannel:
+    def __init__(self, guild, channel_id, name, category=None, overwrites=None):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.category = category
+        self.overwrites = overwrites or {}
+        self.messages = {}
+
+    @property
+    def mention(self):
+        return f"<#{self.id}>"
+
+    @property
+    def members(self):
+        role = discord.utils.get(self.guild.roles, name=self.name)
+        return list(role.members) if role else []
+
+    async def send(self, content=None, *, embed=None, embeds=None, view=None, **kwargs):
+        await self.guild.api.request('POST /channels/{channel_id}/messages', self.id)
+        message = FakeMessage(self, self.guild.api.next_id(), content, embed, embeds, view)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id):
+        await self.guild.api.request('GET /channels/{channel_id}/messages/{message_id}', self.id)
+        message = self.messages.get(message_id)
+        if message is None:
+            raise discord.NotFound(FakeResponse(404, 'Not Found'), 'Unknown Message')
+        return message
+
+    def get_partial_message(self, message_id):
+        return FakePartialMessage(self, message_id)
+
+    async def edit(self, *, name=None, **kwargs):
+        await self.guild.api.request('PATCH /channels/{channel_id}', self.id)
+        if name is not None:
+            self.name = name
+        return self
+
+    async def delete(self, reason=None):
+        await self.guild.api.request('DELETE /channels/{channel_id}', self.id)
+        self.guild._channels.pop(self.id, None)
+        if self.category:
+            self.category.text_channels.remove(self)
+
+
+class FakeCategory:
+    def __init__(self, guild, category_id, name):
+        self.guild = guild
+        self.id = category_id
+        self.name = name
+        self.text_channels = []
+
+    async def create_text_channel(self, name, *, overwrites=None, **kwargs):
+        return await self.guild.create_text_channel(name, category=self, overwrites=overwrites)
+
+
+class FakeGuild:
+    """A guild whose members, roles and channels live in memory and whose API calls go through `api`."""
+    def __init__(self, api: FakeDiscordAPI, name='fake-guild', guild_id=None):
+        self.api = api
+        self.id = guild_id or api.next_id()
+        self.name = name
+        self.roles = []
+        self.categories = []
+        self._members = {}
+        self._cached_member_ids = set()
+        self._channels = {}
+        self._roles = {}
+        self.default_role = self._add_role('@everyone')
+        self.me = self.add_member(api.next_id(), 'maestro')
+        self.me.bot = True
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def text_channels(self):
+        return [channel for channel in self._channels.values() if isinstance(channel, FakeTextChannel)]
+
+    def add_member(self, user_id, name, cached=True):
+        """Add a member, which is only reachable through API calls until requested if not `cached`."""
+        member = self._members[user_id] = FakeMember(self, user_id, name)
+        if cached:
+            self._cached_member_ids.add(user_id)
+        return member
+
+    def add_category(self, name):
+        category = FakeCategory(self, self.api.next_id(), name)
+        self.categories.append(category)
+        self._channels[category.id] = category
+        return category
+
+    def add_text_channel(self, name, category=None, channel_id=None):
+        """Create a channel without an API call, to set up the initial state of the guild."""
+        return self._add_text_channel(name, category, channel_id=channel_id)
+
+    def _add_text_channel(self, name, category, overwrites=None, channel_id=None):
+        channel = FakeTextChannel(self, channel_id or self.api.next_id(), name, category, overwrites)
+        self._channels[channel.id] = channel
+        if category:
+            category.text_channels.append(channel)
+        return channel
+
+    def _add_role(self, name):
+        role = FakeRole(self, self.api.next_id(), name)
+        self.roles.append(role)
+        self._roles[role.id] = role
+        return role
+
+    def get_member(self, user_id):
+        return self._members.get(user_id) if user_id in self._cached_member_ids else None
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    async def fetch_channel(self, channel_id):
+        await self.api.request('GET /channels/{channel_id}', channel_id)
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            raise discord.NotFound(FakeResponse(404, 'Not Found'), 'Unknown Channel')
+        return channel
+
+    async def fetch_member(self, user_id):
+        await self.api.request('GET /guilds/{guild_id}/members/{user_id}', self.id)
+        member = self._members.get(user_id)
+        if member is None:
+            raise discord.NotFound(FakeResponse(404, 'Not Found'), 'Unknown Member')
+        return member
+
+    async def query_members(self, query=None, *, limit=5, user_ids=None, presences=False, cache=True):
+        await self.api.request('GATEWAY REQUEST_GUILD_MEMBERS', self.id)
+        members = [self._members[user_id] for user_id in (user_ids or [])[:limit] if user_id in self._members]
+        if cache:
+            self._cached_member_ids.update(member.id for member in members)
+        return members
+
+    async def create_text_channel(self, name, *, category=None, overwrites=None, **kwargs):
+        await self.api.request('POST /guilds/{guild_id}/channels', self.id)
+        return self._add_text_channel(name, self.get_channel(category.id) if category else None, overwrites)
+
+    async def create_role(self, *, name, color=None, colour=None, hoist=False, **kwargs):
+        await self.api.request('POST /guilds/{guild_id}/roles', self.id)
+        return self._add_role(name)
+
+
+class FakeInteractionResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _respond(self):
+        if self._done:
+            raise discord.InteractionResponded(self.interaction)
+        await self.interaction.guild.api.request('POST /interactions/{interaction_id}/{token}/callback')
+        self._done = True
+
+    async def send_message(self, content=None, **kwargs):
+        await self._respond()
+        self.interaction.sent_messages.append((content, kwargs))
+
+    async def send_modal(self, modal):
+        await self._respond()
+
+    async def defer(self, **kwargs):
+        await self._respond()
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        await self.interaction.guild.api.request('POST /webhooks/{application_id}/{token}')
+        self.interaction.sent_messages.append((content, kwargs))
+
+
+class FakeInteraction:
+    """An interaction from `user` in `channel`, recording everything the bot answers."""
+    def __init__(self, guild: FakeGuild, user: FakeMember, channel: FakeTextChannel = None):
+        self.guild = guild
+        self.user = user
+        self.channel = channel
+        self.id = guild.api.next_id()
+        self.sent_messages = []
+        self.response = FakeInteractionResponse(self)
+        self.followup = FakeFollowup(self)
@@ -0,0 +1,164 @@
+"""
+Fan-out benchmark of the habit check session and the declaration flow against a fake Discord.
+
+Usage:
+    python -m benchmarks.fanout --output fanout_output.json
+    python -m benchmarks.fanout --latency 0.1 --time-scale 0.001 --compare fanout_output.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.run import compare, get_commit, summarize
+
+TRACKING_PREFIX = 'habit-tracking'
+TRACKING_CATEGORY = 'TRACKING CHANNELS'
+DECLARATION_CHANNEL = 'habit-declaration'
+
+
+def build_fake_guild(api, db_name, dataset, uncached_members=0.0, seed=0):
+    """Mirror the synthetic database as a fake guild: members, a tracking category, and a channel and role per tracking channel."""
+    import sqlite3
+    from benchmarks.fake_discord import FakeGuild
+
+    rng = random.Random(seed)
+    guild = FakeGuild(api, name='benchmark', guild_id=dataset['guild_id'])
+    for user_id in dataset['user_ids']:
+        guild.add_member(user_id, f"user{user_id}", cached=rng.random() >= uncached_members)
+
+    guild.add_text_channel(DECLARATION_CHANNEL)
+    category = guild.add_category(TRACKING_CATEGORY)
+    roles = {}
+    for i, channel_id in enumerate(dataset['channel_ids']):
+        channel = guild.add_text_channel(f"{TRACKING_PREFIX}-{i + 1}", category, channel_id=channel_id)
+        roles[channel_id] = guild._add_role(channel.name)
+
+    conn = sqlite3.connect(db_name)
+    for channel_id, user_id in conn.execute('SELECT DISTINCT tracking_channel_id, user_id FROM habits'):
+        member = guild._members[user_id]
+        member.roles.append(roles[channel_id])
+        roles[channel_id].members.append(member)
+    conn.close()
+    return guild
+
+async def time_phase(coroutine):
+    start_time = time.perf_counter()
+    await coroutine
+    return summarize([time.perf_counter() - start_time])
+
+async def run_fanout(args):
+    import data_handler
+    from benchmarks.synthetic_db import build_synthetic_database
+
+    dataset = build_synthetic_database(args.db, args.users, args.habits, args.weeks, args.seed)
+    # The handlers open their own DatabaseHandler() on the default database
+    default_db_name, data_handler.DB_NAME = data_handler.DB_NAME, args.db
+    try:
+        return await _run_scenario(args, dataset)
+    finally:
+        data_handler.DB_NAME = default_db_name
+
+async def _run_scenario(args, dataset):
+    from benchmarks.fake_discord import DEFAULT_RATE_LIMITS, FakeDiscordAPI, FakeInteraction
+    from declaration.declaration_handler import DeclarationHandler
+    from guild_index import GuildIndex
+    from tracking.tracking_handler import TrackingHandler
+
+    api = FakeDiscordAPI(latency=args.latency, jitter=args.jitter, time_scale=args.time_scale, seed=args.seed,
+                         rate_limits=None if args.no_rate_limits else DEFAULT_RATE_LIMITS)
+    guild = build_fake_guild(api, args.db, dataset, args.uncached_members, args.seed)
+    guild_index = GuildIndex(guild, DECLARATION_CHANNEL, TRACKING_PREFIX, TRACKING_CATEGORY)
+    declaration_handler = DeclarationHandler(guild, DECLARATION_CHANNEL, TRACKING_PREFIX, TRACKING_CATEGORY, guild_index=guild_index)
+    tracking_handler = TrackingHandler(guild, declaration_handler, TRACKING_PREFIX, TRACKING_CATEGORY, guild_index=guild_index)
+    declaration_handler.init_tracking_handler(tracking_handler)
+
+    results, api_stats = {}, {}
+
+    results['prepare_habit_check'] = await time_phase(tracking_handler.prepare_habit_check())
+    api_stats['prepare_habit_check'] = api.stats()
+    api.reset_stats()
+
+    results['send_habit_check'] = await time_phase(tracking_handler.send_habit_check_to_all_tracking_channels())
+    results['send_habit_check']['messages'] = len(tracking_handler.get_check_records())
+    api_stats['send_habit_check'] = api.stats()
+    api.reset_stats()
+
+    results['end_habit_check_session'] = await time_phase(tracking_handler.end_habit_check_session())
+    api_stats['end_habit_check_session'] = api.stats()
+    api.reset_stats()
+
+    rng = random.Random(args.seed)
+    durations = []
+    for i in range(args.declarations):
+        interaction = FakeInteraction(guild, guild.get_member(rng.choice(dataset['user_ids'])) or guild.me)
+        habit_data = {
+            'metadata': {'user_id': str(interaction.user.id), 'timestamp': datetime.now().isoformat()},
+            'declaration': {'habit_name': f"Benchmark habit {i}", 'time_location': 'every morning', 'identity': 'a tester'},
+        }
+        start_time = time.perf_counter()
+        await declaration_handler.handle_habit_submission(interaction, habit_data)
+        durations.append(time.perf_counter() - start_time)
+    if durations:
+        results['declaration'] = summarize(durations)
+        api_stats['declaration'] = api.stats()
+
+    return {
+        'commit': get_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'dataset': {key: dataset[key] for key in ('users', 'habits', 'weeks', 'channels', 'tracking_rows', 'seed')},
+        'fake_discord': {
+            'latency_s': args.latency,
+            'jitter': args.jitter,
+            'time_scale': args.time_scale,
+            'rate_limits': not args.no_rate_limits,
+            'uncached_members': args.uncached_members,
+        },
+        'results': results,
+        'api': api_stats,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Discord fan-out paths against an in-process fake Discord.")
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'maestro_fanout.db'), help="Path of the generated database.")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--habits', type=int, default=4000)
+    parser.add_argument('--weeks', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.05, help="Mean simulated API latency in seconds.")
+    parser.add_argument('--jitter', type=float, default=0.2, help="Relative spread of the simulated latency.")
+    parser.add_argument('--time-scale', type=float, default=0.01, help="Factor applied to simulated latencies and rate limit windows.")
+    parser.add_argument('--no-rate-limits', action='store_true', help="Disable the simulated per-route rate limits.")
+    parser.add_argument('--uncached-members', type=float, default=0.0, help="Fraction of members missing from the guild cache.")
+    parser.add_argument('--declarations', type=int, default=20, help="Habit declarations submitted after the session.")
+    parser.add_argument('--output', default='fanout_output.json', help="Where to write the JSON report.")
+    parser.add_argument('--compare', help="A previous JSON report to compare against.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # data_handler requires a database name in the environment at import time
+    os.environ.setdefault('DISCORD_BOT_DB_NAME', args.db)
+
+    from monitoring.logging_setup import configure_logging, stop_logging
+    configure_logging(level='WARNING', log_format='text')
+    try:
+        report = asyncio.run(run_fanout(args))
+    finally:
+        stop_logging()
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Fan-out report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""
+Benchmark suite over a synthetic production-scale database.
+
+Usage:
+    python -m benchmarks.run --output bench_output.json
+    python -m benchmarks.run --users 2000 --habits 6000 --weeks 52 --compare bench_output.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+
+def summarize(durations):
+    """Summarize a list of durations in seconds."""
+    ordered = sorted(durations)
+    return {
+        'calls': len(ordered),
+        'total_s': round(sum(ordered), 6),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 4),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 4),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        'max_ms': round(ordered[-1] * 1000, 4),
+    }
+
+def time_calls(func, args_list):
+    durations = []
+    for args in args_list:
+        start_time = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - start_time)
+    return summarize(durations)
+
+async def time_async_calls(func, args_list):
+    durations = []
+    for args in args_list:
+        start_time = time.perf_counter()
+        await func(*args)
+        durations.append(time.perf_counter() - start_time)
+    return summarize(durations)
+
+
+#####################
+### DISCORD STUBS ###
+#####################
+class StubPartialMessage:
+    async def edit(self, **kwargs):
+        pass
+
+async def stub_send(*args, **kwargs):
+    return SimpleNamespace(id=0)
+
+def make_stub_guild(guild_id, channel_ids, prefix, category_name):
+    """A guild with one tracking category holding one text channel per synthetic channel ID."""
+    channels = [SimpleNamespace(id=channel_id, name=f"{prefix}-{i + 1}", members=[],
+                                get_partial_message=lambda message_id: StubPartialMessage(), send=stub_send)
+                for i, channel_id in enumerate(channel_ids)]
+    category = SimpleNamespace(id=0, name=category_name, text_channels=channels)
+    objects = {channel.id: channel for channel in (category, *channels)}
+    return SimpleNamespace(id=guild_id, name='benchmark', categories=[category], text_channels=channels, roles=[],
+                           objects=objects, get_channel=objects.get, get_role=lambda role_id: None)
+
+
+##################
+### BENCHMARKS ###
+##################
+def bench_mark_habit_completed(db_name, habit_ids, week_key):
+    from data_handler import DatabaseHandler
+    db_handler = DatabaseHandler(db_name=db_name)
+    result = time_calls(lambda habit_id: db_handler.mark_habit_completed(habit_id, True, week_key=week_key),
+                        [(habit_id,) for habit_id in habit_ids])
+    db_handler.close()
+    return result
+
+def bench_writes_during_scans(db_name, guild_id, habit_ids, week_key):
+    """Time check-in writes while another thread keeps scanning the tracking history for /stats on a read-only connection."""
+    from data_handler import DatabaseHandler
+    stop = threading.Event()
+    scans = []
+
+    def scan():
+        reader = DatabaseHandler(db_name=db_name, guild_id=guild_id)
+        try:
+            while not stop.is_set():
+                reader.get_tracking_records()
+                scans.append(1)
+        finally:
+            reader.close()
+
+    thread = threading.Thread(target=scan)
+    thread.start()
+    try:
+        result = bench_mark_habit_completed(db_name, habit_ids, week_key)
+    finally:
+        stop.set()
+        thread.join()
+    result['scans'] = len(scans)
+    return result
+
+def bench_get_current_streak(db_name, habit_ids):
+    from data_handler import DatabaseHandler
+    db_handler = DatabaseHandler(db_name=db_name)
+    result = time_calls(db_handler.get_current_streak, [(habit_id,) for habit_id in habit_ids])
+    db_handler.close()
+    return result
+
+async def bench_reserve_tracking_channel(db_name, guild, iterations, prefix, category_name):
+    from data_handler import DatabaseHandler
+    from tracking.channel_management import TrackingChannelManager
+    manager = TrackingChannelManager(guild, prefix, category_name)
+    manager.db_handler = DatabaseHandler(db_name=db_name, guild_id=guild.id)
+    # Every synthetic channel is full, so each call counts the slots of all of them, and every 8th one creates a channel
+    async def create_tracking_channel(category, new_channel_name):
+        new_channel = SimpleNamespace(id=-len(guild.text_channels), name=new_channel_name)
+        guild.text_channels.append(new_channel)
+        guild.objects[new_channel.id] = new_channel
+        manager.guild_index.add_tracking_channel(new_channel.id, None)
+        return new_channel
+    manager._create_tracking_channel = create_tracking_channel
+    result = await time_async_calls(manager.reserve_tracking_channel, [() for _ in range(iterations)])
+    manager.db_handler.conn.execute('DELETE FROM channel_reservations')
+    manager.db_handler.conn.commit()
+    manager.db_handler.close()
+    return result
+
+async def bench_habit_cards(db_name, guild, user_ids):
+    from data_handler import DatabaseHandler
+    from declaration.components import DetailedHabitCardView
+    tracking_handler = SimpleNamespace(db_handler=DatabaseHandler(db_name=db_name, guild_id=guild.id))
+
+    async def load_cards(user_id):
+        DetailedHabitCardView(guild, tracking_handler, None, SimpleNamespace(id=user_id)).show_page(0)
+    return await time_async_calls(load_cards, [(user_id,) for user_id in user_ids])
+
+async def bench_end_of_week_finalization(db_name, guild, habit_ids, week_key, prefix, category_name):
+    from data_handler import DatabaseHandler
+    from tracking.tracking_handler import TrackingHandler
+    db_handler = DatabaseHandler(db_name=db_name)
+    habit_channels = dict(db_handler.conn.execute(
+        f"SELECT id, tracking_channel_id FROM habits WHERE id IN ({', '.join('?' for _ in habit_ids)})", habit_ids
+    ).fetchall())
+    db_handler.close()
+
+    tracking_handler = TrackingHandler(guild, None, prefix, category_name)
+    tracking_handler.db_handler = DatabaseHandler(db_name=db_name, guild_id=guild.id)
+    tracking_handler.db_handler.save_habit_checks((habit_id, habit_channels[habit_id], habit_id, week_key) for habit_id in habit_ids)
+    return await time_async_calls(tracking_handler.end_habit_check_session, [()])
+
+def bench_backup_snapshot(db_name, iterations):
+    """Time a consistent snapshot of the database through the SQLite backup API."""
+    snapshot_name = db_name + '.snapshot'
+    durations = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        source, target = sqlite3.connect(db_name), sqlite3.connect(snapshot_name)
+        source.backup(target)
+        target.close()
+        source.close()
+        durations.append(time.perf_counter() - start_time)
+        os.remove(snapshot_name)
+    result = summarize(durations)
+    result['size_bytes'] = os.path.getsize(db_name)
+    return result
+
+
+def bench_guild_stats(db_name, guild_id, iterations):
+    """Time the bulk tracking read and the vectorized stats computation behind /stats."""
+    from tracking.analytics import load_guild_stats
+    week_key = datetime.now().strftime("%Y-W%U")
+    return time_calls(lambda: load_guild_stats(db_name, guild_id, week_key), [()] * iterations)
+
+##############
+### RUNNER ###
+##############
+async def run_benchmarks(args):
+    from benchmarks.synthetic_db import build_synthetic_database, get_week_keys
+    prefix, category_name = 'habit-tracking', 'TRACKING CHANNELS'
+
+    start_time = time.perf_counter()
+    dataset = build_synthetic_database(args.db, args.users, args.habits, args.weeks, args.seed)
+    generation_seconds = time.perf_counter() - start_time
+
+    rng = random.Random(args.seed)
+    sample_habit_ids = rng.sample(range(1, args.habits + 1), min(args.samples, args.habits))
+    sample_user_ids = rng.sample(dataset['user_ids'], min(args.samples, args.users))
+    next_week_key = get_week_keys(1, datetime.now() + timedelta(weeks=1))[0]
+    guild = make_stub_guild(dataset['guild_id'], dataset['channel_ids'], prefix, category_name)
+
+    results = {}
+    results['get_current_streak'] = bench_get_current_streak(args.db, sample_habit_ids)
+    results['reserve_tracking_channel'] = await bench_reserve_tracking_channel(args.db, guild, args.channel_iterations, prefix, category_name)
+    results['habit_cards'] = await bench_habit_cards(args.db, guild, sample_user_ids)
+    results['mark_habit_completed'] = bench_mark_habit_completed(args.db, sample_habit_ids, next_week_key)
+    results['writes_during_scans'] = bench_writes_during_scans(args.db, dataset['guild_id'], sample_habit_ids, next_week_key)
+    # The marked habits are answered, the rest of the session is finalized as unanswered
+    results['end_of_week_finalization'] = await bench_end_of_week_finalization(
+        args.db, guild, rng.sample(range(1, args.habits + 1), min(args.finalize_habits, args.habits)), next_week_key, prefix, category_name)
+    results['end_of_week_finalization']['habits'] = min(args.finalize_habits, args.habits)
+    results['backup_snapshot'] = bench_backup_snapshot(args.db, args.snapshot_iterations)
+    results['guild_stats'] = bench_guild_stats(args.db, dataset['guild_id'], args.snapshot_iterations)
+
+    return {
+        'commit': get_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'dataset': {key: dataset[key] for key in ('users', 'habits', 'weeks', 'channels', 'tracking_rows', 'seed')},
+        'generation_s': round(generation_seconds, 3),
+        'results': results,
+    }
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report, baseline):
+    """Print the relative change of the mean duration of each benchmark against a baseline report."""
+    print(f"{'benchmark':<34}{'baseline ms':>14}{'current ms':>14}{'change':>10}")
+    for name, result in report['results'].items():
+        baseline_result = baseline.get('results', {}).get(name)
+        if not baseline_result:
+            print(f"{name:<34}{'-':>14}{result['mean_ms']:>14.3f}{'new':>10}")
+            continue
+        change = (result['mean_ms'] / baseline_result['mean_ms'] - 1) * 100 if baseline_result['mean_ms'] else 0.0
+        print(f"{name:<34}{baseline_result['mean_ms']:>14.3f}{result['mean_ms']:>14.3f}{change:>+9.1f}%")
+
+def parse_args(argv=None):
+    from benchmarks.synthetic_db import DEFAULT_USERS, DEFAULT_HABITS, DEFAULT_WEEKS
+    parser = argparse.ArgumentParser(description="Benchmark DatabaseHandler operations over a synthetic database.")
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'maestro_benchmark.db'), help="Path of the generated database.")
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS)
+    parser.add_argument('--habits', type=int, default=DEFAULT_HABITS)
+    parser.add_argument('--weeks', type=int, default=DEFAULT_WEEKS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--samples', type=int, default=1000, help="Calls per single-habit or single-user benchmark.")
+    parser.add_argument('--channel-iterations', type=int, default=2)
+    parser.add_argument('--finalize-habits', type=int, default=2000, help="Habits in the finalized check session.")
+    parser.add_argument('--snapshot-iterations', type=int, default=3)
+    parser.add_argument('--output', default='bench_output.json', help="Where to write the JSON report.")
+    parser.add_argument('--compare', help="A previous JSON report to compare against.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # data_handler requires a database name in the environment at import time
+    os.environ.setdefault('DISCORD_BOT_DB_NAME', args.db)
+
+    from monitoring.logging_setup import configure_logging, stop_logging
+    configure_logging(level='WARNING', log_format='text')
+    try:
+        report = asyncio.run(run_benchmarks(args))
+    finally:
+        stop_logging()
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return report
+
+if __name__ == '__main__':
+    main()
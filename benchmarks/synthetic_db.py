@@ -0,0 +1,96 @@
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+# Production-scale defaults
+DEFAULT_USERS = 20000
+DEFAULT_HABITS = 60000
+DEFAULT_WEEKS = 104
+HABITS_PER_CHANNEL = 8
+# Synthetic Discord snowflakes start here, so they look like real IDs
+FIRST_USER_ID = 300000000000000000
+FIRST_CHANNEL_ID = 900000000000000000
+SYNTHETIC_GUILD_ID = 800000000000000000
+
+HABIT_NAMES = ['Meditate', 'Read', 'Run', 'Journal', 'Stretch', 'Study', 'Code', 'Walk', 'Practice guitar', 'Cook']
+TIME_LOCATIONS = ['when I wake up', 'after lunch', 'before bed', 'at the gym', 'at home', 'after work']
+IDENTITIES = ['a mindful person', 'a reader', 'an athlete', 'a writer', 'a healthy person', 'a musician']
+
+
+def get_week_keys(weeks, last_week=None):
+    """Return the week keys of the last `weeks` Saturdays in chronological order, in the bot's '%Y-W%U' format."""
+    last_week = last_week or datetime.now()
+    last_saturday = last_week - timedelta(days=(last_week.weekday() - 5) % 7)
+    return [(last_saturday - timedelta(weeks=i)).strftime("%Y-W%U") for i in reversed(range(weeks))]
+
+def build_synthetic_database(db_name, users=DEFAULT_USERS, habits=DEFAULT_HABITS, weeks=DEFAULT_WEEKS, seed=0, guild_id=SYNTHETIC_GUILD_ID):
+    """
+    Build a DatabaseHandler database with realistic, reproducible data.
+
+    Every habit belongs to a random user, is packed into tracking channels of 8 habits and has
+    a weekly `tracking` row from the week it was declared on, with a per-habit completion rate.
+
+    :return: A dictionary describing the generated data.
+    """
+    from data_handler import DatabaseHandler
+
+    if os.path.exists(db_name):
+        os.remove(db_name)
+    rng = random.Random(seed)
+    week_keys = get_week_keys(weeks)
+
+    db_handler = DatabaseHandler(init=True, db_name=db_name)
+    conn = db_handler.conn
+    user_ids = [FIRST_USER_ID + i for i in range(users)]
+    channel_count = (habits + HABITS_PER_CHANNEL - 1) // HABITS_PER_CHANNEL
+    channel_ids = [FIRST_CHANNEL_ID + i for i in range(channel_count)]
+
+    habit_rows = []
+    channel_slots = [[] for _ in channel_ids]
+    for habit_id in range(1, habits + 1):
+        user_id = rng.choice(user_ids)
+        channel_index = (habit_id - 1) // HABITS_PER_CHANNEL
+        channel_slots[channel_index].append(user_id)
+        habit_rows.append((habit_id, guild_id, user_id, channel_ids[channel_index], rng.choice(HABIT_NAMES),
+                           rng.choice(TIME_LOCATIONS), rng.choice(IDENTITIES)))
+
+    with conn:
+        conn.executemany('INSERT INTO users (user_id, username) VALUES (?, ?)',
+                         ((user_id, f"user{user_id - FIRST_USER_ID}") for user_id in user_ids))
+        conn.executemany(
+            'INSERT INTO tracking_channels (channel_id, guild_id, user1_id, user2_id, user3_id, user4_id, user5_id, user6_id, user7_id, user8_id) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            ((channel_id, guild_id, *(slots + [None] * (HABITS_PER_CHANNEL - len(slots)))) for channel_id, slots in zip(channel_ids, channel_slots))
+        )
+        conn.executemany(
+            'INSERT INTO habits (id, guild_id, user_id, tracking_channel_id, habit_name, time_location, identity) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            habit_rows
+        )
+        conn.executemany('INSERT INTO tracking (habit_id, guild_id, week_key, completed, streak) VALUES (?, ?, ?, ?, ?)',
+                         _generate_tracking_rows(rng, habits, week_keys, guild_id))
+
+    tracking_rows = conn.execute('SELECT COUNT(*) FROM tracking').fetchone()[0]
+    db_handler.close()
+    return {
+        'users': users,
+        'habits': habits,
+        'weeks': weeks,
+        'channels': channel_count,
+        'tracking_rows': tracking_rows,
+        'seed': seed,
+        'guild_id': guild_id,
+        'week_keys': week_keys,
+        'user_ids': user_ids,
+        'channel_ids': channel_ids,
+    }
+
+def _generate_tracking_rows(rng, habits, week_keys, guild_id):
+    for habit_id in range(1, habits + 1):
+        start_week = rng.randrange(len(week_keys))
+        completion_rate = rng.uniform(0.3, 0.95)
+        streak = 0
+        for week_key in week_keys[start_week:]:
+            completed = rng.random() < completion_rate
+            streak = streak + 1 if completed else 0
+            yield (habit_id, guild_id, week_key, completed, streak)
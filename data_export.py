@@ -0,0 +1,141 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import zipfile
+import importlib.util
+from datetime import datetime
+import logging
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+EXPORT_TABLES = ('users', 'habits', 'tracking')
+EXPORT_CHUNK_SIZE = 5000
+# The archive stays in memory up to this size, then it is rolled over to a temporary file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# Parquet column types, since a chunk of NULLs cannot tell the type of a column
+PARQUET_TYPES = {
+    'user_id': 'int64', 'username': 'string',
+    'id': 'int64', 'tracking_channel_id': 'int64', 'habit_name': 'string', 'time_location': 'string', 'identity': 'string',
+    'habit_id': 'int64', 'week_key': 'string', 'completed': 'bool', 'streak': 'int64',
+}
+
+
+def is_format_available(export_format):
+    """Parquet needs the optional pyarrow package."""
+    if export_format == 'parquet':
+        return importlib.util.find_spec('pyarrow') is not None
+    return export_format in EXPORT_FORMATS
+
+def write_csv(stream, columns, chunks):
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    writer = csv.writer(text_stream)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+    text_stream.flush()
+    text_stream.detach()
+
+def write_jsonl(stream, columns, chunks):
+    for rows in chunks:
+        stream.write(''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows).encode('utf-8'))
+
+def write_parquet(stream, columns, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, PARQUET_TYPES[column]) for column in columns])
+    # One row group per chunk, so only one chunk is held in memory at a time
+    with pq.ParquetWriter(stream, schema) as writer:
+        for rows in chunks:
+            # Cast after the conversion, SQLite booleans are integers
+            arrays = [pa.array(values).cast(field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+FORMAT_WRITERS = {'csv': write_csv, 'jsonl': write_jsonl, 'parquet': write_parquet}
+
+
+def snapshot_database(db_name, snapshot_name):
+    """
+    Copy the database and its tracking archive with the SQLite backup API.
+
+    The copy is consistent and takes a read lock for the copy only, so a long export of the
+    snapshot does not keep the bot from writing to the database. Both files are copied in the same
+    read transaction, so an archival running meanwhile cannot move records out of the snapshot.
+    """
+    from data_handler import get_archive_db_name
+
+    source = sqlite3.connect(db_name)
+    try:
+        source.execute('ATTACH DATABASE ? AS archive', (get_archive_db_name(db_name),))
+        source.execute('BEGIN')
+        # Reading both schemas takes the read lock of both files until the commit
+        source.execute('SELECT COUNT(*) FROM main.sqlite_master').fetchone()
+        source.execute('SELECT COUNT(*) FROM archive.sqlite_master').fetchone()
+        for name, target_name in (('main', snapshot_name), ('archive', get_archive_db_name(snapshot_name))):
+            target = sqlite3.connect(target_name)
+            try:
+                source.backup(target, name=name)
+            finally:
+                target.close()
+        source.commit()
+    finally:
+        source.close()
+
+def count_rows(chunks, row_counts, table):
+    row_counts[table] = 0
+    for rows in chunks:
+        row_counts[table] += len(rows)
+        yield rows
+
+def export_guild_data(db_name, guild_id, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Export the users, habits and tracking history of a guild in a zip archive, one file per table.
+
+    Rows are streamed from a snapshot of the database in chunks and written straight into the archive,
+    which is spooled to disk once it outgrows SPOOL_MAX_BYTES, so memory use does not depend on the history length.
+    Meant to run in a worker thread.
+
+    :param db_name: The database to export.
+    :param guild_id: The guild to export, every guild if None.
+    :param export_format: One of EXPORT_FORMATS.
+    :return: The archive, rewound to its start (the caller closes it), and the number of rows of each table.
+    """
+    from data_handler import DatabaseHandler, EXPORT_COLUMNS
+
+    if not is_format_available(export_format):
+        raise ValueError(f"The {export_format} export format is not available.")
+    write_table = FORMAT_WRITERS[export_format]
+    start_time = time.perf_counter()
+    archive = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    row_counts = {}
+
+    try:
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            snapshot_name = os.path.join(snapshot_dir, 'export.db')
+            snapshot_database(db_name, snapshot_name)
+            db_handler = DatabaseHandler(db_name=snapshot_name, guild_id=guild_id)
+            try:
+                # Parquet files are already compressed
+                compression = zipfile.ZIP_STORED if export_format == 'parquet' else zipfile.ZIP_DEFLATED
+                with zipfile.ZipFile(archive, 'w', compression=compression) as zip_file:
+                    for table in EXPORT_TABLES:
+                        with zip_file.open(f"{table}.{export_format}", 'w', force_zip64=True) as stream:
+                            write_table(stream, EXPORT_COLUMNS[table], count_rows(db_handler.iter_export_rows(table, chunk_size), row_counts, table))
+            finally:
+                db_handler.close()
+                db_handler.close_read_conn()
+    except Exception:
+        archive.close()
+        raise
+
+    archive.seek(0)
+    logger.info("Exported %s of guild %s as %s in %.2fs.", row_counts, guild_id, export_format, time.perf_counter() - start_time)
+    return archive, row_counts
+
+def get_export_filename(guild_name, export_format):
+    safe_name = ''.join(char if char.isalnum() else '-' for char in guild_name).strip('-').lower() or 'guild'
+    return f"{safe_name}-{export_format}-export-{datetime.now():%Y%m%d}.zip"
@@ -1,35 +1,145 @@
 import sqlite3
+from bisect import bisect_right
 from contextlib import closing
+from pathlib import Path
 import logging
 logger = logging.getLogger(__name__)
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
+import json
+import time
+from monitoring.metrics import DB_QUERY_SECONDS, observe_duration
 
 load_dotenv()
 DB_NAME = os.environ['DISCORD_BOT_DB_NAME']
 
+# Tables partitioned by guild, users are global since Discord user IDs are
+GUILD_PARTITIONED_TABLES = ('habits', 'tracking_channels', 'tracking')
+# Columns of the tables an export contains, in export order
+EXPORT_COLUMNS = {
+    'users': ('user_id', 'username'),
+    'habits': ('id', 'user_id', 'tracking_channel_id', 'habit_name', 'time_location', 'identity'),
+    'tracking': ('habit_id', 'week_key', 'completed', 'streak'),
+}
+# Tracking records of the weeks before this horizon are moved to the archive database. The previous
+# week must stay in the hot table, since a new streak continues from its record.
+MIN_HOT_TRACKING_WEEKS = 2
+# bot_state key set when the archive changed and is not uploaded yet
+ARCHIVE_UPLOAD_PENDING_KEY = 'tracking_archive_upload_pending'
+# Seconds a tracking channel slot stays reserved for a declaration that is neither saved nor released
+CHANNEL_RESERVATION_SECONDS = 15 * 60
+# Seconds a tracking channel name stays claimed by the process or worker creating it
+CHANNEL_CREATION_SECONDS = 5 * 60
+# Lower bounds of the streak buckets of the weekly rollups, the /stats streak distribution buckets
+ROLLUP_STREAK_BOUNDS = (0, 1, 2, 4, 8, 16, 32)
+ROLLUP_STREAK_COLUMNS = tuple(f"streak_{low}" for low in ROLLUP_STREAK_BOUNDS)
+# Check outcomes counted in the weekly rollups, a check unanswered at the end of its session breaks the streak
+# like a failed one but is stored and counted apart
+ROLLUP_OUTCOMES = ('completed', 'failed', 'unanswered')
+# Route labels of the DB_QUERY_SECONDS operations: the read-write connection, or the read-only one of the long reads
+PRIMARY_ROUTE = 'primary'
+READ_ONLY_ROUTE = 'read_only'
+
+def get_archive_db_name(db_name):
+    """The archive database attached next to a database, e.g. data/discord_bot_archive.db for data/discord_bot.db."""
+    root, extension = os.path.splitext(db_name)
+    return f"{root}_archive{extension or '.db'}"
+
 class DatabaseHandler:
-    def __init__(self, init=False, db_name=None):
+    def __init__(self, init=False, db_name=None, guild_id=None):
         self.db_name = db_name if db_name else DB_NAME # Accept environment value if not forced
+        self.guild_id = guild_id  # Scopes the per-user queries to one guild, all guilds if None
         self.conn = None
+        self.read_conn = None
         self.connect()
         if init:
             self._init_tables()
 
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
     def connect(self):
         """Establish a connection to the SQLite database."""
         try:
             if self.conn:
                 self.conn.close()  # Ensure any existing connection is closed before reopening
             self.conn = sqlite3.connect(self.db_name)
-            logger.info(f"Connected to the database: {self.db_name}")
+            # Off by default in SQLite, deleting a habit cascades to its tracking records
+            self.conn.execute('PRAGMA foreign_keys = ON')
+            self._attach_archive()
+            logger.info("Connected to the database: %s", self.db_name)
         except sqlite3.Error as e:
-            logger.error(f"Error connecting to database: {e}")
+            logger.error("Error connecting to database: %s", e)
             raise
 
+    def get_read_conn(self):
+        """
+        Return the read-only connection of the long reads (leaderboards, habit listings, stats, exports), opened on first use.
+
+        The database is in WAL mode, where readers do not block the writer: a long scan on this connection
+        does not delay the check-ins written on the main connection, nor does it wait for them.
+        It sees the transactions committed on the main connection, not the open one.
+        It is kept for the handler's lifetime, across the connect() and close() of the main connection,
+        until close_read_conn().
+        """
+        if self.read_conn is None:
+            try:
+                self.read_conn = sqlite3.connect(Path(self.db_name).resolve().as_uri() + '?mode=ro', uri=True)
+                self.read_conn.execute('ATTACH DATABASE ? AS archive', (Path(get_archive_db_name(self.db_name)).resolve().as_uri() + '?mode=ro',))
+                self._create_history_view(self.read_conn)
+            except sqlite3.Error as e:
+                logger.error("Error opening the read-only connection to %s: %s", self.db_name, e)
+                self.close_read_conn()
+                raise
+        return self.read_conn
+
+    def close_read_conn(self):
+        """Close the read-only connection, e.g. when the handler is no longer used. The next long read reopens it."""
+        if self.read_conn is not None:
+            self.read_conn.close()
+            self.read_conn = None
+
+    def _attach_archive(self):
+        """
+        Attach the archive database, which holds the tracking records older than the hot horizon.
+
+        The `tracking` table only holds the recent weeks, which the streak lookups and status checks read.
+        The `tracking_history` view joins both tables for the history reads (analytics, exports).
+        A week found in both tables, left by an archival interrupted between its two commits or by a main
+        database restored from a backup older than an archival, is read from the hot table only.
+        It is a TEMP view since a view of the main database cannot refer to an attached one.
+        """
+        self.conn.execute('ATTACH DATABASE ? AS archive', (get_archive_db_name(self.db_name),))
+        # Same columns as `tracking`, the foreign key cannot refer to the habits of another database file
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS archive.tracking_archive (
+                habit_id INTEGER NOT NULL,
+                guild_id INTEGER,
+                channel_id INTEGER,
+                week_key TEXT NOT NULL,
+                completed BOOLEAN NOT NULL,
+                unanswered BOOLEAN NOT NULL DEFAULT 0,
+                streak INTEGER DEFAULT 0,
+                UNIQUE (habit_id, week_key)
+            )
+        ''')
+        self._create_history_view(self.conn)
+        self.conn.commit()
+
+    def _create_history_view(self, conn):
+        conn.execute('''
+            CREATE TEMP VIEW IF NOT EXISTS tracking_history AS
+            SELECT habit_id, guild_id, channel_id, week_key, completed, unanswered, streak FROM main.tracking
+            UNION ALL
+            SELECT habit_id, guild_id, channel_id, week_key, completed, unanswered, streak FROM archive.tracking_archive a
+            WHERE NOT EXISTS (SELECT 1 FROM main.tracking t WHERE t.habit_id = a.habit_id AND t.week_key = a.week_key)
+        ''')
+
     def _init_tables(self):
         try:
+            # Persistent, the read-only connections then never block the writes. The archive keeps its rollback
+            # journal since its file is uploaded as is, and an archival is then only atomic per file, see archive_tracking.
+            self.conn.execute('PRAGMA main.journal_mode = WAL')
+            self._add_tracking_cascade()
             with self.conn:
                 # Users table
                 self.conn.execute('''
@@ -43,6 +153,7 @@ class DatabaseHandler:
                 self.conn.execute('''
                     CREATE TABLE IF NOT EXISTS habits (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        guild_id INTEGER,
                         user_id INTEGER NOT NULL,
                         tracking_channel_id INTEGER,
                         habit_name TEXT NOT NULL,
@@ -57,6 +168,8 @@ class DatabaseHandler:
                 self.conn.execute('''
                     CREATE TABLE IF NOT EXISTS tracking_channels (
                         channel_id INTEGER PRIMARY KEY,
+                        guild_id INTEGER,
+                        role_id INTEGER,
                         user1_id INTEGER,
                         user2_id INTEGER,
                         user3_id INTEGER,
@@ -80,23 +193,229 @@ class DatabaseHandler:
                 self.conn.execute('''
                     CREATE TABLE IF NOT EXISTS tracking (
                         habit_id INTEGER NOT NULL,
+                        guild_id INTEGER,
+                        channel_id INTEGER,
                         week_key TEXT NOT NULL,
                         completed BOOLEAN NOT NULL,
+                        unanswered BOOLEAN NOT NULL DEFAULT 0,
                         streak INTEGER DEFAULT 0,
-                        FOREIGN KEY (habit_id) REFERENCES habits(id),
+                        FOREIGN KEY (habit_id) REFERENCES habits(id) ON DELETE CASCADE,
                         UNIQUE (habit_id, week_key)
                     )
                 ''')
+
+                # A removed habit frees the first slot of its owner in its tracking channel, the slots hold user IDs
+                # so they cannot cascade. The CASE expressions all read the slots as they were before the update.
+                slot_updates = ',\n'.join(
+                    f"user{slot}_id = CASE WHEN user{slot}_id = OLD.user_id"
+                    + ''.join(f" AND user{previous}_id IS NOT OLD.user_id" for previous in range(1, slot))
+                    + f" THEN NULL ELSE user{slot}_id END"
+                    for slot in range(1, 9)
+                )
+                self.conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS habits_free_channel_slot
+                    AFTER DELETE ON habits
+                    WHEN OLD.tracking_channel_id IS NOT NULL
+                    BEGIN
+                        UPDATE tracking_channels SET {slot_updates}
+                        WHERE channel_id = OLD.tracking_channel_id;
+                    END
+                ''')
+
+                # Key/value state of the bot itself (e.g. the last synced command tree hash)
+                self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS bot_state (
+                        key TEXT PRIMARY KEY,
+                        value TEXT
+                    )
+                ''')
+
+                # Persistent job queue consumed by the workers
+                self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        kind TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        idempotency_key TEXT UNIQUE,
+                        status TEXT NOT NULL DEFAULT 'queued',
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        max_attempts INTEGER NOT NULL DEFAULT 5,
+                        run_at REAL NOT NULL,
+                        locked_by TEXT,
+                        locked_until REAL,
+                        last_error TEXT,
+                        created_at REAL NOT NULL,
+                        finished_at REAL
+                    )
+                ''')
+                self.conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at ON jobs (status, run_at)')
+
+                # IDs of the Discord objects the bot looks up in each guild (e.g. the tracking category)
+                self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS guild_objects (
+                        guild_id INTEGER NOT NULL,
+                        name TEXT NOT NULL,
+                        object_id INTEGER NOT NULL,
+                        PRIMARY KEY (guild_id, name)
+                    )
+                ''')
+
+                # Tracking channel slots held by the declarations being processed
+                self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS channel_reservations (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        channel_id INTEGER NOT NULL,
+                        guild_id INTEGER,
+                        user_id INTEGER,
+                        expires_at REAL NOT NULL
+                    )
+                ''')
+                self.conn.execute('CREATE INDEX IF NOT EXISTS idx_channel_reservations_channel ON channel_reservations (channel_id)')
+
+                # Check messages of the current habit check session, finalized from this table at the end of the session
+                self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS habit_checks (
+                        message_id INTEGER PRIMARY KEY,
+                        guild_id INTEGER,
+                        habit_id INTEGER NOT NULL,
+                        channel_id INTEGER NOT NULL,
+                        week_key TEXT NOT NULL,
+                        closed BOOLEAN NOT NULL DEFAULT 0,
+                        FOREIGN KEY (habit_id) REFERENCES habits(id) ON DELETE CASCADE
+                    )
+                ''')
+                self.conn.execute('CREATE INDEX IF NOT EXISTS idx_habit_checks_habit_week ON habit_checks (habit_id, week_key)')
+                self.conn.execute('CREATE INDEX IF NOT EXISTS idx_habit_checks_guild ON habit_checks (guild_id)')
+
+                # Tracking channels being created, so a single process or worker creates each channel name
+                self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS channel_creations (
+                        guild_id INTEGER NOT NULL,
+                        channel_name TEXT NOT NULL,
+                        owner TEXT,
+                        expires_at REAL NOT NULL,
+                        PRIMARY KEY (guild_id, channel_name)
+                    )
+                ''')
+
+                self._add_guild_columns()
+                self._add_role_column()
+                self._add_unanswered_columns()
+                self._add_tracking_channel_columns()
+                self._add_weekly_rollups()
+
+                # Guild partitions and the lookups done per guild
+                self.conn.execute('CREATE INDEX IF NOT EXISTS idx_habits_guild_user ON habits (guild_id, user_id)')
+                self.conn.execute('CREATE INDEX IF NOT EXISTS idx_habits_tracking_channel ON habits (tracking_channel_id)')
+                self.conn.execute('CREATE INDEX IF NOT EXISTS idx_tracking_channels_guild ON tracking_channels (guild_id)')
+                self.conn.execute('CREATE INDEX IF NOT EXISTS idx_tracking_guild_week ON tracking (guild_id, week_key)')
         except sqlite3.Error as e:
-            print(f"Error creating tables: {e}")
+            logger.error("Error creating tables: %s", e)
             raise
 
+    def _add_tracking_cascade(self):
+        """
+        Rebuild a tracking table created without ON DELETE CASCADE, SQLite cannot alter a foreign key.
+
+        Orphaned records, left by habits removed before the foreign keys were enforced, are dropped.
+        """
+        foreign_keys = self.conn.execute('PRAGMA main.foreign_key_list(tracking)').fetchall()
+        if not foreign_keys or foreign_keys[0][6] == 'CASCADE':
+            return
+        # Foreign keys can only be switched outside of a transaction, and the view would block the rename
+        columns = [column[1] for column in self.conn.execute('PRAGMA main.table_info(tracking)')]
+        guild_column = 'guild_id' if 'guild_id' in columns else 'NULL'
+        self.conn.execute('PRAGMA foreign_keys = OFF')
+        self.conn.execute('DROP VIEW IF EXISTS temp.tracking_history')
+        try:
+            with self.conn:
+                self.conn.execute('''
+                    CREATE TABLE tracking_new (
+                        habit_id INTEGER NOT NULL,
+                        guild_id INTEGER,
+                        week_key TEXT NOT NULL,
+                        completed BOOLEAN NOT NULL,
+                        unanswered BOOLEAN NOT NULL DEFAULT 0,
+                        streak INTEGER DEFAULT 0,
+                        FOREIGN KEY (habit_id) REFERENCES habits(id) ON DELETE CASCADE,
+                        UNIQUE (habit_id, week_key)
+                    )
+                ''')
+                self.conn.execute(f'''
+                    INSERT INTO tracking_new (habit_id, guild_id, week_key, completed, streak)
+                    SELECT habit_id, {guild_column}, week_key, completed, streak FROM tracking
+                    WHERE habit_id IN (SELECT id FROM habits)
+                ''')
+                orphans = self.conn.execute('SELECT (SELECT COUNT(*) FROM tracking) - (SELECT COUNT(*) FROM tracking_new)').fetchone()[0]
+                self.conn.execute('DROP TABLE tracking')
+                self.conn.execute('ALTER TABLE tracking_new RENAME TO tracking')
+            logger.info("Rebuilt the tracking table with cascading deletes, dropped %s orphaned records.", orphans)
+        finally:
+            self.conn.execute('PRAGMA foreign_keys = ON')
+            self._create_history_view(self.conn)
+
+    def _add_guild_columns(self):
+        """Add the guild_id column to tables created before the bot served several guilds."""
+        for table in GUILD_PARTITIONED_TABLES:
+            columns = [column[1] for column in self.conn.execute(f'PRAGMA table_info({table})')]
+            if 'guild_id' not in columns:
+                self.conn.execute(f'ALTER TABLE {table} ADD COLUMN guild_id INTEGER')
+                logger.info("Added guild_id column to the %s table.", table)
+
+    def _add_unanswered_columns(self):
+        """Add the unanswered column to tracking tables created before the unanswered checks were told apart."""
+        for schema, table in (('main', 'tracking'), ('archive', 'tracking_archive')):
+            columns = [column[1] for column in self.conn.execute(f'PRAGMA {schema}.table_info({table})')]
+            if 'unanswered' not in columns:
+                self.conn.execute(f'ALTER TABLE {schema}.{table} ADD COLUMN unanswered BOOLEAN NOT NULL DEFAULT 0')
+                logger.info("Added unanswered column to the %s table.", table)
+
+    def _add_tracking_channel_columns(self):
+        """
+        Add the channel_id column to tracking tables created before the records kept the channel they are counted in,
+        filled with the current channel of their habit.
+        """
+        for schema, table in (('main', 'tracking'), ('archive', 'tracking_archive')):
+            columns = [column[1] for column in self.conn.execute(f'PRAGMA {schema}.table_info({table})')]
+            if 'channel_id' not in columns:
+                self.conn.execute(f'ALTER TABLE {schema}.{table} ADD COLUMN channel_id INTEGER')
+                self.conn.execute(f'UPDATE {schema}.{table} SET channel_id = (SELECT tracking_channel_id FROM main.habits WHERE id = habit_id)')
+                logger.info("Added channel_id column to the %s table.", table)
+
+    def _add_weekly_rollups(self):
+        """Create the weekly_rollups table, aggregating the existing tracking history once."""
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'weekly_rollups'").fetchone():
+            return
+        # Check outcomes and streak buckets of each tracking channel and week, updated with every check
+        self.conn.execute(f'''
+            CREATE TABLE weekly_rollups (
+                channel_id INTEGER NOT NULL,
+                week_key TEXT NOT NULL,
+                guild_id INTEGER,
+                {', '.join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in ROLLUP_OUTCOMES + ROLLUP_STREAK_COLUMNS)},
+                digest_message_id INTEGER,
+                PRIMARY KEY (channel_id, week_key)
+            )
+        ''')
+        self.conn.execute('CREATE INDEX idx_weekly_rollups_guild_week ON weekly_rollups (guild_id, week_key)')
+        with closing(self.conn.cursor()) as cursor:
+            self._aggregate_weekly_rollups(cursor)
+        logger.info("Weekly rollups built from the tracking history.")
+
+    def _add_role_column(self):
+        """Add the role_id column to a tracking_channels table created before the role IDs were stored."""
+        columns = [column[1] for column in self.conn.execute('PRAGMA table_info(tracking_channels)')]
+        if 'role_id' not in columns:
+            self.conn.execute('ALTER TABLE tracking_channels ADD COLUMN role_id INTEGER')
+            logger.info("Added role_id column to the tracking_channels table.")
+
     #########################
     ### INSERTION METHODS ###
     #########################
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
     def add_user(self, user_id, username):
         if self.user_exists(user_id):
-            print(f"User with ID {user_id} already exists.")
+            logger.debug("User with ID %s already exists.", user_id)
             return
         try:
             with self.conn:
@@ -104,22 +423,30 @@ class DatabaseHandler:
                     INSERT INTO users (user_id, username)
                     VALUES (?, ?)
                 ''', (user_id, username))
-            print(f"User {username} added successfully.")
+            logger.info("User %s added successfully.", username)
         except sqlite3.Error as e:
-            print(f"Error adding user: {e}")
+            logger.error("Error adding user: %s", e)
             raise
 
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
     def user_exists(self, user_id):
         try:
             with closing(self.conn.cursor()) as cursor:
                 cursor.execute('SELECT 1 FROM users WHERE user_id = ?', (user_id,))
                 return cursor.fetchone() is not None
         except sqlite3.Error as e:
-            print(f"Error checking if user exists: {e}")
+            logger.error("Error checking if user exists: %s", e)
             raise
 
 
-    def add_habit_with_data(self, habit_data, tracking_channel_id):
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def add_habit_with_data(self, habit_data, tracking_channel_id, reservation_id=None):
+        """
+        Insert a declared habit.
+
+        :param reservation_id: The reservation of the habit's slot (see reserve_channel_slot), which the habit takes over.
+        :return: The ID of the new habit.
+        """
         try:
             # Extract data from the habit_data dictionary
             user_id = habit_data['metadata']['user_id']
@@ -129,16 +456,20 @@ class DatabaseHandler:
 
             # Insert the habit data into the habits table
             with self.conn:
-                self.conn.execute('''
-                    INSERT INTO habits (user_id, tracking_channel_id, habit_name, time_location, identity)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (user_id, tracking_channel_id, habit_name, time_location, identity))
+                cursor = self.conn.execute('''
+                    INSERT INTO habits (guild_id, user_id, tracking_channel_id, habit_name, time_location, identity)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (self.guild_id, user_id, tracking_channel_id, habit_name, time_location, identity))
+                if reservation_id is not None:
+                    self.conn.execute('DELETE FROM channel_reservations WHERE id = ?', (reservation_id,))
             
-            logger.info(f"Habit '{habit_name}' added successfully for user {user_id} in channel {tracking_channel_id}.")
+            logger.info("Habit '%s' added successfully for user %s in channel %s.", habit_name, user_id, tracking_channel_id)
+            return cursor.lastrowid
         except sqlite3.Error as e:
-            logger.error(f"Error adding habit for user {user_id}: {e}")
+            logger.error("Error adding habit for user %s: %s", user_id, e)
             raise
 
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
     def update_habit_with_data(self, habit_data, tracking_channel_id, habit_id):
         try:
             # Extract data from the habit_data dictionary
@@ -156,13 +487,14 @@ class DatabaseHandler:
                     WHERE id = ?
                 ''', (user_id, tracking_channel_id, habit_name, time_location, identity, habit_id))
             
-                logger.info(f"Habit ID {habit_id} updated successfully with new data.")
+                logger.info("Habit ID %s updated successfully with new data.", habit_id)
             
             
         except sqlite3.Error as e:
-            logger.error(f"Error adding habit for user {user_id}: {e}")
+            logger.error("Error adding habit for user %s: %s", user_id, e)
             raise
 
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
     def add_user_to_tracking_channel(self, user_id, channel_id):
         try:
             with closing(self.conn.cursor()) as cursor:
@@ -177,12 +509,12 @@ class DatabaseHandler:
                 
                 if not channel:
                     # Channel does not exist, create it
-                    logger.info(f"Channel {channel_id} does not exist. Creating new channel.")
+                    logger.info("Channel %s does not exist. Creating new channel.", channel_id)
                     with self.conn:
                         self.conn.execute('''
-                            INSERT INTO tracking_channels (channel_id)
-                            VALUES (?)
-                        ''', (channel_id,))
+                            INSERT INTO tracking_channels (channel_id, guild_id)
+                            VALUES (?, ?)
+                        ''', (channel_id, self.guild_id))
                     
                     # Re-fetch the channel row after creation
                     cursor.execute('''
@@ -198,7 +530,7 @@ class DatabaseHandler:
                         slot = i + 1
                         break
                 else:
-                    logger.error(f"Channel {channel_id} is already full.")
+                    logger.error("Channel %s is already full.", channel_id)
                     return False
 
                 # Update the table with the new user in the first available slot
@@ -210,28 +542,41 @@ class DatabaseHandler:
                         WHERE channel_id = ?
                     ''', (user_id, channel_id))
 
-                logger.info(f"User {user_id} added to channel {channel_id} in slot {slot}.")
+                logger.info("User %s added to channel %s in slot %s.", user_id, channel_id, slot)
                 return True
         except sqlite3.Error as e:
-            logger.error(f"Error adding user to channel {channel_id}: {e}")
+            logger.error("Error adding user to channel %s: %s", channel_id, e)
             raise
         
-    def mark_habit_completed(self, habit_id, completed, current_week=True, week_key=None):
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def mark_habit_completed(self, habit_id, completed, current_week=True, week_key=None, unanswered=False):
+        """
+        Record whether the habit was completed in the given week and update its streak and the weekly rollup of its channel.
+
+        :param unanswered: The check was not answered before the end of its session, it is counted apart from
+                           the failed ones in the weekly rollup.
+        :return: The new streak of the habit, or None if the record could not be stored.
+        """
         try:
-            week_key = self._get_week_key(current_week, week_key) if week_key else week_key
-            logger.debug(f"Marking habit: habit_id={habit_id}, completed={completed}, week_key={week_key}")
+            week_key = self._get_week_key(current_week, week_key)
+            logger.debug("Marking habit: habit_id=%s, completed=%s, week_key=%s", habit_id, completed, week_key)
 
             with self.conn:
                 with closing(self.conn.cursor()) as cursor:
                     last_streak_record = self._get_last_streak_record(cursor, habit_id)
+                    cursor.execute('SELECT completed, unanswered, streak, channel_id FROM tracking WHERE habit_id = ? AND week_key = ?', (habit_id, week_key))
+                    previous_record = cursor.fetchone()
 
+                    unanswered = bool(unanswered and not completed)
                     new_streak = self._calculate_new_streak(completed, last_streak_record, week_key)
-                    self._insert_or_update_tracking(cursor, habit_id, week_key, completed, new_streak)
+                    self._insert_or_update_tracking(cursor, habit_id, week_key, completed, new_streak, unanswered)
+                    self._update_weekly_rollup(cursor, habit_id, week_key, previous_record, self._get_outcome(completed, unanswered), new_streak)
+            return new_streak
 
         except sqlite3.IntegrityError:
-            logger.warning(f"Habit with ID {habit_id} already has a record for week {week_key}.")
+            logger.warning("Habit with ID %s already has a record for week %s.", habit_id, week_key)
         except sqlite3.Error as e:
-            logger.error(f"Error marking habit as completed: {e}")
+            logger.error("Error marking habit as completed: %s", e)
             raise
 
     def _get_week_key(self, current_week, week_key):
@@ -249,7 +594,7 @@ class DatabaseHandler:
         ''', (habit_id,))
         last_streak_record = cursor.fetchone()
         if last_streak_record:
-            logger.debug(f"Last streak record found: last_week_key={last_streak_record[0]}, last_streak={last_streak_record[1]}")
+            logger.debug("Last streak record found: last_week_key=%s, last_streak=%s", last_streak_record[0], last_streak_record[1])
         return last_streak_record
 
     def _calculate_new_streak(self, completed, last_streak_record, week_key):
@@ -260,138 +605,106 @@ class DatabaseHandler:
                 
                 # If the last streak week is not passed, streak continues unchanged
                 if last_week_key == week_key:
-                    logger.debug(f"Same week, streak continues unchanged: new_streak={last_streak}")
+                    logger.debug("Same week, streak continues unchanged: new_streak=%s", last_streak)
                     return last_streak  
                 
                 # Last week matches the expected previous week, streak continues
                 elif last_week_key == self.get_previous_week_key(week_key):
                     new_streak = last_streak + 1  
-                    logger.debug(f"Last week matches expected previous week, streak incremented: new_streak={new_streak}")
+                    logger.debug("Last week matches expected previous week, streak incremented: new_streak=%s", new_streak)
                     return new_streak
                 
                 # In any other case of completion, start a new streak as 1
                 else:
-                    logger.debug(f"Streak reset: new_streak=1")
+                    logger.debug("Streak reset: new_streak=1")
                     return 1  # Streak reset
             
             # If habit is completed but last streak record is not found
             else:
-                logger.debug(f"Streak reset: new_streak=1")
+                logger.debug("Streak reset: new_streak=1")
                 return 1  # Streak reset
         
         # If habit is not completed
         else:
-            logger.debug(f"Not completed, resetting streak: new_streak=0")
+            logger.debug("Not completed, resetting streak: new_streak=0")
             return 0
         
         
 
-    def _insert_or_update_tracking(self, cursor, habit_id, week_key, completed, new_streak):
+    def _insert_or_update_tracking(self, cursor, habit_id, week_key, completed, new_streak, unanswered=False):
+        # The tracking row belongs to the guild of its habit, and is counted in the rollup of the habit's current channel
         cursor.execute('''
-            INSERT INTO tracking (habit_id, week_key, completed, streak)
-            VALUES (?, ?, ?, ?)
-            ON CONFLICT(habit_id, week_key) DO UPDATE SET completed=excluded.completed, streak=excluded.streak
-        ''', (habit_id, week_key, completed, new_streak))
-        logger.info(f"Habit with ID {habit_id} marked as {completed} for week {week_key} with streak {new_streak}.")
+            INSERT INTO tracking (habit_id, guild_id, channel_id, week_key, completed, unanswered, streak)
+            VALUES (?, (SELECT guild_id FROM habits WHERE id = ?), (SELECT tracking_channel_id FROM habits WHERE id = ?), ?, ?, ?, ?)
+            ON CONFLICT(habit_id, week_key) DO UPDATE SET
+                channel_id=excluded.channel_id, completed=excluded.completed, unanswered=excluded.unanswered, streak=excluded.streak
+        ''', (habit_id, habit_id, habit_id, week_key, completed, unanswered, new_streak))
+        logger.info("Habit with ID %s marked as %s for week %s with streak %s.", habit_id, completed, week_key, new_streak)
 
 
-    def remove_habit_by_id(self, habit_id):
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def remove_habits(self, habit_ids=None, condition=None, params=(), dry_run=False):
         """
-        Remove a habit and its associated tracking data from the database.
-        Also, clear the user's slot in the tracking_channels table if applicable.
+        Remove habits with their tracking history and their tracking channel slots, in one transaction.
 
-        :param habit_id: The ID of the habit to be removed.
+        The habits are deleted with a single statement: the hot tracking records cascade, the
+        habits_free_channel_slot trigger frees the slots, and the archived records are deleted by habit ID.
+
+        :param habit_ids: The IDs of the habits to remove.
+        :param condition: Or an SQL condition on the columns of the habits table, e.g. 'habit_name = ?'.
+        :param params: The parameters of the condition.
+        :param dry_run: Only select the habits, without removing them.
+        :return: The IDs of the removed habits, only the ones of the handler's guild if it has one.
         """
+        if (habit_ids is None) == (condition is None):
+            raise ValueError("Either habit IDs or a condition select the habits to remove.")
+        guild_condition, guild_params = self._get_guild_condition('guild_id')
         try:
             with self.conn:
-                # Retrieve the habit's data, specifically the user_id and tracking_channel_id
-                cursor = self.conn.cursor()
-                cursor.execute('''
-                    SELECT user_id, tracking_channel_id
-                    FROM habits
-                    WHERE id = ?
-                ''', (habit_id,))
-                habit_data = cursor.fetchone()
-
-                if not habit_data:
-                    logger.error(f"No habit found with ID {habit_id}.")
-                    return
-
-                user_id, tracking_channel_id = habit_data
-
-                # Remove the tracking data related to the habit
-                self.conn.execute('''
-                    DELETE FROM tracking
-                    WHERE habit_id = ?
-                ''', (habit_id,))
-
-                # Remove the habit itself
-                self.conn.execute('''
-                    DELETE FROM habits
-                    WHERE id = ?
-                ''', (habit_id,))
-
-                # Clear the user's slot in the tracking_channels table
-                if tracking_channel_id:
-                    cursor.execute(f'''
-                        SELECT channel_id, user1_id, user2_id, user3_id, user4_id, user5_id, user6_id, user7_id, user8_id
-                        FROM tracking_channels
-                        WHERE channel_id = ?
-                    ''', (tracking_channel_id,))
-                    channel_data = cursor.fetchone()
-
-                    if channel_data:
-                        # Find the user's slot and set it to NULL
-                        for i, user in enumerate(channel_data[1:], start=1):  # Skip channel_id
-                            if user == user_id:
-                                column_name = f"user{i}_id"
-                                self.conn.execute(f'''
-                                    UPDATE tracking_channels
-                                    SET {column_name} = NULL
-                                    WHERE channel_id = ?
-                                ''', (tracking_channel_id,))
-                                logger.info(f"Cleared user {user_id} from slot {i} in channel {tracking_channel_id}.")
-                                break
-
-                logger.info(f"Habit with ID {habit_id} and its tracking data have been successfully removed.")
+                self.conn.execute('CREATE TEMP TABLE IF NOT EXISTS removed_habits (id INTEGER PRIMARY KEY)')
+                self.conn.execute('DELETE FROM temp.removed_habits')
+                if habit_ids is not None:
+                    self.conn.executemany('INSERT OR IGNORE INTO temp.removed_habits (id) VALUES (?)', ((habit_id,) for habit_id in habit_ids))
+                    self.conn.execute(f'DELETE FROM temp.removed_habits WHERE id NOT IN (SELECT id FROM main.habits WHERE 1 = 1 {guild_condition})', guild_params)
+                else:
+                    self.conn.execute(f'INSERT INTO temp.removed_habits (id) SELECT id FROM main.habits WHERE ({condition}) {guild_condition}', (*params, *guild_params))
 
+                removed_ids = [row[0] for row in self.conn.execute('SELECT id FROM temp.removed_habits')]
+                if removed_ids and not dry_run:
+                    self.conn.execute('DELETE FROM archive.tracking_archive WHERE habit_id IN (SELECT id FROM temp.removed_habits)')
+                    self.conn.execute('DELETE FROM main.habits WHERE id IN (SELECT id FROM temp.removed_habits)')
+            if not dry_run:
+                logger.info("Removed %s habits and their tracking data.", len(removed_ids))
+            return removed_ids
         except sqlite3.Error as e:
-            logger.error(f"Error removing habit with ID {habit_id}: {e}")
+            logger.error("Error removing habits: %s", e)
             raise
 
-    def remove_all_dev_habits(self):
-        """
-        Remove all habits named 'dev' and their associated tracking data.
-        Uses the remove_habit_by_id method to delete each habit and its related data.
+    def remove_habit_by_id(self, habit_id):
         """
-        logger.info(f"\nRemoving all the development purpose habit entries in the database")
-        try:
-            with closing(self.conn.cursor()) as cursor:
-                # Fetch all habits named 'dev'
-                cursor.execute('''
-                    SELECT id
-                    FROM habits
-                    WHERE habit_name = ?
-                ''', ('dev',))
-                dev_habits = cursor.fetchall()
+        Remove a habit and its associated tracking data from the database.
+        Also, clear the user's slot in the tracking_channels table if applicable.
 
-                if not dev_habits:
-                    logger.info("No habits named 'dev' found.")
-                    return
+        :param habit_id: The ID of the habit to be removed.
+        """
+        if not self.remove_habits([habit_id]):
+            logger.error("No habit found with ID %s.", habit_id)
 
-                # Remove each habit by ID
-                for habit in dev_habits:
-                    habit_id = habit[0]
-                    self.remove_habit_by_id(habit_id)
-                    logger.info(f"Habit with ID {habit_id} and name 'dev' has been removed.")
-                logger.info('\n')
-        except sqlite3.Error as e:
-            logger.error(f"Error removing habits named 'dev': {e}")
-            raise
+    def remove_all_dev_habits(self):
+        """Remove all habits named 'dev' and their associated tracking data."""
+        logger.info("Removing all the development purpose habit entries in the database")
+        return self.remove_habits(condition='habit_name = ?', params=('dev',))
 
     ###################
     ### GET METHODS ###
     ###################
+    def _get_guild_condition(self, column):
+        """Return the SQL condition and parameters restricting a query to the handler's guild."""
+        if self.guild_id is None:
+            return '', ()
+        return f'AND {column} = ?', (self.guild_id,)
+
+    @observe_duration(DB_QUERY_SECONDS, route=READ_ONLY_ROUTE)
     def get_user_habits(self, user_id):
         """
         Retrieve all habits associated with a given user ID.
@@ -399,9 +712,10 @@ class DatabaseHandler:
         :param user_id: The ID of the user whose habits to retrieve.
         :return: A list of dictionaries, each containing the habit data.
         """
+        guild_condition, guild_params = self._get_guild_condition('h.guild_id')
         try:
-            with closing(self.conn.cursor()) as cursor:
-                cursor.execute('''
+            with closing(self.get_read_conn().cursor()) as cursor:
+                cursor.execute(f'''
                     SELECT 
                         h.id, 
                         h.habit_name, 
@@ -409,8 +723,8 @@ class DatabaseHandler:
                         h.identity, 
                         h.tracking_channel_id
                     FROM habits h
-                    WHERE h.user_id = ?
-                ''', (user_id,))
+                    WHERE h.user_id = ? {guild_condition}
+                ''', (user_id, *guild_params))
                 
                 habits = cursor.fetchall()
                 
@@ -428,12 +742,13 @@ class DatabaseHandler:
                     
                     return habit_list
                 else:
-                    logger.info(f"No habits found for user ID {user_id}.")
+                    logger.info("No habits found for user ID %s.", user_id)
                     return []
         except sqlite3.Error as e:
-            logger.error(f"Error retrieving habits for user ID {user_id}: {e}")
+            logger.error("Error retrieving habits for user ID %s: %s", user_id, e)
             raise
     
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
     def get_user_habit_ids(self, user_id):
         """
         Retrieve all habit IDs associated with a given user ID.
@@ -441,13 +756,14 @@ class DatabaseHandler:
         :param user_id: The ID of the user whose habit IDs to retrieve.
         :return: A list of habit IDs.
         """
+        guild_condition, guild_params = self._get_guild_condition('guild_id')
         try:
             with closing(self.conn.cursor()) as cursor:
-                cursor.execute('''
+                cursor.execute(f'''
                     SELECT id 
                     FROM habits
-                    WHERE user_id = ?
-                ''', (user_id,))
+                    WHERE user_id = ? {guild_condition}
+                ''', (user_id, *guild_params))
                 
                 habit_ids = cursor.fetchall()
                 
@@ -455,15 +771,16 @@ class DatabaseHandler:
                 habit_id_list = [habit_id[0] for habit_id in habit_ids] if habit_ids else []
                 
                 if habit_id_list:
-                    logger.info(f"Retrieved habit IDs for user ID {user_id}: {habit_id_list}")
+                    logger.info("Retrieved habit IDs for user ID %s: %s", user_id, habit_id_list)
                 else:
-                    logger.info(f"No habits found for user ID {user_id}.")
+                    logger.info("No habits found for user ID %s.", user_id)
                 
                 return habit_id_list
         except sqlite3.Error as e:
-            logger.error(f"Error retrieving habit IDs for user ID {user_id}: {e}")
+            logger.error("Error retrieving habit IDs for user ID %s: %s", user_id, e)
             raise
 
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
     def get_habit_data(self, habit_id):
         """
         Retrieve habit data from the database based on the habit ID.
@@ -501,12 +818,13 @@ class DatabaseHandler:
                     }
                     return habit_data
                 else:
-                    logger.info(f"No habit found with ID {habit_id}.")
+                    logger.info("No habit found with ID %s.", habit_id)
                     return None
         except sqlite3.Error as e:
-            logger.error(f"Error retrieving habit data for habit ID {habit_id}: {e}")
+            logger.error("Error retrieving habit data for habit ID %s: %s", habit_id, e)
             raise
 
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
     def get_habits_in_channel(self, channel_id):
         try:
             with closing(self.conn.cursor()) as cursor:
@@ -519,11 +837,66 @@ class DatabaseHandler:
                 ''', (channel_id,))
                 
                 habits = cursor.fetchall()
-                logging.info(f"Habits fetched: {habits}")
+                logger.debug("Fetched %s habits for channel %s.", len(habits), channel_id)
                 return habits if habits else []
                     
         except sqlite3.Error as e:
-            logger.error(f"Error retrieving habits for channel {channel_id}: {e}")
+            logger.error("Error retrieving habits for channel %s: %s", channel_id, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=READ_ONLY_ROUTE)
+    def get_habit_check_data(self, channel_ids):
+        """
+        Retrieve the data needed to build the habit checks of the given channels in a single query.
+
+        :param channel_ids: The IDs of the tracking channels.
+        :return: A list of dictionaries with the habit data, the username and the current streak.
+        """
+        channel_ids = list(channel_ids)
+        if not channel_ids:
+            return []
+        try:
+            with closing(self.get_read_conn().cursor()) as cursor:
+                placeholders = ', '.join('?' for _ in channel_ids)
+                cursor.execute(f'''
+                    SELECT 
+                        h.id, 
+                        h.user_id, 
+                        h.tracking_channel_id, 
+                        h.habit_name, 
+                        h.time_location, 
+                        h.identity,
+                        u.username,
+                        COALESCE((
+                            SELECT t.streak
+                            FROM tracking t
+                            WHERE t.habit_id = h.id
+                            ORDER BY t.week_key DESC
+                            LIMIT 1
+                        ), 0)
+                    FROM habits h
+                    JOIN users u ON h.user_id = u.user_id
+                    JOIN tracking_channels tc ON h.tracking_channel_id = tc.channel_id
+                    WHERE tc.channel_id IN ({placeholders})
+                    ORDER BY h.tracking_channel_id, h.id
+                ''', channel_ids)
+
+                habit_check_data = []
+                for habit in cursor.fetchall():
+                    habit_check_data.append({
+                        'habit_id': habit[0],
+                        'user_id': habit[1],
+                        'tracking_channel_id': habit[2],
+                        'habit_name': habit[3],
+                        'time_location': habit[4],
+                        'identity': habit[5],
+                        'username': habit[6],
+                        'current_streak': habit[7]
+                    })
+                logger.info("Retrieved habit check data for %s habits in %s channels.", len(habit_check_data), len(channel_ids))
+                return habit_check_data
+        except sqlite3.Error as e:
+            logger.error("Error retrieving habit check data for channels %s: %s", channel_ids, e)
             raise
 
     
@@ -535,7 +908,7 @@ class DatabaseHandler:
         :return: The previous week key.
         """
         year, week = map(int, current_week_key.split('-W'))
-        logger.debug(f"Calculating previous week key from: current_week_key={current_week_key}")
+        logger.debug("Calculating previous week key from: current_week_key=%s", current_week_key)
         
         if week > 1:
             previous_week_key = f"{year}-W{week-1:02d}"
@@ -545,12 +918,14 @@ class DatabaseHandler:
             previous_week = datetime.strptime(f"{previous_year}-12-28", "%Y-%m-%d").isocalendar()[1]
             previous_week_key = f"{previous_year}-W{previous_week:02d}"
         
-        logger.debug(f"Previous week key calculated: previous_week_key={previous_week_key}")
+        logger.debug("Previous week key calculated: previous_week_key=%s", previous_week_key)
         return previous_week_key
 
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
     def get_current_streak(self, habit_id):
         """
         Retrieve the current streak for the given habit ID.
+        Only the hot tracking table is read: a habit without a record since the archive horizon has no streak.
         
         :param habit_id: The ID of the habit.
         :return: The current streak value.
@@ -567,12 +942,106 @@ class DatabaseHandler:
                 streak_record = cursor.fetchone()
                 return streak_record[0] if streak_record else 0
         except sqlite3.Error as e:
-            logger.error(f"Error retrieving current streak for habit ID {habit_id}: {e}")
+            logger.error("Error retrieving current streak for habit ID %s: %s", habit_id, e)
             raise
 
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def is_latest_week(self, habit_id, week_key):
+        """Whether the habit has no tracking record after the given week, i.e. the week holds its current streak."""
+        try:
+            with closing(self.conn.cursor()) as cursor:
+                cursor.execute('SELECT 1 FROM tracking WHERE habit_id = ? AND week_key > ? LIMIT 1', (habit_id, week_key))
+                return cursor.fetchone() is None
+        except sqlite3.Error as e:
+            logger.error("Error retrieving the last week of habit ID %s: %s", habit_id, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=READ_ONLY_ROUTE)
+    def get_habit_streaks(self, habit_ids=None):
+        """
+        Retrieve the current streak of every habit of the guild, or of the given habits, in a single query.
+
+        :param habit_ids: The IDs of the habits, all the habits if None.
+        :return: A list of dictionaries with the habit ID, owner, tracking channel, name and current streak.
+        """
+        guild_condition, params = self._get_guild_condition('h.guild_id')
+        habit_condition = ''
+        if habit_ids is not None:
+            habit_ids = list(habit_ids)
+            if not habit_ids:
+                return []
+            habit_condition = f"AND h.id IN ({', '.join('?' for _ in habit_ids)})"
+        try:
+            with closing(self.get_read_conn().cursor()) as cursor:
+                cursor.execute(f'''
+                    SELECT 
+                        h.id, 
+                        h.user_id, 
+                        h.tracking_channel_id, 
+                        h.habit_name,
+                        COALESCE((
+                            SELECT t.streak
+                            FROM tracking t
+                            WHERE t.habit_id = h.id
+                            ORDER BY t.week_key DESC
+                            LIMIT 1
+                        ), 0)
+                    FROM habits h
+                    WHERE 1 = 1 {guild_condition} {habit_condition}
+                ''', (*params, *(habit_ids or ())))
+                return [
+                    {
+                        'habit_id': habit[0],
+                        'user_id': habit[1],
+                        'tracking_channel_id': habit[2],
+                        'habit_name': habit[3],
+                        'current_streak': habit[4]
+                    }
+                    for habit in cursor.fetchall()
+                ]
+        except sqlite3.Error as e:
+            logger.error("Error retrieving habit streaks: %s", e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=READ_ONLY_ROUTE)
+    def get_tracking_records(self, before_week_key=None):
+        """
+        Retrieve every tracking record of the guild in a single query, archived ones included, as numeric columns for the analytics.
+
+        :param before_week_key: Only the records of the weeks before this one, all the records if None.
+        :return: A list of (habit_id, tracking_channel_id, week, completed, streak) tuples, where week is
+                 year * 100 + week number and tracking_channel_id is 0 for records of removed habits.
+        """
+        # The unary plus keeps SQLite from using idx_tracking_guild_week: reading most of the table
+        # through the index costs a random table lookup per row, twice as slow as a sequential scan
+        guild_condition, params = self._get_guild_condition('+t.guild_id')
+        week_condition = ''
+        if before_week_key:
+            week_condition = 'AND t.week_key < ?'
+            params = (*params, before_week_key)
+        try:
+            with closing(self.get_read_conn().cursor()) as cursor:
+                cursor.execute(f'''
+                    SELECT
+                        t.habit_id,
+                        COALESCE(h.tracking_channel_id, 0),
+                        CAST(substr(t.week_key, 1, 4) AS INTEGER) * 100 + CAST(substr(t.week_key, 7) AS INTEGER),
+                        t.completed,
+                        COALESCE(t.streak, 0)
+                    FROM tracking_history t
+                    LEFT JOIN habits h ON h.id = t.habit_id
+                    WHERE 1 = 1 {guild_condition} {week_condition}
+                ''', params)
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error("Error retrieving tracking records: %s", e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
     def get_habit_completion_status(self, habit_id, week_key):
         """
         Check if the habit is marked as completed for a given habit ID and week.
+        Only the hot tracking table is read, the weeks before the archive horizon have no status.
         
         :param habit_id: The ID of the habit.
         :param week_key: The week key (e.g., '2024-W39') to check for.
@@ -592,7 +1061,970 @@ class DatabaseHandler:
                 else:
                     return None  # No entry found
         except sqlite3.Error as e:
-            logger.error(f"Error checking habit status for habit ID {habit_id} and week {week_key}: {e}")
+            logger.error("Error checking habit status for habit ID %s and week %s: %s", habit_id, week_key, e)
+            raise
+
+
+    #########################
+    ### BOT STATE METHODS ###
+    #########################
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def get_state(self, key):
+        """
+        Retrieve a value from the bot_state table.
+
+        :param key: The key of the state entry.
+        :return: The stored value or None if the key does not exist.
+        """
+        try:
+            with closing(self.conn.cursor()) as cursor:
+                cursor.execute('SELECT value FROM bot_state WHERE key = ?', (key,))
+                result = cursor.fetchone()
+                return result[0] if result else None
+        except sqlite3.Error as e:
+            logger.error("Error retrieving bot state '%s': %s", key, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def set_state(self, key, value):
+        """
+        Insert or replace a value in the bot_state table.
+
+        :param key: The key of the state entry.
+        :param value: The value to store.
+        """
+        try:
+            with self.conn:
+                self.conn.execute('''
+                    INSERT INTO bot_state (key, value)
+                    VALUES (?, ?)
+                    ON CONFLICT(key) DO UPDATE SET value=excluded.value
+                ''', (key, value))
+        except sqlite3.Error as e:
+            logger.error("Error storing bot state '%s': %s", key, e)
+            raise
+
+
+    #########################
+    ### JOB QUEUE METHODS ###
+    #########################
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def enqueue_job(self, kind, payload, idempotency_key=None, delay=0, max_attempts=5):
+        """
+        Add a job to the queue.
+
+        :param kind: The name of the job handler.
+        :param payload: JSON serializable arguments of the job.
+        :param idempotency_key: Unique key of the job, a job with an existing key is not added again.
+        :param delay: Seconds to wait before the job can run.
+        :param max_attempts: Number of attempts before the job is marked as failed.
+        :return: The ID of the new job, or None if a job with the same idempotency key exists.
+        """
+        now = time.time()
+        try:
+            with self.conn:
+                cursor = self.conn.execute('''
+                    INSERT INTO jobs (kind, payload, idempotency_key, max_attempts, run_at, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(idempotency_key) DO NOTHING
+                ''', (kind, json.dumps(payload), idempotency_key, max_attempts, now + delay, now))
+            if not cursor.rowcount:
+                logger.info("Job '%s' with key %s is already queued.", kind, idempotency_key)
+                return None
+            logger.debug("Queued job %s '%s'.", cursor.lastrowid, kind)
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.error("Error queueing job '%s': %s", kind, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def claim_job(self, worker_id, visibility_timeout):
+        """
+        Atomically take the next due job, or a running job whose worker did not finish it in time.
+
+        :param worker_id: The ID of the claiming worker.
+        :param visibility_timeout: Seconds the job stays invisible to the other workers.
+        :return: A dictionary with the job's id, kind, payload and attempts, or None if no job is due.
+        """
+        now = time.time()
+        try:
+            with self.conn:
+                job = self.conn.execute('''
+                    UPDATE jobs
+                    SET status = 'running', locked_by = ?, locked_until = ?, attempts = attempts + 1
+                    WHERE id = (
+                        SELECT id FROM jobs
+                        WHERE (status = 'queued' AND run_at <= ?) OR (status = 'running' AND locked_until <= ?)
+                        ORDER BY run_at
+                        LIMIT 1
+                    )
+                    RETURNING id, kind, payload, attempts, max_attempts
+                ''', (worker_id, now + visibility_timeout, now, now)).fetchone()
+            if not job:
+                return None
+            return {'id': job[0], 'kind': job[1], 'payload': json.loads(job[2]), 'attempts': job[3], 'max_attempts': job[4]}
+        except sqlite3.Error as e:
+            logger.error("Error claiming a job for worker %s: %s", worker_id, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def complete_job(self, job_id, worker_id):
+        """
+        Mark a job as done, unless another worker took it over after its visibility timeout.
+
+        :return: True if the job was marked as done.
+        """
+        try:
+            with self.conn:
+                cursor = self.conn.execute('''
+                    UPDATE jobs
+                    SET status = 'done', locked_until = NULL, finished_at = ?
+                    WHERE id = ? AND locked_by = ? AND status = 'running'
+                ''', (time.time(), job_id, worker_id))
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            logger.error("Error completing job %s: %s", job_id, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def retry_job(self, job_id, worker_id, error, delay):
+        """
+        Release a failed job to run again after `delay` seconds, or mark it as failed once its attempts are used up.
+
+        :return: The new status of the job, or None if another worker took it over.
+        """
+        now = time.time()
+        try:
+            with self.conn:
+                job = self.conn.execute('''
+                    UPDATE jobs
+                    SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                        run_at = ?, locked_by = NULL, locked_until = NULL, last_error = ?,
+                        finished_at = CASE WHEN attempts >= max_attempts THEN ? END
+                    WHERE id = ? AND locked_by = ? AND status = 'running'
+                    RETURNING status
+                ''', (now + delay, str(error), now, job_id, worker_id)).fetchone()
+            return job[0] if job else None
+        except sqlite3.Error as e:
+            logger.error("Error releasing job %s: %s", job_id, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def get_job(self, job_id):
+        try:
+            with closing(self.conn.cursor()) as cursor:
+                cursor.execute('''
+                    SELECT id, kind, payload, idempotency_key, status, attempts, max_attempts, run_at, last_error
+                    FROM jobs
+                    WHERE id = ?
+                ''', (job_id,))
+                job = cursor.fetchone()
+                if not job:
+                    return None
+                return {
+                    'id': job[0],
+                    'kind': job[1],
+                    'payload': json.loads(job[2]),
+                    'idempotency_key': job[3],
+                    'status': job[4],
+                    'attempts': job[5],
+                    'max_attempts': job[6],
+                    'run_at': job[7],
+                    'last_error': job[8],
+                }
+        except sqlite3.Error as e:
+            logger.error("Error retrieving job %s: %s", job_id, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def purge_finished_jobs(self, older_than_seconds):
+        """Delete the done and failed jobs finished more than `older_than_seconds` ago, freeing their idempotency keys."""
+        try:
+            with self.conn:
+                cursor = self.conn.execute('''
+                    DELETE FROM jobs
+                    WHERE status IN ('done', 'failed') AND finished_at < ?
+                ''', (time.time() - older_than_seconds,))
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error("Error purging finished jobs: %s", e)
+            raise
+
+
+    #######################
+    ### ARCHIVE METHODS ###
+    #######################
+    def get_archive_horizon(self, hot_weeks, now=None):
+        """
+        The first week kept in the hot tracking table.
+
+        :param hot_weeks: The number of weeks kept in the hot table, at least MIN_HOT_TRACKING_WEEKS.
+        :return: The week key of the horizon.
+        """
+        if hot_weeks < MIN_HOT_TRACKING_WEEKS:
+            raise ValueError(f"At least {MIN_HOT_TRACKING_WEEKS} weeks must stay in the hot tracking table.")
+        return ((now or datetime.now()) - timedelta(weeks=hot_weeks)).strftime("%Y-W%U")
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def archive_tracking(self, before_week_key):
+        """
+        Move the tracking records of every guild older than the given week to the archive database, in one transaction.
+
+        Moving the same weeks again is a no-op, so a retried archival does not change the history.
+        With the main database in WAL mode the transaction is atomic per file: after a crash between the two
+        commits the records are in both files until the next archival moves them again, the
+        tracking_history view reads them once.
+        A move sets the ARCHIVE_UPLOAD_PENDING_KEY state in the same transaction.
+        The freed pages are reclaimed with a VACUUM once they make up a quarter of the database,
+        so the uploaded backups shrink as well.
+
+        :param before_week_key: The horizon, records of this week and later stay in the hot table.
+        :return: The number of moved records.
+        """
+        try:
+            with self.conn:
+                self.conn.execute('''
+                    INSERT INTO archive.tracking_archive (habit_id, guild_id, channel_id, week_key, completed, unanswered, streak)
+                    SELECT habit_id, guild_id, channel_id, week_key, completed, unanswered, streak
+                    FROM main.tracking
+                    WHERE week_key < ?
+                    ON CONFLICT(habit_id, week_key) DO UPDATE SET
+                        channel_id=excluded.channel_id, completed=excluded.completed, unanswered=excluded.unanswered, streak=excluded.streak
+                ''', (before_week_key,))
+                moved = self.conn.execute('DELETE FROM main.tracking WHERE week_key < ?', (before_week_key,)).rowcount
+                if moved:
+                    self.conn.execute('''
+                        INSERT INTO bot_state (key, value) VALUES (?, '1')
+                        ON CONFLICT(key) DO UPDATE SET value=excluded.value
+                    ''', (ARCHIVE_UPLOAD_PENDING_KEY,))
+            if not moved:
+                return 0
+            logger.info("Archived %s tracking records of the weeks before %s.", moved, before_week_key)
+
+            free_pages = self.conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+            page_count = self.conn.execute('PRAGMA main.page_count').fetchone()[0]
+            if free_pages * 4 >= page_count:
+                self.conn.execute('VACUUM main')
+                logger.info("Vacuumed %s free pages of %s.", free_pages, page_count)
+            return moved
+        except sqlite3.Error as e:
+            logger.error("Error archiving the tracking records before %s: %s", before_week_key, e)
+            raise
+
+    ######################
+    ### EXPORT METHODS ###
+    ######################
+    def iter_export_rows(self, table, chunk_size=1000):
+        """
+        Stream the rows of the guild in an exported table, without loading the table in memory.
+
+        :param table: One of the EXPORT_COLUMNS tables. A guild's users are the owners of its habits.
+        :param chunk_size: The number of rows fetched at a time.
+        :return: A generator of row lists, with the EXPORT_COLUMNS of the table.
+        """
+        columns = ', '.join(EXPORT_COLUMNS[table])
+        if table == 'users' and self.guild_id is not None:
+            query = f'SELECT {columns} FROM users WHERE user_id IN (SELECT user_id FROM habits WHERE guild_id = ?) ORDER BY user_id'
+            params = (self.guild_id,)
+        elif table == 'users':
+            query, params = f'SELECT {columns} FROM users ORDER BY user_id', ()
+        elif table == 'habits':
+            guild_condition, params = self._get_guild_condition('guild_id')
+            query = f'SELECT {columns} FROM habits WHERE 1 = 1 {guild_condition} ORDER BY id'
+        else:
+            # Sequential scan of the hot and archived records, see get_tracking_records
+            guild_condition, params = self._get_guild_condition('+guild_id')
+            query = f'SELECT {columns} FROM tracking_history WHERE 1 = 1 {guild_condition}'
+
+        try:
+            with closing(self.get_read_conn().cursor()) as cursor:
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+        except sqlite3.Error as e:
+            logger.error("Error exporting table %s: %s", table, e)
+            raise
+
+    ######################
+    ### IMPORT METHODS ###
+    ######################
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def bulk_import(self, users, habits, tracking, channel_slots, chunk_size=1000, reservation_ids=()):
+        """
+        Import users, habits and tracking history in a single transaction.
+
+        Rows are inserted with executemany, the habits get new IDs and are put in the given channel slots,
+        and the streaks of the imported habits are computed from their history once everything is inserted.
+        Either everything is imported or nothing is.
+
+        :param users: Iterable of (user_id, username) rows. Existing users are kept.
+        :param habits: Iterable of (source_habit_id, user_id, habit_name, time_location, identity) rows.
+        :param tracking: Iterable of (source_habit_id, week_key, completed) rows. Rows of unknown habits are skipped.
+        :param channel_slots: The tracking channel ID of each imported habit, in order.
+        :param chunk_size: The number of habits whose streaks are computed at a time.
+        :param reservation_ids: The reservations of the channel slots (see reserve_channel_slot), which the habits take over.
+        :return: A dictionary with the number of imported users, habits and tracking records, and of skipped tracking records.
+        """
+        counts = {'users': 0, 'habits': 0, 'tracking': 0, 'skipped_tracking': 0}
+        channel_slots = iter(channel_slots)
+        habit_ids = {}  # source habit ID -> new habit ID
+        habit_owners = set()
+        channel_users = {}  # channel_id -> IDs of the owners of its imported habits, one per habit
+
+        try:
+            cursor = self.conn.cursor()
+            # Taking the write lock first keeps the new habit IDs free until the commit
+            cursor.execute('BEGIN IMMEDIATE')
+            # The owners and the channel rows of the habits are inserted after them, checked at the commit
+            cursor.execute('PRAGMA defer_foreign_keys = ON')
+            cursor.executemany('INSERT INTO users (user_id, username) VALUES (?, ?) ON CONFLICT(user_id) DO NOTHING', users)
+            counts['users'] = max(cursor.rowcount, 0)
+
+            cursor.execute('''
+                SELECT MAX(COALESCE((SELECT MAX(id) FROM habits), 0), COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'habits'), 0))
+            ''')
+            first_habit_id = cursor.fetchone()[0] + 1
+
+            def habit_rows():
+                for source_habit_id, user_id, habit_name, time_location, identity in habits:
+                    if source_habit_id in habit_ids:
+                        raise ValueError(f"Habit {source_habit_id} is imported twice.")
+                    habit_id = habit_ids[source_habit_id] = first_habit_id + len(habit_ids)
+                    channel_id = next(channel_slots, None)
+                    if channel_id is None:
+                        raise ValueError("There are fewer tracking channel slots than imported habits.")
+                    habit_owners.add(user_id)
+                    channel_users.setdefault(channel_id, []).append(user_id)
+                    yield habit_id, self.guild_id, user_id, channel_id, habit_name, time_location, identity
+
+            cursor.executemany('''
+                INSERT INTO habits (id, guild_id, user_id, tracking_channel_id, habit_name, time_location, identity)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', habit_rows())
+            counts['habits'] = len(habit_ids)
+            # Owners missing from the imported users
+            cursor.executemany('INSERT INTO users (user_id) VALUES (?) ON CONFLICT(user_id) DO NOTHING', ((user_id,) for user_id in habit_owners))
+            counts['users'] += max(cursor.rowcount, 0)
+
+            cursor.executemany('DELETE FROM channel_reservations WHERE id = ?', ((reservation_id,) for reservation_id in reservation_ids))
+            self._fill_channel_slots(cursor, channel_users)
+
+            def tracking_rows():
+                for source_habit_id, week_key, completed in tracking:
+                    habit_id = habit_ids.get(source_habit_id)
+                    if habit_id is None:
+                        counts['skipped_tracking'] += 1
+                        continue
+                    yield habit_id, self.guild_id, week_key, completed
+
+            cursor.executemany('''
+                INSERT INTO tracking (habit_id, guild_id, week_key, completed, streak)
+                VALUES (?, ?, ?, ?, 0)
+                ON CONFLICT(habit_id, week_key) DO UPDATE SET completed = excluded.completed
+            ''', tracking_rows())
+            counts['tracking'] = max(cursor.rowcount, 0)
+
+            cursor.execute('''
+                UPDATE tracking SET channel_id = (SELECT tracking_channel_id FROM habits WHERE id = tracking.habit_id)
+                WHERE habit_id BETWEEN ? AND ?
+            ''', (first_habit_id, first_habit_id + len(habit_ids) - 1))
+            self._recompute_streaks(cursor, first_habit_id, first_habit_id + len(habit_ids) - 1, chunk_size)
+            self._aggregate_weekly_rollups(cursor, 'h.id BETWEEN ? AND ?', (first_habit_id, first_habit_id + len(habit_ids) - 1))
+            self.conn.commit()
+        except (sqlite3.Error, ValueError) as e:
+            self.conn.rollback()
+            logger.error("Error importing data, nothing was imported: %s", e)
+            raise
+        finally:
+            cursor.close()
+
+        logger.info("Imported %s users, %s habits and %s tracking records (%s skipped).", counts['users'], counts['habits'], counts['tracking'], counts['skipped_tracking'])
+        return counts
+
+    def _fill_channel_slots(self, cursor, channel_users):
+        """Put the given users in the free user slots of their tracking channels, one statement for all the channels."""
+        slot_columns = [f"user{slot}_id" for slot in range(1, 9)]
+        updated_channels = []
+        for channel_id, user_ids in channel_users.items():
+            cursor.execute(f"SELECT {', '.join(slot_columns)} FROM tracking_channels WHERE channel_id = ?", (channel_id,))
+            channel = cursor.fetchone()
+            if channel is None:
+                cursor.execute('INSERT INTO tracking_channels (channel_id, guild_id) VALUES (?, ?)', (channel_id, self.guild_id))
+                channel = (None,) * len(slot_columns)
+            slots = list(channel)
+            pending_users = iter(user_ids)
+            for i, user in enumerate(slots):
+                if user is None:
+                    slots[i] = next(pending_users, None)
+            if next(pending_users, None) is not None:
+                raise ValueError(f"Tracking channel {channel_id} has no free slot left for its imported habits.")
+            updated_channels.append((*slots, channel_id))
+
+        cursor.executemany(f'''
+            UPDATE tracking_channels
+            SET {', '.join(f"{column} = ?" for column in slot_columns)}
+            WHERE channel_id = ?
+        ''', updated_channels)
+
+    def _recompute_streaks(self, cursor, first_habit_id, last_habit_id, chunk_size):
+        """Compute the streak of every tracking record of the given habit ID range, week by week."""
+        for chunk_start in range(first_habit_id, last_habit_id + 1, chunk_size):
+            cursor.execute('''
+                SELECT habit_id, week_key, completed
+                FROM tracking
+                WHERE habit_id BETWEEN ? AND ?
+                ORDER BY habit_id, week_key
+            ''', (chunk_start, min(chunk_start + chunk_size - 1, last_habit_id)))
+
+            streaks = []
+            last_habit_id_seen, last_streak_record = None, None
+            for habit_id, week_key, completed in cursor.fetchall():
+                if habit_id != last_habit_id_seen:
+                    last_habit_id_seen, last_streak_record = habit_id, None
+                streak = self._calculate_new_streak(completed, last_streak_record, week_key)
+                last_streak_record = (week_key, streak)
+                streaks.append((streak, habit_id, week_key))
+
+            cursor.executemany('UPDATE tracking SET streak = ? WHERE habit_id = ? AND week_key = ?', streaks)
+
+    ###########################
+    ### RESERVATION METHODS ###
+    ###########################
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def reserve_channel_slot(self, channel_ids, max_habits_per_channel, user_id=None):
+        """
+        Reserve a habit slot in the first of the given tracking channels with a free one.
+
+        The write lock is taken before the slots are counted, so concurrent reservations, from this process
+        or another one, never get the same slot. The slot is held until a habit is saved with the reservation
+        (see add_habit_with_data) or the reservation is released, or for CHANNEL_RESERVATION_SECONDS.
+
+        :param channel_ids: The IDs of the candidate channels, in order of preference.
+        :param max_habits_per_channel: The number of habits a channel holds.
+        :param user_id: The user the slot is reserved for.
+        :return: A (reservation_id, channel_id, free_slots) tuple, free_slots being the number of slots left in the
+                 channel, or None if all the channels are full.
+        """
+        channel_ids = list(channel_ids)
+        if not channel_ids:
+            return None
+        now = time.time()
+        try:
+            with self.conn:
+                self.conn.execute('BEGIN IMMEDIATE')
+                self.conn.execute('DELETE FROM channel_reservations WHERE expires_at <= ?', (now,))
+                used_slots = self.get_channel_used_slots(channel_ids)
+                channel_id = next((channel_id for channel_id in channel_ids if used_slots.get(channel_id, 0) < max_habits_per_channel), None)
+                if channel_id is None:
+                    return None
+                reservation_id = self.conn.execute('''
+                    INSERT INTO channel_reservations (channel_id, guild_id, user_id, expires_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (channel_id, self.guild_id, user_id, now + CHANNEL_RESERVATION_SECONDS)).lastrowid
+            logger.debug("Reserved a slot of channel %s for user %s (reservation %s).", channel_id, user_id, reservation_id)
+            return reservation_id, channel_id, max_habits_per_channel - used_slots.get(channel_id, 0) - 1
+        except sqlite3.Error as e:
+            logger.error("Error reserving a slot in channels %s: %s", channel_ids, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def release_channel_reservation(self, reservation_id):
+        """Free the slot of a reservation whose habit was not saved."""
+        try:
+            with self.conn:
+                self.conn.execute('DELETE FROM channel_reservations WHERE id = ?', (reservation_id,))
+        except sqlite3.Error as e:
+            logger.error("Error releasing reservation %s: %s", reservation_id, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def get_channel_used_slots(self, channel_ids):
+        """
+        Count the slots used by habits or by live reservations in the given tracking channels, in a single query.
+
+        :return: A dictionary mapping each channel ID with used slots to their count.
+        """
+        channel_ids = list(channel_ids)
+        if not channel_ids:
+            return {}
+        placeholders = ', '.join('?' for _ in channel_ids)
+        try:
+            with closing(self.conn.cursor()) as cursor:
+                cursor.execute(f'''
+                    SELECT channel_id, COUNT(*)
+                    FROM (
+                        SELECT tracking_channel_id AS channel_id FROM habits WHERE tracking_channel_id IN ({placeholders})
+                        UNION ALL
+                        SELECT channel_id FROM channel_reservations WHERE channel_id IN ({placeholders}) AND expires_at > ?
+                    )
+                    GROUP BY channel_id
+                ''', (*channel_ids, *channel_ids, time.time()))
+                return dict(cursor.fetchall())
+        except sqlite3.Error as e:
+            logger.error("Error counting the used slots of channels %s: %s", channel_ids, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def get_reservation_count(self):
+        """Count the live reservations of the handler's guild, i.e. the declarations being processed."""
+        try:
+            with closing(self.conn.cursor()) as cursor:
+                cursor.execute('SELECT COUNT(*) FROM channel_reservations WHERE guild_id IS ? AND expires_at > ?', (self.guild_id, time.time()))
+                return cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error("Error counting the reservations of guild %s: %s", self.guild_id, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def claim_channel_creation(self, channel_name, owner=None):
+        """
+        Claim the creation of a tracking channel of the handler's guild, for the processes and the workers alike.
+
+        The claim is held for CHANNEL_CREATION_SECONDS: a created channel stays claimed until every process
+        learns about it from its gateway events, a failed creation releases its claim (see release_channel_creations).
+
+        :param owner: Lets the same owner claim the creation again, e.g. the job it was claimed for when queued.
+        :return: True if the creation was claimed, False if another process or worker holds it.
+        """
+        now = time.time()
+        try:
+            with self.conn:
+                self.conn.execute('BEGIN IMMEDIATE')
+                self.conn.execute('DELETE FROM channel_creations WHERE expires_at <= ?', (now,))
+                claimed = self.conn.execute('''
+                    INSERT INTO channel_creations (guild_id, channel_name, owner, expires_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(guild_id, channel_name) DO UPDATE SET expires_at = excluded.expires_at
+                    WHERE owner = excluded.owner
+                ''', (self.guild_id, channel_name, owner, now + CHANNEL_CREATION_SECONDS)).rowcount
+            logger.debug("Creation of channel '%s' %s.", channel_name, "claimed" if claimed else "already claimed")
+            return bool(claimed)
+        except sqlite3.Error as e:
+            logger.error("Error claiming the creation of channel '%s': %s", channel_name, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def release_channel_creations(self, channel_names):
+        """Release the creation claims of the given channel names of the handler's guild."""
+        channel_names = list(channel_names)
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    'DELETE FROM channel_creations WHERE guild_id = ? AND channel_name = ?',
+                    ((self.guild_id, channel_name) for channel_name in channel_names)
+                )
+        except sqlite3.Error as e:
+            logger.error("Error releasing the creation claims of channels %s: %s", channel_names, e)
+            raise
+
+    ##########################
+    ### COMPACTION METHODS ###
+    ##########################
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def get_channel_habits(self, channel_ids):
+        """
+        Retrieve the habits of the given tracking channels in a single query.
+
+        :return: A dictionary mapping each channel ID with habits to its (habit_id, user_id) pairs, in habit ID order.
+        """
+        channel_ids = list(channel_ids)
+        if not channel_ids:
+            return {}
+        channel_habits = {}
+        try:
+            with closing(self.conn.cursor()) as cursor:
+                cursor.execute(f'''
+                    SELECT tracking_channel_id, id, user_id
+                    FROM habits
+                    WHERE tracking_channel_id IN ({', '.join('?' for _ in channel_ids)})
+                    ORDER BY id
+                ''', channel_ids)
+                for channel_id, habit_id, user_id in cursor.fetchall():
+                    channel_habits.setdefault(channel_id, []).append((habit_id, user_id))
+            return channel_habits
+        except sqlite3.Error as e:
+            logger.error("Error retrieving the habits of channels %s: %s", channel_ids, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def reassign_habits(self, moves, removed_channel_ids):
+        """
+        Move habits to other tracking channels and remove the emptied channels, in one transaction.
+
+        The user slots of the channels receiving habits are rewritten from the owners of their habits.
+
+        :param moves: (habit_id, from_channel_id, to_channel_id) tuples. A habit no longer in its
+                      from channel (e.g. edited meanwhile) cancels the whole reassignment with a ValueError.
+        :param removed_channel_ids: The channels to remove, they must not have habits left.
+        :raises ValueError: During a habit check session, whose messages are in the channels, or while
+                            declarations hold reserved slots, checked in the same transaction.
+        """
+        moves = list(moves)
+        removed_channel_ids = list(removed_channel_ids)
+        try:
+            with self.conn:
+                self.conn.execute('BEGIN IMMEDIATE')
+                with closing(self.conn.cursor()) as cursor:
+                    cursor.execute('SELECT 1 FROM habit_checks WHERE guild_id IS ? LIMIT 1', (self.guild_id,))
+                    if cursor.fetchone():
+                        raise ValueError("The tracking channels cannot be compacted during a habit check session.")
+                    cursor.execute('SELECT 1 FROM channel_reservations WHERE guild_id IS ? AND expires_at > ? LIMIT 1', (self.guild_id, time.time()))
+                    if cursor.fetchone():
+                        raise ValueError("Habit declarations are in progress, their channel slots would be lost.")
+                    cursor.executemany('''
+                        UPDATE habits SET tracking_channel_id = ?
+                        WHERE id = ? AND tracking_channel_id = ?
+                    ''', ((to_channel_id, habit_id, from_channel_id) for habit_id, from_channel_id, to_channel_id in moves))
+                    if cursor.rowcount != len(moves):
+                        raise ValueError(f"{len(moves) - cursor.rowcount} habits changed channel since the compaction was planned.")
+                    self._rewrite_channel_slots(cursor, sorted({to_channel_id for _, _, to_channel_id in moves}))
+                    cursor.execute(f'''
+                        DELETE FROM tracking_channels WHERE channel_id IN ({', '.join('?' for _ in removed_channel_ids)})
+                    ''', removed_channel_ids)
+            logger.info("Moved %s habits and removed %s tracking channels.", len(moves), len(removed_channel_ids))
+        except sqlite3.Error as e:
+            logger.error("Error reassigning habits to tracking channels: %s", e)
+            raise
+
+    def _rewrite_channel_slots(self, cursor, channel_ids):
+        """Set the user slots of the given channels to the owners of their habits, in habit ID order."""
+        slot_columns = [f"user{slot}_id" for slot in range(1, 9)]
+        channel_slots = []
+        for channel_id in channel_ids:
+            cursor.execute('SELECT user_id FROM habits WHERE tracking_channel_id = ? ORDER BY id LIMIT ?', (channel_id, len(slot_columns)))
+            owners = [row[0] for row in cursor.fetchall()]
+            channel_slots.append((*owners, *(None,) * (len(slot_columns) - len(owners)), channel_id))
+        cursor.executemany(f'''
+            UPDATE tracking_channels
+            SET {', '.join(f"{column} = ?" for column in slot_columns)}
+            WHERE channel_id = ?
+        ''', channel_slots)
+
+    #############################
+    ### CHECK SESSION METHODS ###
+    #############################
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def save_habit_checks(self, habit_checks):
+        """
+        Store the sent check messages of the habit check session of the handler's guild.
+
+        :param habit_checks: (habit_id, channel_id, message_id, week_key) tuples.
+        """
+        habit_checks = list(habit_checks)
+        try:
+            with self.conn:
+                self.conn.executemany('''
+                    INSERT INTO habit_checks (message_id, guild_id, habit_id, channel_id, week_key)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(message_id) DO NOTHING
+                ''', ((message_id, self.guild_id, habit_id, channel_id, week_key) for habit_id, channel_id, message_id, week_key in habit_checks))
+            logger.debug("Stored %s habit check messages.", len(habit_checks))
+        except sqlite3.Error as e:
+            logger.error("Error storing the habit check messages: %s", e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def get_habit_checks(self):
+        """
+        Retrieve the check messages of the habit check session of the handler's guild.
+
+        :return: A list of (habit_id, channel_id, message_id, week_key, closed) tuples, in message order.
+        """
+        guild_condition, params = self._get_guild_condition('guild_id')
+        try:
+            with closing(self.conn.cursor()) as cursor:
+                cursor.execute(f'''
+                    SELECT habit_id, channel_id, message_id, week_key, closed
+                    FROM habit_checks
+                    WHERE 1 = 1 {guild_condition}
+                    ORDER BY message_id
+                ''', params)
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error("Error retrieving the habit check messages: %s", e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def is_habit_check_open(self, habit_id, week_key):
+        """Whether the habit has a check of the given week in a session that is not closed yet, so it can be answered."""
+        try:
+            with closing(self.conn.cursor()) as cursor:
+                cursor.execute('SELECT 1 FROM habit_checks WHERE habit_id = ? AND week_key = ? AND closed = 0 LIMIT 1', (habit_id, week_key))
+                return cursor.fetchone() is not None
+        except sqlite3.Error as e:
+            logger.error("Error checking the habit check of habit %s for week %s: %s", habit_id, week_key, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def close_habit_checks(self):
+        """
+        Close the habit check session of the handler's guild, its checks cannot be answered anymore.
+
+        :return: The (habit_id, channel_id, message_id, week_key) tuples of the checks to finalize.
+        """
+        guild_condition, params = self._get_guild_condition('guild_id')
+        try:
+            with self.conn:
+                self.conn.execute(f'UPDATE habit_checks SET closed = 1 WHERE closed = 0 {guild_condition}', params)
+                return self.conn.execute(f'''
+                    SELECT habit_id, channel_id, message_id, week_key
+                    FROM habit_checks
+                    WHERE 1 = 1 {guild_condition}
+                    ORDER BY message_id
+                ''', params).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Error closing the habit check session: %s", e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def delete_habit_checks(self, week_keys):
+        """Forget the finalized check messages of the given weeks of the handler's guild."""
+        week_keys = list(week_keys)
+        guild_condition, params = self._get_guild_condition('guild_id')
+        try:
+            with self.conn:
+                self.conn.executemany(f'DELETE FROM habit_checks WHERE week_key = ? {guild_condition}', ((week_key, *params) for week_key in week_keys))
+        except sqlite3.Error as e:
+            logger.error("Error deleting the habit check messages of weeks %s: %s", week_keys, e)
+            raise
+
+    ######################
+    ### ROLLUP METHODS ###
+    ######################
+    def _get_outcome(self, completed, unanswered):
+        """The rollup outcome of a check, one of ROLLUP_OUTCOMES."""
+        return 'completed' if completed else 'unanswered' if unanswered else 'failed'
+
+    def _update_weekly_rollup(self, cursor, habit_id, week_key, previous_record, outcome, streak):
+        """
+        Move a check from its previous outcome and streak bucket, in the rollup of the channel it was counted in,
+        to the new ones in the rollup of its habit's current channel.
+        """
+        cursor.execute('SELECT tracking_channel_id, guild_id FROM habits WHERE id = ?', (habit_id,))
+        channel_id, guild_id = cursor.fetchone() or (None, None)
+        channel_deltas = {}
+        if channel_id is not None:
+            deltas = channel_deltas.setdefault(channel_id, dict.fromkeys(ROLLUP_OUTCOMES + ROLLUP_STREAK_COLUMNS, 0))
+            deltas[outcome] += 1
+            deltas[self._get_streak_column(streak)] += 1
+        if previous_record and previous_record[3] is not None:
+            previous_completed, previous_unanswered, previous_streak, previous_channel_id = previous_record
+            deltas = channel_deltas.setdefault(previous_channel_id, dict.fromkeys(ROLLUP_OUTCOMES + ROLLUP_STREAK_COLUMNS, 0))
+            deltas[self._get_outcome(previous_completed, previous_unanswered)] -= 1
+            deltas[self._get_streak_column(previous_streak or 0)] -= 1
+        columns = ROLLUP_OUTCOMES + ROLLUP_STREAK_COLUMNS
+        cursor.executemany(f'''
+            INSERT INTO weekly_rollups (channel_id, week_key, guild_id, {', '.join(columns)})
+            VALUES (?, ?, ?, {', '.join('?' for _ in columns)})
+            ON CONFLICT(channel_id, week_key) DO UPDATE SET {', '.join(f"{column} = {column} + excluded.{column}" for column in columns)}
+        ''', [(rollup_channel_id, week_key, guild_id, *(deltas[column] for column in columns)) for rollup_channel_id, deltas in channel_deltas.items()])
+
+    def _get_streak_column(self, streak):
+        """The ROLLUP_STREAK_COLUMNS bucket of a streak."""
+        return ROLLUP_STREAK_COLUMNS[bisect_right(ROLLUP_STREAK_BOUNDS, streak) - 1]
+
+    def _aggregate_weekly_rollups(self, cursor, habit_condition='1 = 1', params=()):
+        """Add the tracking history of the matching habits (`h` alias) to the weekly rollups of the channels it was counted in."""
+        bounds = ROLLUP_STREAK_BOUNDS + (None,)
+        streak_sums = [
+            f"SUM(COALESCE(t.streak, 0) >= {low}" + (f" AND COALESCE(t.streak, 0) < {high})" if high is not None else ")")
+            for low, high in zip(bounds, bounds[1:])
+        ]
+        columns = ROLLUP_OUTCOMES + ROLLUP_STREAK_COLUMNS
+        cursor.execute(f'''
+            INSERT INTO weekly_rollups (channel_id, week_key, guild_id, {', '.join(columns)})
+            SELECT t.channel_id, t.week_key, h.guild_id, SUM(t.completed), SUM(NOT t.completed AND NOT t.unanswered),
+                   SUM(NOT t.completed AND t.unanswered), {', '.join(streak_sums)}
+            FROM tracking_history t
+            JOIN habits h ON h.id = t.habit_id
+            WHERE t.channel_id IS NOT NULL AND {habit_condition}
+            GROUP BY t.channel_id, t.week_key
+            ON CONFLICT(channel_id, week_key) DO UPDATE SET {', '.join(f"{column} = {column} + excluded.{column}" for column in columns)}
+        ''', params)
+
+    def _get_rollup(self, row):
+        """The rollup dictionary of a (channel_id, week_key, *ROLLUP_OUTCOMES, *ROLLUP_STREAK_COLUMNS) row."""
+        rollup = dict(zip(('channel_id', 'week_key') + ROLLUP_OUTCOMES, row))
+        bounds = ROLLUP_STREAK_BOUNDS
+        labels = [str(low) if high - low == 1 else f"{low}-{high - 1}" for low, high in zip(bounds, bounds[1:])] + [f"{bounds[-1]}+"]
+        rollup['streaks'] = list(zip(labels, row[2 + len(ROLLUP_OUTCOMES):]))
+        return rollup
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def get_pending_digests(self, week_key):
+        """
+        Retrieve the rollups of the guild's channels for a week whose digest is not posted yet.
+
+        :return: A list of rollup dictionaries, with the outcome counts and the (label, count) streak buckets.
+        """
+        guild_condition, params = self._get_guild_condition('guild_id')
+        try:
+            with closing(self.conn.cursor()) as cursor:
+                cursor.execute(f'''
+                    SELECT channel_id, week_key, {', '.join(ROLLUP_OUTCOMES + ROLLUP_STREAK_COLUMNS)}
+                    FROM weekly_rollups
+                    WHERE week_key = ? AND digest_message_id IS NULL {guild_condition}
+                    ORDER BY channel_id
+                ''', (week_key, *params))
+                return [self._get_rollup(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error("Error retrieving the pending digests of week %s: %s", week_key, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def save_digest_messages(self, week_key, digest_messages):
+        """
+        Store the posted digest message of each channel, so a week's digest is posted once.
+
+        :param digest_messages: (channel_id, message_id) pairs.
+        """
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    'UPDATE weekly_rollups SET digest_message_id = ? WHERE channel_id = ? AND week_key = ?',
+                    ((message_id, channel_id, week_key) for channel_id, message_id in digest_messages)
+                )
+        except sqlite3.Error as e:
+            logger.error("Error saving the digest messages of week %s: %s", week_key, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def get_rollup_history(self, channel_id=None, weeks=8):
+        """
+        Retrieve the latest weekly rollups of a tracking channel, or of the guild summed over its channels.
+
+        :param channel_id: The tracking channel, the whole guild if None.
+        :param weeks: The number of weeks to retrieve.
+        :return: A list of rollup dictionaries, oldest week first, with channel_id set to the given one.
+        """
+        guild_condition, params = self._get_guild_condition('guild_id')
+        channel_condition = ''
+        if channel_id is not None:
+            channel_condition = 'AND channel_id = ?'
+            params = (*params, channel_id)
+        try:
+            with closing(self.conn.cursor()) as cursor:
+                cursor.execute(f'''
+                    SELECT ?, week_key, {', '.join(f"SUM({column})" for column in ROLLUP_OUTCOMES + ROLLUP_STREAK_COLUMNS)}
+                    FROM weekly_rollups
+                    WHERE 1 = 1 {guild_condition} {channel_condition}
+                    GROUP BY week_key
+                    ORDER BY week_key DESC
+                    LIMIT ?
+                ''', (channel_id, *params, weeks))
+                return [self._get_rollup(row) for row in reversed(cursor.fetchall())]
+        except sqlite3.Error as e:
+            logger.error("Error retrieving the rollup history: %s", e)
+            raise
+
+    #####################
+    ### GUILD METHODS ###
+    #####################
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def claim_guild_channels(self, channel_ids):
+        """
+        Assign the rows stored before the bot served several guilds to the handler's guild.
+
+        Tracking channel IDs are unique across Discord, so the channels of a guild identify its
+        tracking channels, their habits and the tracking records of those habits.
+
+        :param channel_ids: The IDs of the guild's text channels.
+        :return: The number of habits assigned to the guild.
+        """
+        channel_ids = list(channel_ids)
+        if self.guild_id is None or not channel_ids:
+            return 0
+        try:
+            with self.conn:
+                placeholders = ', '.join('?' for _ in channel_ids)
+                self.conn.execute(f'''
+                    UPDATE tracking_channels SET guild_id = ?
+                    WHERE guild_id IS NULL AND channel_id IN ({placeholders})
+                ''', (self.guild_id, *channel_ids))
+                claimed_habits = self.conn.execute(f'''
+                    UPDATE habits SET guild_id = ?
+                    WHERE guild_id IS NULL AND tracking_channel_id IN ({placeholders})
+                ''', (self.guild_id, *channel_ids)).rowcount
+                for table in ('main.tracking', 'archive.tracking_archive'):
+                    self.conn.execute(f'''
+                        UPDATE {table} SET guild_id = ?
+                        WHERE guild_id IS NULL AND habit_id IN (SELECT id FROM main.habits WHERE guild_id = ?)
+                    ''', (self.guild_id, self.guild_id))
+            if claimed_habits:
+                logger.info("Assigned %s habits without a guild to guild %s.", claimed_habits, self.guild_id)
+            return claimed_habits
+        except sqlite3.Error as e:
+            logger.error("Error assigning rows to guild %s: %s", self.guild_id, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def get_guild_objects(self):
+        """
+        Retrieve the IDs of the Discord objects stored for the handler's guild.
+
+        :return: A dictionary mapping each object name (e.g. 'tracking_category') to its ID.
+        """
+        try:
+            with closing(self.conn.cursor()) as cursor:
+                cursor.execute('SELECT name, object_id FROM guild_objects WHERE guild_id = ?', (self.guild_id,))
+                return dict(cursor.fetchall())
+        except sqlite3.Error as e:
+            logger.error("Error retrieving the objects of guild %s: %s", self.guild_id, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def save_guild_object(self, name, object_id):
+        """
+        Store the ID of a Discord object of the handler's guild, replacing the previous one of the same name.
+
+        :param name: The name of the object (e.g. 'tracking_category').
+        :param object_id: The ID of the object.
+        """
+        try:
+            with self.conn:
+                self.conn.execute('''
+                    INSERT INTO guild_objects (guild_id, name, object_id)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(guild_id, name) DO UPDATE SET object_id=excluded.object_id
+                ''', (self.guild_id, name, object_id))
+        except sqlite3.Error as e:
+            logger.error("Error storing object '%s' of guild %s: %s", name, self.guild_id, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def get_tracking_channel_roles(self):
+        """
+        Retrieve the tracking channels of the handler's guild with the IDs of their roles.
+
+        :return: A dictionary mapping each tracking channel ID to its role ID, None if it was never stored.
+        """
+        try:
+            with closing(self.conn.cursor()) as cursor:
+                cursor.execute('SELECT channel_id, role_id FROM tracking_channels WHERE guild_id = ?', (self.guild_id,))
+                return dict(cursor.fetchall())
+        except sqlite3.Error as e:
+            logger.error("Error retrieving the tracking channels of guild %s: %s", self.guild_id, e)
+            raise
+
+    @observe_duration(DB_QUERY_SECONDS, route=PRIMARY_ROUTE)
+    def save_tracking_channel(self, channel_id, role_id):
+        """
+        Store a tracking channel of the handler's guild with the ID of its role, when it is created.
+
+        :param channel_id: The ID of the tracking channel.
+        :param role_id: The ID of the role giving access to the channel.
+        """
+        try:
+            with self.conn:
+                self.conn.execute('''
+                    INSERT INTO tracking_channels (channel_id, guild_id, role_id)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(channel_id) DO UPDATE SET role_id=excluded.role_id
+                ''', (channel_id, self.guild_id, role_id))
+        except sqlite3.Error as e:
+            logger.error("Error storing tracking channel %s: %s", channel_id, e)
             raise
 
 
@@ -602,28 +2034,32 @@ class DatabaseHandler:
     def reset_db(self, second_check=False):
         if second_check:
             try:
+                # Dropping a referenced table first would break the foreign keys of the others
+                self.conn.execute('PRAGMA foreign_keys = OFF')
                 with closing(self.conn.cursor()) as cursor:
                     cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
                     tables = cursor.fetchall()
                     for table_name in tables:
                         if table_name[0] != 'sqlite_sequence':  # Skip the special sqlite_sequence table
                             cursor.execute(f"DROP TABLE IF EXISTS {table_name[0]};")
-                            logger.info(f"Dropped table {table_name[0]}")
+                            logger.info("Dropped table %s", table_name[0])
+                    cursor.execute("DELETE FROM archive.tracking_archive;")
                     self.conn.commit()
                     logger.info("Database reset completed.")
+                self.conn.execute('PRAGMA foreign_keys = ON')
                 # Optionally, reinitialize the tables after the reset
                 self._init_tables()
             except sqlite3.Error as e:
-                logger.error(f"Error resetting the database: {e}")
+                logger.error("Error resetting the database: %s", e)
                 raise
 
 
     def close(self):
         try:
             self.conn.close()
-            logger.info(f"Disconnected from the database: {self.db_name}")
+            logger.info("Disconnected from the database: %s", self.db_name)
         except sqlite3.Error as e:
-            print(f"Error closing the database connection: {e}")
+            logger.error("Error closing the database connection: %s", e)
             raise
 
 # Example Usage
@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+import re
+import time
+import zipfile
+import logging
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+IMPORT_TABLES = ('users', 'habits', 'tracking')
+# Columns an imported table must have, the others (e.g. the streaks, which are recomputed) are ignored
+REQUIRED_COLUMNS = {
+    'users': ('user_id',),
+    'habits': ('id', 'user_id', 'habit_name'),
+    'tracking': ('habit_id', 'week_key', 'completed'),
+}
+WEEK_KEY_PATTERN = re.compile(r'^\d{4}-W\d{2}$')
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'no', 'n'}
+
+
+class ImportArchive:
+    """
+    A zip archive with a users, habits and tracking file, in the layout of the /export archives.
+
+    The tables are read as streams of validated rows, so an archive can be read more than once without loading it in memory.
+    """
+    def __init__(self, fp):
+        self.zip_file = zipfile.ZipFile(fp)
+        names = set(self.zip_file.namelist())
+        for import_format in IMPORT_FORMATS:
+            if all(f"{table}.{import_format}" in names for table in IMPORT_TABLES):
+                self.format = import_format
+                break
+        else:
+            raise ValueError(f"The archive needs a {', '.join(IMPORT_TABLES)} file, all in one of these formats: {', '.join(IMPORT_FORMATS)}.")
+
+    def iter_records(self, table):
+        """Yield the records of a table as dictionaries, with their line number."""
+        with self.zip_file.open(f"{table}.{self.format}") as stream:
+            text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+            if self.format == 'csv':
+                reader = csv.DictReader(text_stream)
+                missing_columns = set(REQUIRED_COLUMNS[table]) - set(reader.fieldnames or ())
+                if missing_columns:
+                    raise ValueError(f"{table}.csv is missing the columns: {', '.join(sorted(missing_columns))}.")
+                for record in reader:
+                    yield reader.line_num, record
+            else:
+                for line_number, line in enumerate(text_stream, start=1):
+                    if line.strip():
+                        yield line_number, json.loads(line)
+
+    def _iter_rows(self, table, parse):
+        for line_number, record in self.iter_records(table):
+            try:
+                yield parse(record)
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Invalid record on line {line_number} of {table}.{self.format}: {e!r}") from None
+
+    def iter_users(self):
+        return self._iter_rows('users', lambda record: (int(record['user_id']), record.get('username') or None))
+
+    def iter_habits(self):
+        return self._iter_rows('habits', lambda record: (
+            int(record['id']), int(record['user_id']), require_text(record['habit_name']),
+            record.get('time_location') or '', record.get('identity') or '',
+        ))
+
+    def iter_tracking(self):
+        return self._iter_rows('tracking', lambda record: (int(record['habit_id']), parse_week_key(record['week_key']), parse_bool(record['completed'])))
+
+    def validate(self):
+        """
+        Read every table once, so an invalid archive is rejected before anything (e.g. a tracking channel) is made for it.
+
+        :return: The number of habits.
+        """
+        for _ in self.iter_users():
+            pass
+        habit_ids = set()
+        for source_habit_id, *_ in self.iter_habits():
+            if source_habit_id in habit_ids:
+                raise ValueError(f"Habit {source_habit_id} is imported twice.")
+            habit_ids.add(source_habit_id)
+        for _ in self.iter_tracking():
+            pass
+        return len(habit_ids)
+
+    def close(self):
+        self.zip_file.close()
+
+
+def require_text(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("empty text")
+    return value.strip()
+
+def parse_week_key(value):
+    if not isinstance(value, str) or not WEEK_KEY_PATTERN.match(value):
+        raise ValueError(f"week key {value!r} is not in the YYYY-Www format")
+    return value
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"{value!r} is not a boolean")
+
+
+def import_guild_data(db_name, guild_id, archive: ImportArchive, channel_slots, reservation_ids=()):
+    """
+    Import an archive into a guild in a single transaction. Meant to run in a worker thread.
+
+    :param channel_slots: The tracking channel ID of each imported habit, in order.
+    :param reservation_ids: The reservations of these slots, taken over by the habits.
+    :return: The counts of DatabaseHandler.bulk_import.
+    """
+    from data_handler import DatabaseHandler
+
+    start_time = time.perf_counter()
+    db_handler = DatabaseHandler(db_name=db_name, guild_id=guild_id)
+    try:
+        counts = db_handler.bulk_import(archive.iter_users(), archive.iter_habits(), archive.iter_tracking(), channel_slots, reservation_ids=reservation_ids)
+    finally:
+        db_handler.close()
+    logger.info("Imported an archive into guild %s in %.2fs.", guild_id, time.perf_counter() - start_time)
+    return counts
@@ -6,10 +6,15 @@ import logging
 import random
 import asyncio
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Habit embeds per page of /habits, the most a message can hold
+HABITS_PER_PAGE = 10
+# Total length of the embeds a message can hold
+MAX_MESSAGE_EMBED_LENGTH = 6000
+# Seconds the /habits buttons keep working, within the 15 minutes its response can be edited
+HABIT_VIEW_TIMEOUT = 600
+
 class DeclarationView(discord.ui.View):
     def __init__(self, handler: DeclarationHandler, user_id):
         super().__init__(timeout=None)
@@ -18,7 +23,7 @@ class DeclarationView(discord.ui.View):
 
         self.instructions_embed = self.create_instructions_embed()  # Create the embed during initialization
         self.full_form_embed = self.create_full_form_embed()
-        logger.info(f"DeclareView initialized with handler: %s", handler)
+        logger.info("DeclareView initialized with handler: %s", handler)
 
     async def disable_all_buttons(self):
         """Disable all buttons in the view."""
@@ -71,7 +76,7 @@ class DeclarationView(discord.ui.View):
     @discord.ui.button(label="Start Declaration", style=discord.ButtonStyle.success)
     async def declare_button_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user.id == self.user_id:
-            logger.debug(f"'Start Declaration' button clicked by {interaction.user.name} (ID: {interaction.user.id})")
+            logger.debug("'Start Declaration' button clicked by %s (ID: %s)", interaction.user.name, interaction.user.id)
     
             await self.handler.send_declaration_modal(interaction)
 
@@ -199,41 +204,76 @@ class HabitEditModal(discord.ui.Modal):
     
 
 class DetailedHabitCardView(discord.ui.View):
+    """
+    The habits of a user in a single message, up to HABITS_PER_PAGE embeds per page.
+
+    The habits and their streaks are loaded at once, and the embeds of a page are only rendered when it is
+    first shown. A page also ends before its embeds would exceed the length a message can hold.
+    """
     def __init__(self, guild, tracking_handler: TrackingHandler, declaration_handler: DeclarationHandler, user):
-        super().__init__(timeout=None)
+        super().__init__(timeout=HABIT_VIEW_TIMEOUT)
         self.guild = guild
         self.tracking_handler = tracking_handler
         self.declaration_handler = declaration_handler
         self.user = user
         self.user_id = user.id
+        self.interaction = None  # The /habits interaction, whose response is edited after a habit edit
+        self.page = 0
+        self.page_starts = [0]  # Index of the first habit of each rendered page, and of the next page
+        self.page_embeds = {}
 
         self.tracking_handler.db_handler.connect()
-        self.habit_ids = tracking_handler.db_handler.get_user_habit_ids(self.user_id)
-        self.habits = tracking_handler.db_handler.get_user_habits(self.user_id)
-        self.embeds = self.create_embed_for_all_habits()
-
-        # Create edit buttons for each habit
-        self.create_edit_buttons()
+        habits = tracking_handler.db_handler.get_user_habits(self.user_id)
+        streaks = {habit['habit_id']: habit['current_streak'] for habit in tracking_handler.db_handler.get_habit_streaks(habit['habit_id'] for habit in habits)}
         self.tracking_handler.db_handler.close()
 
-    def create_embed_for_all_habits(self):
-        embeds = []
-        for habit_id in self.habit_ids:
-            habit_data = self.tracking_handler.db_handler.get_habit_data(habit_id)
-            current_streak = self.tracking_handler.db_handler.get_current_streak(habit_id)
-            tracking_channel_id = habit_data['tracking_channel_id']
-            tracking_channel = self.guild.get_channel(tracking_channel_id)
-            if tracking_channel:
-                tracking_channel_name = self.guild.get_channel(tracking_channel_id).name
-            else:
-                logger.info(f"Tracking channel with id {tracking_channel_id} does not exist. ")
+        self.habits = []
+        for habit in habits:
+            if self.guild.get_channel(habit['tracking_channel_id']) is None:
+                logger.info("Tracking channel with id %s does not exist. ", habit['tracking_channel_id'])
                 continue
-
-            embed = self.create_embed(habit_data, current_streak, tracking_channel_name)
-            embeds.append(embed)
-        
+            habit['current_streak'] = streaks.get(habit['habit_id'], 0)
+            self.habits.append(habit)
+
+    def get_page_embeds(self, page):
+        """Render the embeds of a page, pages are rendered in order since each one starts where the previous one ended."""
+        if page not in self.page_embeds:
+            embeds, start = [], self.page_starts[page]
+            for habit in self.habits[start:start + HABITS_PER_PAGE]:
+                embed = self.create_embed(habit, habit['current_streak'], self.guild.get_channel(habit['tracking_channel_id']).name)
+                if embeds and sum(len(e) for e in embeds) + len(embed) > MAX_MESSAGE_EMBED_LENGTH:
+                    break
+                embeds.append(embed)
+            self.page_embeds[page] = embeds
+            if len(self.page_starts) == page + 1:
+                self.page_starts.append(start + len(embeds))
+        return self.page_embeds[page]
+
+    def show_page(self, page):
+        """Render a page and set the buttons of its habits and the paging buttons, returning its embeds."""
+        embeds = self.get_page_embeds(page)
+        self.page = page
+        start, end = self.page_starts[page], self.page_starts[page + 1]
+        self.clear_items()
+        for i, habit in enumerate(self.habits[start:end]):
+            button = discord.ui.Button(label=f"Edit {habit['habit_name']}"[:80], style=discord.ButtonStyle.secondary, row=i // 5)
+            button.callback = self.generate_edit_button_callback(start + i)
+            self.add_item(button)
+        if page > 0 or end < len(self.habits):
+            for label, target_page, disabled in (("◀ Previous", page - 1, page == 0), (f"{start + 1}-{end} of {len(self.habits)}", page, True), ("Next ▶", page + 1, end >= len(self.habits))):
+                button = discord.ui.Button(label=label, style=discord.ButtonStyle.primary, row=4, disabled=disabled)
+                button.callback = self.generate_page_button_callback(target_page)
+                self.add_item(button)
         return embeds
-    
+
+    def generate_page_button_callback(self, page):
+        async def callback(interaction: discord.Interaction):
+            if interaction.user.id != self.user_id:
+                await interaction.response.send_message("This button is not for you.", ephemeral=True)
+                return
+            await interaction.response.edit_message(embeds=self.show_page(page), view=self)
+        return callback
+
     def create_embed(self, habit_data, current_streak, tracking_channel_name):
         """Create and return the embed for the Habit Data."""
         embed = discord.Embed(
@@ -254,64 +294,36 @@ class DetailedHabitCardView(discord.ui.View):
         embed.set_thumbnail(url=self.get_random_image_url())  # Random image
         return embed 
 
-    def create_edit_buttons(self):
-        """Create an edit button for each habit."""
-        for habit_id in self.habit_ids:
-            button = discord.ui.Button(
-                label="Edit Habit",
-                style=discord.ButtonStyle.secondary
-            )
-            button.callback = self.generate_edit_button_callback(habit_id)
-            self.add_item(button)
-
-    def generate_edit_button_callback(self, habit_id):
+    def generate_edit_button_callback(self, habit_index):
         async def callback(interaction: discord.Interaction):
             if interaction.user.id == self.user_id:
-                self.tracking_handler.db_handler.connect()
-                logger.debug(f"'Edit Habit' button clicked by {interaction.user.name} (ID: {interaction.user.id}) for habit ID: {habit_id}")
-                habit_data = self.tracking_handler.db_handler.get_habit_data(habit_id)
-                tracking_channel_id = habit_data['tracking_channel_id']
+                habit = self.habits[habit_index]
+                logger.debug("'Edit Habit' button clicked by %s (ID: %s) for habit ID: %s", interaction.user.name, interaction.user.id, habit['habit_id'])
                 # Wait for the declaration modal to be submitted and handled
-                habit_data = await self.declaration_handler.send_habit_edit_modal(interaction, habit_data, tracking_channel_id)
-                logger.debug(f"Habit data after modal submission: {habit_data}")
+                habit_data = await self.declaration_handler.send_habit_edit_modal(interaction, habit, habit['tracking_channel_id'])
+                logger.debug("Habit data after modal submission: %s", habit_data)
                 
-                # Update the habit check message with the new data
-                await self.update_habit_check_message(interaction, habit_data, habit_id)
-                self.tracking_handler.db_handler.close()
+                # Show the edited habit in the /habits message
+                await self.update_habit_page(habit_index, habit_data)
             else:
                 await interaction.response.send_message("This button is not for you.", ephemeral=True)
         return callback
 
-    async def update_habit_check_message(self, interaction, habit_data, habit_id):
-        logger.debug(f"Initializing the new view for updated habit with habit_id: {habit_id}")
-        
-        # Create a new view for the updated habit
-        new_view = discord.ui.View(timeout=None)
-        
-        # Add the "Edit Habit" button for this habit
-        edit_button = discord.ui.Button(
-            label="Edit Habit",
-            style=discord.ButtonStyle.secondary
-        )
-        edit_button.callback = self.generate_edit_button_callback(habit_id)
-        new_view.add_item(edit_button)
-
-        # Generate the new embed with updated habit data
-        self.tracking_handler.db_handler.connect()
-        updated_habit_data = self.tracking_handler.db_handler.get_habit_data(habit_id)
-        current_streak = self.tracking_handler.db_handler.get_current_streak(habit_id)
-        tracking_channel_name = self.guild.get_channel(updated_habit_data['tracking_channel_id']).name
-        new_embed = self.create_embed(updated_habit_data, current_streak, tracking_channel_name)
-        self.tracking_handler.db_handler.close()
-
-        # Send a new message with the updated embed and view
-        await interaction.followup.send(
-            embed=new_embed,
-            view=new_view,
-            ephemeral=True  # Ephemeral message so only the user can see it
-        )
-        
-        logger.debug(f"New message sent with updated habit information for habit_id: {habit_id}")
+    async def update_habit_page(self, habit_index, habit_data):
+        """Update the cached habit with its edited declaration, then render its page again in the /habits message."""
+        self.habits[habit_index].update(habit_data['declaration'])
+        # The edited embeds may not fit on their pages anymore, the pages from this one on are laid out again
+        page = next(page for page in range(len(self.page_starts) - 1) if self.page_starts[page + 1] > habit_index)
+        for later_page in range(page, len(self.page_starts) - 1):
+            self.page_embeds.pop(later_page, None)
+        del self.page_starts[page + 1:]
+        embeds = self.show_page(page)
+        if self.interaction is None:
+            return
+        try:
+            await self.interaction.edit_original_response(embeds=embeds, view=self)
+        except discord.HTTPException as e:
+            logger.warning("Could not update the habits message of user %s: %s", self.user_id, e)
     
     def get_random_image_url(self):
         """Select a random image URL."""
@@ -331,7 +343,7 @@ class HabitCardView(discord.ui.View):
         self.user = user
 
         self.embed = self.create_embed()  # Create the embed during initialization
-        logger.debug(f"HabitCardView initialized")
+        logger.debug("HabitCardView initialized")
 
     async def disable_all_buttons(self):
         """Disable all buttons in the view."""
@@ -4,20 +4,20 @@ import os
 from tracking.channel_management import TrackingChannelManager
 import logging
 from data_handler import DatabaseHandler
+from guild_index import GuildIndex
 
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 class DeclarationHandler:
-    def __init__(self, guild: discord.Guild, habit_declaration_channel: str, habit_tracking_channels_prefix: str, habit_tracking_category_name: str):
+    def __init__(self, guild: discord.Guild, habit_declaration_channel: str, habit_tracking_channels_prefix: str, habit_tracking_category_name: str, use_job_queue: bool = False, guild_index: GuildIndex = None):
         self.guild = guild
         self.habit_declaration_channel = habit_declaration_channel
         self.habit_tracking_channels_prefix = habit_tracking_channels_prefix
-        self.tracking_channel_manager = TrackingChannelManager(guild, habit_tracking_channels_prefix, habit_tracking_category_name)
-        self.db_handler = DatabaseHandler()
-        logger.debug(f"DeclarationHandler initialized with channels: {habit_declaration_channel}, prefix: {habit_tracking_channels_prefix}")
+        guild_index = guild_index or GuildIndex(guild, habit_declaration_channel, habit_tracking_channels_prefix, habit_tracking_category_name)
+        self.tracking_channel_manager = TrackingChannelManager(guild, habit_tracking_channels_prefix, habit_tracking_category_name, use_job_queue, guild_index)
+        self.db_handler = DatabaseHandler(guild_id=guild.id)
+        logger.debug("DeclarationHandler initialized with channels: %s, prefix: %s", habit_declaration_channel, habit_tracking_channels_prefix)
 
     def init_tracking_handler(self, tracking_handler):
         self.tracking_handler = tracking_handler
@@ -27,36 +27,24 @@ class DeclarationHandler:
 
         # Initialize the view with the necessary parameters
         habit_view = DetailedHabitCardView(guild, tracking_handler, declaration_handler, interaction.user)
-        
-        # Send the first message to acknowledge the interaction
+        if not habit_view.habits:
+            await interaction.response.send_message("You have no habits yet, declare one with /declare!", ephemeral=True)
+            return
+
+        # All the habits in one message, the later pages are rendered when the user turns to them
         await interaction.response.send_message(
-            content=f"Getting habits for {interaction.user.mention}",
+            content=f"Habits of {interaction.user.mention}",
+            embeds=habit_view.show_page(0),
+            view=habit_view,
             ephemeral=True
         )
-
-        # Follow up with each habit embed and its corresponding button
-        for embed in habit_view.embeds:
-            habit_specific_view = discord.ui.View(timeout=None)
-            habit_id = habit_view.habit_ids[habit_view.embeds.index(embed)]
-            edit_button = discord.ui.Button(
-                label="Edit Habit",
-                style=discord.ButtonStyle.secondary
-            )
-            edit_button.callback = habit_view.generate_edit_button_callback(habit_id)
-            habit_specific_view.add_item(edit_button)
-
-            # Send each embed with its corresponding button as a follow-up message
-            await interaction.followup.send(
-                embed=embed,
-                view=habit_specific_view,
-                ephemeral=True
-            )
+        habit_view.interaction = interaction
 
 
     async def send_declaration_view(self, interaction: discord.Interaction):
         from declaration.components import DeclarationView
-        habit_declaration_channel = discord.utils.get(interaction.guild.text_channels, name=self.habit_declaration_channel)
-        if interaction.channel.name == self.habit_declaration_channel:
+        habit_declaration_channel = self.tracking_channel_manager.load_guild_index().declaration_channel
+        if habit_declaration_channel and interaction.channel.id == habit_declaration_channel.id:
             # Create the DeclarationView and its embed
             declaration_view = DeclarationView(self, interaction.user.id)
 
@@ -66,9 +54,10 @@ class DeclarationHandler:
                 view=declaration_view,
                 ephemeral=True
             )
-            logger.info(f"Declaration View Sent.")
+            logger.info("Declaration View Sent.")
         else:
-            await interaction.followup.send(f"Please declare your habit in {habit_declaration_channel.mention}", ephemeral=True)
+            channel_mention = habit_declaration_channel.mention if habit_declaration_channel else f"#{self.habit_declaration_channel}"
+            await interaction.followup.send(f"Please declare your habit in {channel_mention}", ephemeral=True)
 
     async def send_habit_edit_modal(self, interaction: discord.Interaction, habit_data, tracking_channel_id):
         from declaration.components import HabitEditModal
@@ -85,56 +74,71 @@ class DeclarationHandler:
         await interaction.response.send_modal(modal)
 
     async def handle_habit_submission(self, interaction: discord.Interaction, habit_data: dict, habit_id=None, predefined_tracking_channel: discord.TextChannel = None):
-        # Add the user to the database if they do not exist
-        self.db_handler.connect()
+        # Add the user to the database if they do not exist. The connection stays open, concurrent submissions share it
         self.db_handler.add_user(interaction.user.id, interaction.user.name)
 
-        logger.debug(f"Handling habit submission for user: {interaction.user.name} (ID: {interaction.user.id})")
-        habit_declaration_channel = discord.utils.get(interaction.guild.text_channels, name=self.habit_declaration_channel)
-        habit_tracking_channel = predefined_tracking_channel if predefined_tracking_channel else await self.tracking_channel_manager.get_or_create_tracking_channel()
-        
-        # If habit id is given, update the data
-        if habit_id:
-            self.db_handler.update_habit_with_data(habit_data, habit_tracking_channel.id, habit_id)
-            self.db_handler.close()
-            await interaction.response.send_message(f"Your habit has been updated", ephemeral=True)
-            return
-
-
-        if habit_declaration_channel:
-            logger.debug(f"Habit declaration channel found: {habit_declaration_channel.name}")
+        logger.debug("Handling habit submission for user: %s (ID: %s)", interaction.user.name, interaction.user.id)
+        habit_declaration_channel = self.tracking_channel_manager.load_guild_index().declaration_channel
+        reservation_id = None
+        if predefined_tracking_channel:
+            habit_tracking_channel = predefined_tracking_channel
         else:
-            logger.warning(f"Habit declaration channel '{self.habit_declaration_channel}' not found.")
+            # The slot is reserved before any Discord request, so simultaneous declarations cannot take the same one
+            habit_tracking_channel, reservation_id = await self.tracking_channel_manager.reserve_tracking_channel(interaction.user.id)
 
-        if habit_tracking_channel:
-            logger.debug(f"Habit tracking channel found: {habit_tracking_channel.name}")
-        else:
-            logger.warning(f"Habit tracking channel not found.")
+        try:
+            # If habit id is given, update the data
+            if habit_id:
+                self.db_handler.update_habit_with_data(habit_data, habit_tracking_channel.id, habit_id)
+                self._update_leaderboard(habit_id, habit_data, habit_tracking_channel.id)
+                await interaction.response.send_message(f"Your habit has been updated", ephemeral=True)
+                return
 
-        # Log declaration data
-        declaration_data = habit_data['declaration']
-        logger.debug(f"Declaration data: {declaration_data}")
 
-        from declaration.components import HabitCardView
-        habit_card_view = HabitCardView(self.tracking_handler, declaration_handler=self, user=interaction.user, habit_data=habit_data, tracking_channel_name=habit_tracking_channel.name)
+            if habit_declaration_channel:
+                logger.debug("Habit declaration channel found: %s", habit_declaration_channel.name)
+            else:
+                logger.warning("Habit declaration channel '%s' not found.", self.habit_declaration_channel)
 
-        # Send the message with both embeds
-        await interaction.response.send_message(
-            embed=habit_card_view.embed,  # Include both embeds
-            view=habit_card_view
-        )
-        
-        # Add the user to the habit-tracking channel
-        if habit_tracking_channel:
-            await self.tracking_channel_manager.assign_role_to_user_for_channel(interaction.user, habit_tracking_channel)
-            logger.debug(f"User {interaction.user.name} added to habit tracking channel: {habit_tracking_channel.name}")
+            if habit_tracking_channel:
+                logger.debug("Habit tracking channel found: %s", habit_tracking_channel.name)
+            else:
+                logger.warning("Habit tracking channel not found.")
 
-            # Add user to the tracking channel table
-            self.db_handler.add_user_to_tracking_channel(interaction.user.id, habit_tracking_channel.id)
+            # Log declaration data
+            declaration_data = habit_data['declaration']
+            logger.debug("Declaration data: %s", declaration_data)
 
-        # Save habit declaration to a database
-        self.db_handler.add_habit_with_data(habit_data, habit_tracking_channel.id)
-        self.db_handler.close()
+            from declaration.components import HabitCardView
+            habit_card_view = HabitCardView(self.tracking_handler, declaration_handler=self, user=interaction.user, habit_data=habit_data, tracking_channel_name=habit_tracking_channel.name)
+
+            # Send the message with both embeds
+            await interaction.response.send_message(
+                embed=habit_card_view.embed,  # Include both embeds
+                view=habit_card_view
+            )
+            
+            # Add the user to the habit-tracking channel
+            if habit_tracking_channel:
+                await self.tracking_channel_manager.assign_role_to_user_for_channel(interaction.user, habit_tracking_channel)
+                logger.debug("User %s added to habit tracking channel: %s", interaction.user.name, habit_tracking_channel.name)
+
+                # Add user to the tracking channel table
+                self.db_handler.add_user_to_tracking_channel(interaction.user.id, habit_tracking_channel.id)
+
+            # Save habit declaration to a database, the habit takes over the reserved slot
+            new_habit_id = self.db_handler.add_habit_with_data(habit_data, habit_tracking_channel.id, reservation_id)
+            reservation_id = None
+        finally:
+            if reservation_id is not None:
+                self.db_handler.release_channel_reservation(reservation_id)
+        self._update_leaderboard(new_habit_id, habit_data, habit_tracking_channel.id)
 
         await interaction.followup.send(f"{interaction.user.mention} Your habit has been declared, and you have been added to the {habit_tracking_channel.mention} channel for tracking your habit!", ephemeral=True)
         logger.debug("User notified of successful habit declaration.")
+
+    def _update_leaderboard(self, habit_id, habit_data, tracking_channel_id):
+        """Add a declared habit to the leaderboard, or move an edited one. An unloaded leaderboard reads it from the database later."""
+        leaderboard = self.tracking_handler.leaderboard
+        if leaderboard.loaded:
+            leaderboard.set_habit(int(habit_id), habit_data['metadata']['user_id'], tracking_channel_id, habit_data['declaration']['habit_name'])
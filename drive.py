@@ -8,8 +8,6 @@ import logging
 from datetime import datetime, timedelta
 import json
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Define the scope for Google Drive API access
@@ -39,18 +37,22 @@ def authenticate():
     return creds
 
 
-def generate_timestamped_name(base_name):
+def generate_timestamped_name(base_name, extension='.db'):
     """Generates a file name in the format discord_bot_timestamp.db"""
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    return f"{base_name}_{timestamp}.db"
+    return f"{base_name}_{timestamp}{extension}"
 
-def upload_file(file_path, folder_id, base_name):
-    """Uploads a file to a specific folder in Google Drive with a timestamped name."""
+def upload_file(file_path, folder_id, base_name, extension='.db'):
+    """
+    Uploads a file to a specific folder in Google Drive with a timestamped name.
+
+    :return: The name of the uploaded file.
+    """
     creds = authenticate()
     service = build('drive', 'v3', credentials=creds)
 
     # Generate a timestamped name for the file
-    new_file_name = generate_timestamped_name(base_name)
+    new_file_name = generate_timestamped_name(base_name, extension)
 
     # Prepare the file metadata and media for upload
     file_metadata = {
@@ -62,10 +64,11 @@ def upload_file(file_path, folder_id, base_name):
     try:
         # Upload the file to Google Drive
         file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-        logger.info(f'File uploaded successfully with ID: {file.get("id")} and name: {new_file_name}')
+        logger.info("File uploaded successfully with ID: %s and name: %s", file.get("id"), new_file_name)
     except Exception as e:
-        logger.error(f"Failed to upload file: {e}")
+        logger.error("Failed to upload file: %s", e)
         raise
+    return new_file_name
 
 def extract_timestamp(file_name):
     """Extracts the timestamp from the file name. Assumes the format is name_YYYY-MM-DD_HH-MM-SS.ext."""
@@ -75,6 +78,53 @@ def extract_timestamp(file_name):
         return match.group(1)
     return None
 
+def list_timestamped_files(folder_id, base_name, extension='.db', service=None):
+    """
+    Lists the files named base_name_YYYY-MM-DD_HH-MM-SS.ext in a Google Drive folder.
+
+    :return: A list of (file, timestamp) tuples sorted by timestamp, oldest first.
+    """
+    if service is None:
+        service = build('drive', 'v3', credentials=authenticate())
+
+    files = []
+    page_token = None
+    while True:
+        # Only the first 100 files are listed without paging, there are many more backups
+        results = service.files().list(
+            q=f"'{folder_id}' in parents and name contains '{base_name}_' and trashed = false",
+            spaces='drive',
+            fields="nextPageToken, files(id, name)",
+            pageSize=1000,
+            pageToken=page_token,
+        ).execute()
+        files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+    files_with_timestamps = []
+    for file in files:
+        timestamp = extract_timestamp(file['name'])
+        # The folder also holds the files of other base names, e.g. discord_bot_archive next to discord_bot
+        if timestamp and file['name'] == f"{base_name}_{timestamp}{extension}":
+            files_with_timestamps.append((file, timestamp))
+    files_with_timestamps.sort(key=lambda x: x[1])
+    return files_with_timestamps
+
+def download_file(file_id, download_path, service=None):
+    """Downloads a Google Drive file to the given path."""
+    if service is None:
+        service = build('drive', 'v3', credentials=authenticate())
+
+    request = service.files().get_media(fileId=file_id)
+    with io.FileIO(download_path, 'wb') as fh:
+        downloader = MediaIoBaseDownload(fh, request)
+        done = False
+        while not done:
+            status, done = downloader.next_chunk()
+            logger.info("Download progress: %s%% complete.", int(status.progress() * 100))
+
 def download_latest_file(folder_id, base_name, download_name):
     """Downloads the latest file matching the specified base name from Google Drive, ordered by the timestamp in the name."""
     creds = authenticate()
@@ -83,53 +133,24 @@ def download_latest_file(folder_id, base_name, download_name):
     logger.info("Fetching files from Google Drive...")
 
     try:
-        # List all files in the specified folder (no base_name filter)
-        results = service.files().list(
-            q=f"'{folder_id}' in parents",  # Only check for files in the specified folder
-            spaces='drive',
-            fields="files(id, name)",  # Request file id and name
-        ).execute()
-        files = results.get('files', [])
+        files_with_timestamps = list_timestamped_files(folder_id, base_name, service=service)
     except Exception as e:
-        logger.error(f"Failed to list files in Google Drive: {e}")
+        logger.error("Failed to list files in Google Drive: %s", e)
         return
 
-    if not files:
-        logger.info("No files found in the drive folder.")
-        raise FileNotFoundError("No matching files found in the drive folder.")
-    else:
-        logger.info(f"Found {len(files)} files in the folder.")
-
-    # Extract timestamps and sort files by the extracted timestamp
-    files_with_timestamps = []
-    for file in files:
-        timestamp = extract_timestamp(file['name'])
-        if timestamp:
-            files_with_timestamps.append((file, timestamp))
-    
     if not files_with_timestamps:
         logger.info("No files found with a valid timestamp in the name.")
         raise FileNotFoundError("No matching files found with a valid timestamp.")
+    logger.info("Found %s files in the folder.", len(files_with_timestamps))
 
-    # Sort files by timestamp in descending order (most recent first)
-    files_with_timestamps.sort(key=lambda x: x[1], reverse=True)
-    
-    # The latest file (first in the list)
-    latest_file = files_with_timestamps[0][0]
-    logger.info(f"Latest file found: {latest_file['name']} (ID: {latest_file['id']})")
+    # The latest file (last in the list)
+    latest_file = files_with_timestamps[-1][0]
+    logger.info("Latest file found: %s (ID: %s)", latest_file['name'], latest_file['id'])
 
     # Download the latest file
-    request = service.files().get_media(fileId=latest_file['id'])
     file_path = os.path.join(os.getcwd(), download_name)
-
-    with io.FileIO(file_path, 'wb') as fh:
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-            logger.info(f"Download progress: {int(status.progress() * 100)}% complete.")
-
-    logger.info(f"File '{latest_file['name']}' downloaded successfully to {file_path}")
+    download_file(latest_file['id'], file_path, service=service)
+    logger.info("File '%s' downloaded successfully to %s", latest_file['name'], file_path)
 
 def upload_file_as_biggest_entry(db_file_name, folder_id, base_name):
     """
@@ -150,7 +171,7 @@ def upload_file_as_biggest_entry(db_file_name, folder_id, base_name):
         ).execute()
         files = results.get('files', [])
     except Exception as e:
-        logger.error(f"Failed to list files in Google Drive: {e}")
+        logger.error("Failed to list files in Google Drive: %s", e)
         return
 
     if not files:
@@ -171,7 +192,7 @@ def upload_file_as_biggest_entry(db_file_name, folder_id, base_name):
         else:
             # Sort by the latest timestamp
             latest_timestamp = max(files_with_timestamps, key=lambda x: x[1])[1]
-            logger.info(f"Latest timestamp found: {latest_timestamp}")
+            logger.info("Latest timestamp found: %s", latest_timestamp)
 
     # Add 5 minutes to the latest timestamp
     new_timestamp = latest_timestamp + timedelta(minutes=1)
@@ -187,9 +208,9 @@ def upload_file_as_biggest_entry(db_file_name, folder_id, base_name):
     try:
         # Upload the file to Google Drive
         uploaded_file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-        logger.info(f'File uploaded successfully with ID: {uploaded_file.get("id")} and name: {new_file_name}')
+        logger.info("File uploaded successfully with ID: %s and name: %s", uploaded_file.get("id"), new_file_name)
     except Exception as e:
-        logger.error(f"Failed to upload file: {e}")
+        logger.error("Failed to upload file: %s", e)
         raise
 
 if __name__ == '__main__':
@@ -0,0 +1,140 @@
+import discord
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Names of the guild_objects rows
+TRACKING_CATEGORY_OBJECT = 'tracking_category'
+DECLARATION_CHANNEL_OBJECT = 'declaration_channel'
+
+
+def get_tracking_channel_number(channel, tracking_channel_prefix):
+    """Sort key of a tracking channel by the number in its name, channels without one sort last."""
+    suffix = channel.name[len(tracking_channel_prefix):].lstrip('-')
+    return (0, int(suffix)) if suffix.isdigit() else (1, channel.name)
+
+
+class GuildIndex:
+    """
+    The IDs of the category, channels and roles the bot uses in one guild.
+
+    The IDs are stored in the database when the objects are created, and kept current from the gateway
+    channel and role events. Lookups then go through the guild's caches, which are keyed by ID, instead of
+    scanning the guild's channels and roles by name, and still find renamed channels.
+    Objects created before their IDs were stored are found by name once, when the index is loaded.
+    """
+    def __init__(self, guild: discord.Guild, declaration_channel_name: str, tracking_channel_prefix: str, category_name: str):
+        self.guild = guild
+        self.declaration_channel_name = declaration_channel_name
+        self.tracking_channel_prefix = tracking_channel_prefix
+        self.category_name = category_name
+        self.loaded = False
+        self.category_id = None
+        self.declaration_channel_id = None
+        self.tracking_role_ids = {}  # tracking channel ID -> role ID, None if the role is unknown
+
+    def load(self, db_handler):
+        """
+        Load the stored IDs, then look up and store the IDs of the objects created before they were stored.
+
+        :param db_handler: A DatabaseHandler scoped to the guild.
+        """
+        objects = db_handler.get_guild_objects()
+        self.category_id = self._find_object(db_handler, objects, TRACKING_CATEGORY_OBJECT, self.guild.categories, self.category_name)
+        self.declaration_channel_id = self._find_object(db_handler, objects, DECLARATION_CHANNEL_OBJECT, self.guild.text_channels, self.declaration_channel_name)
+
+        self.tracking_role_ids = db_handler.get_tracking_channel_roles()
+        category = self.category
+        for channel in (category.text_channels if category else []):
+            if channel.name.startswith(self.tracking_channel_prefix):
+                self.tracking_role_ids.setdefault(channel.id, None)
+        for channel_id, role_id in self.tracking_role_ids.items():
+            channel = self.guild.get_channel(channel_id)
+            if channel is None or (role_id is not None and self.guild.get_role(role_id)):
+                continue
+            role = discord.utils.get(self.guild.roles, name=channel.name)
+            if role:
+                self.tracking_role_ids[channel_id] = role.id
+                db_handler.save_tracking_channel(channel_id, role.id)
+        self.loaded = True
+        logger.info("Guild index loaded for guild %s: %s tracking channels.", self.guild.id, len(self.tracking_role_ids))
+
+    def _find_object(self, db_handler, objects, object_name, candidates, name):
+        if name is None:
+            return None
+        object_id = objects.get(object_name)
+        if object_id is not None and self.guild.get_channel(object_id):
+            return object_id
+        found = discord.utils.get(candidates, name=name)
+        if found is None:
+            logger.warning("Could not find '%s' in guild %s.", name, self.guild.id)
+            return None
+        db_handler.save_guild_object(object_name, found.id)
+        return found.id
+
+    @property
+    def category(self):
+        return self.guild.get_channel(self.category_id) if self.category_id else None
+
+    @property
+    def declaration_channel(self):
+        return self.guild.get_channel(self.declaration_channel_id) if self.declaration_channel_id else None
+
+    def get_tracking_channels(self):
+        """The existing tracking channels, in channel number order."""
+        channels = (self.guild.get_channel(channel_id) for channel_id in self.tracking_role_ids)
+        return sorted((channel for channel in channels if channel), key=lambda channel: get_tracking_channel_number(channel, self.tracking_channel_prefix))
+
+    def get_role(self, channel_id):
+        """The role giving access to a tracking channel, None if it is unknown."""
+        role_id = self.tracking_role_ids.get(channel_id)
+        return self.guild.get_role(role_id) if role_id else None
+
+    def add_tracking_channel(self, channel_id, role_id):
+        self.tracking_role_ids[channel_id] = role_id
+
+    def remove_tracking_channel(self, channel_id):
+        self.tracking_role_ids.pop(channel_id, None)
+
+    ######################
+    ### GATEWAY EVENTS ###
+    ######################
+    def on_channel_create(self, channel):
+        """Track the channels created outside of this process, e.g. by a worker or by hand."""
+        if not self.loaded:
+            return
+        if isinstance(channel, discord.CategoryChannel):
+            if self.category_id is None and channel.name == self.category_name:
+                self.category_id = channel.id
+        elif self.declaration_channel_id is None and channel.name == self.declaration_channel_name:
+            self.declaration_channel_id = channel.id
+        elif (channel.category_id == self.category_id and channel.name.startswith(self.tracking_channel_prefix)
+                and channel.id not in self.tracking_role_ids):
+            # The channel's role is among its permission overwrites
+            role = next((target for target in channel.overwrites if isinstance(target, discord.Role) and target.name == channel.name), None)
+            self.tracking_role_ids[channel.id] = role.id if role else None
+            logger.info("Tracking channel '%s' added to the index of guild %s.", channel.name, self.guild.id)
+
+    def on_channel_delete(self, channel):
+        if channel.id == self.category_id:
+            self.category_id = None
+        elif channel.id == self.declaration_channel_id:
+            self.declaration_channel_id = None
+        else:
+            self.remove_tracking_channel(channel.id)
+
+    def on_role_create(self, role):
+        """Link a role created after its tracking channel, by name since it is new."""
+        if not self.loaded:
+            return
+        for channel_id, role_id in self.tracking_role_ids.items():
+            channel = self.guild.get_channel(channel_id) if role_id is None else None
+            if channel and channel.name == role.name:
+                self.tracking_role_ids[channel_id] = role.id
+                return
+
+    def on_role_delete(self, role):
+        for channel_id, role_id in self.tracking_role_ids.items():
+            if role_id == role.id:
+                self.tracking_role_ids[channel_id] = None
+                return
@@ -0,0 +1,92 @@
+import discord
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class GuildHandlers:
+    """The declaration and tracking handlers serving one guild, with the index of the guild's objects they share."""
+    def __init__(self, guild: discord.Guild, declaration_handler, tracking_handler, guild_index):
+        self.guild = guild
+        self.declaration_handler = declaration_handler
+        self.tracking_handler = tracking_handler
+        self.guild_index = guild_index
+
+    def rebind(self, guild: discord.Guild):
+        """Point the handlers to a new Guild object of the same guild, keeping their state (e.g. a running habit check)."""
+        self.guild = guild
+        for handler in (self.declaration_handler, self.declaration_handler.tracking_channel_manager,
+                        self.tracking_handler, self.tracking_handler.tracking_channel_manager,
+                        self.tracking_handler.member_resolver, self.guild_index):
+            handler.guild = guild
+
+
+class GuildRegistry:
+    """
+    Keeps the handlers of every guild the bot is in, creating them the first time a guild is seen.
+
+    Each guild gets its own DeclarationHandler and TrackingHandler, whose database handlers are scoped to the guild.
+    """
+    def __init__(self, habit_declaration_channel: str, habit_tracking_channels_prefix: str, habit_tracking_category_name: str, use_job_queue: bool = False):
+        self.habit_declaration_channel = habit_declaration_channel
+        self.use_job_queue = use_job_queue
+        self.habit_tracking_channels_prefix = habit_tracking_channels_prefix
+        self.habit_tracking_category_name = habit_tracking_category_name
+        self._handlers = {}  # guild_id -> GuildHandlers
+
+    def get(self, guild: discord.Guild) -> GuildHandlers:
+        """
+        Return the handlers of the given guild, creating them on first use.
+
+        :param guild: The guild to serve.
+        :return: The GuildHandlers of the guild.
+        """
+        handlers = self._handlers.get(guild.id)
+        if handlers is None:
+            handlers = self._handlers[guild.id] = self._create_handlers(guild)
+        elif handlers.guild is not guild:
+            handlers.rebind(guild)
+        return handlers
+
+    def _create_handlers(self, guild: discord.Guild) -> GuildHandlers:
+        from declaration.declaration_handler import DeclarationHandler
+        from tracking.tracking_handler import TrackingHandler
+        from data_handler import DatabaseHandler
+        from guild_index import GuildIndex
+
+        guild_index = GuildIndex(guild, self.habit_declaration_channel, self.habit_tracking_channels_prefix, self.habit_tracking_category_name)
+        declaration_handler = DeclarationHandler(guild, self.habit_declaration_channel, self.habit_tracking_channels_prefix, self.habit_tracking_category_name, self.use_job_queue, guild_index)
+        tracking_handler = TrackingHandler(guild, declaration_handler, self.habit_tracking_channels_prefix, self.habit_tracking_category_name, self.use_job_queue, guild_index)
+        declaration_handler.init_tracking_handler(tracking_handler)
+
+        # Rows stored before the bot served several guilds belong to the guild owning their tracking channel
+        db_handler = DatabaseHandler(guild_id=guild.id)
+        try:
+            db_handler.claim_guild_channels(channel.id for channel in guild.text_channels)
+            guild_index.load(db_handler)
+        finally:
+            db_handler.close()
+
+        logger.info("Handlers initialized for guild %s (ID: %s).", guild.name, guild.id)
+        return GuildHandlers(guild, declaration_handler, tracking_handler, guild_index)
+
+    def remove(self, guild_id):
+        """Drop the handlers of a guild the bot left. Its data stays in the database."""
+        handlers = self._handlers.pop(guild_id, None)
+        if handlers:
+            logger.info("Handlers removed for guild %s (ID: %s).", handlers.guild.name, guild_id)
+        return handlers
+
+    def get_index(self, guild_id):
+        """The index of a guild whose handlers exist, for the gateway events. None otherwise."""
+        handlers = self._handlers.get(guild_id)
+        return handlers.guild_index if handlers else None
+
+    def tracking_handlers(self):
+        return [handlers.tracking_handler for handlers in self._handlers.values()]
+
+    def __contains__(self, guild_id):
+        return guild_id in self._handlers
+
+    def __len__(self):
+        return len(self._handlers)
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import tempfile
+import time
+import discord
+from jobs.worker import job_handler
+from monitoring import metrics
+import logging
+logger = logging.getLogger(__name__)
+
+
+@job_handler('backup.upload')
+async def upload_backup(context, payload):
+    """
+    Upload the pages of the database changed since the last backup to Google Drive,
+    or a new base snapshot every BACKUP_DELTAS_PER_BASE backups.
+    """
+    import backup
+    import drive
+
+    db_name = context.db_name or os.environ['DISCORD_BOT_DB_NAME']
+    db_prefix = os.environ['DISCORD_BOT_DB_PREFIX']
+    start_time = time.perf_counter()
+    try:
+        with tempfile.TemporaryDirectory() as staging_dir:
+            prepared = await asyncio.to_thread(backup.prepare_backup, db_name, staging_dir)
+            if prepared['path'] is None:
+                logger.info("%s did not change since its last backup.", db_name)
+                return
+            if prepared['kind'] == 'base':
+                base_name, extension = db_prefix, '.db'
+            else:
+                base_name, extension = backup.get_delta_base_name(db_prefix), backup.DELTA_EXTENSION
+            uploaded_name = await asyncio.to_thread(drive.upload_file, prepared['path'], os.environ['DRIVE_FOLDER_ID'], base_name, extension)
+            backup.commit_backup(db_name, prepared, uploaded_name)
+            metrics.BACKUP_SIZE_BYTES.set(os.path.getsize(prepared['path']))
+        metrics.BACKUPS.inc(status='success')
+        logger.info("Uploaded a %s backup of %s with %s pages to Google Drive.", prepared['kind'], db_name, prepared['pages'])
+    except Exception:
+        metrics.BACKUPS.inc(status='failure')
+        raise
+    finally:
+        metrics.BACKUP_SECONDS.observe(time.perf_counter() - start_time)
+
+def move_to_archive(db_name, before_week_key):
+    """Archive the old tracking records on a connection of its own, so it can run in a worker thread."""
+    from data_handler import DatabaseHandler, ARCHIVE_UPLOAD_PENDING_KEY
+
+    db_handler = DatabaseHandler(db_name=db_name)
+    try:
+        db_handler.archive_tracking(before_week_key)
+        # Still pending if the upload of a previous attempt failed after the move
+        return db_handler.get_state(ARCHIVE_UPLOAD_PENDING_KEY) == '1'
+    finally:
+        db_handler.close()
+
+@job_handler('tracking.archive')
+async def archive_tracking(context, payload):
+    """
+    Move the tracking records older than the hot horizon to the archive database,
+    then upload the archive to Google Drive if it changed since its last upload.
+
+    The regular backups only upload the main database, the archive only changes here.
+    """
+    import drive
+    from data_handler import DatabaseHandler, ARCHIVE_UPLOAD_PENDING_KEY, get_archive_db_name
+
+    db_name = context.db_name or os.environ['DISCORD_BOT_DB_NAME']
+    if not await asyncio.to_thread(move_to_archive, db_name, payload['before_week_key']):
+        return
+    await asyncio.to_thread(drive.upload_file, get_archive_db_name(db_name), os.environ['DRIVE_FOLDER_ID'], f"{os.environ['DISCORD_BOT_DB_PREFIX']}_archive")
+    db_handler = DatabaseHandler(db_name=db_name)
+    try:
+        db_handler.set_state(ARCHIVE_UPLOAD_PENDING_KEY, '0')
+    finally:
+        db_handler.close()
+    logger.info("Uploaded the tracking archive to Google Drive.")
+
+@job_handler('habit_check.finalize')
+async def finalize_habit_check(context, payload):
+    """
+    End a guild's habit check session: disable the buttons of every check message,
+    mark the checks nobody answered as failed, then post the weekly digest of each channel.
+
+    Every step is idempotent, so a retried job does not change the already finalized checks nor post a digest twice.
+    """
+    from data_handler import DatabaseHandler
+    from tracking.components import build_disabled_check_view
+    from tracking.digest import send_weekly_digests
+
+    disabled_view = build_disabled_check_view()
+    for check in payload['checks']:
+        if not check['message_id']:
+            continue
+        message = context.client.get_partial_messageable(check['channel_id']).get_partial_message(check['message_id'])
+        try:
+            await message.edit(view=disabled_view)
+        except discord.NotFound:
+            logger.warning("Habit check message %s in channel %s no longer exists.", check['message_id'], check['channel_id'])
+
+    db_handler = DatabaseHandler(db_name=context.db_name, guild_id=payload['guild_id'])
+    try:
+        failed = 0
+        for check in payload['checks']:
+            if db_handler.get_habit_completion_status(check['habit_id'], check['week_key']) is None:
+                db_handler.mark_habit_completed(check['habit_id'], completed=False, week_key=check['week_key'], unanswered=True)
+                failed += 1
+        logger.info("Finalized %s habit checks of guild %s, %s were unanswered.", len(payload['checks']), payload['guild_id'], failed)
+
+        # The digests already posted by a previous attempt are not pending anymore
+        if payload['checks']:
+            week_key = payload['checks'][0]['week_key']
+            digest_messages = await send_weekly_digests(db_handler.get_pending_digests(week_key), context.client.get_partial_messageable)
+            db_handler.save_digest_messages(week_key, digest_messages)
+        # The stored session is finalized
+        db_handler.delete_habit_checks({check['week_key'] for check in payload['checks']})
+    finally:
+        db_handler.close()
+
+@job_handler('channel.provision')
+async def provision_tracking_channel(context, payload):
+    """Create a tracking channel and its role ahead of the declaration that will need it."""
+    from tracking.channel_management import create_tracking_channel
+    from data_handler import DatabaseHandler
+
+    client = context.client
+    guild = client.get_guild(payload['guild_id']) or await client.fetch_guild(payload['guild_id'])
+    existing_channels = await guild.fetch_channels()
+    if discord.utils.get(existing_channels, name=payload['channel_name']):
+        logger.info("Tracking channel '%s' already exists in guild %s.", payload['channel_name'], guild.id)
+        return
+
+    bot_member = guild.me or discord.Object(id=client.user.id)
+    db_handler = DatabaseHandler(db_name=context.db_name, guild_id=guild.id)
+    try:
+        # Claimed for this job when it was queued, or by a declaration that creates the channel itself
+        if not db_handler.claim_channel_creation(payload['channel_name'], owner='channel.provision'):
+            logger.info("Tracking channel '%s' is being created by another process.", payload['channel_name'])
+            return
+        try:
+            # The bot learns about the channel from its gateway events, the stored IDs outlive a restart
+            await create_tracking_channel(guild, discord.Object(id=payload['category_id']), payload['channel_name'], bot_member, db_handler)
+        except Exception:
+            # A declaration needing the channel may create it before the job is retried
+            db_handler.release_channel_creations([payload['channel_name']])
+            raise
+    finally:
+        db_handler.close()
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import random
+import socket
+import time
+import uuid
+from monitoring import metrics
+import logging
+logger = logging.getLogger(__name__)
+
+# Seconds a claimed job stays invisible to the other workers before it is considered abandoned
+DEFAULT_VISIBILITY_TIMEOUT = 15 * 60
+DEFAULT_POLL_INTERVAL = 2.0
+# Retry delays grow as BACKOFF_BASE_SECONDS * 2^(attempt - 1), up to BACKOFF_MAX_SECONDS
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 30 * 60
+# Done and failed jobs are kept this long, their idempotency keys block duplicates until then
+FINISHED_JOB_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+JOB_HANDLERS = {}  # kind -> async handler(context, payload)
+
+
+def job_handler(kind):
+    """Register the decorated coroutine function as the handler of the jobs of the given kind."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+def get_retry_delay(attempts):
+    """Exponential backoff with jitter for a job that failed its `attempts`-th attempt."""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class JobContext:
+    """What the job handlers can use: a logged in Discord client and the database name."""
+    def __init__(self, client, db_name=None):
+        self.client = client
+        self.db_name = db_name
+
+
+class JobWorker:
+    """
+    Pulls jobs from the queue in the database and runs their handlers.
+
+    Several workers, in this process or in others, can share the queue. A claimed job is invisible to the
+    other workers for `visibility_timeout` seconds, failed jobs are retried with exponential backoff, and a
+    job whose worker died is picked up again once its visibility timeout expires.
+    """
+    def __init__(self, client, db_name=None, worker_id=None, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, poll_interval=DEFAULT_POLL_INTERVAL):
+        from data_handler import DatabaseHandler
+        from jobs import handlers  # Registers the job handlers
+
+        self.context = JobContext(client, db_name)
+        self.db_handler = DatabaseHandler(db_name=db_name)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self._stopped = asyncio.Event()
+
+    async def run(self):
+        logger.info("Job worker %s started.", self.worker_id)
+        self.db_handler.purge_finished_jobs(FINISHED_JOB_RETENTION_SECONDS)
+        while not self._stopped.is_set():
+            try:
+                ran_job = await self.run_once()
+            except Exception as e:
+                logger.error("Job worker %s failed to poll the queue: %s", self.worker_id, e)
+                ran_job = False
+            if not ran_job:
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        logger.info("Job worker %s stopped.", self.worker_id)
+
+    def stop(self):
+        self._stopped.set()
+
+    async def run_once(self):
+        """
+        Claim and run one due job.
+
+        :return: True if a job was run, False if the queue had no due job.
+        """
+        job = self.db_handler.claim_job(self.worker_id, self.visibility_timeout)
+        if not job:
+            return False
+
+        handler = JOB_HANDLERS.get(job['kind'])
+        start_time = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for job kind '{job['kind']}'.")
+            logger.info("Running job %s '%s' (attempt %s/%s).", job['id'], job['kind'], job['attempts'], job['max_attempts'])
+            await handler(self.context, job['payload'])
+        except Exception as e:
+            status = self.db_handler.retry_job(job['id'], self.worker_id, e, get_retry_delay(job['attempts']))
+            metrics.JOBS.inc(kind=job['kind'], status='failed' if status == 'failed' else 'retried')
+            logger.error("Job %s '%s' failed (attempt %s/%s, now %s): %s", job['id'], job['kind'], job['attempts'], job['max_attempts'], status, e)
+        else:
+            if self.db_handler.complete_job(job['id'], self.worker_id):
+                metrics.JOBS.inc(kind=job['kind'], status='done')
+                logger.info("Job %s '%s' done.", job['id'], job['kind'])
+            else:
+                logger.warning("Job %s '%s' finished after another worker took it over.", job['id'], job['kind'])
+        finally:
+            metrics.JOB_SECONDS.observe(time.perf_counter() - start_time, kind=job['kind'])
+        return True
@@ -1,33 +1,50 @@
+from monitoring.startup import StartupTimer
+startup_timer = StartupTimer()  # Created first, so the report covers the imports too
+
 import discord
 from discord import ButtonStyle
 from discord.ui import Button, View
 from discord.ext import commands, tasks
 from discord import app_commands
 from datetime import datetime, timedelta, timezone
+import backup
 import drive
 import os
+from monitoring import metrics
+from monitoring.watchdog import LoopWatchdog
+from monitoring.logging_setup import configure_logging
+from guild_registry import GuildRegistry
+from tracking.components import HabitCheckButton
+from data_export import export_guild_data, get_export_filename, is_format_available
+from typing import Literal
+import asyncio
+import hashlib
+import json
+import tempfile
+import time
+import zipfile
 
 import logging
-logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger('maestro_bot')
 
 def load_environment():
     # Check if running in development or production mode
     environment = os.environ['ENV']
-    logging.info('\n')
-    logging.info('='*32)
-    logging.info(f"MODE: {environment}")
-    logging.info('='*32)
-    logging.info('\n')
+    logger.info('\n')
+    logger.info('='*32)
+    logger.info("MODE: %s", environment)
+    logger.info('='*32)
+    logger.info('\n')
 
     # Load environment variables
     from dotenv import load_dotenv
     dotenv_file = '.env' if environment == 'production' else '.env.dev'
-    logging.info(f"Loading '{dotenv_file}'")
+    logger.info("Loading '%s'", dotenv_file)
     dotenv_loaded = load_dotenv(dotenv_path=dotenv_file, override=True)
-    logging.info(f".env file loaded: {dotenv_loaded}")
+    logger.info(".env file loaded: %s", dotenv_loaded)
     
     # Set the DISCORD_BOT_DB_PREFIX based on the database name
-    os.environ['DISCORD_BOT_DB_PREFIX'] = os.environ['DISCORD_BOT_DB_NAME'].split('.')[0]
+    os.environ['DISCORD_BOT_DB_PREFIX'] = os.path.basename(os.environ['DISCORD_BOT_DB_NAME']).split('.')[0]
 
     # Return the environment variables as a dictionary
     return {
@@ -35,16 +52,24 @@ def load_environment():
         "DRIVE_FOLDER_ID": os.environ['DRIVE_FOLDER_ID'],
         "DISCORD_BOT_DB_NAME": os.environ['DISCORD_BOT_DB_NAME'],
         "DISCORD_BOT_DB_PREFIX": os.environ['DISCORD_BOT_DB_PREFIX'],  # Now it's in the environment
-        "GUILD_NAME": os.environ['GUILD_NAME']
     }
 
 def check_and_download_db(db_name, drive_folder_id, db_prefix):
     # Check if the 'discord_bot.db' file exists in the current directory
     if not os.path.exists(db_name):
-        logging.info(f"'{db_name}' does not exist. Downloading the latest version from Google Drive...")
-        drive.download_latest_file(drive_folder_id, db_prefix, db_name)
+        logger.info("'%s' does not exist. Restoring the latest backup from Google Drive...", db_name)
+        backup.restore_database(drive_folder_id, db_prefix, db_name)
     else:
-        logging.info(f"'{db_name}' already exists. Skipping download.")
+        logger.info("'%s' already exists. Skipping download.", db_name)
+
+    # The tracking archive is uploaded on its own, by the archival jobs
+    from data_handler import get_archive_db_name
+    archive_db_name = get_archive_db_name(db_name)
+    if not os.path.exists(archive_db_name):
+        try:
+            drive.download_latest_file(drive_folder_id, f"{db_prefix}_archive", archive_db_name)
+        except FileNotFoundError:
+            logger.info("No tracking archive in Google Drive yet.")
 
 # Initialize bot-related variables and handlers
 intents = discord.Intents.default()
@@ -52,88 +77,234 @@ intents.members = True
 intents.message_content = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Sharded automatically, with the shard count recommended by Discord for the number of guilds
+bot = commands.AutoShardedBot(command_prefix='!', intents=intents, http_trace=metrics.discord_http_trace())
 
 HABIT_DECLARATION_CHANNEL = 'habit-declaration'
 HABIT_TRACKING_CHANNELS_PREFIX = 'habit-tracking'
 HABIT_TRACKING_CATEGORY_NAME = 'TRACKING CHANNELS'
-
-guild = None
-declaration_handler = None
-tracking_handler = None
+COMMAND_TREE_HASH_KEY = 'command_tree_hash'
+# 'inline' runs a job worker inside the bot, 'external' leaves the queued jobs to worker.py processes
+JOB_WORKER_MODE = os.environ.get('JOB_WORKER_MODE', 'inline')
+BACKUP_INTERVAL_MINUTES = 10
+# Weeks of tracking records kept in the hot table, the older ones are moved to the archive database every week
+TRACKING_HOT_WEEKS = int(os.environ.get('TRACKING_HOT_WEEKS', '26'))
+
+guild_registry = GuildRegistry(HABIT_DECLARATION_CHANNEL, HABIT_TRACKING_CHANNELS_PREFIX, HABIT_TRACKING_CATEGORY_NAME, use_job_queue=True)
+# The habit check buttons are routed by their custom_id to the handlers of the clicked message's guild
+bot.guild_registry = guild_registry
+bot.add_dynamic_items(HabitCheckButton)
 db_handler = None
+job_worker = None
+startup_complete = False
+deferred_startup_task = None
+monitoring_tasks = []
+loop_watchdog = LoopWatchdog(threshold=float(os.environ.get('LOOP_STALL_THRESHOLD', '0.25')))
 
 def initialize_handlers():
-    global guild, declaration_handler, tracking_handler, db_handler
-    from declaration.declaration_handler import DeclarationHandler
-    from tracking.tracking_handler import TrackingHandler
+    global db_handler
     from data_handler import DatabaseHandler
     
     try:
-        guild = discord.utils.get(bot.guilds, name=os.environ['GUILD_NAME'])
-        if not guild:
-            raise ValueError(f"Guild '{os.environ['GUILD_NAME']}' not found.")
-
-        # Initialize the handlers
-        declaration_handler = DeclarationHandler(guild, HABIT_DECLARATION_CHANNEL, HABIT_TRACKING_CHANNELS_PREFIX, HABIT_TRACKING_CATEGORY_NAME)
-        tracking_handler = TrackingHandler(guild, declaration_handler, HABIT_TRACKING_CHANNELS_PREFIX, HABIT_TRACKING_CATEGORY_NAME)
-        declaration_handler.init_tracking_handler(tracking_handler)
-        
-        # Initialize the database handler and clean up development habits
-        db_handler = DatabaseHandler()
-        db_handler.remove_all_dev_habits()
-
-        logging.info("Handlers and guild successfully initialized.")
-
-    except ValueError as ve:
-        logging.error(f"Initialization Error: {ve}")
+        # Initialize the database handler first, creating any table or column missing from the current database
+        db_handler = DatabaseHandler(init=True)
+
+        # Initialize the handlers of every guild the bot is in, the ones joined later are added on demand
+        for guild in bot.guilds:
+            guild_registry.get(guild)
+
+        logger.info("Handlers successfully initialized for %s guilds on %s shards.", len(guild_registry), bot.shard_count)
+
+    except Exception as e:
+        logger.error("An unexpected error occurred during initialization: %s", e)
+
+async def run_for_all_guilds(method_name):
+    """
+    Run a TrackingHandler coroutine method for every guild concurrently.
+
+    A failure in one guild is logged and does not affect the others.
+    """
+    tracking_handlers = guild_registry.tracking_handlers()
+    results = await asyncio.gather(*(getattr(tracking_handler, method_name)() for tracking_handler in tracking_handlers), return_exceptions=True)
+    for tracking_handler, result in zip(tracking_handlers, results):
+        if isinstance(result, Exception):
+            logger.error("%s failed for guild %s: %s", method_name, tracking_handler.guild.name, result)
+
+def remove_dev_habits():
+    """Clean up development habits on a connection of its own, so it can run in a worker thread."""
+    from data_handler import DatabaseHandler
+    cleanup_db_handler = DatabaseHandler()
+    try:
+        cleanup_db_handler.remove_all_dev_habits()
+    finally:
+        cleanup_db_handler.close()
+
+async def run_deferred_startup_work():
+    try:
+        await asyncio.to_thread(remove_dev_habits)
+        # A habit check session whose end was missed while the bot was down is finalized now
+        await run_for_all_guilds('resume_habit_check_session')
+        logger.info("Deferred startup work completed.")
     except Exception as e:
-        logging.error(f"An unexpected error occurred during initialization: {e}")
+        logger.error("Deferred startup work failed: %s", e)
+
+def get_command_tree_hash():
+    """Hash the payload that bot.tree.sync() would send to Discord."""
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    payload.sort(key=lambda command: (command.get('type', 1), command['name']))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+async def sync_command_tree():
+    """Synchronize slash commands with Discord, only if they changed since the last sync."""
+    command_tree_hash = get_command_tree_hash()
+    if db_handler and db_handler.get_state(COMMAND_TREE_HASH_KEY) == command_tree_hash:
+        logger.info("Command tree unchanged since the last sync. Skipping sync.")
+        return False
+
+    await bot.tree.sync()
+    if db_handler:
+        db_handler.set_state(COMMAND_TREE_HASH_KEY, command_tree_hash)
+    logger.debug("Slash commands synchronized with Discord.")
+    return True
 
 @bot.event
 async def on_ready():
-    logging.info(f'{bot.user.name} has connected to Discord!')
+    logger.info("%s has connected to Discord!", bot.user.name)
+    global startup_complete, deferred_startup_task
+    if startup_complete:
+        logger.info("Reconnected to Discord, skipping startup.")
+        return
+    startup_timer.mark('gateway_connect')
+
     initialize_handlers()
+    startup_timer.mark('handlers')
+
+    # Heavy cleanup runs in the background instead of delaying the bot's readiness
+    deferred_startup_task = asyncio.create_task(run_deferred_startup_work())
+
+    await start_monitoring()
+    start_job_worker()
 
     # Start the habit check and DB upload tasks
     check_habits.start()
-    logging.debug("Started weekly habit check task.")
+    logger.debug("Started weekly habit check task.")
     upload_db_to_drive.start()
-    logging.debug("Started DB upload task.")
+    logger.debug("Started DB upload task.")
     
     try:
-        await bot.tree.sync()  # Synchronize slash commands with Discord
-        logging.debug("Slash commands synchronized with Discord.")
+        await sync_command_tree()
     except Exception as e:
-        logging.error(f"Failed to sync commands: {e}")
+        logger.error("Failed to sync commands: %s", e)
 
-    logging.info("Commands synced:")
+    logger.info("Commands synced:")
     for command in bot.tree.get_commands():
-        logging.info(f"- {command.name}")
-    logging.info("Sync complete.")
+        logger.info("- %s", command.name)
+    logger.info("Sync complete.")
+    startup_timer.mark('command_sync')
+    logger.info(startup_timer.report())
+    startup_complete = True
+
+async def start_monitoring():
+    try:
+        await metrics.start_metrics_server(os.environ.get('METRICS_HOST', '127.0.0.1'), int(os.environ.get('METRICS_PORT', '8080')))
+    except OSError as e:
+        logger.error("Failed to start the metrics server: %s", e)
+    monitoring_tasks.append(asyncio.create_task(loop_watchdog.run()))
+
+def start_job_worker():
+    global job_worker
+    if JOB_WORKER_MODE != 'inline':
+        logger.info("Queued jobs are left to the external workers.")
+        return
+    from jobs.worker import JobWorker
+    job_worker = JobWorker(bot)
+    monitoring_tasks.append(asyncio.create_task(job_worker.run()))
+
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    logger.info("Joined guild %s (ID: %s).", guild.name, guild.id)
+    guild_registry.get(guild)
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    logger.info("Removed from guild %s (ID: %s).", guild.name, guild.id)
+    guild_registry.remove(guild.id)
+
+# Keep the guild indexes current, the channels and roles are only looked up by ID
+@bot.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel):
+    guild_index = guild_registry.get_index(channel.guild.id)
+    if guild_index:
+        guild_index.on_channel_create(channel)
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    guild_index = guild_registry.get_index(channel.guild.id)
+    if guild_index:
+        guild_index.on_channel_delete(channel)
+
+@bot.event
+async def on_guild_role_create(role: discord.Role):
+    guild_index = guild_registry.get_index(role.guild.id)
+    if guild_index:
+        guild_index.on_role_create(role)
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    guild_index = guild_registry.get_index(role.guild.id)
+    if guild_index:
+        guild_index.on_role_delete(role)
+
+@bot.event
+async def on_interaction(interaction: discord.Interaction):
+    startup_timer.finish('first_interaction')
+
+    if interaction.type == discord.InteractionType.application_command:
+        metrics.SLASH_COMMANDS.inc(command=interaction.data.get('name', 'unknown'))
+    elif interaction.type == discord.InteractionType.component:
+        component_type = discord.ComponentType.try_value(interaction.data.get('component_type'))
+        metrics.COMPONENT_INTERACTIONS.inc(type=getattr(component_type, 'name', component_type))
+    else:
+        metrics.COMPONENT_INTERACTIONS.inc(type=interaction.type.name)
 
 @bot.tree.command(name="declare", description="Declare a new habit")
+@app_commands.guild_only()
 async def declare(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
-    logging.debug(f"Declare command invoked by user: {interaction.user.name} (ID: {interaction.user.id})")
+    logger.debug("Declare command invoked by user: %s (ID: %s)", interaction.user.name, interaction.user.id)
 
-    if guild:
-        await declaration_handler.send_declaration_view(interaction)
-        logging.debug("HabitDeclarationModal sent to user.")
-    else:
-        logging.warning("Guild is not initialized. Cannot declare habit.")
-        await interaction.response.send_message("Guild not found. Please try again later.", ephemeral=True)
+    handlers = guild_registry.get(interaction.guild)
+    await handlers.declaration_handler.send_declaration_view(interaction)
+    logger.debug("HabitDeclarationModal sent to user.")
 
 @bot.tree.command(name="habits", description="See all habits")
+@app_commands.guild_only()
 async def habits(interaction: discord.Interaction):
-    logging.debug(f"Habits command invoked by user: {interaction.user.name} (ID: {interaction.user.id})")
+    logger.debug("Habits command invoked by user: %s (ID: %s)", interaction.user.name, interaction.user.id)
 
-    if guild:
-        await declaration_handler.send_detailed_habit_view(interaction, guild, tracking_handler, declaration_handler)
-        logging.debug("DetailedHabitView sent to user.")
-    else:
-        logging.warning("Guild is not initialized. Cannot see habits.")
-        await interaction.response.send_message("Guild not found. Please try again later.", ephemeral=True)
+    handlers = guild_registry.get(interaction.guild)
+    await handlers.declaration_handler.send_detailed_habit_view(interaction, interaction.guild, handlers.tracking_handler, handlers.declaration_handler)
+    logger.debug("DetailedHabitView sent to user.")
+
+@bot.tree.command(name="leaderboard", description="See the longest habit streaks")
+@app_commands.guild_only()
+@app_commands.describe(channel="Rank only the habits of this tracking channel", size="Number of entries to show")
+async def leaderboard(interaction: discord.Interaction, channel: discord.TextChannel = None, size: app_commands.Range[int, 1, 25] = 10):
+    logger.debug("Leaderboard command invoked by user: %s (ID: %s)", interaction.user.name, interaction.user.id)
+
+    handlers = guild_registry.get(interaction.guild)
+    embed = handlers.tracking_handler.build_leaderboard_embed(interaction.user, channel, size)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="history", description="See the weekly completion history")
+@app_commands.guild_only()
+@app_commands.describe(channel="Show only this tracking channel", weeks="Number of recent weeks to show")
+async def history(interaction: discord.Interaction, channel: discord.TextChannel = None, weeks: app_commands.Range[int, 1, 26] = 8):
+    logger.debug("History command invoked by user: %s (ID: %s)", interaction.user.name, interaction.user.id)
+
+    handlers = guild_registry.get(interaction.guild)
+    embed = handlers.tracking_handler.build_history_embed(channel, weeks)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @bot.tree.command(name="support", description="Get the links to support us via membership or donations")
 async def support(interaction: discord.Interaction):
@@ -166,20 +337,146 @@ def is_admin():
     return app_commands.check(predicate)
 
 @bot.tree.command(name="check", description="Ask users if they completed their habits")
+@app_commands.guild_only()
 @is_admin()
 async def check(interaction: discord.Interaction):
-    logging.debug(f"Check command invoked by user: {interaction.user.name} (ID: {interaction.user.id})")
+    logger.debug("Check command invoked by user: %s (ID: %s)", interaction.user.name, interaction.user.id)
     await interaction.response.defer(ephemeral=True)
     
-    if guild:
-        await tracking_handler.send_habit_check_to_all_tracking_channels()
-        await interaction.followup.send("Habit check has been triggered for all tracking channels.", ephemeral=True)
+    handlers = guild_registry.get(interaction.guild)
+    await handlers.tracking_handler.send_habit_check_to_all_tracking_channels()
+    await interaction.followup.send("Habit check has been triggered for all tracking channels.", ephemeral=True)
+
+@bot.tree.command(name="stats", description="See the completion rates, retention and streaks of the server")
+@app_commands.guild_only()
+@app_commands.describe(weeks="Number of recent weeks to list")
+@is_admin()
+async def stats(interaction: discord.Interaction, weeks: app_commands.Range[int, 1, 26] = 8):
+    logger.debug("Stats command invoked by user: %s (ID: %s)", interaction.user.name, interaction.user.id)
+    await interaction.response.defer(ephemeral=True)
+
+    handlers = guild_registry.get(interaction.guild)
+    embed = await handlers.tracking_handler.build_stats_embed(weeks)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="export", description="Export the users, habits and tracking history of the server")
+@app_commands.guild_only()
+@app_commands.rename(file_format="format")
+@app_commands.describe(file_format="File format of the exported tables")
+@is_admin()
+async def export(interaction: discord.Interaction, file_format: Literal['csv', 'jsonl', 'parquet'] = 'csv'):
+    logger.debug("Export command invoked by user: %s (ID: %s)", interaction.user.name, interaction.user.id)
+    await interaction.response.defer(ephemeral=True)
+    if not is_format_available(file_format):
+        await interaction.followup.send(f"The {file_format} format is not available, the bot needs the pyarrow package for it.", ephemeral=True)
+        return
+
+    handlers = guild_registry.get(interaction.guild)
+    archive, row_counts = await asyncio.to_thread(export_guild_data, handlers.tracking_handler.db_handler.db_name, interaction.guild.id, file_format)
+    try:
+        archive_size = archive.seek(0, os.SEEK_END)
+        archive.seek(0)
+        if archive_size > interaction.guild.filesize_limit:
+            await interaction.followup.send(
+                f"The export is {archive_size / 2**20:.1f} MB, over the {interaction.guild.filesize_limit / 2**20:.0f} MB upload limit of this server.",
+                ephemeral=True
+            )
+            return
+        await interaction.followup.send(
+            f"Exported {row_counts['users']} users, {row_counts['habits']} habits and {row_counts['tracking']} tracking records.",
+            file=discord.File(archive, filename=get_export_filename(interaction.guild.name, file_format)),
+            ephemeral=True
+        )
+    finally:
+        archive.close()
+
+@bot.tree.command(name="import", description="Import users, habits and tracking history from an export archive")
+@app_commands.guild_only()
+@app_commands.describe(archive="A zip archive with users, habits and tracking files in CSV or JSONL, as made by /export")
+@is_admin()
+async def import_data(interaction: discord.Interaction, archive: discord.Attachment):
+    logger.debug("Import command invoked by user: %s (ID: %s)", interaction.user.name, interaction.user.id)
+    await interaction.response.defer(ephemeral=True)
+
+    handlers = guild_registry.get(interaction.guild)
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as archive_file:
+        await archive.save(archive_file)
+        try:
+            counts = await handlers.tracking_handler.import_archive(archive_file)
+        except (ValueError, zipfile.BadZipFile) as e:
+            await interaction.followup.send(f"Nothing was imported: {e}", ephemeral=True)
+            return
+
+    await interaction.followup.send(
+        f"Imported {counts['users']} new users, {counts['habits']} habits and {counts['tracking']} tracking records "
+        f"({counts['skipped_tracking']} records of unknown habits skipped). {counts['roles']} tracking channel roles were given.",
+        ephemeral=True
+    )
+
+@bot.tree.command(name="cleanup", description="Remove habits with their tracking history")
+@app_commands.guild_only()
+@app_commands.describe(user="Remove the habits of this user", habit_name="Remove the habits with this name", confirm="Remove the habits, otherwise only count them")
+@is_admin()
+async def cleanup(interaction: discord.Interaction, user: discord.User = None, habit_name: str = None, confirm: bool = False):
+    logger.debug("Cleanup command invoked by user: %s (ID: %s)", interaction.user.name, interaction.user.id)
+    handlers = guild_registry.get(interaction.guild)
+    try:
+        habit_ids = handlers.tracking_handler.cleanup_habits(user.id if user else None, habit_name, dry_run=not confirm)
+    except ValueError as e:
+        await interaction.response.send_message(str(e), ephemeral=True)
+        return
+
+    if confirm:
+        message = f"Removed {len(habit_ids)} habits with their tracking history."
     else:
-        logging.warning("Guild is not initialized. Cannot track habit.")
-        await interaction.followup.send("Guild not found. Please try again later.", ephemeral=True)
+        message = f"{len(habit_ids)} habits match. Run the command again with `confirm` to remove them with their tracking history."
+    await interaction.response.send_message(message, ephemeral=True)
+
+@bot.tree.command(name="compact", description="Pack the habits into the fewest tracking channels")
+@app_commands.guild_only()
+@app_commands.describe(confirm="Apply the changes, otherwise only report them")
+@is_admin()
+async def compact(interaction: discord.Interaction, confirm: bool = False):
+    logger.debug("Compact command invoked by user: %s (ID: %s)", interaction.user.name, interaction.user.id)
+    await interaction.response.defer(ephemeral=True)
+
+    handlers = guild_registry.get(interaction.guild)
+    try:
+        report = await handlers.tracking_handler.compact_tracking_channels(dry_run=not confirm)
+    except ValueError as e:
+        await interaction.followup.send(f"Nothing was changed: {e}", ephemeral=True)
+        return
+    await interaction.followup.send(embed=handlers.tracking_handler.build_compaction_embed(report, dry_run=not confirm), ephemeral=True)
+
+@bot.tree.command(name="stalls", description="See the code that blocked the bot the longest")
+@is_admin()
+async def stalls(interaction: discord.Interaction, reset: bool = False):
+    logger.debug("Stalls command invoked by user: %s (ID: %s)", interaction.user.name, interaction.user.id)
+    top_stalls = loop_watchdog.get_top_stalls()
+
+    embed = discord.Embed(
+        title="Event Loop Stalls",
+        description=f"Call sites that blocked the event loop for more than {loop_watchdog.threshold}s.",
+        color=discord.Color.orange()
+    )
+    for call_site, stall in top_stalls:
+        embed.add_field(
+            name=call_site[:256],
+            value=f"{stall['count']} stalls, {stall['total_seconds']:.2f}s in total, longest {stall['max_seconds']:.2f}s",
+            inline=False
+        )
+    if not top_stalls:
+        embed.add_field(name="No stalls", value="The event loop has not been blocked.", inline=False)
+
+    if reset:
+        loop_watchdog.reset()
+        embed.set_footer(text="Stall statistics have been reset.")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 # Define timezone
 utc_plus_3 = timezone(timedelta(hours=3))
+# Minutes before the Saturday 12:00 habit check at which its messages are prepared
+HABIT_CHECK_PREPARATION_LEAD_MINUTES = 5
 
 @tasks.loop(minutes=1)
 async def check_habits():
@@ -188,45 +485,65 @@ async def check_habits():
     current_hour = current_time.hour
     current_minute = current_time.minute
 
-    logging.debug(f"Current UTC+3 day: {current_day}, hour: {current_hour}, minute: {current_minute}")
+    logger.debug("Current UTC+3 day: %s, hour: %s, minute: %s", current_day, current_hour, current_minute)
+
+    if current_day == 5 and current_hour == 11 and current_minute == 60 - HABIT_CHECK_PREPARATION_LEAD_MINUTES:
+        logger.info("It's %s minutes before the habit check (UTC+3). Preparing habit check.", HABIT_CHECK_PREPARATION_LEAD_MINUTES)
+        await run_for_all_guilds('prepare_habit_check')
 
     if current_day == 5 and current_hour == 12 and current_minute == 0:
-        logging.info("It's exactly 12:00 on Saturday (UTC+3). Sending habit check.")
-        await tracking_handler.send_habit_check_to_all_tracking_channels()
+        logger.info("It's exactly 12:00 on Saturday (UTC+3). Sending habit check.")
+        await run_for_all_guilds('send_habit_check_to_all_tracking_channels')
 
     if current_day == 5 and current_hour == 23 and current_minute == 59:
-        logging.info("It's 00:00 on Sunday (UTC+3). Ending habit check session.")
-        await tracking_handler.end_habit_check_session()
+        logger.info("It's 00:00 on Sunday (UTC+3). Ending habit check session.")
+        await run_for_all_guilds('end_habit_check_session')
+        queue_tracking_archival()
+
+def queue_tracking_archival():
+    """Queue the weekly move of the tracking records older than TRACKING_HOT_WEEKS to the archive database."""
+    try:
+        before_week_key = db_handler.get_archive_horizon(TRACKING_HOT_WEEKS)
+        db_handler.enqueue_job('tracking.archive', {'before_week_key': before_week_key}, idempotency_key=f"tracking.archive:{before_week_key}", max_attempts=3)
+    except Exception as e:
+        logger.error("Failed to queue the tracking archival: %s", e)
 
 @check_habits.before_loop
 async def before_check_habits():
     await bot.wait_until_ready()
-    logging.debug("Bot is ready, starting habit check loop.")
+    logger.debug("Bot is ready, starting habit check loop.")
 
-@tasks.loop(minutes=10)
+@tasks.loop(minutes=BACKUP_INTERVAL_MINUTES)
 async def upload_db_to_drive():
+    # The upload runs in a worker, one job per backup interval however often this is called
+    backup_slot = int(time.time() // (BACKUP_INTERVAL_MINUTES * 60))
     try:
-        drive.upload_file(os.environ['DISCORD_BOT_DB_NAME'], os.environ['DRIVE_FOLDER_ID'], os.environ['DISCORD_BOT_DB_PREFIX'])
-        logging.info("Successfully uploaded discord_bot.db to Google Drive.")
+        db_handler.enqueue_job('backup.upload', {}, idempotency_key=f"backup.upload:{backup_slot}", max_attempts=3)
     except Exception as e:
-        logging.error(f"Failed to upload discord_bot.db to Google Drive: {e}")
+        logger.error("Failed to queue the database upload: %s", e)
 
 @upload_db_to_drive.before_loop
 async def before_upload_db_to_drive():
     await bot.wait_until_ready()
-    logging.debug("Bot is ready, starting DB upload task loop.")
+    logger.debug("Bot is ready, starting DB upload task loop.")
 
 # Function to run the bot
 def create_and_run_bot():
+    configure_logging()
+    startup_timer.mark('imports')
+
     # Load environment variables
     env_vars = load_environment()
+    startup_timer.mark('environment')
 
     # Check and download the latest DB if necessary
     check_and_download_db(env_vars['DISCORD_BOT_DB_NAME'], env_vars['DRIVE_FOLDER_ID'], env_vars['DISCORD_BOT_DB_PREFIX'])
+    startup_timer.mark('database_download')
 
     # Run the bot with the token
-    logging.info("Running the bot.")
-    bot.run(env_vars["DISCORD_BOT_TOKEN"])
+    logger.info("Running the bot.")
+    # Records of the discord loggers go through the handler set up by configure_logging
+    bot.run(env_vars["DISCORD_BOT_TOKEN"], log_handler=None)
 
 if __name__ == '__main__':
     create_and_run_bot()
@@ -0,0 +1,109 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+# Default levels per subsystem, overridden by the LOG_LEVELS environment variable
+DEFAULT_LOG_LEVELS = {
+    'discord': 'INFO',
+    'discord.gateway': 'WARNING',
+    'aiohttp.access': 'WARNING',
+    'googleapiclient.discovery_cache': 'ERROR',
+}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line."""
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that only merges the message of the record.
+
+    The default QueueHandler formats the whole record (time, level, traceback) in the logging thread
+    before enqueueing it. Here only the %-style arguments are merged, so a mutable argument changed
+    after the call is logged as it was, and the listener thread does the rest of the formatting and the I/O.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def parse_log_levels(value):
+    """Parse 'discord=INFO,data_handler=DEBUG' into a {logger name: level} dictionary."""
+    levels = {}
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        name, _, level = entry.partition('=')
+        if not level:
+            raise ValueError(f"Invalid log level entry '{entry}', expected 'logger=LEVEL'.")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure_logging(level=None, levels=None, log_format=None, stream=None):
+    """
+    Set up the logging of the whole process.
+
+    Records go through a queue to a listener thread that formats and writes them.
+    Levels are read from LOG_LEVEL (root) and LOG_LEVELS (per subsystem), and the output
+    format from LOG_FORMAT ('json' or 'text') unless they are passed explicitly.
+    """
+    global _listener
+    level = level or os.environ.get('LOG_LEVEL', 'INFO')
+    levels = {**DEFAULT_LOG_LEVELS, **(levels if levels is not None else parse_log_levels(os.environ.get('LOG_LEVELS', '')))}
+    log_format = log_format or os.environ.get('LOG_FORMAT', 'json')
+
+    output_handler = logging.StreamHandler(stream or sys.stderr)
+    if log_format == 'json':
+        output_handler.setFormatter(JsonFormatter())
+    else:
+        output_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    if _listener:
+        _listener.stop()
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, output_handler, respect_handler_level=True)
+    _listener.start()
+
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(DeferredQueueHandler(log_queue))
+    root_logger.setLevel(level.upper())
+
+    for name, logger_level in levels.items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    return _listener
+
+def stop_logging():
+    """Flush the queued records and stop the listener thread."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
@@ -0,0 +1,211 @@
+import functools
+import re
+import threading
+import time
+import aiohttp
+from aiohttp import web
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class MetricsRegistry:
+    """Keeps every metric of the process and renders them in the Prometheus text format."""
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, label_names=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()  # Database metrics are also recorded from worker threads
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Metric {self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+
+class Counter(_Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels))
+
+    def render(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, label_names, registry)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            bucket_counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    bucket_counts[i] += 1
+            self._values[key] = (bucket_counts, total + value)
+
+    def count(self, **labels):
+        bucket_counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return bucket_counts[-1]
+
+    def render(self):
+        with self._lock:
+            values = [(key, (list(bucket_counts), total)) for key, (bucket_counts, total) in self._values.items()]
+        lines = []
+        for key, (bucket_counts, total) in values:
+            for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                labels = _format_labels(self.label_names, key, [('le', _format_value(upper_bound))])
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {bucket_counts[-1]}")
+        return lines
+
+
+def observe_duration(histogram, label_name='operation', **labels):
+    """Decorator recording the duration of every call in the histogram, labelled with the function name and the given labels."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start_time, **{label_name: func.__name__}, **labels)
+        return wrapper
+    return decorator
+
+
+###############
+### METRICS ###
+###############
+SLASH_COMMANDS = Counter('maestro_slash_commands_total', 'Slash commands invoked.', ['command'])
+COMPONENT_INTERACTIONS = Counter('maestro_component_interactions_total', 'Button and other component interactions.', ['type'])
+DB_QUERY_SECONDS = Histogram('maestro_db_query_seconds', 'Duration of DatabaseHandler operations, by connection route.', ['operation', 'route'])
+DISCORD_HTTP_SECONDS = Histogram('maestro_discord_http_request_seconds', 'Duration of Discord HTTP requests.', ['method', 'route'])
+DISCORD_HTTP_RESPONSES = Counter('maestro_discord_http_responses_total', 'Discord HTTP responses by status code.', ['method', 'route', 'status'])
+BACKUP_SECONDS = Histogram('maestro_backup_seconds', 'Duration of database backups.', buckets=(1, 2.5, 5, 10, 30, 60, 120, 300))
+BACKUP_SIZE_BYTES = Gauge('maestro_backup_size_bytes', 'Size of the last uploaded database backup.')
+BACKUPS = Counter('maestro_backups_total', 'Database backups by result.', ['status'])
+EVENT_LOOP_LAG_SECONDS = Histogram('maestro_event_loop_lag_seconds', 'Scheduling delay of the event loop.', buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+JOBS = Counter('maestro_jobs_total', 'Queued jobs run by the workers, by result.', ['kind', 'status'])
+JOB_SECONDS = Histogram('maestro_job_seconds', 'Duration of queued jobs.', ['kind'], buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900))
+
+
+##########################
+### DISCORD HTTP TRACE ###
+##########################
+def normalize_discord_route(path):
+    """Turn a Discord API path into a low cardinality route, e.g. /channels/{id}/messages/{id}."""
+    path = re.sub(r'^/api/v\d+', '', path)
+    path = re.sub(r'/\d+', '/{id}', path)
+    # Interaction and webhook tokens are secrets, never expose them as label values
+    return re.sub(r'^/(interactions|webhooks)/\{id\}/[^/]+', r'/\1/{id}/{token}', path)
+
+def discord_http_trace():
+    """Create an aiohttp trace config recording the latency and status code of every Discord HTTP request."""
+    async def on_request_start(session, context, params):
+        context.start_time = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        route = normalize_discord_route(params.url.path)
+        DISCORD_HTTP_SECONDS.observe(time.perf_counter() - context.start_time, method=params.method, route=route)
+        DISCORD_HTTP_RESPONSES.inc(method=params.method, route=route, status=params.response.status)
+
+    async def on_request_exception(session, context, params):
+        route = normalize_discord_route(params.url.path)
+        DISCORD_HTTP_RESPONSES.inc(method=params.method, route=route, status='error')
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+######################
+### METRICS SERVER ###
+######################
+async def start_metrics_server(host='127.0.0.1', port=8080, registry=REGISTRY):
+    """Serve the metrics in the Prometheus text format on http://host:port/metrics."""
+    async def handle_metrics(request):
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return runner
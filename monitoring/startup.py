@@ -0,0 +1,39 @@
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """
+    Records how long each startup phase takes, from process start to the first interaction served.
+    """
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.last_mark_time = self.start_time
+        self.phases = []  # (phase name, seconds spent in the phase)
+        self.finished = False
+
+    def mark(self, phase):
+        """Close the current phase under the given name."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last_mark_time))
+        self.last_mark_time = now
+        logger.debug("Startup phase '%s' finished in %.3fs", phase, self.phases[-1][1])
+
+    def finish(self, phase='first_interaction'):
+        """Close the last phase and log the full report. Only the first call has an effect."""
+        if self.finished:
+            return
+        self.mark(phase)
+        self.finished = True
+        logger.info(self.report())
+
+    def elapsed(self):
+        return self.last_mark_time - self.start_time
+
+    def report(self):
+        lines = ["Startup timing report:"]
+        for phase, duration in self.phases:
+            lines.append(f"  {phase:<20} {duration:8.3f}s")
+        lines.append(f"  {'total':<20} {self.elapsed():8.3f}s")
+        return '\n'.join(lines)
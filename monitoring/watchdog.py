@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from monitoring.metrics import EVENT_LOOP_LAG_SECONDS
+import logging
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LoopWatchdog:
+    """
+    Measures the scheduling delay of the event loop and finds the code that blocks it.
+
+    A heartbeat task wakes up every `interval` seconds. A sampling thread watches the heartbeat and,
+    once it is late by more than `threshold` seconds, captures the stack of the event loop thread.
+    Stalls are aggregated per call site, the innermost frame of this project in the captured stack.
+    """
+    def __init__(self, threshold=0.25, interval=0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = {}  # call_site -> {'count', 'total_seconds', 'max_seconds', 'stack'}
+        self._heartbeat = time.monotonic()
+        self._pending_stall = None  # (call_site, stack) captured during the current stall
+        self._loop_thread_id = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    async def run(self):
+        """Heartbeat task, to be run on the monitored event loop."""
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        sampler = threading.Thread(target=self._sample, name='loop-watchdog', daemon=True)
+        sampler.start()
+        try:
+            while True:
+                expected_time = loop.time() + self.interval
+                self._heartbeat = time.monotonic()
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, loop.time() - expected_time)
+                EVENT_LOOP_LAG_SECONDS.observe(lag)
+                self._record_stall(lag)
+        finally:
+            self._stopped.set()
+
+    def _sample(self):
+        """Sampling thread capturing the loop thread's stack while the heartbeat is late."""
+        while not self._stopped.wait(self.interval / 2):
+            heartbeat = self._heartbeat
+            if time.monotonic() - heartbeat - self.interval <= self.threshold:
+                continue
+            with self._lock:
+                if self._pending_stall is not None:
+                    continue  # Already captured for this stall
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            del frame
+            with self._lock:
+                if self._heartbeat == heartbeat:
+                    self._pending_stall = (self._get_call_site(stack), ''.join(traceback.format_list(stack[-10:])))
+
+    def _record_stall(self, lag):
+        with self._lock:
+            pending_stall, self._pending_stall = self._pending_stall, None
+        if pending_stall is None or lag <= self.threshold:
+            return
+
+        call_site, stack = pending_stall
+        with self._lock:
+            stall = self.stalls.setdefault(call_site, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'stack': stack})
+            stall['count'] += 1
+            stall['total_seconds'] += lag
+            if lag >= stall['max_seconds']:
+                stall['max_seconds'] = lag
+                stall['stack'] = stack
+        logger.warning("Event loop blocked for %.3fs at %s", lag, call_site)
+
+    @staticmethod
+    def _get_call_site(stack):
+        """Return the innermost frame of this project, or the innermost frame if none is found."""
+        for frame_summary in reversed(stack):
+            filename = os.path.abspath(frame_summary.filename)
+            if filename.startswith(PROJECT_ROOT) and 'site-packages' not in filename and filename != os.path.abspath(__file__):
+                break
+        else:
+            frame_summary = stack[-1]
+        return f"{os.path.relpath(frame_summary.filename, PROJECT_ROOT)}:{frame_summary.lineno} in {frame_summary.name}"
+
+    def get_top_stalls(self, limit=10):
+        """Return the call sites that blocked the loop the longest, as (call_site, stall) tuples."""
+        with self._lock:
+            stalls = [(call_site, dict(stall)) for call_site, stall in self.stalls.items()]
+        stalls.sort(key=lambda item: item[1]['total_seconds'], reverse=True)
+        return stalls[:limit]
+
+    def reset(self):
+        with self._lock:
+            self.stalls.clear()
@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+# data_handler reads the database name from the environment at import time
+os.environ.setdefault('DISCORD_BOT_DB_NAME', os.path.join(tempfile.gettempdir(), 'maestro_test.db'))
+
+import pytest
+
+from data_handler import DatabaseHandler
+
+
+@pytest.fixture
+def db_handler(tmp_path, request):
+    """A DatabaseHandler on a fresh database, scoped to guild 1 unless another guild ID is given by indirect parametrization."""
+    db_handler = DatabaseHandler(init=True, db_name=str(tmp_path / 'test.db'), guild_id=getattr(request, 'param', 1))
+    yield db_handler
+    db_handler.close()
+    db_handler.close_read_conn()
+
+@pytest.fixture
+def add_habit(db_handler):
+    """
+    Declare habits in the db_handler database.
+
+    The returned function adds the owner and their tracking channel slot, then the habit, and marks it
+    completed on the given weeks of 2024. It returns the habit ID.
+    """
+    def add_habit(user_id=42, channel_id=10, habit_name='Read', weeks=(), reservation_id=None):
+        db_handler.add_user(user_id, f"user-{user_id}")
+        if reservation_id is None:
+            db_handler.add_user_to_tracking_channel(user_id, channel_id)
+        habit_id = db_handler.add_habit_with_data({
+            'metadata': {'user_id': str(user_id)},
+            'declaration': {'habit_name': habit_name, 'time_location': 'daily', 'identity': 'a tester'},
+        }, channel_id, reservation_id)
+        for week in weeks:
+            db_handler.mark_habit_completed(habit_id, True, week_key=f"2024-W{week:02d}")
+        return habit_id
+    return add_habit
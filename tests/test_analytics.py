@@ -0,0 +1,62 @@
+import pytest
+from types import SimpleNamespace
+from unittest import mock
+
+from data_handler import DatabaseHandler
+from tracking.analytics import compute_guild_stats
+
+
+def record(habit_id, channel_id, week, completed, streak):
+    return (habit_id, channel_id, 202400 + week, int(completed), streak)
+
+RECORDS = [
+    record(1, 10, 38, True, 1), record(1, 10, 39, True, 2), record(1, 10, 40, True, 3),
+    record(2, 10, 38, True, 1), record(2, 10, 39, False, 0), record(2, 10, 40, False, 0),
+    record(3, 20, 39, True, 1), record(3, 20, 40, False, 0),
+    record(4, 20, 40, True, 1),
+]
+
+def test_guild_stats():
+    stats = compute_guild_stats(RECORDS, '2024-W41')
+
+    assert stats['record_count'] == 9 and stats['habit_count'] == 4
+    assert stats['overall_rate'] == pytest.approx(6 / 9)
+    assert stats['weekly_rates'] == [('2024-W38', 1.0, 2), ('2024-W39', pytest.approx(2 / 3), 3), ('2024-W40', 0.5, 4)]
+    assert stats['last_week_channel_rates'] == [(10, 0.5, 2), (20, 0.5, 2)]
+    # Week 0: all 4 habits were completed in their first week; week 1: 1 of 3; week 2: 1 of 2
+    assert stats['retention'] == [(0, 1.0, 4), (1, pytest.approx(1 / 3), 3), (2, 0.5, 2)]
+    assert dict(stats['streak_distribution']) == {'0': 2, '1': 1, '2-3': 1, '4-7': 0, '8-15': 0, '16-31': 0, '32+': 0}
+
+def test_guild_stats_without_records():
+    stats = compute_guild_stats([], '2024-W41')
+    assert stats['overall_rate'] is None and stats['retention'] == [] and stats['weekly_rates'] == []
+
+@pytest.mark.asyncio
+async def test_stats_are_cached_until_the_week_changes(tmp_path):
+    db_name = str(tmp_path / 'stats.db')
+    db_handler = DatabaseHandler(init=True, db_name=db_name, guild_id=1)
+    db_handler.add_user(42, 'tester')
+    db_handler.add_user_to_tracking_channel(42, 10)
+    habit_id = db_handler.add_habit_with_data({
+        'metadata': {'user_id': '42'},
+        'declaration': {'habit_name': 'Read', 'time_location': 'daily', 'identity': 'a tester'},
+    }, 10)
+    db_handler.mark_habit_completed(habit_id, True, week_key='2024-W39')
+    db_handler.mark_habit_completed(habit_id, True, week_key='2024-W40')
+
+    with mock.patch('data_handler.DB_NAME', db_name):
+        from tracking.tracking_handler import TrackingHandler
+        tracking_handler = TrackingHandler(SimpleNamespace(id=1, name='guild'), mock.MagicMock(), 'habit-tracking', 'TRACKING CHANNELS')
+
+    with mock.patch('tracking.tracking_handler.datetime') as mock_datetime:
+        mock_datetime.now.return_value.strftime.return_value = '2024-W40'
+        stats = await tracking_handler.get_guild_stats()
+        assert [week_key for week_key, _, _ in stats['weekly_rates']] == ['2024-W39']
+
+        db_handler.mark_habit_completed(habit_id, True, week_key='2024-W38')
+        assert await tracking_handler.get_guild_stats() is stats
+
+        mock_datetime.now.return_value.strftime.return_value = '2024-W41'
+        stats = await tracking_handler.get_guild_stats()
+        assert [week_key for week_key, _, _ in stats['weekly_rates']] == ['2024-W38', '2024-W39', '2024-W40']
+    db_handler.close()
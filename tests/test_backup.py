@@ -0,0 +1,127 @@
+import json
+import logging
+import shutil
+import sqlite3
+import pytest
+from unittest import mock
+
+import backup
+from backup import prepare_backup, commit_backup, rebuild_database
+
+
+def dump(db_name):
+    conn = sqlite3.connect(db_name)
+    try:
+        return list(conn.iterdump())
+    finally:
+        conn.close()
+
+@pytest.fixture
+def db_name(tmp_path):
+    db_name = str(tmp_path / 'backup.db')
+    conn = sqlite3.connect(db_name)
+    conn.execute('CREATE TABLE tracking (habit_id INTEGER, week_key TEXT, note TEXT)')
+    conn.executemany('INSERT INTO tracking VALUES (?, ?, ?)', ((i, f"2024-W{i % 52:02d}", 'x' * 200) for i in range(2000)))
+    conn.commit()
+    conn.close()
+    return db_name
+
+def upload(prepared, uploads, name):
+    """Keep a copy of a prepared backup, as the drive folder would."""
+    path = str(uploads / name)
+    shutil.copyfile(prepared['path'], path)
+    return path
+
+def test_deltas_only_hold_the_changed_pages_and_replay_onto_the_base(db_name, tmp_path):
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    states, delta_paths = [], []
+    staging = tmp_path / 'staging'
+    staging.mkdir()
+
+    base = prepare_backup(db_name, str(staging))
+    assert base['kind'] == 'base'
+    base_path = upload(base, uploads, 'backup_base.db')
+    commit_backup(db_name, base, 'backup_base.db')
+    assert prepare_backup(db_name, str(staging))['path'] is None
+
+    conn = sqlite3.connect(db_name)
+    for step, statement in enumerate((
+        "UPDATE tracking SET note = 'y' WHERE habit_id = 1500",
+        "INSERT INTO tracking VALUES (5000, '2024-W40', 'new')",
+        "DELETE FROM tracking WHERE habit_id >= 1000",
+    )):
+        conn.execute(statement)
+        conn.commit()
+        if step == 2:
+            conn.execute('VACUUM')
+        delta = prepare_backup(db_name, str(staging))
+        assert delta['kind'] == 'delta' and delta['manifest']['sequence'] == step + 1
+        if step == 0:
+            assert delta['pages'] <= 3
+        delta_paths.append(upload(delta, uploads, f"backup_delta_{step}.delta"))
+        commit_backup(db_name, delta, delta_paths[-1])
+        states.append(dump(db_name))
+    conn.close()
+
+    restored_name = str(tmp_path / 'restored.db')
+    assert rebuild_database(base_path, 'backup_base.db', delta_paths, restored_name) == 3
+    assert dump(restored_name) == states[-1]
+
+    # Point in time: the deltas uploaded until then
+    assert rebuild_database(base_path, 'backup_base.db', delta_paths[:2], restored_name) == 2
+    assert dump(restored_name) == states[1]
+
+def test_a_reuploaded_sequence_replaces_the_first_upload(db_name, tmp_path):
+    staging = tmp_path / 'staging'
+    staging.mkdir()
+    base = prepare_backup(db_name, str(staging))
+    base_path = upload(base, tmp_path, 'backup_base.db')
+    commit_backup(db_name, base, 'backup_base.db')
+
+    conn = sqlite3.connect(db_name)
+    conn.execute("UPDATE tracking SET note = 'first' WHERE habit_id = 10")
+    conn.commit()
+    # Uploaded, but the manifest was never saved
+    first_path = upload(prepare_backup(db_name, str(staging)), tmp_path, 'first.delta')
+    conn.execute("UPDATE tracking SET note = 'x' WHERE habit_id = 10")
+    conn.execute("UPDATE tracking SET note = 'second' WHERE habit_id = 1900")
+    conn.commit()
+    conn.close()
+    second_path = upload(prepare_backup(db_name, str(staging)), tmp_path, 'second.delta')
+
+    restored_name = str(tmp_path / 'restored.db')
+    assert rebuild_database(base_path, 'backup_base.db', [first_path, second_path], restored_name) == 1
+    assert dump(restored_name) == dump(db_name)
+
+def test_wal_databases_are_checkpointed_before_their_pages_are_read(db_name, tmp_path):
+    staging = tmp_path / 'staging'
+    staging.mkdir()
+    conn = sqlite3.connect(db_name)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute("UPDATE tracking SET note = 'wal' WHERE habit_id < 10")
+    conn.commit()
+    # The committed update is only in the write-ahead log until the backup checkpoints it
+    base = prepare_backup(db_name, str(staging))
+    state = dump(db_name)
+    conn.close()
+
+    restored_name = str(tmp_path / 'restored.db')
+    rebuild_database(base['path'], 'backup_base.db', [], restored_name)
+    assert dump(restored_name) == state
+
+def test_restore_cli_logs_like_the_bot(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('LOG_LEVEL', 'INFO')
+    monkeypatch.setenv('LOG_FORMAT', 'json')
+    root_logger = logging.getLogger()
+    handlers, level = root_logger.handlers[:], root_logger.level
+    restore = mock.MagicMock(side_effect=lambda *args, **kwargs: backup.logger.info("Restored %s", args[2]))
+    try:
+        with mock.patch('backup.restore_database', restore):
+            backup.main([str(tmp_path / 'restored.db'), '--prefix', 'bot', '--folder-id', 'folder'])
+    finally:
+        root_logger.handlers[:] = handlers
+        root_logger.setLevel(level)
+
+    records = [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+    assert [(record['logger'], record['message']) for record in records] == [('backup', f"Restored {tmp_path / 'restored.db'}")]
@@ -0,0 +1,70 @@
+import json
+import sqlite3
+
+from benchmarks import run
+from benchmarks.synthetic_db import build_synthetic_database, get_week_keys
+
+
+def test_synthetic_database_is_consistent(tmp_path):
+    db_name = str(tmp_path / 'synthetic.db')
+    dataset = build_synthetic_database(db_name, users=20, habits=50, weeks=6)
+
+    conn = sqlite3.connect(db_name)
+    assert conn.execute('SELECT COUNT(*) FROM habits').fetchone()[0] == 50
+    assert dataset['channels'] == 7
+    # Streaks count the consecutive completed weeks
+    rows = conn.execute('SELECT completed, streak FROM tracking WHERE habit_id = 1 ORDER BY week_key').fetchall()
+    expected_streak = 0
+    for completed, streak in rows:
+        expected_streak = expected_streak + 1 if completed else 0
+        assert streak == expected_streak
+    conn.close()
+
+def test_week_keys_are_chronological():
+    week_keys = get_week_keys(60)
+    assert len(set(week_keys)) == 60
+    assert week_keys == sorted(week_keys, key=lambda week_key: (int(week_key[:4]), int(week_key[6:])))
+
+def test_run_writes_machine_readable_report(tmp_path, capsys):
+    output = tmp_path / 'bench_output.json'
+    args = ['--db', str(tmp_path / 'bench.db'), '--users', '20', '--habits', '40', '--weeks', '4',
+            '--samples', '5', '--finalize-habits', '10', '--snapshot-iterations', '1', '--output', str(output)]
+    run.main(args)
+    report = json.loads(output.read_text())
+
+    assert set(report['results']) == {'mark_habit_completed', 'writes_during_scans', 'get_current_streak', 'reserve_tracking_channel',
+                                      'habit_cards', 'end_of_week_finalization', 'backup_snapshot', 'guild_stats'}
+    assert report['results']['get_current_streak']['calls'] == 5
+
+    run.main(args + ['--compare', str(output)])
+    assert 'mark_habit_completed' in capsys.readouterr().out
+
+def test_fake_discord_rate_limits_channel_sends():
+    import asyncio
+    from benchmarks.fake_discord import FakeDiscordAPI, FakeGuild
+
+    async def send_messages():
+        api = FakeDiscordAPI(latency=0.001, jitter=0, time_scale=0.01)
+        guild = FakeGuild(api)
+        channel = guild.add_text_channel('habit-tracking-1', guild.add_category('TRACKING CHANNELS'))
+        messages = [await channel.send(f"check {i}") for i in range(7)]
+        await channel.get_partial_message(messages[0].id).edit(content='edited')
+        return api, channel, messages
+
+    api, channel, messages = asyncio.run(send_messages())
+    stats = api.stats()
+    # The channel's bucket allows 5 messages per window, the sixth waits for the reset
+    assert stats['POST /channels/{channel_id}/messages']['requests'] == 7
+    assert stats['POST /channels/{channel_id}/messages']['rate_limited'] == 1
+    assert channel.messages[messages[0].id].content == 'edited'
+
+def test_fanout_reports_every_phase(tmp_path):
+    from benchmarks import fanout
+    output = tmp_path / 'fanout_output.json'
+    report = fanout.main(['--db', str(tmp_path / 'fanout.db'), '--users', '20', '--habits', '40', '--weeks', '2',
+                          '--latency', '0.001', '--time-scale', '0.01', '--uncached-members', '0.5',
+                          '--declarations', '2', '--output', str(output)])
+
+    assert report['results']['send_habit_check']['messages'] == 40
+    assert set(report['results']) == {'prepare_habit_check', 'send_habit_check', 'end_habit_check_session', 'declaration'}
+    assert report['api']['prepare_habit_check']['GATEWAY REQUEST_GUILD_MEMBERS']['requests'] == 1
@@ -0,0 +1,88 @@
+import pytest
+from types import SimpleNamespace
+from unittest import mock
+
+from guild_index import GuildIndex
+from tracking.channel_management import TrackingChannelManager
+from tracking.compaction import plan_compaction
+
+
+def habits(channel_id, count, user_id=None):
+    return [(channel_id * 100 + i, user_id or channel_id * 100 + i) for i in range(count)]
+
+def test_plan_keeps_the_fullest_channels_and_moves_the_rest():
+    plan = plan_compaction([(1, habits(1, 8)), (2, habits(2, 3)), (3, habits(3, 2)), (4, habits(4, 5)), (5, [])], 8)
+    assert plan['kept_channels'] == [1, 2, 4]
+    assert plan['removed_channels'] == [3, 5]
+    # 18 habits need 3 channels, the 2 habits of channel 3 are the fewest moves
+    assert [(habit_id, to_channel_id) for habit_id, _, _, to_channel_id in plan['moves']] == [(300, 2), (301, 2)]
+    assert plan['role_grants'] == [(2, 300), (2, 301)]
+
+def test_moved_habits_follow_their_owners():
+    plan = plan_compaction([(1, habits(1, 5)), (2, habits(2, 4, user_id=42)), (3, habits(3, 2, user_id=42))], 8)
+    assert plan['kept_channels'] == [1, 2]
+    assert [to_channel_id for _, _, _, to_channel_id in plan['moves']] == [2, 2]
+    assert plan['role_grants'] == []
+
+def test_overfull_channels_keep_enough_room():
+    plan = plan_compaction([(1, habits(1, 10)), (2, habits(2, 7)), (3, habits(3, 2))], 8)
+    assert plan['kept_channels'] == [1, 2, 3] and plan['moves'] == []
+
+
+def make_item(name, item_id=None):
+    return SimpleNamespace(id=item_id, name=name, delete=mock.AsyncMock(), edit=mock.AsyncMock(), mention=name)
+
+@pytest.mark.asyncio
+async def test_compaction_reassigns_habits_then_edits_discord(db_handler, add_habit):
+    channels = [make_item(f"habit-tracking-{number}", number) for number in (1, 2, 3, 10)]
+    for channel, owners in zip(channels, ([42, 42, 42, 43, 43, 43], [], [44], [45, 45, 45, 46, 46])):
+        for user_id in owners:
+            add_habit(user_id, channel.id)
+    roles = [make_item(channel.name, 100 + channel.id) for channel in channels]
+    members = {user_id: SimpleNamespace(add_roles=mock.AsyncMock()) for user_id in (42, 43, 44, 45, 46)}
+    category = SimpleNamespace(id=500, name='TRACKING CHANNELS', text_channels=list(reversed(channels)))
+    objects = {item.id: item for item in (category, *channels, *roles)}
+    guild = SimpleNamespace(id=1, categories=[category], text_channels=channels, roles=roles,
+                            get_channel=objects.get, get_role=objects.get, get_member=members.get)
+
+    manager = TrackingChannelManager.__new__(TrackingChannelManager)
+    manager.tracking_channel_prefix = 'habit-tracking'
+    manager.db_handler = db_handler
+    manager.guild = guild
+    manager.guild_index = GuildIndex(guild, None, 'habit-tracking', 'TRACKING CHANNELS')
+
+    report = await manager.compact_channels(dry_run=True)
+    assert report['removed_channels'] == ['habit-tracking-2', 'habit-tracking-3']
+    assert report['moves'] == [(7, 'habit-tracking-3', 'habit-tracking-1')]
+    assert report['renames'] == [('habit-tracking-10', 'habit-tracking-2')]
+    assert not channels[2].delete.called
+    # The roles of the channels created before their IDs were stored are found by name once
+    assert db_handler.get_tracking_channel_roles() == {1: 101, 2: 102, 3: 103, 10: 110}
+
+    await manager.compact_channels(dry_run=False)
+    assert db_handler.conn.execute('SELECT tracking_channel_id FROM habits WHERE id = 7').fetchone() == (1,)
+    assert db_handler.conn.execute('SELECT channel_id, user7_id, user8_id FROM tracking_channels ORDER BY channel_id').fetchall() == [
+        (1, 44, None), (10, None, None)
+    ]
+    members[44].add_roles.assert_awaited_once_with(roles[0])
+    for item in (channels[1], channels[2], roles[1], roles[2]):
+        item.delete.assert_awaited_once()
+    for item in (channels[3], roles[3]):
+        item.edit.assert_awaited_once_with(name='habit-tracking-2')
+    assert manager.guild_index.get_tracking_channels() == [channels[0], channels[3]]
+
+def test_reassignment_is_refused_during_a_session_or_a_declaration(db_handler, add_habit):
+    habit_id = add_habit(channel_id=1)
+    db_handler.add_user_to_tracking_channel(42, 2)
+    db_handler.save_habit_checks([(habit_id, 1, 900, '2024-W01')])
+    with pytest.raises(ValueError, match='habit check session'):
+        db_handler.reassign_habits([(habit_id, 1, 2)], [1])
+    db_handler.delete_habit_checks(['2024-W01'])
+    reservation_id, _, _ = db_handler.reserve_channel_slot([2], 8)
+    with pytest.raises(ValueError, match='declarations are in progress'):
+        db_handler.reassign_habits([(habit_id, 1, 2)], [1])
+    assert db_handler.conn.execute('SELECT tracking_channel_id FROM habits').fetchall() == [(1,)]
+
+    db_handler.release_channel_reservation(reservation_id)
+    db_handler.reassign_habits([(habit_id, 1, 2)], [1])
+    assert db_handler.conn.execute('SELECT tracking_channel_id FROM habits').fetchall() == [(2,)]
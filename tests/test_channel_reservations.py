@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest import mock
+
+from tracking.channel_management import TrackingChannelManager
+from guild_index import GuildIndex
+
+
+def test_reservations_hold_slots_until_saved_released_or_expired(db_handler, add_habit):
+    for _ in range(6):
+        add_habit()
+
+    first_id, channel_id, free_slots = db_handler.reserve_channel_slot([10, 11], 8, 42)
+    assert (channel_id, free_slots) == (10, 1)
+    second_id, _, free_slots = db_handler.reserve_channel_slot([10, 11], 8, 43)
+    assert free_slots == 0
+    assert db_handler.reserve_channel_slot([10, 11], 8)[1] == 11
+    assert db_handler.reserve_channel_slot([10], 8) is None
+
+    # The saved habit takes over its reserved slot, a released one is free again
+    add_habit(reservation_id=first_id)
+    db_handler.release_channel_reservation(second_id)
+    assert db_handler.get_channel_used_slots([10, 11]) == {10: 7, 11: 1}
+    assert db_handler.get_reservation_count() == 1
+
+    with mock.patch('data_handler.time.time', return_value=db_handler.conn.execute('SELECT MAX(expires_at) FROM channel_reservations').fetchone()[0]):
+        assert db_handler.get_channel_used_slots([10, 11]) == {10: 7}
+
+@pytest.mark.asyncio
+async def test_simultaneous_declarations_share_the_channel_creations(db_handler):
+    category = SimpleNamespace(id=500, name='TRACKING CHANNELS', text_channels=[])
+    objects = {category.id: category}
+    guild = SimpleNamespace(id=1, categories=[category], text_channels=[], roles=[], get_channel=objects.get, get_role=objects.get)
+
+    manager = TrackingChannelManager.__new__(TrackingChannelManager)
+    manager.guild = guild
+    manager.tracking_channel_prefix = 'habit-tracking'
+    manager.use_job_queue = False
+    manager.db_handler = db_handler
+    manager.guild_index = GuildIndex(guild, None, 'habit-tracking', 'TRACKING CHANNELS')
+    created_channels = []
+
+    async def create_tracking_channel(category, name):
+        await asyncio.sleep(0.01)
+        channel = objects[len(objects)] = SimpleNamespace(id=len(objects), name=name)
+        manager.guild_index.add_tracking_channel(channel.id, None)
+        created_channels.append(name)
+        return channel
+    manager._create_tracking_channel = create_tracking_channel
+
+    reservations = await asyncio.gather(*(manager.reserve_tracking_channel(user_id) for user_id in range(20)))
+    assert created_channels == ['habit-tracking-1', 'habit-tracking-2', 'habit-tracking-3']
+    assert db_handler.get_channel_used_slots([1, 2, 3]) == {1: 8, 2: 8, 3: 4}
+    assert len({reservation_id for _, reservation_id in reservations}) == 20
+
+@pytest.mark.asyncio
+async def test_declarations_wait_for_the_queued_channel_creation(db_handler):
+    category = SimpleNamespace(id=500, name='TRACKING CHANNELS', text_channels=[])
+    objects = {category.id: category}
+    guild = SimpleNamespace(id=1, categories=[category], text_channels=[], roles=[], get_channel=objects.get, get_role=objects.get)
+
+    manager = TrackingChannelManager.__new__(TrackingChannelManager)
+    manager.guild = guild
+    manager.tracking_channel_prefix = 'habit-tracking'
+    manager.use_job_queue = True
+    manager.db_handler = db_handler
+    manager.guild_index = GuildIndex(guild, None, 'habit-tracking', 'TRACKING CHANNELS')
+    created_channels = []
+
+    def add_channel(name):
+        channel = objects[len(objects)] = SimpleNamespace(id=len(objects), name=name)
+        manager.guild_index.add_tracking_channel(channel.id, None)
+        return channel
+
+    async def create_tracking_channel(category, name):
+        created_channels.append(name)
+        return add_channel(name)
+    manager._create_tracking_channel = create_tracking_channel
+
+    # Filling the last slot of the first channel queues the creation of the second one
+    for user_id in range(8):
+        await manager.reserve_tracking_channel(user_id)
+    assert db_handler.conn.execute("SELECT COUNT(*) FROM jobs WHERE kind = 'channel.provision'").fetchone()[0] == 1
+
+    async def provision():
+        # The worker runs the job while the next declaration finds every channel full
+        await asyncio.sleep(0.05)
+        return add_channel('habit-tracking-2')
+
+    with mock.patch('tracking.channel_management.CHANNEL_CREATION_POLL_SECONDS', 0.01):
+        (channel, _), _ = await asyncio.gather(manager.reserve_tracking_channel(8), provision())
+    assert channel.name == 'habit-tracking-2'
+    assert created_channels == ['habit-tracking-1']
+
+    # The job claimed the creation when it was queued, it can claim it again when it runs, others cannot
+    assert db_handler.claim_channel_creation('habit-tracking-2', owner='channel.provision')
+    assert not db_handler.claim_channel_creation('habit-tracking-2')
+    db_handler.release_channel_creations(['habit-tracking-2'])
+    assert db_handler.claim_channel_creation('habit-tracking-2')
@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+import zipfile
+import pytest
+
+from data_handler import DatabaseHandler
+from data_export import export_guild_data
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    db_name = str(tmp_path / 'export.db')
+    db_handler = DatabaseHandler(init=True, db_name=db_name)
+    for guild_id, user_id, habit_name in ((1, 42, 'Read'), (1, 43, 'Run'), (2, 44, 'Write')):
+        db_handler.guild_id = guild_id
+        db_handler.add_user(user_id, f"user-{user_id}")
+        db_handler.add_user_to_tracking_channel(user_id, 10 * guild_id)
+        habit_id = db_handler.add_habit_with_data({
+            'metadata': {'user_id': str(user_id)},
+            'declaration': {'habit_name': habit_name, 'time_location': 'daily', 'identity': 'a tester'},
+        }, 10 * guild_id)
+        for week in range(30, 40):
+            db_handler.mark_habit_completed(habit_id, week % 3 != 0, week_key=f"2024-W{week}")
+    db_handler.close()
+    return db_name
+
+def read_archive(archive, name):
+    with zipfile.ZipFile(archive) as zip_file:
+        return zip_file.read(name).decode('utf-8')
+
+def test_csv_export_streams_the_guild_in_chunks(db_name):
+    archive, row_counts = export_guild_data(db_name, 1, 'csv', chunk_size=3)
+    assert row_counts == {'users': 2, 'habits': 2, 'tracking': 20}
+
+    tracking = list(csv.DictReader(io.StringIO(read_archive(archive, 'tracking.csv'))))
+    assert len(tracking) == 20 and {row['habit_id'] for row in tracking} == {'1', '2'}
+    users = list(csv.reader(io.StringIO(read_archive(archive, 'users.csv'))))
+    assert users == [['user_id', 'username'], ['42', 'user-42'], ['43', 'user-43']]
+    archive.close()
+
+def test_jsonl_export(db_name):
+    archive, row_counts = export_guild_data(db_name, 2, 'jsonl', chunk_size=4)
+    habits = [json.loads(line) for line in read_archive(archive, 'habits.jsonl').splitlines()]
+    assert habits == [{'id': 3, 'user_id': 44, 'tracking_channel_id': 20, 'habit_name': 'Write', 'time_location': 'daily', 'identity': 'a tester'}]
+    assert row_counts['tracking'] == 10
+    archive.close()
+
+def test_parquet_export(db_name):
+    pq = pytest.importorskip('pyarrow.parquet')
+    archive, _ = export_guild_data(db_name, None, 'parquet', chunk_size=7)
+    with zipfile.ZipFile(archive) as zip_file:
+        tracking = pq.read_table(io.BytesIO(zip_file.read('tracking.parquet')))
+    assert tracking.num_rows == 30
+    assert str(tracking.schema.field('completed').type) == 'bool'
+    archive.close()
@@ -0,0 +1,131 @@
+import io
+import zipfile
+import pytest
+from types import SimpleNamespace
+from unittest import mock
+
+from data_handler import DatabaseHandler
+from data_export import export_guild_data
+from data_import import ImportArchive, import_guild_data
+from tracking.channel_management import TrackingChannelManager
+
+
+def make_database(db_name, guild_id, habits):
+    db_handler = DatabaseHandler(init=True, db_name=db_name, guild_id=guild_id)
+    for user_id, habit_name, weeks in habits:
+        db_handler.add_user(user_id, f"user-{user_id}")
+        db_handler.add_user_to_tracking_channel(user_id, 10)
+        habit_id = db_handler.add_habit_with_data({
+            'metadata': {'user_id': str(user_id)},
+            'declaration': {'habit_name': habit_name, 'time_location': 'daily', 'identity': 'a tester'},
+        }, 10)
+        for week, completed in weeks:
+            db_handler.mark_habit_completed(habit_id, completed, week_key=f"2024-W{week:02d}")
+    return db_handler
+
+def make_archive(files):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+        for name, content in files.items():
+            zip_file.writestr(name, content)
+    archive.seek(0)
+    return archive
+
+@pytest.mark.parametrize('file_format', ['csv', 'jsonl'])
+def test_exported_history_is_imported_with_the_same_streaks(tmp_path, file_format):
+    source = make_database(str(tmp_path / 'source.db'), 1, [
+        (42, 'Read', [(30, True), (31, True), (32, False), (33, True), (34, True), (35, True)]),
+        (43, 'Run', [(30, True), (32, True), (33, True)]),
+    ])
+    exported, _ = export_guild_data(source.db_name, 1, file_format)
+
+    target = make_database(str(tmp_path / 'target.db'), 5, [(42, 'Write', [(30, True)])])
+    archive = ImportArchive(exported)
+    counts = import_guild_data(target.db_name, 5, archive, channel_slots=[100, 101])
+    archive.close()
+    assert counts == {'users': 1, 'habits': 2, 'tracking': 9, 'skipped_tracking': 0}
+
+    def streaks(db_handler, habit_ids):
+        return [db_handler.conn.execute('SELECT week_key, streak FROM tracking WHERE habit_id = ? ORDER BY week_key', (habit_id,)).fetchall() for habit_id in habit_ids]
+
+    assert streaks(target, [2, 3]) == streaks(source, [1, 2])
+    assert target.conn.execute('SELECT id, guild_id, tracking_channel_id FROM habits ORDER BY id').fetchall() == [(1, 5, 10), (2, 5, 100), (3, 5, 101)]
+    assert target.conn.execute('SELECT channel_id, guild_id, user1_id FROM tracking_channels ORDER BY channel_id').fetchall() == [(10, 5, 42), (100, 5, 42), (101, 5, 43)]
+    assert target.conn.execute('SELECT DISTINCT guild_id FROM tracking').fetchall() == [(5,)]
+    source.close()
+    target.close()
+
+def test_an_invalid_record_imports_nothing(tmp_path):
+    target = make_database(str(tmp_path / 'target.db'), 5, [])
+    archive = ImportArchive(make_archive({
+        'users.csv': 'user_id,username\n42,tester\n',
+        'habits.csv': 'id,user_id,habit_name\n7,42,Read\n',
+        'tracking.csv': 'habit_id,week_key,completed\n7,2024-W30,true\n7,week 31,true\n8,2024-W30,false\n',
+    }))
+    with pytest.raises(ValueError, match='line 3 of tracking.csv'):
+        import_guild_data(target.db_name, 5, archive, channel_slots=[100])
+    assert target.conn.execute('SELECT COUNT(*) FROM users').fetchone() == (0,)
+    assert target.conn.execute('SELECT COUNT(*) FROM habits').fetchone() == (0,)
+    target.close()
+
+@pytest.mark.asyncio
+async def test_an_invalid_archive_creates_no_channel():
+    from tracking.tracking_handler import TrackingHandler
+    tracking_handler = TrackingHandler.__new__(TrackingHandler)
+    tracking_handler.tracking_channel_manager = mock.MagicMock(get_channel_slots=mock.AsyncMock())
+    archive = make_archive({
+        'users.csv': 'user_id,username\n42,tester\n',
+        'habits.csv': 'id,user_id,habit_name\n7,42,Read\n',
+        'tracking.csv': 'habit_id,week_key,completed\n7,2024-W30,maybe\n',
+    })
+    with pytest.raises(ValueError, match='line 2 of tracking.csv'):
+        await tracking_handler.import_archive(archive)
+    tracking_handler.tracking_channel_manager.get_channel_slots.assert_not_called()
+
+def test_archive_needs_every_table():
+    with pytest.raises(ValueError, match='needs a users, habits, tracking file'):
+        ImportArchive(make_archive({'users.csv': 'user_id\n', 'habits.jsonl': ''}))
+
+@pytest.mark.asyncio
+async def test_channel_slots_fill_existing_channels_before_creating_new_ones(tmp_path):
+    db_handler = DatabaseHandler(init=True, db_name=str(tmp_path / 'slots.db'), guild_id=1)
+    for channel_id, used_slots in ((1, 8), (2, 5)):
+        for _ in range(used_slots):
+            db_handler.reserve_channel_slot([channel_id], 8)
+    channels = [SimpleNamespace(id=1, name='habit-tracking-1'), SimpleNamespace(id=2, name='habit-tracking-2')]
+    manager = TrackingChannelManager.__new__(TrackingChannelManager)
+    manager.tracking_channel_prefix = 'habit-tracking'
+    manager.db_handler = db_handler
+    manager.guild = SimpleNamespace(id=1)
+    manager._get_category = mock.AsyncMock()
+    manager._get_tracking_channels = lambda: list(channels)
+    created_channels = []
+
+    async def create_tracking_channel(category, name):
+        created_channels.append(name)
+        channels.append(SimpleNamespace(id=len(channels) + 1, name=name))
+        return channels[-1]
+    manager._create_tracking_channel = create_tracking_channel
+
+    reservations = await manager.get_channel_slots(12)
+    assert [channel_id for _, channel_id in reservations] == [2] * 3 + [3] * 8 + [4]
+    assert created_channels == ['habit-tracking-3', 'habit-tracking-4']
+    # A declaration made during the import cannot take the reserved slots
+    assert db_handler.reserve_channel_slot([1, 2, 3, 4], 8)[1:] == (4, 6)
+
+    manager.release_channel_slots(reservations)
+    assert db_handler.get_channel_used_slots([1, 2, 3, 4]) == {1: 8, 2: 5, 4: 1}
+    db_handler.close()
+
+def test_import_into_a_full_channel_imports_nothing(tmp_path):
+    target = make_database(str(tmp_path / 'target.db'), 5, [(42, f"Habit {i}", []) for i in range(7)])
+    archive = ImportArchive(make_archive({
+        'users.csv': 'user_id,username\n43,tester\n',
+        'habits.csv': 'id,user_id,habit_name\n1,43,Read\n2,43,Run\n',
+        'tracking.csv': 'habit_id,week_key,completed\n',
+    }))
+    with pytest.raises(ValueError, match='no free slot'):
+        import_guild_data(target.db_name, 5, archive, channel_slots=[10, 10])
+    assert target.conn.execute('SELECT COUNT(*) FROM habits').fetchone() == (7,)
+    archive.close()
+    target.close()
@@ -0,0 +1,82 @@
+import pytest
+from unittest import mock
+from tracking.tracking_handler import TrackingHandler
+from tracking.leaderboard import GuildLeaderboard
+
+
+@pytest.fixture
+def tracking_handler():
+    """TrackingHandler with mocked guild and database"""
+    handler = TrackingHandler.__new__(TrackingHandler)
+    handler.use_job_queue = False
+    handler.leaderboard = GuildLeaderboard()
+    handler.db_handler = mock.MagicMock()
+    handler.db_handler.get_habit_completion_status.return_value = None
+    handler.channels = {}
+
+    def get_channel(channel_id):
+        channel = handler.channels.setdefault(channel_id, mock.MagicMock())
+        channel.get_partial_message.return_value.edit = mock.AsyncMock()
+        return channel
+
+    handler.guild = mock.MagicMock()
+    handler.guild.get_channel.side_effect = get_channel
+    return handler
+
+@pytest.mark.asyncio
+async def test_end_session_edits_by_id_without_fetching(tracking_handler):
+    tracking_handler.db_handler.close_habit_checks.return_value = [(10, 1, 100, '2024-W40'), (11, 1, 101, '2024-W40'), (12, 2, 102, '2024-W40')]
+
+    await tracking_handler.end_habit_check_session()
+
+    for channel in tracking_handler.channels.values():
+        channel.fetch_message.assert_not_called()
+    tracking_handler.channels[1].get_partial_message.assert_has_calls([mock.call(100), mock.call(101)], any_order=True)
+    tracking_handler.channels[2].get_partial_message.assert_called_once_with(102)
+
+    # Unanswered checks are marked as failed
+    assert tracking_handler.db_handler.mark_habit_completed.call_count == 3
+    # The finalized session is forgotten
+    tracking_handler.db_handler.delete_habit_checks.assert_called_once_with(['2024-W40'])
+
+@pytest.mark.asyncio
+async def test_end_session_without_sent_checks(tracking_handler):
+    tracking_handler.db_handler.close_habit_checks.return_value = []
+
+    await tracking_handler.end_habit_check_session()
+
+    tracking_handler.db_handler.mark_habit_completed.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_session_is_finalized_after_a_restart(db_handler, add_habit):
+    from types import SimpleNamespace
+
+    for habit_name in ('Read', 'Run'):
+        add_habit(habit_name=habit_name)
+    channel = SimpleNamespace(id=10, name='habit-tracking-1', send=mock.AsyncMock(side_effect=[SimpleNamespace(id=100), SimpleNamespace(id=101), SimpleNamespace(id=900)]),
+                              get_partial_message=mock.MagicMock())
+    channel.get_partial_message.return_value.edit = mock.AsyncMock()
+
+    def create_handler():
+        handler = TrackingHandler.__new__(TrackingHandler)
+        handler.use_job_queue = False
+        handler.leaderboard = GuildLeaderboard()
+        handler.db_handler = db_handler
+        handler.guild = SimpleNamespace(id=1, name='guild', get_channel={10: channel}.get)
+        return handler
+
+    checks = [{'habit_id': habit_id, 'user_id': 42, 'content': '', 'embed': None} for habit_id in (1, 2)]
+    await create_handler().send_habit_check_to_tracking_channel(channel, checks, '2024-W40')
+    db_handler.connect()
+    db_handler.mark_habit_completed(1, True, week_key='2024-W40')
+
+    # The bot restarts after the end of the session was missed
+    handler = create_handler()
+    assert [check_record.message_id for check_record in handler.get_check_records()] == [100, 101]
+    await handler.resume_habit_check_session()
+
+    assert channel.get_partial_message.return_value.edit.await_count == 2
+    db_handler.connect()
+    assert db_handler.get_habit_completion_status(2, '2024-W40') == 0
+    assert db_handler.get_habit_checks() == []
+    assert channel.send.await_count == 3  # The two checks and the digest
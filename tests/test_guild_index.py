@@ -0,0 +1,56 @@
+import discord
+import pytest
+from types import SimpleNamespace
+from unittest import mock
+
+from guild_index import GuildIndex
+
+
+def make_role(role_id, name):
+    role = mock.MagicMock(spec=discord.Role)
+    role.id, role.name = role_id, name
+    return role
+
+@pytest.fixture
+def guild():
+    category = SimpleNamespace(id=500, name='TRACKING CHANNELS', text_channels=[])
+    declaration_channel = SimpleNamespace(id=600, name='habit-declaration', category_id=None)
+    category.text_channels = [SimpleNamespace(id=channel_id, name=f"habit-tracking-{number}", category_id=500)
+                              for number, channel_id in ((2, 11), (1, 10))]
+    roles = [make_role(110, 'habit-tracking-1'), make_role(111, 'habit-tracking-2')]
+    objects = {item.id: item for item in (category, declaration_channel, *category.text_channels, *roles)}
+    return SimpleNamespace(id=1, categories=[category], text_channels=[declaration_channel, *category.text_channels], roles=roles,
+                           objects=objects, get_channel=objects.get, get_role=objects.get)
+
+def test_stored_ids_find_renamed_objects(guild, db_handler):
+    GuildIndex(guild, 'habit-declaration', 'habit-tracking', 'TRACKING CHANNELS').load(db_handler)
+    assert db_handler.get_guild_objects() == {'tracking_category': 500, 'declaration_channel': 600}
+
+    # Renamed objects are no longer found by name, the stored IDs still find them
+    for item in (*guild.categories, *guild.text_channels, *guild.roles):
+        item.name = f"renamed-{item.id}"
+    guild_index = GuildIndex(guild, 'habit-declaration', 'habit-tracking', 'TRACKING CHANNELS')
+    guild_index.load(db_handler)
+    assert guild_index.category.id == 500 and guild_index.declaration_channel.id == 600
+    assert [channel.id for channel in guild_index.get_tracking_channels()] == [10, 11]
+    assert guild_index.get_role(11).id == 111
+
+def test_gateway_events_keep_the_index_current(guild, db_handler):
+    guild_index = GuildIndex(guild, 'habit-declaration', 'habit-tracking', 'TRACKING CHANNELS')
+    guild_index.load(db_handler)
+
+    # A channel created by a worker, with its role in the permission overwrites
+    role = guild.objects[112] = make_role(112, 'habit-tracking-3')
+    channel = guild.objects[12] = SimpleNamespace(id=12, name='habit-tracking-3', category_id=500, overwrites={role: None})
+    guild_index.on_channel_create(channel)
+    assert guild_index.get_tracking_channels()[-1] is channel and guild_index.get_role(12) is role
+
+    guild_index.on_role_delete(role)
+    assert guild_index.get_role(12) is None
+    guild_index.on_role_create(role)
+    assert guild_index.get_role(12) is role
+
+    guild_index.on_channel_delete(channel)
+    guild_index.on_channel_delete(guild.objects[600])
+    assert [channel.id for channel in guild_index.get_tracking_channels()] == [10, 11]
+    assert guild_index.declaration_channel is None
@@ -0,0 +1,97 @@
+import sqlite3
+import pytest
+from types import SimpleNamespace
+from unittest import mock
+
+import maestro_bot
+from data_handler import DatabaseHandler
+from guild_registry import GuildRegistry
+
+
+def habit_data(user_id, habit_name):
+    return {
+        'metadata': {'user_id': str(user_id)},
+        'declaration': {'habit_name': habit_name, 'time_location': 'in the morning', 'identity': 'a tester'},
+    }
+
+@pytest.fixture
+def db_name(tmp_path):
+    db_name = str(tmp_path / 'guilds.db')
+    DatabaseHandler(init=True, db_name=db_name).close()
+    return db_name
+
+def test_user_habits_are_scoped_to_the_guild(db_name):
+    first_guild = DatabaseHandler(db_name=db_name, guild_id=1)
+    second_guild = DatabaseHandler(db_name=db_name, guild_id=2)
+    for db_handler, channel_id, habit_name in ((first_guild, 10, 'Read'), (second_guild, 20, 'Run')):
+        db_handler.add_user(42, 'tester')
+        db_handler.add_user_to_tracking_channel(42, channel_id)
+        db_handler.add_habit_with_data(habit_data(42, habit_name), channel_id)
+
+    assert [habit['habit_name'] for habit in first_guild.get_user_habits(42)] == ['Read']
+    assert [habit['habit_name'] for habit in second_guild.get_user_habits(42)] == ['Run']
+    # Without a guild, the handler sees every guild
+    assert len(DatabaseHandler(db_name=db_name).get_user_habit_ids(42)) == 2
+
+    habit_id = second_guild.get_user_habit_ids(42)[0]
+    first_guild.mark_habit_completed(habit_id, True, week_key='2024-W40')
+    assert first_guild.conn.execute('SELECT guild_id FROM tracking WHERE habit_id = ?', (habit_id,)).fetchone() == (2,)
+
+def test_existing_database_is_migrated_and_claimed(tmp_path):
+    db_name = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(db_name)
+    conn.executescript('''
+        CREATE TABLE users (user_id INTEGER NOT NULL UNIQUE, username TEXT);
+        CREATE TABLE habits (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, tracking_channel_id INTEGER,
+                             habit_name TEXT NOT NULL, time_location TEXT, identity TEXT);
+        CREATE TABLE tracking_channels (channel_id INTEGER PRIMARY KEY, user1_id INTEGER, user2_id INTEGER, user3_id INTEGER,
+                                        user4_id INTEGER, user5_id INTEGER, user6_id INTEGER, user7_id INTEGER, user8_id INTEGER);
+        CREATE TABLE tracking (habit_id INTEGER NOT NULL, week_key TEXT NOT NULL, completed BOOLEAN NOT NULL,
+                               streak INTEGER DEFAULT 0, UNIQUE (habit_id, week_key));
+        INSERT INTO habits (user_id, tracking_channel_id, habit_name) VALUES (42, 10, 'Read'), (43, 99, 'Run');
+        INSERT INTO tracking_channels (channel_id, user1_id) VALUES (10, 42), (99, 43);
+        INSERT INTO tracking (habit_id, week_key, completed, streak) VALUES (1, '2024-W40', 1, 1), (2, '2024-W40', 1, 1);
+    ''')
+    conn.close()
+
+    db_handler = DatabaseHandler(init=True, db_name=db_name, guild_id=7)
+    assert db_handler.claim_guild_channels([10, 11]) == 1
+
+    conn = db_handler.conn
+    assert conn.execute('SELECT id, guild_id FROM habits ORDER BY id').fetchall() == [(1, 7), (2, None)]
+    assert conn.execute('SELECT channel_id, guild_id FROM tracking_channels ORDER BY channel_id').fetchall() == [(10, 7), (99, None)]
+    assert conn.execute('SELECT habit_id, guild_id FROM tracking ORDER BY habit_id').fetchall() == [(1, 7), (2, None)]
+    db_handler.close()
+
+def test_registry_creates_handlers_once_per_guild(db_name):
+    def make_guild(guild_id):
+        return SimpleNamespace(id=guild_id, name=f"guild-{guild_id}", text_channels=[], categories=[], roles=[],
+                               get_channel=lambda channel_id: None, get_role=lambda role_id: None)
+
+    registry = GuildRegistry('habit-declaration', 'habit-tracking', 'TRACKING CHANNELS')
+    with mock.patch('data_handler.DB_NAME', db_name):
+        first_guild, second_guild = make_guild(1), make_guild(2)
+        handlers = registry.get(first_guild)
+        assert registry.get(first_guild) is handlers
+        assert registry.get(second_guild).tracking_handler.db_handler.guild_id == 2
+
+        # A new Guild object for the same guild keeps the handlers and their state
+        reconnected_guild = make_guild(1)
+        assert registry.get(reconnected_guild) is handlers
+        assert handlers.tracking_handler.guild is reconnected_guild
+        assert handlers.declaration_handler.tracking_channel_manager.guild is reconnected_guild
+        assert handlers.guild_index.guild is reconnected_guild
+
+    registry.remove(2)
+    assert len(registry) == 1 and 2 not in registry
+
+@pytest.mark.asyncio
+async def test_a_failing_guild_does_not_stop_the_others():
+    failing, working = mock.MagicMock(), mock.MagicMock()
+    failing.send_habit_check_to_all_tracking_channels = mock.AsyncMock(side_effect=RuntimeError('missing permissions'))
+    working.send_habit_check_to_all_tracking_channels = mock.AsyncMock()
+
+    with mock.patch.object(maestro_bot.guild_registry, 'tracking_handlers', return_value=[failing, working]):
+        await maestro_bot.run_for_all_guilds('send_habit_check_to_all_tracking_channels')
+
+    working.send_habit_check_to_all_tracking_channels.assert_awaited_once()
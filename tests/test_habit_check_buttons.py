@@ -0,0 +1,76 @@
+import pytest
+from types import SimpleNamespace
+from unittest import mock
+
+from tracking.components import HabitCheckButton, build_check_view
+from tracking.tracking_handler import CheckRecord
+
+
+def make_interaction(user_id, handlers):
+    return SimpleNamespace(
+        user=SimpleNamespace(id=user_id, name='tester', mention=f"<@{user_id}>"), guild=SimpleNamespace(id=1),
+        client=SimpleNamespace(guild_registry=SimpleNamespace(get=lambda guild: handlers)),
+        message=SimpleNamespace(edit=mock.AsyncMock()), response=SimpleNamespace(send_message=mock.AsyncMock())
+    )
+
+@pytest.mark.asyncio
+async def test_buttons_are_rebuilt_from_their_custom_id():
+    view = build_check_view(7, 42, '2024-W40')
+    custom_ids = [item.custom_id for item in view.children]
+    assert custom_ids == ['habit_check:yes:7:42:2024-W40', 'habit_check:no:7:42:2024-W40', 'habit_check:edit:7:42:2024-W40']
+    # The client does not keep the view of a sent check
+    assert view.is_finished()
+
+    match = HabitCheckButton.__discord_ui_compiled_template__.fullmatch(custom_ids[1])
+    button = await HabitCheckButton.from_custom_id(None, None, match)
+    assert (button.action, button.habit_id, button.user_id, button.week_key) == ('no', 7, 42, '2024-W40')
+    assert button.item.label == "❌ No, not yet"
+
+@pytest.mark.asyncio
+async def test_clicks_are_routed_to_the_guild_handlers():
+    handlers = SimpleNamespace(tracking_handler=SimpleNamespace(handle_check_submission=mock.AsyncMock()))
+    button = HabitCheckButton('yes', 7, 42, '2024-W40')
+
+    other_user = make_interaction(43, handlers)
+    await button.callback(other_user)
+    other_user.response.send_message.assert_awaited_once()
+    handlers.tracking_handler.handle_check_submission.assert_not_awaited()
+
+    owner = make_interaction(42, handlers)
+    await button.callback(owner)
+    handlers.tracking_handler.handle_check_submission.assert_awaited_once_with(owner, 7, '2024-W40', completed=True)
+    disabled_view = owner.message.edit.await_args.kwargs['view']
+    assert all(item.disabled for item in disabled_view.children)
+
+def test_check_records_have_no_instance_dict():
+    check_record = CheckRecord(7, 1, 100, '2024-W40')
+    assert not hasattr(check_record, '__dict__')
+
+@pytest.mark.asyncio
+async def test_only_the_checks_of_the_open_session_can_be_answered(db_handler, add_habit):
+    from tracking.leaderboard import GuildLeaderboard
+    from tracking.tracking_handler import TrackingHandler
+
+    add_habit(weeks=range(38, 42))
+    tracking_handler = TrackingHandler.__new__(TrackingHandler)
+    tracking_handler.db_handler = db_handler
+    tracking_handler.leaderboard = mock.MagicMock(spec=GuildLeaderboard)
+    interaction = make_interaction(42, None)
+
+    # The check of a finalized week
+    assert await tracking_handler.handle_check_submission(interaction, 1, '2024-W39', completed=True) is False
+    assert interaction.response.send_message.await_args.kwargs == {'ephemeral': True}
+    db_handler.connect()
+    assert db_handler.get_current_streak(1) == 4
+    assert db_handler.conn.execute("SELECT streak FROM tracking WHERE week_key = '2024-W39'").fetchone() == (2,)
+
+    # An open check of an older week than the latest record leaves the leaderboard alone
+    db_handler.save_habit_checks([(1, 10, 100, '2024-W40'), (1, 10, 101, '2024-W41')])
+    assert await tracking_handler.handle_check_submission(interaction, 1, '2024-W40', completed=True) is True
+    tracking_handler.leaderboard.update_streak.assert_not_called()
+    assert await tracking_handler.handle_check_submission(interaction, 1, '2024-W41', completed=True) is True
+    tracking_handler.leaderboard.update_streak.assert_called_once_with(1, 4)
+
+    db_handler.connect()
+    db_handler.close_habit_checks()
+    assert await tracking_handler.handle_check_submission(interaction, 1, '2024-W41', completed=False) is False
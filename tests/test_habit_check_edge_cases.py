@@ -2,7 +2,7 @@ import pytest
 import logging
 from unittest import mock  # Keep only mock import
 from datetime import datetime, timedelta, timezone
-from maestro_bot import check_habits, tracking_handler
+from maestro_bot import check_habits
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -22,7 +22,8 @@ def mock_tracking_handler():
     mock_th = mock.MagicMock()  # Use MagicMock for async methods
     mock_th.send_habit_check_to_all_tracking_channels = mock.AsyncMock()  # Use mock.AsyncMock here
     mock_th.end_habit_check_session = mock.AsyncMock()
-    with mock.patch('maestro_bot.tracking_handler', mock_th):
+    mock_th.prepare_habit_check = mock.AsyncMock()
+    with mock.patch('maestro_bot.guild_registry.tracking_handlers', return_value=[mock_th]):
         yield mock_th
 
 # Test right before and after 12:00 PM on Saturday
@@ -44,6 +45,27 @@ async def test_habit_check_boundary(mock_datetime, mock_tracking_handler):
     await check_habits()
     mock_tracking_handler.send_habit_check_to_all_tracking_channels.assert_not_called()
 
+# Test the preparation right before and after 11:55 AM on Saturday
+@pytest.mark.asyncio
+async def test_habit_check_preparation_boundary(mock_datetime, mock_tracking_handler):
+    # Set datetime to 11:54 AM on Saturday (should not prepare)
+    mock_datetime.now.return_value = datetime(2024, 10, 5, 11, 54, 0, tzinfo=utc_plus_3)
+    await check_habits()
+    mock_tracking_handler.prepare_habit_check.assert_not_called()
+
+    # Set datetime to 11:55 AM on Saturday (should prepare, but not send yet)
+    mock_datetime.now.return_value = datetime(2024, 10, 5, 11, 55, 0, tzinfo=utc_plus_3)
+    await check_habits()
+    mock_tracking_handler.prepare_habit_check.assert_called_once()
+    mock_tracking_handler.send_habit_check_to_all_tracking_channels.assert_not_called()
+    mock_tracking_handler.prepare_habit_check.reset_mock()
+
+    # Set datetime to 12:00 PM on Saturday (should send without preparing again)
+    mock_datetime.now.return_value = datetime(2024, 10, 5, 12, 0, 0, tzinfo=utc_plus_3)
+    await check_habits()
+    mock_tracking_handler.prepare_habit_check.assert_not_called()
+    mock_tracking_handler.send_habit_check_to_all_tracking_channels.assert_called_once()
+
 # Test right before and after 23:59 PM on Saturday
 @pytest.mark.asyncio
 async def test_end_habit_check_boundary(mock_datetime, mock_tracking_handler):
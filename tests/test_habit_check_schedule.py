@@ -2,7 +2,7 @@ import pytest
 import logging
 from unittest import mock  # Keep only mock import
 from datetime import datetime, timedelta, timezone
-from maestro_bot import check_habits, tracking_handler
+from maestro_bot import check_habits
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -22,7 +22,8 @@ def mock_tracking_handler():
     mock_th = mock.MagicMock()  # Use MagicMock for async methods
     mock_th.send_habit_check_to_all_tracking_channels = mock.AsyncMock()  # Use mock.AsyncMock here
     mock_th.end_habit_check_session = mock.AsyncMock()
-    with mock.patch('maestro_bot.tracking_handler', mock_th):
+    mock_th.prepare_habit_check = mock.AsyncMock()
+    with mock.patch('maestro_bot.guild_registry.tracking_handlers', return_value=[mock_th]):
         yield mock_th
 
 # Test habit check triggers exactly at 12:00 on Saturday and ends at 23:59
@@ -45,6 +46,12 @@ async def test_habit_check_every_minute_of_the_week(mock_datetime, mock_tracking
                 else:
                     mock_tracking_handler.send_habit_check_to_all_tracking_channels.assert_not_called()
 
+                # Check that habit check is only prepared at 11:55 AM on Saturday
+                if current_time.weekday() == 5 and current_time.hour == 11 and current_time.minute == 55:
+                    mock_tracking_handler.prepare_habit_check.assert_called_once()
+                else:
+                    mock_tracking_handler.prepare_habit_check.assert_not_called()
+
                 # Check that habit check session only ends at 23:59 on Saturday
                 if current_time.weekday() == 5 and current_time.hour == 23 and current_time.minute == 59:
                     mock_tracking_handler.end_habit_check_session.assert_called_once()
@@ -54,3 +61,4 @@ async def test_habit_check_every_minute_of_the_week(mock_datetime, mock_tracking
                 # Reset the mocks for the next minute
                 mock_tracking_handler.send_habit_check_to_all_tracking_channels.reset_mock()
                 mock_tracking_handler.end_habit_check_session.reset_mock()
+                mock_tracking_handler.prepare_habit_check.reset_mock()
@@ -0,0 +1,70 @@
+import pytest
+from types import SimpleNamespace
+from unittest import mock
+
+from data_handler import DatabaseHandler
+from declaration.components import DetailedHabitCardView
+
+
+@pytest.fixture
+def tracking_handler(tmp_path):
+    db_name = str(tmp_path / 'pages.db')
+    db_handler = DatabaseHandler(init=True, db_name=db_name, guild_id=1)
+    db_handler.add_user(42, 'tester')
+    for i in range(23):
+        db_handler.add_user_to_tracking_channel(42, 10 + i // 8)
+        habit_id = db_handler.add_habit_with_data({
+            'metadata': {'user_id': '42'},
+            # Three long habits do not fit on a page together
+            'declaration': {'habit_name': f"Habit {i}", 'time_location': 'x' * (1000 if i in (12, 13, 14) else 10),
+                            'identity': 'y' * (900 if i in (12, 13, 14) else 8)},
+        }, 10 + i // 8)
+        db_handler.mark_habit_completed(habit_id, True, week_key='2024-W30')
+    db_handler.close()
+    # The view reconnects the handler's connection
+    yield SimpleNamespace(db_handler=DatabaseHandler(db_name=db_name, guild_id=1))
+
+def make_interaction(user_id=42):
+    return SimpleNamespace(user=SimpleNamespace(id=user_id, name='tester'), response=SimpleNamespace(edit_message=mock.AsyncMock(), send_message=mock.AsyncMock()))
+
+@pytest.mark.asyncio
+async def test_habits_are_paged_in_one_message(tracking_handler):
+    channels = {channel_id: SimpleNamespace(id=channel_id, name=f"habit-tracking-{channel_id - 9}") for channel_id in (10, 11, 12)}
+    view = DetailedHabitCardView(SimpleNamespace(get_channel=channels.get), tracking_handler, None, SimpleNamespace(id=42))
+
+    embeds = view.show_page(0)
+    assert [embed.title for embed in embeds] == [f"Habit {i}" for i in range(10)]
+    assert embeds[0].fields[1].value == '🔥 1 weeks'
+    assert [item.label for item in view.children[-3:]] == ['◀ Previous', '1-10 of 23', 'Next ▶']
+    # Only the shown page is rendered
+    assert list(view.page_embeds) == [0]
+
+    interaction = make_interaction()
+    await view.children[-1].callback(interaction)
+    embeds = interaction.response.edit_message.await_args.kwargs['embeds']
+    assert [embed.title for embed in embeds] == [f"Habit {i}" for i in range(10, 14)]
+    assert sum(len(embed) for embed in embeds) <= 6000
+
+    await view.children[-1].callback(interaction)
+    assert view.children[-2].label == '15-23 of 23' and view.children[-1].disabled
+    assert view.children[0].label == 'Edit Habit 14'
+
+    other_user = make_interaction(user_id=43)
+    await view.children[-3].callback(other_user)
+    other_user.response.send_message.assert_awaited_once()
+    assert view.page == 2
+
+@pytest.mark.asyncio
+async def test_an_edited_habit_is_shown_in_place(tracking_handler):
+    channels = {channel_id: SimpleNamespace(id=channel_id, name=f"habit-tracking-{channel_id - 9}") for channel_id in (10, 11, 12)}
+    declaration_handler = SimpleNamespace(send_habit_edit_modal=mock.AsyncMock(return_value={
+        'declaration': {'habit_name': 'Read', 'time_location': 'at night', 'identity': 'a reader'}
+    }))
+    view = DetailedHabitCardView(SimpleNamespace(get_channel=channels.get), tracking_handler, declaration_handler, SimpleNamespace(id=42))
+    view.show_page(0)
+    view.interaction = SimpleNamespace(edit_original_response=mock.AsyncMock())
+
+    await view.children[1].callback(make_interaction())
+    embeds = view.interaction.edit_original_response.await_args.kwargs['embeds']
+    assert embeds[1].title == 'Read' and embeds[1].fields[2].value == 'at night'
+    assert declaration_handler.send_habit_edit_modal.await_args.args[1]['habit_id'] == 2
@@ -0,0 +1,111 @@
+import pytest
+import time
+from unittest import mock
+
+from data_handler import DatabaseHandler
+from jobs.worker import JOB_HANDLERS, JobWorker, job_handler
+from jobs.handlers import finalize_habit_check
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    db_name = str(tmp_path / 'jobs.db')
+    DatabaseHandler(init=True, db_name=db_name).close()
+    return db_name
+
+@pytest.fixture
+def db_handler(db_name):
+    db_handler = DatabaseHandler(db_name=db_name)
+    yield db_handler
+    db_handler.close()
+
+def test_idempotency_key_prevents_duplicates(db_handler):
+    job_id = db_handler.enqueue_job('backup.upload', {}, idempotency_key='backup.upload:1')
+    assert job_id is not None
+    assert db_handler.enqueue_job('backup.upload', {}, idempotency_key='backup.upload:1') is None
+    assert db_handler.enqueue_job('backup.upload', {}, idempotency_key='backup.upload:2') != job_id
+
+def test_claimed_job_is_invisible_until_its_timeout(db_handler):
+    job_id = db_handler.enqueue_job('test.job', {'value': 1})
+
+    job = db_handler.claim_job('worker-a', visibility_timeout=60)
+    assert job == {'id': job_id, 'kind': 'test.job', 'payload': {'value': 1}, 'attempts': 1, 'max_attempts': 5}
+    assert db_handler.claim_job('worker-b', visibility_timeout=60) is None
+
+    # The visibility timeout of worker-a expired, worker-b takes the job over
+    db_handler.conn.execute('UPDATE jobs SET locked_until = ? WHERE id = ?', (time.time() - 1, job_id))
+    assert db_handler.claim_job('worker-b', visibility_timeout=60)['attempts'] == 2
+    assert db_handler.complete_job(job_id, 'worker-a') is False
+    assert db_handler.complete_job(job_id, 'worker-b') is True
+    assert db_handler.get_job(job_id)['status'] == 'done'
+
+def test_failed_job_is_retried_until_its_attempts_are_used(db_handler):
+    job_id = db_handler.enqueue_job('test.job', {}, max_attempts=2)
+
+    db_handler.claim_job('worker', visibility_timeout=60)
+    assert db_handler.retry_job(job_id, 'worker', 'timeout', delay=30) == 'queued'
+    assert db_handler.claim_job('worker', visibility_timeout=60) is None  # Backing off
+
+    db_handler.conn.execute('UPDATE jobs SET run_at = ? WHERE id = ?', (time.time() - 1, job_id))
+    db_handler.claim_job('worker', visibility_timeout=60)
+    assert db_handler.retry_job(job_id, 'worker', 'timeout', delay=30) == 'failed'
+    assert db_handler.get_job(job_id)['last_error'] == 'timeout'
+
+@pytest.mark.asyncio
+async def test_worker_runs_handlers_and_backs_off_on_failure(db_name, db_handler):
+    calls = []
+
+    @job_handler('test.flaky')
+    async def flaky(context, payload):
+        calls.append(payload)
+        if len(calls) == 1:
+            raise RuntimeError('Discord is down')
+
+    try:
+        worker = JobWorker(client=None, db_name=db_name, worker_id='worker')
+        job_id = db_handler.enqueue_job('test.flaky', {'attempt': 'any'})
+
+        assert await worker.run_once() is True
+        job = db_handler.get_job(job_id)
+        assert job['status'] == 'queued' and job['run_at'] > time.time()
+
+        db_handler.conn.execute('UPDATE jobs SET run_at = ? WHERE id = ?', (time.time() - 1, job_id))
+        db_handler.conn.commit()
+        assert await worker.run_once() is True
+        assert db_handler.get_job(job_id)['status'] == 'done'
+        assert await worker.run_once() is False
+        assert len(calls) == 2
+    finally:
+        JOB_HANDLERS.pop('test.flaky')
+        worker.db_handler.close()
+
+@pytest.mark.asyncio
+async def test_finalize_job_disables_buttons_and_fails_unanswered_checks(db_name, db_handler):
+    db_handler.add_user(42, 'tester')
+    for habit_name in ('Read', 'Run'):
+        db_handler.add_user_to_tracking_channel(42, 10)
+        db_handler.add_habit_with_data({
+            'metadata': {'user_id': '42'},
+            'declaration': {'habit_name': habit_name, 'time_location': 'daily', 'identity': 'a tester'},
+        }, 10)
+    db_handler.mark_habit_completed(1, True, week_key='2024-W40')
+
+    client = mock.MagicMock()
+    message = client.get_partial_messageable.return_value.get_partial_message.return_value
+    message.edit = mock.AsyncMock()
+    client.get_partial_messageable.return_value.send = mock.AsyncMock(return_value=mock.MagicMock(id=900))
+    checks = [{'habit_id': habit_id, 'channel_id': 10, 'message_id': 100 + habit_id, 'week_key': '2024-W40'} for habit_id in (1, 2)]
+
+    context = mock.MagicMock(client=client, db_name=db_name)
+    await finalize_habit_check(context, {'guild_id': None, 'checks': checks})
+    # Running the job again changes nothing
+    await finalize_habit_check(context, {'guild_id': None, 'checks': checks})
+
+    assert message.edit.await_count == 4
+    assert all(item.disabled for item in message.edit.await_args.kwargs['view'].children)
+    assert db_handler.get_habit_completion_status(1, '2024-W40') == 1
+    assert db_handler.get_habit_completion_status(2, '2024-W40') == 0
+    # One digest for the channel, with the unanswered check counted apart
+    client.get_partial_messageable.return_value.send.assert_awaited_once()
+    digest = client.get_partial_messageable.return_value.send.await_args.kwargs['embed']
+    assert [field.value for field in digest.fields[:3]] == ['1', '0', '1']
@@ -0,0 +1,92 @@
+import random
+import pytest
+from types import SimpleNamespace
+from unittest import mock
+
+from data_handler import DatabaseHandler
+from tracking.leaderboard import FenwickTree, GuildLeaderboard, Leaderboard
+
+
+def test_fenwick_tree_grows_past_its_initial_size():
+    tree = FenwickTree(4)
+    for index in (0, 3, 3, 9):
+        tree.add(index, 1)
+    assert tree.size == 16
+    assert [tree.prefix_sum(index) for index in (0, 2, 3, 8, 9, 100)] == [1, 1, 3, 3, 4, 4]
+    assert [tree.find(k) for k in (1, 2, 3, 4)] == [0, 3, 3, 9]
+
+def test_ranks_match_a_full_sort():
+    rng = random.Random(7)
+    leaderboard = Leaderboard()
+    streaks = {}
+    for _ in range(2000):
+        habit_id = rng.randrange(300)
+        if rng.random() < 0.1:
+            leaderboard.remove(habit_id)
+            streaks.pop(habit_id, None)
+        else:
+            streaks[habit_id] = rng.choice([0, 0, 1, 2, 3, rng.randrange(200)])
+            leaderboard.update(habit_id, streaks[habit_id])
+
+    for habit_id, streak in streaks.items():
+        assert leaderboard.rank(habit_id) == 1 + sum(other > streak for other in streaks.values())
+
+    top = leaderboard.top(20)
+    expected_streaks = sorted((streak for streak in streaks.values() if streak > 0), reverse=True)[:20]
+    assert [streak for _, _, streak in top] == expected_streaks
+    assert all(leaderboard.rank(habit_id) == rank for rank, habit_id, _ in top)
+
+def test_habits_move_between_channel_boards():
+    leaderboard = GuildLeaderboard()
+    leaderboard.load([
+        {'habit_id': 1, 'user_id': '42', 'tracking_channel_id': 10, 'habit_name': 'Read', 'current_streak': 5},
+        {'habit_id': 2, 'user_id': '43', 'tracking_channel_id': 10, 'habit_name': 'Run', 'current_streak': 3},
+        {'habit_id': 3, 'user_id': '42', 'tracking_channel_id': 20, 'habit_name': 'Write', 'current_streak': 4},
+    ])
+    assert [habit_id for _, habit_id, _ in leaderboard.get_board().top(10)] == [1, 3, 2]
+    assert leaderboard.get_user_ranks(42) == [(1, 1, 5), (2, 3, 4)]
+
+    leaderboard.set_habit(2, 43, 20, 'Run')
+    leaderboard.update_streak(2, 6)
+    assert 10 in leaderboard.channel_boards and leaderboard.get_board(10).top(10) == [(1, 1, 5)]
+    assert leaderboard.get_board(20).top(10) == [(1, 2, 6), (2, 3, 4)]
+
+    leaderboard.remove_habit(1)
+    assert 10 not in leaderboard.channel_boards
+    assert leaderboard.get_user_ranks(42, tracking_channel_id=10) == []
+
+def test_leaderboard_follows_checks_and_worker_finalization(tmp_path):
+    db_name = str(tmp_path / 'leaderboard.db')
+    db_handler = DatabaseHandler(init=True, db_name=db_name, guild_id=1)
+    db_handler.add_user(42, 'tester')
+    db_handler.add_user_to_tracking_channel(42, 10)
+    db_handler.add_user_to_tracking_channel(42, 10)
+    habit_ids = [
+        db_handler.add_habit_with_data({
+            'metadata': {'user_id': '42'},
+            'declaration': {'habit_name': habit_name, 'time_location': 'daily', 'identity': 'a tester'},
+        }, 10)
+        for habit_name in ('Read', 'Run')
+    ]
+    assert db_handler.mark_habit_completed(habit_ids[0], True, week_key='2024-W39') == 1
+    assert db_handler.mark_habit_completed(habit_ids[0], True, week_key='2024-W40') == 2
+    assert db_handler.mark_habit_completed(habit_ids[1], True, week_key='2024-W40') == 1
+
+    with mock.patch('data_handler.DB_NAME', db_name):
+        from tracking.tracking_handler import CheckRecord, TrackingHandler
+        guild = SimpleNamespace(id=1, name='guild')
+        tracking_handler = TrackingHandler(guild, mock.MagicMock(), 'habit-tracking', 'TRACKING CHANNELS', use_job_queue=True)
+
+    leaderboard = tracking_handler.get_leaderboard()
+    assert leaderboard.get_user_ranks(42) == [(1, habit_ids[0], 2), (2, habit_ids[1], 1)]
+
+    # A worker fails the unanswered check of the second habit
+    job_id = tracking_handler.queue_habit_check_finalization([CheckRecord(habit_ids[1], 10, 100, '2024-W41')])
+    db_handler.mark_habit_completed(habit_ids[1], False, week_key='2024-W41')
+    assert tracking_handler.get_leaderboard().get_board().streaks[habit_ids[1]] == 1
+
+    db_handler.conn.execute("UPDATE jobs SET status = 'done' WHERE id = ?", (job_id,))
+    db_handler.conn.commit()
+    assert tracking_handler.get_leaderboard().get_board().streaks[habit_ids[1]] == 0
+    assert tracking_handler.pending_leaderboard_refresh is None
+    db_handler.close()
@@ -0,0 +1,55 @@
+import io
+import json
+import logging
+import queue
+import pytest
+from monitoring.logging_setup import DeferredQueueHandler, configure_logging, stop_logging, parse_log_levels
+
+
+@pytest.fixture
+def log_stream():
+    """Configure logging into a buffer and restore the previous root logger afterwards"""
+    root_logger = logging.getLogger()
+    handlers, level = root_logger.handlers[:], root_logger.level
+    stream = io.StringIO()
+    configure_logging(level='INFO', levels={'maestro.quiet': 'WARNING'}, log_format='json', stream=stream)
+    yield stream
+    stop_logging()
+    root_logger.handlers[:] = handlers
+    root_logger.setLevel(level)
+
+def read_records(stream):
+    stop_logging()  # Flushes the queue
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+def test_records_are_written_as_json(log_stream):
+    logging.getLogger('maestro.test').info("Habit %s marked with streak %d", 42, 3)
+
+    records = read_records(log_stream)
+    assert len(records) == 1
+    assert records[0]['message'] == "Habit 42 marked with streak 3"
+    assert records[0]['level'] == 'INFO'
+    assert records[0]['logger'] == 'maestro.test'
+
+def test_per_subsystem_levels(log_stream):
+    logging.getLogger('maestro.quiet').info("Dropped")
+    logging.getLogger('maestro.quiet').warning("Kept")
+    logging.getLogger('maestro.test').debug("Dropped by the root level")
+
+    assert [record['message'] for record in read_records(log_stream)] == ["Kept"]
+
+def test_queue_handler_merges_the_message_when_logged():
+    values = ['before']
+    record = logging.LogRecord('maestro.test', logging.INFO, __file__, 1, "Values: %s", (values,), None)
+
+    prepared = DeferredQueueHandler(queue.SimpleQueue()).prepare(record)
+    values.append('after')
+
+    assert prepared.msg == "Values: ['before']" and prepared.args is None
+    # The rest of the formatting is left to the listener thread
+    assert prepared.exc_text is None and not hasattr(prepared, 'message')
+
+def test_parse_log_levels():
+    assert parse_log_levels("discord=warning, data_handler=DEBUG") == {'discord': 'WARNING', 'data_handler': 'DEBUG'}
+    with pytest.raises(ValueError):
+        parse_log_levels("discord")
@@ -0,0 +1,42 @@
+import asyncio
+import time
+import pytest
+from monitoring.watchdog import LoopWatchdog
+
+
+def blocking_call():
+    time.sleep(0.3)
+
+@pytest.mark.asyncio
+async def test_watchdog_aggregates_stalls_per_call_site():
+    watchdog = LoopWatchdog(threshold=0.1, interval=0.02)
+    watchdog_task = asyncio.create_task(watchdog.run())
+    await asyncio.sleep(0.05)
+
+    for _ in range(2):
+        blocking_call()
+        await asyncio.sleep(0.1)
+
+    watchdog_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await watchdog_task
+
+    top_stalls = watchdog.get_top_stalls()
+    assert len(top_stalls) == 1
+    call_site, stall = top_stalls[0]
+    assert call_site.startswith('tests/test_loop_watchdog.py') and call_site.endswith('in blocking_call')
+    assert stall['count'] == 2
+    assert stall['max_seconds'] >= 0.2
+    assert 'time.sleep' in stall['stack']
+
+@pytest.mark.asyncio
+async def test_watchdog_ignores_short_delays():
+    watchdog = LoopWatchdog(threshold=0.5, interval=0.02)
+    watchdog_task = asyncio.create_task(watchdog.run())
+    time.sleep(0.1)
+    await asyncio.sleep(0.1)
+    watchdog_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await watchdog_task
+
+    assert watchdog.get_top_stalls() == []
@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from unittest import mock
+from tracking.member_resolver import MemberResolver
+
+
+def make_member(user_id):
+    member = mock.MagicMock()
+    member.id = user_id
+    return member
+
+@pytest.fixture
+def guild():
+    """Guild with two cached members and 250 more reachable through the gateway"""
+    guild = mock.MagicMock()
+    cached = {1: make_member(1), 2: make_member(2)}
+    gateway = {user_id: make_member(user_id) for user_id in range(100, 350)}
+    guild.get_member.side_effect = cached.get
+
+    async def query_members(user_ids, limit, cache):
+        assert len(user_ids) <= 100
+        return [gateway[user_id] for user_id in user_ids if user_id in gateway]
+
+    guild.query_members = mock.AsyncMock(side_effect=query_members)
+    guild.fetch_member = mock.AsyncMock()
+    return guild
+
+@pytest.mark.asyncio
+async def test_resolve_uses_batched_gateway_requests(guild):
+    resolver = MemberResolver(guild)
+    user_ids = [1, 2] + list(range(100, 350)) + [999]
+
+    members = await resolver.resolve(user_ids)
+
+    assert set(members) == set(user_ids) - {999}
+    assert guild.query_members.await_count == 3
+    guild.fetch_member.assert_not_called()
+    assert resolver.rest_fetches_avoided == 251
+
+@pytest.mark.asyncio
+async def test_resolve_serves_repeated_requests_from_cache(guild):
+    resolver = MemberResolver(guild)
+    await resolver.resolve([100, 999])
+    guild.query_members.reset_mock()
+
+    members = await resolver.resolve([100, 999])
+
+    assert set(members) == {100}
+    guild.query_members.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_resolve_expires_cache_entries(guild):
+    resolver = MemberResolver(guild, ttl_seconds=0)
+    await resolver.resolve([100])
+    await resolver.resolve([100])
+
+    assert guild.query_members.await_count == 2
+
+@pytest.mark.asyncio
+async def test_resolve_falls_back_to_rest_on_gateway_timeout(guild):
+    guild.query_members.side_effect = asyncio.TimeoutError
+    guild.fetch_member.side_effect = make_member
+    resolver = MemberResolver(guild)
+
+    members = await resolver.resolve([100, 101])
+
+    assert set(members) == {100, 101}
+    assert resolver.rest_fetches == 2
@@ -0,0 +1,46 @@
+from monitoring.metrics import MetricsRegistry, Counter, Gauge, Histogram, observe_duration, normalize_discord_route
+
+
+def test_render_prometheus_text_format():
+    registry = MetricsRegistry()
+    commands = Counter('commands_total', 'Commands invoked.', ['command'], registry=registry)
+    size = Gauge('backup_size_bytes', 'Backup size.', registry=registry)
+    latency = Histogram('query_seconds', 'Query latency.', ['operation'], buckets=(0.1, 1.0), registry=registry)
+
+    commands.inc(command='declare')
+    commands.inc(command='declare')
+    size.set(2048)
+    latency.observe(0.05, operation='get')
+    latency.observe(0.5, operation='get')
+
+    lines = registry.render().splitlines()
+    assert '# TYPE commands_total counter' in lines
+    assert 'commands_total{command="declare"} 2' in lines
+    assert 'backup_size_bytes 2048' in lines
+    assert 'query_seconds_bucket{operation="get",le="0.1"} 1' in lines
+    assert 'query_seconds_bucket{operation="get",le="1.0"} 2' in lines
+    assert 'query_seconds_bucket{operation="get",le="+Inf"} 2' in lines
+    assert 'query_seconds_count{operation="get"} 2' in lines
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    counter = Counter('escaped_total', 'Escaping.', ['value'], registry=registry)
+    counter.inc(value='a "quoted"\nvalue')
+
+    assert 'escaped_total{value="a \\"quoted\\"\\nvalue"} 1' in registry.render()
+
+def test_observe_duration_labels_with_function_name():
+    registry = MetricsRegistry()
+    latency = Histogram('operation_seconds', 'Operation latency.', ['operation'], registry=registry)
+
+    @observe_duration(latency)
+    def get_habit_data():
+        return 42
+
+    assert get_habit_data() == 42
+    assert latency.count(operation='get_habit_data') == 1
+
+def test_normalize_discord_route_hides_ids_and_tokens():
+    assert normalize_discord_route('/api/v10/channels/123456789012345678/messages/987654321098765432') == '/channels/{id}/messages/{id}'
+    assert normalize_discord_route('/api/v10/interactions/123456789012345678/aW50ZXJhY3Rpb24/callback') == '/interactions/{id}/{token}/callback'
+    assert normalize_discord_route('/api/v10/webhooks/123456789012345678/aW50ZXJhY3Rpb24/messages/@original') == '/webhooks/{id}/{token}/messages/@original'
@@ -0,0 +1,43 @@
+import sqlite3
+import pytest
+
+from data_handler import READ_ONLY_ROUTE, PRIMARY_ROUTE
+from monitoring.metrics import DB_QUERY_SECONDS
+
+
+@pytest.fixture(autouse=True)
+def habits(add_habit):
+    for i in range(3):
+        add_habit(habit_name=f"Habit {i}", weeks=[30])
+
+def test_long_reads_do_not_block_check_in_writes(db_handler):
+    assert db_handler.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    # An export still streaming its rows holds a read transaction on the read-only connection
+    rows = db_handler.iter_export_rows('tracking', chunk_size=1)
+    assert len(next(rows)) == 1
+    # The main connection would wait for the reader's lock in a rollback journal mode
+    db_handler.conn.execute('PRAGMA busy_timeout = 0')
+    assert db_handler.mark_habit_completed(1, True, week_key='2024-W31') == 2
+    # The reader keeps its snapshot, later reads see the commit
+    assert sum(len(chunk) for chunk in rows) == 2
+    assert db_handler.get_habit_streaks([1])[0]['current_streak'] == 2
+
+    with pytest.raises(sqlite3.OperationalError):
+        db_handler.get_read_conn().execute('DELETE FROM habits')
+
+def test_latencies_are_labelled_by_route(db_handler):
+    reads = DB_QUERY_SECONDS.count(operation='get_user_habits', route=READ_ONLY_ROUTE)
+    writes = DB_QUERY_SECONDS.count(operation='mark_habit_completed', route=PRIMARY_ROUTE)
+    assert len(db_handler.get_user_habits(42)) == 3
+    db_handler.mark_habit_completed(2, False, week_key='2024-W31')
+    assert DB_QUERY_SECONDS.count(operation='get_user_habits', route=READ_ONLY_ROUTE) == reads + 1
+    assert DB_QUERY_SECONDS.count(operation='mark_habit_completed', route=PRIMARY_ROUTE) == writes + 1
+
+    # The read-only connection outlives the reconnections of the main one
+    read_conn = db_handler.read_conn
+    db_handler.close()
+    db_handler.connect()
+    assert db_handler.read_conn is read_conn
+    assert len(db_handler.get_user_habits(42)) == 3
+    assert db_handler.get_read_conn() is read_conn
@@ -0,0 +1,60 @@
+import sqlite3
+import pytest
+
+from data_handler import DatabaseHandler
+
+
+@pytest.fixture
+def habits(add_habit):
+    for user_id, habit_name in ((42, 'Read'), (42, 'dev'), (43, 'dev'), (42, 'Run')):
+        add_habit(user_id, habit_name=habit_name, weeks=range(30, 34))
+
+def channel_slots(db_handler):
+    return db_handler.conn.execute('SELECT user1_id, user2_id, user3_id, user4_id FROM tracking_channels WHERE channel_id = 10').fetchone()
+
+@pytest.mark.usefixtures('habits')
+def test_removing_habits_cascades_to_their_history_and_slots(db_handler):
+    db_handler.archive_tracking('2024-W32')
+    assert db_handler.remove_habits(condition='habit_name = ?', params=('dev',), dry_run=True) == [2, 3]
+    assert db_handler.remove_habits(condition='habit_name = ?', params=('dev',)) == [2, 3]
+
+    assert db_handler.conn.execute('SELECT DISTINCT habit_id FROM tracking_history ORDER BY habit_id').fetchall() == [(1,), (4,)]
+    # Like the slots of their declarations, the first slot of the owner is freed for each removed habit
+    assert channel_slots(db_handler) == (None, 42, None, 42)
+
+    assert db_handler.remove_habits([1, 4, 99]) == [1, 4]
+    assert channel_slots(db_handler) == (None, None, None, None)
+    assert db_handler.conn.execute('SELECT COUNT(*) FROM tracking_history').fetchone() == (0,)
+
+@pytest.mark.usefixtures('habits')
+def test_habits_of_other_guilds_are_kept(db_handler):
+    db_handler.guild_id = 2
+    assert db_handler.remove_habits([1]) == []
+    assert db_handler.remove_habits(condition='user_id = ?', params=(42,)) == []
+    with pytest.raises(ValueError):
+        db_handler.remove_habits()
+
+def test_tracking_table_is_rebuilt_with_cascading_deletes(tmp_path):
+    db_name = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(db_name)
+    conn.execute('''
+        CREATE TABLE habits (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, tracking_channel_id INTEGER,
+                             habit_name TEXT NOT NULL, time_location TEXT, identity TEXT)
+    ''')
+    conn.execute('''
+        CREATE TABLE tracking (habit_id INTEGER NOT NULL, week_key TEXT NOT NULL, completed BOOLEAN NOT NULL, streak INTEGER DEFAULT 0,
+                               FOREIGN KEY (habit_id) REFERENCES habits(id), UNIQUE (habit_id, week_key))
+    ''')
+    conn.execute("INSERT INTO habits (user_id, habit_name) VALUES (42, 'Read')")
+    # The record of a habit removed before the foreign keys were enforced
+    conn.executemany('INSERT INTO tracking VALUES (?, ?, 1, 1)', ((1, '2024-W30'), (7, '2024-W30')))
+    conn.commit()
+    conn.close()
+
+    db_handler = DatabaseHandler(init=True, db_name=db_name)
+    assert db_handler.conn.execute('PRAGMA foreign_key_list(tracking)').fetchone()[6] == 'CASCADE'
+    assert db_handler.conn.execute('SELECT habit_id, guild_id FROM tracking_history').fetchall() == [(1, None)]
+    db_handler.remove_all_dev_habits()
+    db_handler.remove_habit_by_id(1)
+    assert db_handler.conn.execute('SELECT COUNT(*) FROM tracking').fetchone() == (0,)
+    db_handler.close()
@@ -0,0 +1,49 @@
+import pytest
+from unittest import mock
+from monitoring.startup import StartupTimer
+import maestro_bot
+
+
+def test_startup_timer_reports_each_phase_once():
+    timer = StartupTimer()
+    timer.mark('imports')
+    timer.finish('first_interaction')
+    timer.finish('first_interaction')
+
+    assert [phase for phase, _ in timer.phases] == ['imports', 'first_interaction']
+    assert 'total' in timer.report()
+
+def test_command_tree_hash_is_stable():
+    assert maestro_bot.get_command_tree_hash() == maestro_bot.get_command_tree_hash()
+
+@pytest.mark.asyncio
+async def test_sync_skipped_when_command_tree_unchanged():
+    db_handler = mock.MagicMock()
+    db_handler.get_state.return_value = maestro_bot.get_command_tree_hash()
+    with mock.patch('maestro_bot.db_handler', db_handler), \
+         mock.patch.object(maestro_bot.bot.tree, 'sync', mock.AsyncMock()) as sync:
+        assert await maestro_bot.sync_command_tree() is False
+        sync.assert_not_called()
+
+        db_handler.get_state.return_value = 'outdated'
+        assert await maestro_bot.sync_command_tree() is True
+        sync.assert_awaited_once()
+        db_handler.set_state.assert_called_once_with(maestro_bot.COMMAND_TREE_HASH_KEY, maestro_bot.get_command_tree_hash())
+
+def test_discord_logs_go_through_the_root_logger():
+    discord_logger = maestro_bot.logging.getLogger('discord')
+    handlers = discord_logger.handlers[:]
+    with mock.patch('maestro_bot.configure_logging'), \
+         mock.patch('maestro_bot.load_environment', return_value={
+             'DISCORD_BOT_TOKEN': 'token', 'DISCORD_BOT_DB_NAME': 'bot.db', 'DRIVE_FOLDER_ID': 'folder', 'DISCORD_BOT_DB_PREFIX': 'bot'}), \
+         mock.patch('maestro_bot.check_and_download_db'), \
+         mock.patch.object(maestro_bot.bot, 'start', mock.AsyncMock()) as start, \
+         mock.patch.object(maestro_bot.bot, 'close', mock.AsyncMock()):
+        try:
+            maestro_bot.create_and_run_bot()
+            start.assert_awaited_once()
+            # discord.py would otherwise add its own stream handler and level to the 'discord' logger
+            assert discord_logger.handlers == handlers
+            assert not any(isinstance(handler, maestro_bot.logging.StreamHandler) for handler in discord_logger.handlers)
+        finally:
+            discord_logger.handlers[:] = handlers
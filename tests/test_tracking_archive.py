@@ -0,0 +1,71 @@
+import os
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+from data_handler import ARCHIVE_UPLOAD_PENDING_KEY, get_archive_db_name
+from data_export import export_guild_data
+from jobs.handlers import archive_tracking
+
+
+@pytest.fixture(autouse=True)
+def habits(add_habit):
+    for habit_name in ('Read', 'Run'):
+        add_habit(habit_name=habit_name, weeks=range(30, 40))
+
+def test_old_weeks_move_to_the_archive(db_handler):
+    assert db_handler.archive_tracking('2024-W38') == 16
+    assert db_handler.archive_tracking('2024-W38') == 0
+    assert os.path.exists(get_archive_db_name(db_handler.db_name))
+
+    # Hot reads only see the recent weeks, the history reads see all of them
+    assert db_handler.conn.execute('SELECT COUNT(*) FROM tracking').fetchone() == (4,)
+    assert db_handler.get_habit_completion_status(1, '2024-W37') is None
+    assert len(db_handler.get_tracking_records()) == 20
+    assert db_handler.get_state(ARCHIVE_UPLOAD_PENDING_KEY) == '1'
+
+    # The streaks continue from the hot records
+    assert db_handler.get_current_streak(1) == 10
+    assert db_handler.mark_habit_completed(1, True, week_key='2024-W40') == 11
+
+    db_handler.remove_habit_by_id(2)
+    assert db_handler.conn.execute('SELECT COUNT(*) FROM archive.tracking_archive WHERE habit_id = 2').fetchone() == (0,)
+
+def test_weeks_in_both_tables_are_read_once(db_handler):
+    # Left by an archival interrupted after the archive commit, or by a restored main database
+    db_handler.conn.execute('''
+        INSERT INTO archive.tracking_archive (habit_id, guild_id, week_key, completed, unanswered, streak)
+        SELECT habit_id, guild_id, week_key, 0, unanswered, 0 FROM main.tracking WHERE week_key < '2024-W38'
+    ''')
+    db_handler.conn.commit()
+
+    records = db_handler.get_tracking_records()
+    assert len(records) == 20
+    assert all(completed for _, _, _, completed, _ in records)
+    assert db_handler.archive_tracking('2024-W38') == 16
+    assert len(db_handler.get_tracking_records()) == 20
+
+def test_export_includes_the_archived_weeks(db_handler):
+    db_handler.archive_tracking('2024-W35')
+    archive, row_counts = export_guild_data(db_handler.db_name, 1, 'jsonl')
+    archive.close()
+    assert row_counts['tracking'] == 20
+
+def test_archive_horizon_keeps_the_previous_week_hot(db_handler):
+    assert db_handler.get_archive_horizon(4, now=datetime(2024, 10, 19)) == '2024-W37'
+    with pytest.raises(ValueError):
+        db_handler.get_archive_horizon(1)
+
+@pytest.mark.asyncio
+async def test_archive_upload_is_retried_until_it_succeeds(db_handler):
+    context = SimpleNamespace(db_name=db_handler.db_name)
+    payload = {'before_week_key': '2024-W38'}
+    environment = {'DRIVE_FOLDER_ID': 'folder', 'DISCORD_BOT_DB_PREFIX': 'archive'}
+    with mock.patch.dict(os.environ, environment), mock.patch('drive.upload_file', side_effect=[RuntimeError('Drive is down'), None]) as upload_file:
+        with pytest.raises(RuntimeError):
+            await archive_tracking(context, payload)
+        # The records were moved by the failed attempt, the retry still uploads the archive
+        await archive_tracking(context, payload)
+    upload_file.assert_called_with(get_archive_db_name(db_handler.db_name), 'folder', 'archive_archive')
+    assert db_handler.get_state(ARCHIVE_UPLOAD_PENDING_KEY) == '0'
@@ -0,0 +1,99 @@
+import pytest
+from contextlib import closing
+from types import SimpleNamespace
+from unittest import mock
+
+from tracking.leaderboard import GuildLeaderboard
+from tracking.tracking_handler import TrackingHandler
+
+
+@pytest.fixture(autouse=True)
+def habits(add_habit):
+    for i in range(4):
+        add_habit(channel_id=10 if i < 3 else 11, habit_name=f"Habit {i}")
+
+def get_rollups(db_handler):
+    return db_handler.conn.execute('SELECT * FROM weekly_rollups ORDER BY channel_id, week_key').fetchall()
+
+def test_rollups_follow_every_check(db_handler):
+    for week_key in ('2024-W38', '2024-W39', '2024-W40'):
+        db_handler.mark_habit_completed(1, True, week_key=week_key)
+    db_handler.mark_habit_completed(2, True, week_key='2024-W40')
+    db_handler.mark_habit_completed(4, False, week_key='2024-W40')
+    # A changed answer moves the check to its new outcome and streak bucket
+    db_handler.mark_habit_completed(2, False, week_key='2024-W40')
+    db_handler.mark_habit_completed(3, False, week_key='2024-W40', unanswered=True)
+
+    rollups = {rollup['channel_id']: rollup for rollup in db_handler.get_pending_digests('2024-W40')}
+    assert [rollups[10][outcome] for outcome in ('completed', 'failed', 'unanswered')] == [1, 1, 1]
+    assert [rollups[11][outcome] for outcome in ('completed', 'failed', 'unanswered')] == [0, 1, 0]
+    assert rollups[10]['streaks'][:3] == [('0', 2), ('1', 0), ('2-3', 1)]
+
+    # The same counts are aggregated from the tracking history
+    incremental = get_rollups(db_handler)
+    db_handler.conn.execute('DELETE FROM weekly_rollups')
+    with closing(db_handler.conn.cursor()) as cursor:
+        db_handler._aggregate_weekly_rollups(cursor)
+    assert get_rollups(db_handler) == incremental
+
+    history = db_handler.get_rollup_history(10, weeks=2)
+    assert [(rollup['week_key'], rollup['completed']) for rollup in history] == [('2024-W39', 1), ('2024-W40', 1)]
+    assert [db_handler.get_rollup_history(weeks=1)[0][outcome] for outcome in ('failed', 'unanswered')] == [2, 1]
+
+def test_answering_an_unanswered_check_moves_it_out_of_unanswered(db_handler):
+    db_handler.mark_habit_completed(1, False, week_key='2024-W40', unanswered=True)
+    # Answered through the edit button after the session ended
+    db_handler.mark_habit_completed(1, True, week_key='2024-W40')
+    rollup = db_handler.get_pending_digests('2024-W40')[0]
+    assert [rollup[outcome] for outcome in ('completed', 'failed', 'unanswered')] == [1, 0, 0]
+
+    db_handler.mark_habit_completed(2, False, week_key='2024-W40', unanswered=True)
+    db_handler.mark_habit_completed(2, False, week_key='2024-W40')
+    rollup = db_handler.get_pending_digests('2024-W40')[0]
+    assert [rollup[outcome] for outcome in ('completed', 'failed', 'unanswered')] == [1, 1, 0]
+    assert db_handler.conn.execute('SELECT unanswered FROM tracking WHERE habit_id = 2').fetchone() == (0,)
+
+def test_changed_answer_leaves_the_channel_it_was_counted_in(db_handler):
+    db_handler.mark_habit_completed(1, True, week_key='2024-W40')
+    # Compaction moves the habit to another channel, then its owner changes the answer
+    db_handler.reassign_habits([(1, 10, 11)], [])
+    db_handler.mark_habit_completed(1, False, week_key='2024-W40')
+
+    rollups = {rollup['channel_id']: rollup for rollup in db_handler.get_pending_digests('2024-W40')}
+    assert [rollups[10][outcome] for outcome in ('completed', 'failed', 'unanswered')] == [0, 0, 0]
+    assert [rollups[11][outcome] for outcome in ('completed', 'failed', 'unanswered')] == [0, 1, 0]
+    assert sum(count for _, count in rollups[10]['streaks']) == 0
+
+    # The aggregated rollups agree
+    incremental = get_rollups(db_handler)
+    db_handler.conn.execute('DELETE FROM weekly_rollups')
+    with closing(db_handler.conn.cursor()) as cursor:
+        db_handler._aggregate_weekly_rollups(cursor)
+    assert get_rollups(db_handler) == [row for row in incremental if any(row[3:6])]
+
+@pytest.mark.asyncio
+async def test_end_of_session_posts_one_digest_per_channel(db_handler):
+    db_handler.mark_habit_completed(1, True, week_key='2024-W40')
+    channels = {channel_id: SimpleNamespace(id=channel_id, get_partial_message=mock.MagicMock(), name=f"habit-tracking-{channel_id}",
+                                            send=mock.AsyncMock(return_value=SimpleNamespace(id=900 + channel_id)))
+                for channel_id in (10, 11)}
+    for channel in channels.values():
+        channel.get_partial_message.return_value.edit = mock.AsyncMock()
+
+    tracking_handler = TrackingHandler.__new__(TrackingHandler)
+    tracking_handler.use_job_queue = False
+    tracking_handler.leaderboard = GuildLeaderboard()
+    tracking_handler.db_handler = db_handler
+    tracking_handler.guild = SimpleNamespace(id=1, name='guild', get_channel=channels.get)
+    db_handler.save_habit_checks((habit_id, 10 if habit_id < 4 else 11, 100 + habit_id, '2024-W40') for habit_id in (1, 2, 3, 4))
+
+    await tracking_handler.end_habit_check_session()
+
+    for channel_id, unanswered in ((10, '2'), (11, '1')):
+        channels[channel_id].send.assert_awaited_once()
+        assert channels[channel_id].send.await_args.kwargs['embed'].fields[2].value == unanswered
+    db_handler.connect()
+    assert db_handler.get_pending_digests('2024-W40') == []
+
+    embed = tracking_handler.build_history_embed(channels[10])
+    assert embed.description == '2024-W40 · 33% · ✅ 1 ❌ 0 💤 2'
@@ -0,0 +1,135 @@
+import numpy as np
+from itertools import chain
+import logging
+logger = logging.getLogger(__name__)
+
+# Number of weeks after a habit's first check covered by the retention curve
+RETENTION_WEEKS = 12
+# Upper bounds (exclusive) of the streak distribution buckets, the last bucket is open
+STREAK_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+class TrackingColumns:
+    """
+    The tracking records of a guild as parallel NumPy arrays, one entry per (habit, week) record.
+
+    Weeks are dense indices into `week_keys`, which lists the weeks with records in chronological order.
+    """
+    def __init__(self, records):
+        # Flattened through fromiter, about twice as fast as np.array over a list of tuples
+        table = np.fromiter(chain.from_iterable(records), dtype=np.int64, count=5 * len(records)).reshape(-1, 5)
+        self.habit_ids = table[:, 0]
+        self.channel_ids = table[:, 1]
+        week_codes, self.weeks = np.unique(table[:, 2], return_inverse=True)
+        self.week_keys = [f"{code // 100}-W{code % 100:02d}" for code in week_codes.tolist()]
+        self.completed = table[:, 3].astype(bool)
+        self.streaks = table[:, 4]
+        # Dense habit indices, to use the habits as bincount bins
+        self.habit_list, self.habits = np.unique(self.habit_ids, return_inverse=True)
+
+    def __len__(self):
+        return len(self.habit_ids)
+
+
+def get_completion_rates(groups, completed, minlength=0):
+    """Completion rate and record count of each group, NaN for groups without records."""
+    counts = np.bincount(groups, minlength=minlength)
+    done = np.bincount(groups, weights=completed, minlength=minlength)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rates = done / counts
+    return rates, counts
+
+def get_weekly_completion_rates(columns):
+    """
+    :return: A list of (week_key, completion rate, record count) tuples, oldest first.
+    """
+    rates, counts = get_completion_rates(columns.weeks, columns.completed, minlength=len(columns.week_keys))
+    return list(zip(columns.week_keys, rates.tolist(), counts.tolist()))
+
+def get_channel_completion_rates(columns, week_index=None):
+    """
+    :param week_index: Only the records of this week, every week if None.
+    :return: A list of (tracking_channel_id, completion rate, record count) tuples, best rate first.
+    """
+    mask = (columns.channel_ids != 0) if week_index is None else (columns.channel_ids != 0) & (columns.weeks == week_index)
+    channel_list, channels = np.unique(columns.channel_ids[mask], return_inverse=True)
+    rates, counts = get_completion_rates(channels, columns.completed[mask], minlength=len(channel_list))
+    order = np.lexsort((-counts, -rates))
+    return [(int(channel_list[i]), float(rates[i]), int(counts[i])) for i in order]
+
+def get_retention_curve(columns, max_weeks=RETENTION_WEEKS):
+    """
+    Share of the habits still completed N weeks after their first check.
+
+    Only the habits whose first check is at least N weeks before the last week count for week N.
+
+    :return: A list of (weeks since the first check, retention rate, eligible habit count) tuples.
+    """
+    if not len(columns):
+        return []
+    first_weeks = np.full(len(columns.habit_list), np.iinfo(np.int64).max)
+    np.minimum.at(first_weeks, columns.habits, columns.weeks)
+    offsets = columns.weeks - first_weeks[columns.habits]
+
+    weeks_observed = np.minimum(len(columns.week_keys) - 1 - first_weeks, max_weeks)
+    # eligible[n] = number of habits observed for at least n weeks after their first check
+    eligible = np.bincount(weeks_observed, minlength=max_weeks + 1)[::-1].cumsum()[::-1]
+    in_range = columns.completed & (offsets <= max_weeks)
+    retained = np.bincount(offsets[in_range], minlength=max_weeks + 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rates = retained / eligible
+    return [(n, float(rates[n]), int(eligible[n])) for n in range(max_weeks + 1) if eligible[n]]
+
+def get_current_streaks(columns):
+    """The streak of every habit at its latest record, in the order of `columns.habit_list`."""
+    # Sorted by habit then week, the last record of each habit closes its run
+    order = np.lexsort((columns.weeks, columns.habits))
+    sorted_habits = columns.habits[order]
+    last_of_habit = np.flatnonzero(np.diff(sorted_habits, append=len(columns.habit_list)))
+    return columns.streaks[order][last_of_habit]
+
+def get_streak_distribution(columns, buckets=STREAK_BUCKETS):
+    """
+    :return: A list of (label, habit count) tuples over the current streaks.
+    """
+    streaks = get_current_streaks(columns) if len(columns) else np.array([], dtype=np.int64)
+    counts = np.bincount(np.searchsorted(buckets, streaks, side='right'), minlength=len(buckets) + 1)
+    bounds = (0, *buckets)
+    labels = [str(low) if high - low == 1 else f"{low}-{high - 1}" for low, high in zip(bounds, buckets)] + [f"{buckets[-1]}+"]
+    return list(zip(labels, counts.tolist()))
+
+def compute_guild_stats(records, week_key):
+    """
+    Compute the completion analytics of a guild.
+
+    :param records: The tracking records, as returned by DatabaseHandler.get_tracking_records.
+    :param week_key: The current week key, the stats cover the finalized weeks before it.
+    :return: A dictionary with the weekly and per-channel completion rates, the retention curve and the streak distribution.
+    """
+    columns = TrackingColumns(records)
+    weekly_rates = get_weekly_completion_rates(columns)
+    return {
+        'week_key': week_key,
+        'record_count': len(columns),
+        'habit_count': len(columns.habit_list),
+        'overall_rate': float(columns.completed.mean()) if len(columns) else None,
+        'weekly_rates': weekly_rates,
+        'last_week_channel_rates': get_channel_completion_rates(columns, len(columns.week_keys) - 1) if len(columns) else [],
+        'retention': get_retention_curve(columns),
+        'streak_distribution': get_streak_distribution(columns),
+    }
+
+
+def load_guild_stats(db_name, guild_id, week_key):
+    """Load the tracking records of a guild on a connection of its own and compute its stats, so it can run in a worker thread."""
+    from data_handler import DatabaseHandler
+
+    db_handler = DatabaseHandler(db_name=db_name, guild_id=guild_id)
+    try:
+        records = db_handler.get_tracking_records(before_week_key=week_key)
+    finally:
+        db_handler.close()
+        db_handler.close_read_conn()
+    stats = compute_guild_stats(records, week_key)
+    logger.info("Computed stats of guild %s over %s tracking records.", guild_id, stats['record_count'])
+    return stats
@@ -1,102 +1,288 @@
+import asyncio
 import discord
 import logging
 logger = logging.getLogger(__name__)
 
 from data_handler import DatabaseHandler
+from guild_index import GuildIndex, get_tracking_channel_number
+from tracking.compaction import plan_compaction
+
+# A tracking channel is full once it has this many habits
+MAX_HABITS_PER_CHANNEL = 8
+# Discord requests made at the same time when compacting the tracking channels
+MAX_CONCURRENT_COMPACTION_EDITS = 5
+# Running tracking channel creations by (guild ID, channel name), awaited by every declaration needing the channel
+_channel_creations = {}
+# Seconds between two lookups of a tracking channel another process or a worker is creating
+CHANNEL_CREATION_POLL_SECONDS = 1
 
 class TrackingChannelManager:
-    def __init__(self, guild: discord.Guild, tracking_channel_prefix: str = 'habit-tracking', category_name: str = 'TRACKING CHANNELS'):
+    def __init__(self, guild: discord.Guild, tracking_channel_prefix: str = 'habit-tracking', category_name: str = 'TRACKING CHANNELS', use_job_queue: bool = False, guild_index: GuildIndex = None):
         self.guild = guild
         self.tracking_channel_prefix = tracking_channel_prefix
         self.category_name = category_name
-        self.db_handler = DatabaseHandler()
+        self.use_job_queue = use_job_queue  # Create the next channel in a worker before it is needed
+        self.db_handler = DatabaseHandler(guild_id=guild.id)
+        # Shared with the other handlers of the guild, which keep it current from the gateway events
+        self.guild_index = guild_index or GuildIndex(guild, None, tracking_channel_prefix, category_name)
+
+    def load_guild_index(self) -> GuildIndex:
+        """Return the guild index, loading it on first use."""
+        if not self.guild_index.loaded:
+            self.guild_index.load(self.db_handler)
+        return self.guild_index
 
     async def assign_role_to_user_for_channel(self, user: discord.User, channel: discord.TextChannel):
         # Get the role for the channel
-        role = discord.utils.get(self.guild.roles, name=channel.name)
+        role = self.load_guild_index().get_role(channel.id)
         
         if role:
             # Assign the role to the user
             await user.add_roles(role)
-            logger.info(f"Assigned role '{role.name}' to user '{user.name}'")
+            logger.info("Assigned role '%s' to user '%s'", role.name, user.name)
         else:
-            logger.warning(f"Role for channel '{channel.name}' not found.")
+            logger.warning("Role for channel '%s' not found.", channel.name)
+
 
 
+    async def reserve_tracking_channel(self, user_id=None):
+        """
+        Reserve a habit slot in the first tracking channel with a free one, creating a channel when they are all full.
 
-    async def get_or_create_tracking_channel(self) -> discord.TextChannel:
-        logger.info('\n'*2)
-        logger.info(f"Deciding on the tracking channel to link the declaration. ")
+        The slot is reserved in the database before any Discord request, so concurrent declarations never
+        overfill a channel, and the declarations waiting for a new channel share a single creation,
+        including the one of a worker (see _claim_tracking_channel).
+
+        :param user_id: The user declaring the habit.
+        :return: The channel and the ID of the reservation, which the habit is saved with
+                 (see DatabaseHandler.add_habit_with_data) or which is released if the declaration fails.
+        """
         category = await self._get_category()
-        channels = self._get_tracking_channels(category)
-        logger.info(f"Current tracking channels: {channels}")
-
-        # Check if there are any existing tracking channels
-        if not channels:
-            logger.info("No tracking channel exists")
-            # No channels exist, create the first one
-            new_channel_name = f"{self.tracking_channel_prefix}-1"
-            # Create a new channel with specific permissions
-            new_channel = await self._create_tracking_channel(category, new_channel_name)
-            return new_channel
-
-        # Look for a channel with fewer than 8 members
-        for channel in channels:
-            habit_data = self.db_handler.get_habits_in_channel(channel.id)
-            num_habits = len(habit_data)
-            if num_habits < 8:
-                logger.info(f"Number of habits in the {channel.name} is {num_habits}. Assigning this channel.\n")
-                return channel
+        while True:
+            channels = self._get_tracking_channels()
+            reservation = self.db_handler.reserve_channel_slot((channel.id for channel in channels), MAX_HABITS_PER_CHANNEL, user_id)
+            if reservation:
+                break
+            logger.info("All %s tracking channels are full.", len(channels))
+            await self._create_next_channel(category, len(channels) + 1)
 
-        # Create a new channel if all existing ones are full
-        new_channel_number = len(channels) + 1
-        new_channel_name = f"{self.tracking_channel_prefix}-{new_channel_number}"
-        new_channel = await self._create_tracking_channel(category, new_channel_name)
-        logger.info(f"Could not find a channel with habit number less than 8. Created new channel: {new_channel.name}\n")
-        return new_channel
+        reservation_id, channel_id, free_slots = reservation
+        channel = self.guild.get_channel(channel_id)
+        logger.info("Reserved a slot of %s for user %s, %s slots are left.", channel.name, user_id, free_slots)
+        if self.use_job_queue and free_slots == 0 and channel is channels[-1]:
+            # This declaration fills the last channel
+            self._queue_next_channel(category, f"{self.tracking_channel_prefix}-{len(channels) + 1}")
+        return channel, reservation_id
+
+    async def _create_next_channel(self, category: discord.CategoryChannel, channel_number: int) -> discord.TextChannel:
+        """Create the tracking channel of the given number, or wait for its creation if it is already running."""
+        key = (self.guild.id, f"{self.tracking_channel_prefix}-{channel_number}")
+        creation = _channel_creations.get(key)
+        if creation is None:
+            creation = _channel_creations[key] = asyncio.ensure_future(self._claim_tracking_channel(category, key[1]))
+            creation.add_done_callback(lambda _: _channel_creations.pop(key, None))
+        else:
+            logger.info("Waiting for the creation of %s by another declaration.", key[1])
+        # A cancelled caller does not cancel the creation the others are waiting for
+        return await asyncio.shield(creation)
+
+    async def get_channel_slots(self, habit_count):
+        """
+        Reserve the tracking channel slots of `habit_count` new habits at once.
 
-    async def clean_up_empty_channels(self):
+        The slots are reserved like the ones of the declarations (see reserve_tracking_channel), the free slots of
+        the existing channels first, and every missing channel is created on the way. The reservations obtained
+        so far are released if a channel cannot be created.
+
+        :return: A list of `habit_count` (reservation_id, channel_id) pairs, a channel repeated once per habit it
+                 receives. The habits take the reservations over when they are imported, see release_channel_slots otherwise.
+        """
         category = await self._get_category()
-        channels = self._get_tracking_channels(category)
-        empty_channels = [channel for channel in channels if len(channel.members) == 0]
+        reservations = []
+        created_channels = 0
+        try:
+            while len(reservations) < habit_count:
+                channels = self._get_tracking_channels()
+                reservation = self.db_handler.reserve_channel_slot((channel.id for channel in channels), MAX_HABITS_PER_CHANNEL)
+                if reservation is None:
+                    await self._create_next_channel(category, len(channels) + 1)
+                    created_channels += 1
+                    continue
+                reservations.append(reservation[:2])
+        except BaseException:
+            self.release_channel_slots(reservations)
+            raise
+
+        logger.info("Reserved the slots of %s habits in tracking channels, %s channels were created.", habit_count, created_channels)
+        return reservations
+
+    def release_channel_slots(self, reservations):
+        """Release the (reservation_id, channel_id) slots of get_channel_slots whose habits were not imported."""
+        for reservation_id, _ in reservations:
+            self.db_handler.release_channel_reservation(reservation_id)
+
+    async def compact_channels(self, member_resolver=None, dry_run=True):
+        """
+        Pack the habits into the fewest tracking channels, with the fewest habit moves (see plan_compaction).
+
+        The habits are reassigned in one transaction, then the Discord changes run with at most
+        MAX_CONCURRENT_COMPACTION_EDITS requests at a time: the owners of moved habits get the roles of their
+        new channels, the emptied channels and their roles are deleted, and the kept channels and their
+        roles are renamed to keep the numbering contiguous.
+
+        :param member_resolver: Resolves the owners of the moved habits, the guild cache is used if None.
+        :param dry_run: Only plan the compaction, without changing anything.
+        :return: A report dictionary of the planned (or applied) changes.
+        """
+        category = await self._get_category()
+        channels = self._get_tracking_channels()
+        channel_habits = self.db_handler.get_channel_habits(channel.id for channel in channels)
+        plan = plan_compaction([(channel.id, channel_habits.get(channel.id, [])) for channel in channels], MAX_HABITS_PER_CHANNEL)
+
+        channels_by_id = {channel.id: channel for channel in channels}
+        kept_channels = [channels_by_id[channel_id] for channel_id in plan['kept_channels']]
+        removed_channels = [channels_by_id[channel_id] for channel_id in plan['removed_channels']]
+        renames = [
+            (channel, f"{self.tracking_channel_prefix}-{number}")
+            for number, channel in enumerate(kept_channels, start=1)
+            if channel.name != f"{self.tracking_channel_prefix}-{number}"
+        ]
+        report = {
+            'channels_before': len(channels),
+            'channels_after': len(kept_channels),
+            'moves': [(habit_id, channels_by_id[from_channel_id].name, channels_by_id[to_channel_id].name) for habit_id, _, from_channel_id, to_channel_id in plan['moves']],
+            'removed_channels': [channel.name for channel in removed_channels],
+            'renames': [(channel.name, new_name) for channel, new_name in renames],
+            'role_grants': len(plan['role_grants']),
+            'failed_edits': 0,
+        }
+        if dry_run or not (plan['moves'] or removed_channels or renames):
+            return report
 
-        for channel in empty_channels:
-            await channel.delete()
+        guild_index = self.load_guild_index()
+        roles = {channel.id: guild_index.get_role(channel.id) for channel in channels}
+        self.db_handler.reassign_habits(
+            ((habit_id, from_channel_id, to_channel_id) for habit_id, _, from_channel_id, to_channel_id in plan['moves']),
+            plan['removed_channels']
+        )
+        for channel_id in plan['removed_channels']:
+            guild_index.remove_tracking_channel(channel_id)
+        # The names of the deleted and renamed channels can be created again
+        self.db_handler.release_channel_creations([channel.name for channel in removed_channels] + [channel.name for channel, _ in renames])
+        logger.info("Compacting %s tracking channels into %s, moving %s habits.", len(channels), len(kept_channels), len(plan['moves']))
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_COMPACTION_EDITS)
 
-        # Rename channels to keep the naming convention
-        channels = self._get_tracking_channels(category)
-        for i, channel in enumerate(sorted(channels, key=lambda c: c.name)):
-            expected_name = f"{self.tracking_channel_prefix}-{i + 1}"
-            if channel.name != expected_name:
-                await channel.edit(name=expected_name)
+        async def edit(description, coroutine_function, *args, **kwargs):
+            async with semaphore:
+                try:
+                    await coroutine_function(*args, **kwargs)
+                except discord.HTTPException as e:
+                    logger.error("Could not %s: %s", description, e)
+                    report['failed_edits'] += 1
+
+        user_ids = {user_id for _, user_id in plan['role_grants']}
+        if member_resolver:
+            members = await member_resolver.resolve(user_ids)
+        else:
+            members = {user_id: self.guild.get_member(user_id) for user_id in user_ids}
+        # The new roles first, so nobody loses access to their habits while the old channels are deleted
+        await asyncio.gather(*(
+            edit(f"give role {roles[channel_id]} to user {user_id}", members[user_id].add_roles, roles[channel_id])
+            for channel_id, user_id in plan['role_grants'] if members.get(user_id) and roles[channel_id]
+        ))
+        await asyncio.gather(*(
+            edit(f"delete {item}", item.delete)
+            for channel in removed_channels for item in (channel, roles[channel.id]) if item
+        ))
+        await asyncio.gather(*(
+            edit(f"rename {item} to {new_name}", item.edit, name=new_name)
+            for channel, new_name in renames for item in (channel, roles[channel.id]) if item
+        ))
+        return report
 
     async def _get_category(self) -> discord.CategoryChannel:
-        return discord.utils.get(self.guild.categories, name=self.category_name)
+        return self.load_guild_index().category
 
-    def _get_tracking_channels(self, category: discord.CategoryChannel):
-        return [channel for channel in category.text_channels if channel.name.startswith(self.tracking_channel_prefix)]
+    def _get_tracking_channels(self):
+        """The tracking channels of the guild, in channel number order."""
+        return self.load_guild_index().get_tracking_channels()
     
+    async def _claim_tracking_channel(self, category: discord.CategoryChannel, new_channel_name: str) -> discord.TextChannel:
+        """
+        Create a tracking channel once its creation is claimed in the database, or wait for the process or
+        the worker holding the claim until the channel shows up in the guild index.
+        """
+        while True:
+            channel = discord.utils.get(self._get_tracking_channels(), name=new_channel_name)
+            if channel:
+                return channel
+            if self.db_handler.claim_channel_creation(new_channel_name):
+                try:
+                    return await self._create_tracking_channel(category, new_channel_name)
+                except BaseException:
+                    # Another declaration may retry the creation at once
+                    self.db_handler.release_channel_creations([new_channel_name])
+                    raise
+            logger.info("Waiting for the creation of %s by another process.", new_channel_name)
+            await asyncio.sleep(CHANNEL_CREATION_POLL_SECONDS)
+
     async def _create_tracking_channel(self, category: discord.CategoryChannel, new_channel_name: str) -> discord.TextChannel:
-        # Create a role with a random color and set hoist=True to display role members separately
-        new_role = await self.guild.create_role(
-            name=new_channel_name,
-            color=discord.Color.random(),  # Assign a random color to the role
-        )
-        
-        # Set permissions for the role
-        permission_overwrites = {
-            self.guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=False),  # Show channel to everyone
-            new_role: discord.PermissionOverwrite(read_messages=True, send_messages=True),  # Allow this role to access
-            self.guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)  # Bot can manage the channel
-        }
+        new_channel, new_role = await create_tracking_channel(self.guild, category, new_channel_name, self.guild.me, self.db_handler)
+        self.load_guild_index().add_tracking_channel(new_channel.id, new_role.id)
+        return new_channel
+
+    def _queue_next_channel(self, category: discord.CategoryChannel, new_channel_name: str):
+        """
+        Have a worker create the next tracking channel ahead of the declaration that will need it.
 
-        # Create a new text channel with permissions
-        new_channel = await category.create_text_channel(
-            new_channel_name,
-            overwrites=permission_overwrites,
+        The creation is claimed for the worker first, so a declaration needing the channel before the job
+        runs waits for it instead of creating the channel too. Nothing is queued if the creation is already claimed.
+        """
+        if not self.db_handler.claim_channel_creation(new_channel_name, owner='channel.provision'):
+            logger.info("The creation of the next tracking channel '%s' is already claimed.", new_channel_name)
+            return
+        self.db_handler.enqueue_job(
+            'channel.provision',
+            {'guild_id': self.guild.id, 'category_id': category.id, 'channel_name': new_channel_name},
+            idempotency_key=f"channel.provision:{self.guild.id}:{new_channel_name}",
         )
+        logger.info("Queued the creation of the next tracking channel '%s'.", new_channel_name)
 
-        # Log the creation
-        logger.info(f"Created new channel '{new_channel_name}' with role '{new_role.name}'")
 
-        return new_channel
+async def create_tracking_channel(guild: discord.Guild, category, new_channel_name: str, bot_member, db_handler: DatabaseHandler = None):
+    """
+    Create a tracking channel and the role giving its members access.
+
+    Only the IDs of `category` and `bot_member` are used, so this also works with discord.Object
+    from a process without a gateway connection.
+
+    :param db_handler: Stores the IDs of the channel and its role, if given.
+    :return: The new channel and its role.
+    """
+    # Create a role with a random color and set hoist=True to display role members separately
+    new_role = await guild.create_role(
+        name=new_channel_name,
+        color=discord.Color.random(),  # Assign a random color to the role
+    )
+    
+    # Set permissions for the role
+    permission_overwrites = {
+        guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=False),  # Show channel to everyone
+        new_role: discord.PermissionOverwrite(read_messages=True, send_messages=True),  # Allow this role to access
+        bot_member: discord.PermissionOverwrite(read_messages=True, send_messages=True)  # Bot can manage the channel
+    }
+
+    # Create a new text channel with permissions
+    new_channel = await guild.create_text_channel(
+        new_channel_name,
+        category=category,
+        overwrites=permission_overwrites,
+    )
+
+    # Log the creation
+    logger.info("Created new channel '%s' with role '%s'", new_channel_name, new_role.name)
+
+    if db_handler:
+        db_handler.save_tracking_channel(new_channel.id, new_role.id)
+    return new_channel, new_role
@@ -0,0 +1,45 @@
+def plan_compaction(channel_habits, max_habits_per_channel):
+    """
+    Plan the habit moves packing the habits of the tracking channels into the fewest channels.
+
+    Every habit outside of the kept channels has to move, so keeping the channels with the most habits
+    makes the fewest moves. Among channels with as many habits, the first ones are kept so fewer channels
+    are renamed. A moved habit goes to a kept channel where its owner already has a habit when one has
+    room, so its owner does not need a new role.
+
+    :param channel_habits: A list of (channel_id, [(habit_id, user_id), ...]) tuples, in channel number order.
+    :param max_habits_per_channel: The number of habits a channel holds.
+    :return: A dictionary with the IDs of the kept channels in channel number order, the IDs of the removed
+             channels, the (habit_id, user_id, from_channel_id, to_channel_id) moves and the
+             (channel_id, user_id) pairs of the owners to give a channel role.
+    """
+    ranked = sorted(range(len(channel_habits)), key=lambda i: (-len(channel_habits[i][1]), i))
+    habit_count = sum(len(habits) for _, habits in channel_habits)
+    kept_count = -(-habit_count // max_habits_per_channel)
+    # Channels holding more habits than they should leave less room than expected in the others
+    while sum(max(0, max_habits_per_channel - len(channel_habits[i][1])) for i in ranked[:kept_count]) < sum(len(channel_habits[i][1]) for i in ranked[kept_count:]):
+        kept_count += 1
+
+    kept = sorted(ranked[:kept_count])
+    kept_channels = [channel_habits[i][0] for i in kept]
+    free_slots = {channel_habits[i][0]: max_habits_per_channel - len(channel_habits[i][1]) for i in kept}
+    owners = {channel_habits[i][0]: {user_id for _, user_id in channel_habits[i][1]} for i in kept}
+
+    moves, role_grants = [], []
+    for i in sorted(ranked[kept_count:]):
+        from_channel_id, habits = channel_habits[i]
+        for habit_id, user_id in habits:
+            to_channel_id = next((channel_id for channel_id in kept_channels if free_slots[channel_id] > 0 and user_id in owners[channel_id]), None)
+            if to_channel_id is None:
+                to_channel_id = next(channel_id for channel_id in kept_channels if free_slots[channel_id] > 0)
+                owners[to_channel_id].add(user_id)
+                role_grants.append((to_channel_id, user_id))
+            free_slots[to_channel_id] -= 1
+            moves.append((habit_id, user_id, from_channel_id, to_channel_id))
+
+    return {
+        'kept_channels': kept_channels,
+        'removed_channels': [channel_habits[i][0] for i in sorted(ranked[kept_count:])],
+        'moves': moves,
+        'role_grants': role_grants,
+    }
@@ -1,140 +1,121 @@
 import discord
 import logging
-from tracking.tracking_handler import TrackingHandler  # Import the handler
-from declaration.declaration_handler import DeclarationHandler
 from . import pokemon_urls, dragon_urls
 import random
-from datetime import datetime
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-class BasicHabitCheckView(discord.ui.View):
-    def __init__(self, tracking_handler: TrackingHandler, user_id, habit_id):
-        super().__init__(timeout=None)
-        self.tracking_handler = tracking_handler
-        self.user_id = int(user_id)
-        self.habit_id = int(habit_id)
-        logger.debug(f"HabitCheckView initialized with handler: {tracking_handler}, user_id: {user_id}, habit_id: {habit_id}")
-
-    async def disable_all_buttons(self):
-        """Disable all buttons in the view."""
-        for item in self.children:
-            item.disabled = True
-
-    @discord.ui.button(label="✅ Yes, I did it!", style=discord.ButtonStyle.success)
-    async def yes_button_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id == self.user_id:
-            logger.debug(f"'Yes' button clicked by {interaction.user.name} (ID: {interaction.user.id})")
-            await self.tracking_handler.handle_check_submission(interaction, self.habit_id, completed=True)
-            await self.disable_all_buttons()
-            await interaction.message.edit(view=self)
-        else:
-            await interaction.response.send_message("This button is not for you.", ephemeral=True)
+# The check buttons carry everything their callback needs, a single router serves every check message
+HABIT_CHECK_BUTTONS = (
+    ('yes', "✅ Yes, I did it!", discord.ButtonStyle.success),
+    ('no', "❌ No, not yet", discord.ButtonStyle.danger),
+    ('edit', "Edit Habit", discord.ButtonStyle.secondary),
+)
 
-    @discord.ui.button(label="❌ No, not yet", style=discord.ButtonStyle.danger)
-    async def no_button_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id == self.user_id:
-            logger.debug(f"'No' button clicked by {interaction.user.name} (ID: {interaction.user.id})")
-            await self.tracking_handler.handle_check_submission(interaction, self.habit_id, completed=False)
-            await self.disable_all_buttons()
-            await interaction.message.edit(view=self)
-        else:
-            await interaction.response.send_message("This button is not for you.", ephemeral=True)
 
+class HabitCheckButton(discord.ui.DynamicItem[discord.ui.Button], template=r'habit_check:(?P<action>yes|no|edit):(?P<habit_id>[0-9]+):(?P<user_id>[0-9]+):(?P<week_key>[0-9]{4}-W[0-9]{2})'):
+    """
+    A button of a habit check message, rebuilt from its custom_id when it is clicked.
 
-class DetailedHabitCheckView(discord.ui.View):
-    def __init__(self, tracking_handler: TrackingHandler, declaration_handler: DeclarationHandler, user, habit_id):
-        super().__init__(timeout=None)
-        self.declaration_handler = declaration_handler
-        self.tracking_handler = tracking_handler
-        self.user = user
-        self.user_id = user.id
+    No view is kept for the sent checks: the habit, its owner and the week are in the custom_id,
+    and the guild's handlers are found through the client's guild registry, so the buttons keep
+    working after a restart.
+    """
+    def __init__(self, action, habit_id, user_id, week_key, disabled=False):
+        label, style = next((label, style) for name, label, style in HABIT_CHECK_BUTTONS if name == action)
+        super().__init__(discord.ui.Button(
+            label=label, style=style, disabled=disabled,
+            custom_id=f"habit_check:{action}:{habit_id}:{user_id}:{week_key}"
+        ))
+        self.action = action
         self.habit_id = int(habit_id)
-        self.tracking_handler.db_handler.connect()
-        self.habit_data = tracking_handler.db_handler.get_habit_data(habit_id)
-        self.current_streak = tracking_handler.db_handler.get_current_streak(habit_id)
-        self.tracking_handler.db_handler.close()
-        self.week_key = datetime.now().strftime("%Y-W%U")
-        self.message_id = None
-
-        self.check_text = f"{self.user.mention} did you accomplish your habit of {self.habit_data['habit_name'].lower()} {self.habit_data['time_location'].lower()} this week?"
-        self.embed = self.create_embed()  # Create the embed during initialization
-        logger.debug(f"DetailedHabitCheckView initialized with user_id: {self.user_id}, habit_id: {habit_id}")
-
-    async def disable_all_buttons(self):
-        """Disable all buttons in the view."""
-        for item in self.children:
-            item.disabled = True
-
-    def create_embed(self):
-        """Create and return the embed for the Habit Check."""
-        embed = discord.Embed(
-            title=f"{self.habit_data['habit_name']} Habit Check || {self.week_key}",
-            description=f"{self.user.mention}",
-            color=discord.Color.random()  # Use a random color for the embed
-        )
-        
-        # Add habit details
-        embed.add_field(name="Habit", value=self.habit_data['habit_name'], inline=True)
-        embed.add_field(name="Streak", value=f"🔥 {self.current_streak} weeks", inline=True)
-        embed.add_field(name="Time / Location", value=self.habit_data['time_location'], inline=False)
-        
-        # Motivation and Identity Reminder
-        embed.add_field(name="Don't Forget Your Purpose!", value=f"You're {self.habit_data['habit_name'].lower()} to become {self.habit_data['identity'].lower()}.", inline=False)
-        
-        embed.set_thumbnail(url=self.get_random_image_url())  # Random image
-        return embed
-    
-    def get_random_image_url(self):
-        """Select a random image URL."""
-        # Adding some variety to the images used, including from dragon_urls
-        return random.choice(pokemon_urls)
-    
-    @discord.ui.button(label="✅ Yes, I did it!", style=discord.ButtonStyle.success)
-    async def yes_button_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id == self.user_id:
-            logger.debug(f"'Yes' button clicked by {interaction.user.name} (ID: {interaction.user.id})")
-            await self.tracking_handler.handle_check_submission(interaction, self.habit_id, self.week_key, completed=True)
-            await self.disable_all_buttons()
-            await interaction.message.edit(view=self)
-        else:
-            await interaction.response.send_message("This button is not for you.", ephemeral=True)
+        self.user_id = int(user_id)
+        self.week_key = week_key
 
-    @discord.ui.button(label="❌ No, not yet", style=discord.ButtonStyle.danger)
-    async def no_button_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id == self.user_id:
-            logger.debug(f"'No' button clicked by {interaction.user.name} (ID: {interaction.user.id})")
-            await self.tracking_handler.handle_check_submission(interaction, self.habit_id, self.week_key, completed=False)
-            await self.disable_all_buttons()
-            await interaction.message.edit(view=self)
-        else:
-            await interaction.response.send_message("This button is not for you.", ephemeral=True)
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match['action'], match['habit_id'], match['user_id'], match['week_key'])
 
-    @discord.ui.button(label="Edit Habit", style=discord.ButtonStyle.secondary)
-    async def edit_button_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id == self.user_id:
-            logger.debug(f"'Edit Habit' button clicked by {interaction.user.name} (ID: {interaction.user.id})")
-            
-            # Wait for the declaration modal to be submitted and handled
-            habit_data = await self.declaration_handler.send_habit_edit_modal(interaction, self.habit_data)
-            logger.debug(f"Habit data after modal submission: {habit_data}")
-            
-            await self.update_habit_check_message(interaction)            
-            
-        else:
+    async def callback(self, interaction: discord.Interaction):
+        if interaction.user.id != self.user_id:
             await interaction.response.send_message("This button is not for you.", ephemeral=True)
+            return
+        logger.debug("'%s' button of habit %s clicked by %s (ID: %s)", self.action, self.habit_id, interaction.user.name, interaction.user.id)
+        handlers = interaction.client.guild_registry.get(interaction.guild)
+        if self.action == 'edit':
+            await self.edit_habit(interaction, handlers.tracking_handler, handlers.declaration_handler)
+            return
+        await handlers.tracking_handler.handle_check_submission(interaction, self.habit_id, self.week_key, completed=self.action == 'yes')
+        await interaction.message.edit(view=build_disabled_check_view())
+
+    async def edit_habit(self, interaction, tracking_handler, declaration_handler):
+        db_handler = tracking_handler.db_handler
+        db_handler.connect()
+        habit_data = db_handler.get_habit_data(self.habit_id)
+        db_handler.close()
+        if habit_data is None:
+            await interaction.response.send_message("This habit no longer exists.", ephemeral=True)
+            return
+
+        # Wait for the declaration modal to be submitted and handled
+        habit_data = await declaration_handler.send_habit_edit_modal(interaction, habit_data, habit_data['tracking_channel_id'])
+        logger.debug("Habit data after modal submission: %s", habit_data)
+
+        db_handler.connect()
+        habit_data = db_handler.get_habit_data(self.habit_id)
+        current_streak = db_handler.get_current_streak(self.habit_id)
+        check_open = db_handler.is_habit_check_open(self.habit_id, self.week_key)
+        db_handler.close()
+        # The check of a finalized week keeps its buttons disabled
+        view = build_check_view(self.habit_id, self.user_id, self.week_key) if check_open else build_disabled_check_view()
+        await interaction.message.edit(embed=build_check_embed(habit_data, current_streak, self.user_id, self.week_key), view=view)
+        logger.debug("Habit check message of habit %s updated.", self.habit_id)
+
+
+def build_check_view(habit_id, user_id, week_key):
+    """The buttons of a habit check message."""
+    view = discord.ui.View(timeout=None)
+    for action, _, _ in HABIT_CHECK_BUTTONS:
+        view.add_item(HabitCheckButton(action, habit_id, user_id, week_key))
+    # A stopped view is not stored by the client for the message, the clicks are routed to HabitCheckButton
+    view.stop()
+    return view
+
+
+def build_disabled_check_view():
+    """A view with the buttons of a habit check message, all disabled. It can be shared by any number of messages."""
+    view = discord.ui.View(timeout=None)
+    for _, label, style in HABIT_CHECK_BUTTONS:
+        view.add_item(discord.ui.Button(label=label, style=style, disabled=True))
+    view.stop()
+    return view
+
+
+def build_check_text(habit_data, user_id):
+    return f"<@{user_id}> did you accomplish your habit of {habit_data['habit_name'].lower()} {habit_data['time_location'].lower()} this week?"
+
+
+def build_check_embed(habit_data, current_streak, user_id, week_key):
+    """Create and return the embed of a habit check message."""
+    embed = discord.Embed(
+        title=f"{habit_data['habit_name']} Habit Check || {week_key}",
+        description=f"<@{user_id}>",
+        color=discord.Color.random()  # Use a random color for the embed
+    )
+
+    # Add habit details
+    embed.add_field(name="Habit", value=habit_data['habit_name'], inline=True)
+    embed.add_field(name="Streak", value=f"🔥 {current_streak} weeks", inline=True)
+    embed.add_field(name="Time / Location", value=habit_data['time_location'], inline=False)
+
+    # Motivation and Identity Reminder
+    embed.add_field(name="Don't Forget Your Purpose!", value=f"You're {habit_data['habit_name'].lower()} to become {habit_data['identity'].lower()}.", inline=False)
+
+    embed.set_thumbnail(url=get_random_image_url())  # Random image
+    return embed
+
 
-    
-    async def update_habit_check_message(self, interaction):
-        logger.debug(f"Initializing the new view for updated habit")
-        new_view = DetailedHabitCheckView(self.tracking_handler, self.declaration_handler, self.user, self.habit_id)
-        logger.debug(f"Initializing DONE the new view for updated habit")
-
-        # Create the new embed as a list (even if it's a single embed)
-        new_embeds = [new_view.embed]
-        # Clear old embeds and then add the new one
-        await interaction.message.edit(embeds=[], view=None)  # Clear existing embeds and view
-        await interaction.message.edit(embeds=new_embeds, view=new_view)  # Add new embeds and view
-        logger.debug(f"New view and embeds added to the message.")
+def get_random_image_url():
+    """Select a random image URL."""
+    # Adding some variety to the images used, including from dragon_urls
+    return random.choice(pokemon_urls)
@@ -0,0 +1,76 @@
+import discord
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_completion_rate(rollup):
+    total = rollup['completed'] + rollup['failed'] + rollup['unanswered']
+    return rollup['completed'] / total if total else None
+
+
+def build_digest_embed(rollup):
+    """Build the end of week digest of a tracking channel from its weekly rollup."""
+    total = rollup['completed'] + rollup['failed'] + rollup['unanswered']
+    rate = get_completion_rate(rollup)
+    embed = discord.Embed(
+        title=f"Weekly Digest || {rollup['week_key']}",
+        description=f"{rollup['completed']} of {total} habits completed this week" + (f" ({rate:.0%})." if rate is not None else "."),
+        color=discord.Color.green() if rate and rate >= 0.5 else discord.Color.orange()
+    )
+    embed.add_field(name="✅ Completed", value=str(rollup['completed']), inline=True)
+    embed.add_field(name="❌ Not yet", value=str(rollup['failed']), inline=True)
+    embed.add_field(name="💤 Unanswered", value=str(rollup['unanswered']), inline=True)
+    embed.add_field(
+        name="Streaks",
+        value=' · '.join(f"{label}: {count}" for label, count in rollup['streaks'] if count) or "No streaks this week.",
+        inline=False
+    )
+    return embed
+
+
+def build_history_embed(rollups, title):
+    """
+    Build the weekly completion history of a tracking channel or of the guild.
+
+    :param rollups: The weekly rollups, oldest week first, see DatabaseHandler.get_rollup_history.
+    """
+    embed = discord.Embed(title=f"Habit History || {title}", color=discord.Color.blue())
+    lines = []
+    for rollup in rollups:
+        rate = get_completion_rate(rollup)
+        lines.append(
+            f"{rollup['week_key']} · {f'{rate:.0%}' if rate is not None else '-'} · "
+            f"✅ {rollup['completed']} ❌ {rollup['failed']} 💤 {rollup['unanswered']}"
+        )
+    embed.description = '\n'.join(lines) if lines else "No habit check has been answered yet."
+    if rollups:
+        embed.add_field(
+            name=f"Streaks in {rollups[-1]['week_key']}",
+            value=' · '.join(f"{label}: {count}" for label, count in rollups[-1]['streaks'] if count) or "No streaks.",
+            inline=False
+        )
+    return embed
+
+
+async def send_weekly_digests(rollups, get_channel):
+    """
+    Post the digest of every given channel rollup.
+
+    :param rollups: The rollups whose digest is pending, see DatabaseHandler.get_pending_digests.
+    :param get_channel: Returns the messageable of a channel ID, or None if the channel is gone.
+    :return: The (channel_id, message_id) pairs of the posted digests, to store with DatabaseHandler.save_digest_messages.
+    """
+    digest_messages = []
+    for rollup in rollups:
+        channel = get_channel(rollup['channel_id'])
+        if channel is None:
+            logger.warning("Skipping the digest of missing channel %s.", rollup['channel_id'])
+            continue
+        try:
+            message = await channel.send(embed=build_digest_embed(rollup))
+            digest_messages.append((rollup['channel_id'], message.id))
+        except discord.HTTPException as e:
+            logger.error("Could not post the digest of channel %s: %s", rollup['channel_id'], e)
+    logger.info("Posted %s weekly digests.", len(digest_messages))
+    return digest_messages
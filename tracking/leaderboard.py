@@ -0,0 +1,213 @@
+from collections import defaultdict
+from itertools import islice
+import logging
+logger = logging.getLogger(__name__)
+
+# Streak values the ranking trees start with, they double whenever a longer streak shows up
+INITIAL_STREAK_CAPACITY = 64
+
+
+class FenwickTree:
+    """
+    A binary indexed tree of counts over the indices 0..size-1.
+
+    Adding to an index, prefix sums and finding the index holding the k-th counted item all take O(log size).
+    """
+    def __init__(self, size):
+        self.size = size
+        self.counts = [0] * size
+        self._tree = [0] * (size + 1)
+
+    def add(self, index, delta):
+        if index >= self.size:
+            self._grow(index + 1)
+        self.counts[index] += delta
+        i = index + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, index):
+        """Sum of the counts of the indices 0..index."""
+        total = 0
+        i = min(index, self.size - 1) + 1
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k):
+        """Smallest index whose prefix sum reaches k, for 1 <= k <= total count."""
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            next_position = position + step
+            if next_position <= self.size and self._tree[next_position] < k:
+                position = next_position
+                k -= self._tree[next_position]
+            step >>= 1
+        return position
+
+    def _grow(self, min_size):
+        size = self.size
+        while size < min_size:
+            size *= 2
+        self.counts.extend([0] * (size - self.size))
+        self.size = size
+        # Rebuild in O(size), growing is rare since streaks grow by one per week
+        self._tree = [0] + self.counts
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self._tree[parent] += self._tree[i]
+
+
+class Leaderboard:
+    """
+    Ranks habits by their current streak.
+
+    Habits are counted per streak value in a Fenwick tree, so updating a streak, the rank of a habit
+    and each entry of the top N take O(log max streak), whatever the number of habits or weeks of history.
+    Habits with the same streak share the same rank.
+    """
+    def __init__(self):
+        self.streaks = {}  # habit_id -> streak
+        self._buckets = defaultdict(set)  # streak -> habit_ids
+        self._tree = FenwickTree(INITIAL_STREAK_CAPACITY)
+
+    def update(self, habit_id, streak):
+        previous_streak = self.streaks.get(habit_id)
+        if previous_streak == streak:
+            return
+        if previous_streak is not None:
+            self._discard(habit_id, previous_streak)
+        self.streaks[habit_id] = streak
+        self._buckets[streak].add(habit_id)
+        self._tree.add(streak, 1)
+
+    def remove(self, habit_id):
+        streak = self.streaks.pop(habit_id, None)
+        if streak is not None:
+            self._discard(habit_id, streak)
+
+    def _discard(self, habit_id, streak):
+        bucket = self._buckets[streak]
+        bucket.discard(habit_id)
+        if not bucket:
+            del self._buckets[streak]
+        self._tree.add(streak, -1)
+
+    def rank(self, habit_id):
+        """
+        :return: 1 + the number of habits with a longer streak, or None if the habit is not ranked.
+        """
+        streak = self.streaks.get(habit_id)
+        if streak is None:
+            return None
+        return len(self.streaks) - self._tree.prefix_sum(streak) + 1
+
+    def top(self, n, min_streak=1):
+        """
+        Return the N habits with the longest streaks, habits tied with the N-th one are cut arbitrarily.
+
+        :param n: The number of entries to return.
+        :param min_streak: Habits with a shorter streak are not listed.
+        :return: A list of (rank, habit_id, streak) tuples, best first.
+        """
+        entries = []
+        total = len(self.streaks)
+        rank = 1
+        while len(entries) < n and rank <= total:
+            # The habit ranked `rank` is the (total - rank + 1)-th smallest streak
+            streak = self._tree.find(total - rank + 1)
+            if streak < min_streak:
+                break
+            bucket = self._buckets[streak]
+            for habit_id in sorted(islice(bucket, n - len(entries))):
+                entries.append((rank, habit_id, streak))
+            rank += len(bucket)
+        return entries
+
+    def __len__(self):
+        return len(self.streaks)
+
+
+class GuildLeaderboard:
+    """
+    The guild-wide and per tracking channel streak leaderboards of a guild.
+
+    Loaded once from the database, then kept up to date by the habit checks and declarations.
+    """
+    def __init__(self):
+        self.loaded = False
+        self.guild_board = Leaderboard()
+        self.channel_boards = defaultdict(Leaderboard)
+        self.habits = {}  # habit_id -> {'user_id', 'tracking_channel_id', 'habit_name'}
+        self.user_habits = defaultdict(set)  # user_id -> habit_ids
+
+    def load(self, habit_streaks):
+        """
+        Build the leaderboards from scratch.
+
+        :param habit_streaks: Dictionaries with the habit_id, user_id, tracking_channel_id, habit_name and current_streak of every habit.
+        """
+        self.guild_board = Leaderboard()
+        self.channel_boards.clear()
+        self.habits.clear()
+        self.user_habits.clear()
+        for habit in habit_streaks:
+            self.set_habit(habit['habit_id'], habit['user_id'], habit['tracking_channel_id'], habit['habit_name'], habit['current_streak'])
+        self.loaded = True
+        logger.info("Leaderboard loaded with %s habits in %s channels.", len(self.habits), len(self.channel_boards))
+
+    def set_habit(self, habit_id, user_id, tracking_channel_id, habit_name, streak=None):
+        """Add a habit, or update its owner, channel or name. The streak is kept if not given."""
+        user_id = int(user_id)
+        previous = self.habits.get(habit_id)
+        if streak is None:
+            streak = self.guild_board.streaks.get(habit_id, 0)
+        if previous:
+            self.user_habits[previous['user_id']].discard(habit_id)
+            if previous['tracking_channel_id'] != tracking_channel_id:
+                self._remove_from_channel(habit_id, previous['tracking_channel_id'])
+
+        self.habits[habit_id] = {'user_id': user_id, 'tracking_channel_id': tracking_channel_id, 'habit_name': habit_name}
+        self.user_habits[user_id].add(habit_id)
+        self.update_streak(habit_id, streak)
+
+    def update_streak(self, habit_id, streak):
+        habit = self.habits.get(habit_id)
+        if habit is None:
+            logger.debug("Habit %s is not on the leaderboard, ignoring its streak.", habit_id)
+            return
+        self.guild_board.update(habit_id, streak)
+        self.channel_boards[habit['tracking_channel_id']].update(habit_id, streak)
+
+    def remove_habit(self, habit_id):
+        habit = self.habits.pop(habit_id, None)
+        if habit is None:
+            return
+        self.user_habits[habit['user_id']].discard(habit_id)
+        self.guild_board.remove(habit_id)
+        self._remove_from_channel(habit_id, habit['tracking_channel_id'])
+
+    def _remove_from_channel(self, habit_id, tracking_channel_id):
+        channel_board = self.channel_boards.get(tracking_channel_id)
+        if channel_board is not None:
+            channel_board.remove(habit_id)
+            if not channel_board:
+                del self.channel_boards[tracking_channel_id]
+
+    def get_board(self, tracking_channel_id=None):
+        """The leaderboard of a tracking channel, or the guild-wide one."""
+        if tracking_channel_id is None:
+            return self.guild_board
+        return self.channel_boards.get(tracking_channel_id) or Leaderboard()
+
+    def get_user_ranks(self, user_id, tracking_channel_id=None):
+        """
+        :return: A list of (rank, habit_id, streak) tuples for the user's habits on the given leaderboard.
+        """
+        board = self.get_board(tracking_channel_id)
+        ranks = [(board.rank(habit_id), habit_id, board.streaks[habit_id]) for habit_id in self.user_habits.get(int(user_id), ()) if habit_id in board.streaks]
+        return sorted(ranks)
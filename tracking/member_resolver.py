@@ -0,0 +1,97 @@
+import discord
+import asyncio
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+# Seconds a resolved member (or a user that is no longer in the guild) stays cached
+MEMBER_CACHE_TTL_SECONDS = 15 * 60
+# Discord accepts at most 100 user IDs per gateway member request
+QUERY_MEMBERS_BATCH_SIZE = 100
+
+
+class MemberResolver:
+    """
+    Resolves guild members for a whole habit check session at once.
+
+    Members missing from the guild cache are requested in bulk through gateway member
+    requests instead of one REST `fetch_member` call per user, and the results are cached with a TTL.
+    """
+    def __init__(self, guild: discord.Guild, ttl_seconds: float = MEMBER_CACHE_TTL_SECONDS):
+        self.guild = guild
+        self.ttl_seconds = ttl_seconds
+        self._cache = {}  # user_id -> (member or None, expires_at)
+        self.rest_fetches = 0
+        self.rest_fetches_avoided = 0
+
+    async def resolve(self, user_ids) -> dict:
+        """
+        Resolve the given user IDs to guild members.
+
+        :param user_ids: The IDs of the users to resolve.
+        :return: A dictionary mapping each found user ID to its discord.Member.
+        """
+        now = time.monotonic()
+        members = {}
+        missing_user_ids = []
+
+        for user_id in {int(user_id) for user_id in user_ids}:
+            member = self.guild.get_member(user_id)
+            if member:
+                members[user_id] = member
+                continue
+
+            cached = self._cache.get(user_id)
+            if cached and cached[1] > now:
+                # A fetch was needed here before, the cached result saves it
+                self.rest_fetches_avoided += 1
+                if cached[0]:
+                    members[user_id] = cached[0]
+                continue
+
+            missing_user_ids.append(user_id)
+
+        for i in range(0, len(missing_user_ids), QUERY_MEMBERS_BATCH_SIZE):
+            batch = missing_user_ids[i:i + QUERY_MEMBERS_BATCH_SIZE]
+            found_members = await self._query_members(batch)
+            expires_at = time.monotonic() + self.ttl_seconds
+
+            found_by_id = {member.id: member for member in found_members}
+            for user_id in batch:
+                member = found_by_id.get(user_id)
+                self._cache[user_id] = (member, expires_at)
+                if member:
+                    members[user_id] = member
+                else:
+                    logger.info("User with ID %s not found in the guild.", user_id)
+
+        logger.info("Resolved %s of the requested members (%s guild cache misses). REST fetches avoided so far: %s, performed: %s.",
+                    len(members), len(missing_user_ids), self.rest_fetches_avoided, self.rest_fetches)
+        return members
+
+    async def _query_members(self, user_ids):
+        """Request a batch of members through the gateway, falling back to REST fetches if that fails."""
+        try:
+            found_members = await self.guild.query_members(user_ids=user_ids, limit=len(user_ids), cache=True)
+            self.rest_fetches_avoided += len(user_ids)
+            return found_members
+        except (asyncio.TimeoutError, discord.ClientException) as e:
+            logger.warning("Gateway member request failed, fetching %s members one by one: %s", len(user_ids), e)
+
+        found_members = []
+        for user_id in user_ids:
+            self.rest_fetches += 1
+            try:
+                found_members.append(await self.guild.fetch_member(user_id))
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as e:
+                logger.error("Error fetching user with ID %s: %s", user_id, e)
+        return found_members
+
+    def stats(self):
+        return {
+            'cached_members': len(self._cache),
+            'rest_fetches': self.rest_fetches,
+            'rest_fetches_avoided': self.rest_fetches_avoided,
+        }
@@ -1,25 +1,51 @@
 import discord
 from tracking.channel_management import TrackingChannelManager
+from tracking.member_resolver import MemberResolver
+from tracking.leaderboard import GuildLeaderboard
+from tracking.digest import build_history_embed, send_weekly_digests
 from tracking import congrats_messages, not_accomplished_messages
 from declaration.declaration_handler import DeclarationHandler
 from data_handler import DatabaseHandler
+from guild_index import GuildIndex
 import logging
 import json
 import random
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Number of tracking channels whose check messages are edited at the same time
+MAX_CONCURRENT_CHANNEL_EDITS = 5
+
+
+class CheckRecord:
+    """A sent habit check message, stored in the habit_checks table until the end of its session."""
+    __slots__ = ('habit_id', 'channel_id', 'message_id', 'week_key')
+
+    def __init__(self, habit_id, channel_id, message_id, week_key):
+        self.habit_id = habit_id
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.week_key = week_key
+
 
 class TrackingHandler:
-    def __init__(self, guild: discord.Guild, declaration_handler: DeclarationHandler, habit_tracking_channels_prefix: str, habit_tracking_category_name: str):
+    def __init__(self, guild: discord.Guild, declaration_handler: DeclarationHandler, habit_tracking_channels_prefix: str, habit_tracking_category_name: str, use_job_queue: bool = False, guild_index: GuildIndex = None):
         self.guild = guild
-        self.tracking_channel_manager = TrackingChannelManager(guild, habit_tracking_channels_prefix, habit_tracking_category_name)
+        self.tracking_channel_manager = TrackingChannelManager(guild, habit_tracking_channels_prefix, habit_tracking_category_name, use_job_queue, guild_index)
+        self.use_job_queue = use_job_queue  # Finalize the habit check session in a worker
         self.declaration_handler = declaration_handler
-        self.db_handler = DatabaseHandler()
-        self.detailed_check_view_list = None
-        logger.debug(f"TrackingHandler initialized with guild: {guild.name}, category name: {habit_tracking_category_name}")
+        self.db_handler = DatabaseHandler(guild_id=guild.id)
+        self.member_resolver = MemberResolver(guild)
+        self.leaderboard = GuildLeaderboard()
+        self.pending_leaderboard_refresh = None  # (job ID, habit IDs) of a finalization running in a worker
+        self.guild_stats = None  # Stats of the finalized weeks, until a new week starts
+        self.staged_habit_check = None
+        self.habit_check_timing = {}
+        logger.debug("TrackingHandler initialized with guild: %s, category name: %s", guild.name, habit_tracking_category_name)
 
     def get_response_message(self, interaction, completed):
         user_mention = interaction.user.mention
@@ -28,106 +54,519 @@ class TrackingHandler:
         return random_message.format(user_mention=user_mention)
     
     async def handle_check_submission(self, interaction: discord.Interaction, habit_id, week_key, completed: bool):
-        """Handle the habit check response from the user."""
-        logger.debug(f"Handling habit check for {interaction.user.name} (ID: {interaction.user.id}), completed: {completed}")
+        """
+        Handle the habit check response from the user.
+
+        Only the checks of the open habit check session can be answered, a late click on the check of a
+        finalized week is refused.
+
+        :return: True if the answer was recorded.
+        """
+        logger.debug("Handling habit check for %s (ID: %s), completed: %s", interaction.user.name, interaction.user.id, completed)
         self.db_handler.connect()
-        self.db_handler.mark_habit_completed(habit_id, completed, week_key=week_key)
+        if not self.db_handler.is_habit_check_open(habit_id, week_key):
+            self.db_handler.close()
+            logger.info("Refused the answer of %s to the closed check of habit %s for %s.", interaction.user.name, habit_id, week_key)
+            await interaction.response.send_message("This check is closed.", ephemeral=True)
+            return False
+        new_streak = self.db_handler.mark_habit_completed(habit_id, completed, week_key=week_key)
+        # The leaderboard holds the streak of the habit's latest week
+        is_latest_week = new_streak is not None and self.db_handler.is_latest_week(habit_id, week_key)
         self.db_handler.close()
+        if is_latest_week:
+            self.leaderboard.update_streak(habit_id, new_streak)
         response_message = self.get_response_message(interaction, completed)
         await interaction.response.send_message(response_message)
-        logger.debug(f"Sent response to {interaction.user.name}: {response_message}")
+        logger.debug("Sent response to %s: %s", interaction.user.name, response_message)
+        return True
 
 
+    async def prepare_habit_check(self):
+        """
+        Build every habit check of the session ahead of the scheduled send time.
+
+        Habit data and streaks are loaded in bulk, the owners are resolved at once and the
+        messages are rendered, so sending the staged checks is pure network I/O.
+
+        :return: The staged habit check.
+        """
+        start_time = time.perf_counter()
+        logger.debug("Preparing habit check for all tracking channels...")
+        channels = self.tracking_channel_manager._get_tracking_channels()
+        logger.debug("Found %s tracking channels.", len(channels))
+
+        self.db_handler.connect()
+        habit_check_data = self.db_handler.get_habit_check_data(channel.id for channel in channels)
+        self.db_handler.close()
+
+        # Resolve the owners of every habit in the session at once
+        members = await self.member_resolver.resolve(habit['user_id'] for habit in habit_check_data)
+
+        week_key = datetime.now().strftime("%Y-W%U")
+        channel_checks = self._build_check_messages(habit_check_data, members, week_key)
+        self.staged_habit_check = {
+            'week_key': week_key,
+            'channel_checks': [(channel, channel_checks.get(channel.id, [])) for channel in channels],
+        }
+
+        self.habit_check_timing['prepare_seconds'] = time.perf_counter() - start_time
+        logger.info("Prepared %s habit checks in %s channels in %.2fs.", len(habit_check_data), len(channels), self.habit_check_timing['prepare_seconds'])
+        return self.staged_habit_check
+
+    def _build_check_messages(self, habit_check_data, members, week_key):
+        """Render the check messages of the given habits, grouped by tracking channel ID."""
+        from tracking.components import build_check_embed, build_check_text
+
+        channel_checks = defaultdict(list)
+        for habit in habit_check_data:
+            if not members.get(int(habit['user_id'])):
+                logger.info("User not found with id: %s", habit['user_id'])
+                continue
+            channel_checks[habit['tracking_channel_id']].append({
+                'habit_id': habit['habit_id'],
+                'user_id': int(habit['user_id']),
+                'content': build_check_text(habit, habit['user_id']),
+                'embed': build_check_embed(habit, habit['current_streak'], habit['user_id'], week_key),
+            })
+        return channel_checks
+
     async def send_habit_check_to_all_tracking_channels(self):
+        staged_habit_check = self.staged_habit_check
+        self.staged_habit_check = None
+        if not staged_habit_check or staged_habit_check['week_key'] != datetime.now().strftime("%Y-W%U"):
+            logger.info("No habit check staged for this week, preparing it now.")
+            staged_habit_check = await self.prepare_habit_check()
+            self.staged_habit_check = None
+
+        start_time = time.perf_counter()
         logger.debug("Sending habit check to all tracking channels...")
-        category = await self.tracking_channel_manager._get_category()
-        channels = self.tracking_channel_manager._get_tracking_channels(category)
-        logger.debug(f"Found {len(channels)} tracking channels in category: {category.name}")
+        check_records = []
+        for channel, checks in staged_habit_check['channel_checks']:
+            check_records.extend(await self.send_habit_check_to_tracking_channel(channel, checks, staged_habit_check['week_key']))
 
-        channel_view_lists = []
-        self.db_handler.connect()
-        for channel in channels:
+        self.habit_check_timing['send_seconds'] = time.perf_counter() - start_time
+        logger.info("Sent %s habit checks in %.2fs (prepared in %.2fs).", len(check_records), self.habit_check_timing['send_seconds'], self.habit_check_timing.get('prepare_seconds', 0))
+        return check_records
+
+    async def send_habit_check_to_tracking_channel(self, tracking_channel: discord.TextChannel, checks=None, week_key=None):
+        """
+        Send the habit check messages of a tracking channel.
+
+        Each sent message is stored with the session, so the session can be finalized after a restart
+        (see resume_habit_check_session).
+
+        :param checks: The staged check messages of the channel, rendered now if None.
+        :return: The CheckRecord of every sent message.
+        """
+        from tracking.components import build_check_view
+
+        logger.debug("Sending habit check to channel: %s (ID: %s)", tracking_channel.name, tracking_channel.id)
+        week_key = week_key or datetime.now().strftime("%Y-W%U")
+        if checks is None:
             self.db_handler.connect()
-            channel_view_list = await self.send_habit_check_to_tracking_channel(channel)
-            channel_view_lists.append(channel_view_list)
+            habit_check_data = self.db_handler.get_habit_check_data([tracking_channel.id])
+            self.db_handler.close()
+            members = await self.member_resolver.resolve(habit['user_id'] for habit in habit_check_data)
+            checks = self._build_check_messages(habit_check_data, members, week_key)[tracking_channel.id]
+
+        check_records = []
+        for check in checks:
+            try:
+                logger.debug("Sending habit check to user %s for habit %s", check['user_id'], check['habit_id'])
+                habit_message = await tracking_channel.send(
+                    check['content'],
+                    embed=check['embed'],
+                    view=build_check_view(check['habit_id'], check['user_id'], week_key)
+                )
+                check_records.append(CheckRecord(check['habit_id'], tracking_channel.id, habit_message.id, week_key))
+                # Stored before the next message is sent, the check can only be answered once it is in the session
+                self.db_handler.connect()
+                self.db_handler.save_habit_checks([(check['habit_id'], tracking_channel.id, habit_message.id, week_key)])
+                self.db_handler.close()
+
+            except Exception as e:
+                logger.error("Could not message user %s: %s", check['user_id'], e)
+
+        return check_records
+
+    def get_check_records(self):
+        """The CheckRecord of every check of the stored habit check session, open or being finalized."""
+        self.db_handler.connect()
+        habit_checks = self.db_handler.get_habit_checks()
         self.db_handler.close()
+        return [CheckRecord(*habit_check[:4]) for habit_check in habit_checks]
 
-        concatanated_list = [item for sublist in channel_view_lists for item in sublist]
-        self.detailed_check_view_list = concatanated_list
+    async def resume_habit_check_session(self):
+        """
+        Finalize a habit check session left by a restart, once its week is over or if its finalization had started.
+
+        A session of the current week that is still open is left for end_habit_check_session.
+        """
+        self.db_handler.connect()
+        habit_checks = self.db_handler.get_habit_checks()
+        self.db_handler.close()
+        week_key = datetime.now().strftime("%Y-W%U")
+        if any(closed or habit_check_week_key != week_key for _, _, _, habit_check_week_key, closed in habit_checks):
+            logger.info("Resuming the finalization of %s habit checks of guild %s.", len(habit_checks), self.guild.id)
+            await self.end_habit_check_session()
 
-    async def send_habit_check_to_tracking_channel(self, tracking_channel: discord.TextChannel):
-        from tracking.components import BasicHabitCheckView, DetailedHabitCheckView
-        logger.debug(f"Sending habit check to channel: {tracking_channel.name} (ID: {tracking_channel.id})")
-        
-        habit_data = self.db_handler.get_habits_in_channel(tracking_channel.id)
-        logger.debug(f"Retrieved habit data for channel {tracking_channel.name}: {habit_data}")
-
-        channel_view_list = []
-        for user_id, habit_id, habit_name in habit_data:
-            user = tracking_channel.guild.get_member(int(user_id))
-            if not user:
-                try:
-                    logger.info(f"Trying to fetch the user_id.")
-                    user = await tracking_channel.guild.fetch_member(int(user_id))
-                except discord.NotFound:
-                    logger.info(f"User with ID {user_id} not found in the guild.")
-                except Exception as e:
-                    logger.error(f"Error fetching user with ID {user_id}: {e}")
-
-            if user:
-                try:
-                    logger.debug(f"Sending habit check to user: {user.name} (ID: {user.id}) for habit: {habit_name}")
-                    detailed_check_view = DetailedHabitCheckView(self, self.declaration_handler, user, habit_id)
-                    
-                    habit_message = await tracking_channel.send(
-                        detailed_check_view.check_text, 
-                        embed=detailed_check_view.embed,  # Include the embed in the message
-                        view=detailed_check_view
-                    )
-                    detailed_check_view.message_id = habit_message.id  # Store the message ID in the view
-                    channel_view_list.append(detailed_check_view)
-
-                except Exception as e:
-                    logger.error(f"Could not message {user.name}: {e}")
-            else:
-                logging.info(f"User not found with id: {user_id}")
-            
-        return channel_view_list
-    
     async def end_habit_check_session(self):
+        """
+        Close the stored habit check session and finalize it: disable the buttons, mark the unanswered checks
+        and post the weekly digests. Every step can run again, the session is forgotten once they are done.
+        """
         logger.debug("Ending habit check session and disabling all buttons for incomplete checks...")
-        for detailed_check_view in self.detailed_check_view_list:
-            tracking_channel_id = detailed_check_view.habit_data['tracking_channel_id']
-            habit_id = detailed_check_view.habit_data['habit_id']
-            user = detailed_check_view.user
-            week_key = detailed_check_view.week_key
+        self.db_handler.connect()
+        check_records = [CheckRecord(*habit_check) for habit_check in self.db_handler.close_habit_checks()]
+        self.db_handler.close()
 
-            channel = await self._get_channel_by_id(tracking_channel_id)
+        if self.use_job_queue:
+            self.queue_habit_check_finalization(check_records)
+            return
 
-            habit_message = await channel.fetch_message(detailed_check_view.message_id)
-            # Disable all buttons in the view
-            await detailed_check_view.disable_all_buttons()
+        # Disable the buttons first, so nobody can answer while the week is being finalized
+        await self.disable_check_buttons(check_records)
 
-            # Edit the message to disable the buttons
-            await habit_message.edit(view=detailed_check_view)
+        self.db_handler.connect()
+        for check_record in check_records:
+            habit_id = check_record.habit_id
 
             # Check if the habit is already completed before marking it as failed
-            self.db_handler.connect()
-            habit_status = self.db_handler.get_habit_completion_status(habit_id, week_key)
-            
+            habit_status = self.db_handler.get_habit_completion_status(habit_id, check_record.week_key)
+
             if habit_status is None:  # No entry found, habit not checked
-                logger.info(f"Habit not marked as completed or failed. Marking as failed for {user.name} (ID: {user.id}).")
-                self.db_handler.mark_habit_completed(habit_id, completed=False, week_key=week_key)
+                logger.info("Habit %s not marked as completed or failed. Marking it as failed.", habit_id)
+                new_streak = self.db_handler.mark_habit_completed(habit_id, completed=False, week_key=check_record.week_key, unanswered=True)
+                if new_streak is not None:
+                    self.leaderboard.update_streak(habit_id, new_streak)
             elif habit_status is False:  # Habit explicitly marked as incomplete
-                logger.info(f"Habit already marked as incomplete for {user.name} (ID: {user.id}).")
+                logger.info("Habit %s already marked as incomplete.", habit_id)
             else:
-                logger.info(f"Habit already marked as completed for {user.name} (ID: {user.id}).")
+                logger.info("Habit %s already marked as completed.", habit_id)
+
+        week_keys = sorted({check_record.week_key for check_record in check_records})
+        pending_digests = {week_key: self.db_handler.get_pending_digests(week_key) for week_key in week_keys}
+        self.db_handler.close()
+
+        # One digest per channel, from the rollups the checks kept up to date
+        for week_key in week_keys:
+            digest_messages = await send_weekly_digests(pending_digests[week_key], self.guild.get_channel)
+            if digest_messages:
+                self.db_handler.connect()
+                self.db_handler.save_digest_messages(week_key, digest_messages)
+                self.db_handler.close()
 
+        if week_keys:
+            self.db_handler.connect()
+            self.db_handler.delete_habit_checks(week_keys)
             self.db_handler.close()
-        
-        # Empty the detailed check view list until next week
-        self.detailed_check_view_list = None
 
+    def queue_habit_check_finalization(self, check_records):
+        """
+        Hand the end of the habit check session over to a worker.
+
+        The job carries the message of every sent check, so the worker can disable the buttons and
+        mark the unanswered checks as failed through the REST API. It forgets the stored session once done.
+
+        :return: The ID of the queued job, or None if the session was already queued.
+        """
+        if not check_records:
+            return None
+        week_key = check_records[0].week_key
+        checks = [
+            {
+                'habit_id': check_record.habit_id,
+                'channel_id': check_record.channel_id,
+                'message_id': check_record.message_id,
+                'week_key': check_record.week_key,
+            }
+            for check_record in check_records
+        ]
+        self.db_handler.connect()
+        job_id = self.db_handler.enqueue_job(
+            'habit_check.finalize',
+            {'guild_id': self.guild.id, 'checks': checks},
+            idempotency_key=f"habit_check.finalize:{self.guild.id}:{week_key}",
+        )
+        self.db_handler.close()
+        # The worker resets the streaks of the unanswered checks, the leaderboard picks them up once it is done
+        if job_id is not None:
+            self.pending_leaderboard_refresh = (job_id, [check['habit_id'] for check in checks])
+        logger.info("Queued the finalization of %s habit checks for week %s (job %s).", len(checks), week_key, job_id)
+        return job_id
+
+    def get_leaderboard(self) -> GuildLeaderboard:
+        """
+        Return the guild's streak leaderboard, loading it from the database on first use.
+
+        Afterwards only the habits of a habit check session finalized by a worker are reloaded.
+        """
+        if not self.leaderboard.loaded:
+            self.db_handler.connect()
+            self.leaderboard.load(self.db_handler.get_habit_streaks())
+            self.db_handler.close()
+            self.pending_leaderboard_refresh = None
+        elif self.pending_leaderboard_refresh:
+            job_id, habit_ids = self.pending_leaderboard_refresh
+            self.db_handler.connect()
+            job = self.db_handler.get_job(job_id)
+            if job is None or job['status'] in ('done', 'failed'):
+                for habit in self.db_handler.get_habit_streaks(habit_ids):
+                    self.leaderboard.update_streak(habit['habit_id'], habit['current_streak'])
+                self.pending_leaderboard_refresh = None
+            self.db_handler.close()
+        return self.leaderboard
+
+    def build_leaderboard_embed(self, user, tracking_channel=None, size=10):
+        """
+        Build the leaderboard embed of the guild or of a tracking channel, with the ranks of the user's habits.
+
+        :param user: The user asking for the leaderboard.
+        :param tracking_channel: The tracking channel to rank, the whole guild if None.
+        :param size: The number of entries to list.
+        """
+        leaderboard = self.get_leaderboard()
+        tracking_channel_id = tracking_channel.id if tracking_channel else None
+        board = leaderboard.get_board(tracking_channel_id)
+
+        embed = discord.Embed(
+            title=f"Streak Leaderboard || {tracking_channel.name if tracking_channel else self.guild.name}",
+            color=discord.Color.gold()
+        )
+        lines = []
+        for rank, habit_id, streak in board.top(size):
+            habit = leaderboard.habits[habit_id]
+            lines.append(f"**#{rank}** <@{habit['user_id']}> · {habit['habit_name']} · {streak} week{'s' if streak != 1 else ''}")
+        embed.description = '\n'.join(lines) if lines else "Nobody has a streak yet. Complete your habit this week to get on the board!"
+
+        user_ranks = leaderboard.get_user_ranks(user.id, tracking_channel_id)
+        if user_ranks:
+            embed.add_field(
+                name="Your Ranks",
+                value='\n'.join(f"**#{rank}** of {len(board)} · {leaderboard.habits[habit_id]['habit_name']} · {streak} weeks" for rank, habit_id, streak in user_ranks),
+                inline=False
+            )
+        return embed
+
+    async def get_guild_stats(self):
+        """
+        Return the completion analytics of the guild's finalized weeks.
+
+        They are computed in a worker thread once per week, the finalized weeks do not change afterwards.
+        """
+        from tracking.analytics import load_guild_stats
+
+        week_key = datetime.now().strftime("%Y-W%U")
+        if not self.guild_stats or self.guild_stats['week_key'] != week_key:
+            self.guild_stats = await asyncio.to_thread(load_guild_stats, self.db_handler.db_name, self.guild.id, week_key)
+        return self.guild_stats
+
+    async def build_stats_embed(self, weeks=8):
+        """
+        Build the admin stats embed of the guild.
+
+        :param weeks: The number of recent weeks whose completion rates are listed.
+        """
+        stats = await self.get_guild_stats()
+        embed = discord.Embed(
+            title=f"Habit Stats || {self.guild.name}",
+            description=f"{stats['habit_count']} habits, {stats['record_count']} checks before {stats['week_key']}.",
+            color=discord.Color.blue()
+        )
+        if stats['overall_rate'] is None:
+            embed.add_field(name="No data", value="No habit check has been finalized yet.", inline=False)
+            return embed
+
+        embed.add_field(name="Overall Completion", value=f"{stats['overall_rate']:.0%}", inline=False)
+        embed.add_field(
+            name="Weekly Completion",
+            value='\n'.join(f"{week_key} · {rate:.0%} of {count}" for week_key, rate, count in stats['weekly_rates'][-weeks:]),
+            inline=False
+        )
+        if stats['last_week_channel_rates']:
+            embed.add_field(
+                name=f"Channels in {stats['weekly_rates'][-1][0]}",
+                value='\n'.join(f"<#{channel_id}> · {rate:.0%} of {count}" for channel_id, rate, count in stats['last_week_channel_rates'][:10]),
+                inline=False
+            )
+        embed.add_field(
+            name="Retention",
+            value=' · '.join(f"W{offset}: {rate:.0%}" for offset, rate, _ in stats['retention']),
+            inline=False
+        )
+        embed.add_field(
+            name="Current Streaks",
+            value=' · '.join(f"{label}: {count}" for label, count in stats['streak_distribution']),
+            inline=False
+        )
+        return embed
+
+    def build_history_embed(self, tracking_channel=None, weeks=8):
+        """
+        Build the weekly completion history of the guild or of a tracking channel, from the weekly rollups.
+
+        :param tracking_channel: The tracking channel, the whole guild if None.
+        :param weeks: The number of recent weeks to list.
+        """
+        self.db_handler.connect()
+        rollups = self.db_handler.get_rollup_history(tracking_channel.id if tracking_channel else None, weeks)
+        self.db_handler.close()
+        return build_history_embed(rollups, tracking_channel.name if tracking_channel else self.guild.name)
+
+    async def import_archive(self, fp):
+        """
+        Import the users, habits and tracking history of an archive in the /export layout.
+
+        The whole archive is validated first, then the tracking channel slots of all the imported habits are reserved,
+        creating the missing channels, the rows are imported in a single transaction in a worker thread, and the
+        owners finally get their channels' roles.
+
+        :param fp: The archive file.
+        :return: The import counts, with the number of assigned roles.
+        """
+        from data_import import ImportArchive, import_guild_data
+
+        archive = await asyncio.to_thread(ImportArchive, fp)
+        try:
+            # An invalid record is rejected before any channel is created for the import
+            habit_count = await asyncio.to_thread(archive.validate)
+            reservations = await self.tracking_channel_manager.get_channel_slots(habit_count)
+            channel_slots = [channel_id for _, channel_id in reservations]
+            try:
+                counts = await asyncio.to_thread(import_guild_data, self.db_handler.db_name, self.guild.id, archive, channel_slots,
+                                                 [reservation_id for reservation_id, _ in reservations])
+            except BaseException:
+                self.tracking_channel_manager.release_channel_slots(reservations)
+                raise
+            channel_owners = await asyncio.to_thread(lambda: {(channel_id, habit[1]) for channel_id, habit in zip(channel_slots, archive.iter_habits())})
+        finally:
+            archive.close()
+
+        # The leaderboard and the stats are rebuilt from the database on their next use
+        self.leaderboard.loaded = False
+        self.guild_stats = None
+
+        counts['roles'] = await self._assign_channel_roles(channel_owners)
+        return counts
+
+    def cleanup_habits(self, user_id=None, habit_name=None, dry_run=True):
+        """
+        Remove the habits of a user, or with a name, or both, with their history and tracking channel slots.
+
+        :param dry_run: Only find the matching habits, without removing them.
+        :return: The IDs of the matching habits.
+        """
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(user_id)
+        if habit_name:
+            conditions.append('habit_name = ? COLLATE NOCASE')
+            params.append(habit_name.strip())
+        if not conditions:
+            raise ValueError("A user or a habit name selects the habits to remove.")
+
+        habit_ids = self.db_handler.remove_habits(condition=' AND '.join(conditions), params=params, dry_run=dry_run)
+        if habit_ids and not dry_run:
+            for habit_id in habit_ids:
+                self.leaderboard.remove_habit(habit_id)
+            self.guild_stats = None
+        return habit_ids
+
+    async def compact_tracking_channels(self, dry_run=True):
+        """
+        Pack the habits into the fewest tracking channels, see TrackingChannelManager.compact_channels.
+
+        Refused during a habit check session, whose messages are in the channels to remove, and while
+        declarations hold reserved slots: DatabaseHandler.reassign_habits checks both in its transaction.
+
+        :return: The compaction report.
+        """
+        if self.staged_habit_check:
+            raise ValueError("The tracking channels cannot be compacted during a habit check session.")
+        report = await self.tracking_channel_manager.compact_channels(self.member_resolver, dry_run=dry_run)
+        if report['moves'] and not dry_run:
+            # The channel boards are rebuilt from the database on the next use
+            self.leaderboard.loaded = False
+            self.guild_stats = None
+        return report
+
+    def build_compaction_embed(self, report, dry_run=True):
+        embed = discord.Embed(
+            title="Tracking Channel Compaction" + (" (dry run)" if dry_run else ""),
+            description=(
+                f"{report['channels_before']} → {report['channels_after']} channels, {len(report['moves'])} habits moved, "
+                f"{report['role_grants']} roles given."
+            ),
+            color=discord.Color.orange() if dry_run else discord.Color.green()
+        )
+        if report['removed_channels']:
+            embed.add_field(name="Removed Channels", value=', '.join(report['removed_channels'])[:1024], inline=False)
+        if report['moves']:
+            moves = [f"Habit {habit_id}: {from_name} → {to_name}" for habit_id, from_name, to_name in report['moves'][:15]]
+            if len(report['moves']) > 15:
+                moves.append(f"... and {len(report['moves']) - 15} more")
+            embed.add_field(name="Moves", value='\n'.join(moves), inline=False)
+        if report['renames']:
+            embed.add_field(name="Renames", value='\n'.join(f"{old_name} → {new_name}" for old_name, new_name in report['renames'][:15]), inline=False)
+        if report['failed_edits']:
+            embed.set_footer(text=f"{report['failed_edits']} Discord changes failed, see the logs.")
+        return embed
+
+    async def _assign_channel_roles(self, channel_owners):
+        """Give the members among the given (channel ID, user ID) pairs the role of their tracking channel."""
+        members = await self.member_resolver.resolve(user_id for _, user_id in channel_owners)
+        assigned = 0
+        for channel_id, user_id in sorted(channel_owners):
+            member, channel = members.get(user_id), self.guild.get_channel(channel_id)
+            if member is None or channel is None:
+                continue
+            try:
+                await self.tracking_channel_manager.assign_role_to_user_for_channel(member, channel)
+                assigned += 1
+            except discord.HTTPException as e:
+                logger.error("Could not give the role of channel %s to user %s: %s", channel_id, user_id, e)
+        return assigned
+
+    async def disable_check_buttons(self, check_records):
+        """
+        Disable the buttons of every sent habit check message.
+
+        Messages are edited by ID through partial message handles, so no message is fetched, and
+        they all get the same disabled view.
+        Channels are processed concurrently (bounded by MAX_CONCURRENT_CHANNEL_EDITS), while the
+        edits inside a channel run one after another since they share the same rate limit bucket.
+
+        :return: The duration of the disable pass in seconds.
+        """
+        from tracking.components import build_disabled_check_view
+
+        start_time = time.perf_counter()
+
+        records_by_channel = defaultdict(list)
+        for check_record in check_records:
+            records_by_channel[check_record.channel_id].append(check_record)
+
+        disabled_view = build_disabled_check_view()
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHANNEL_EDITS)
+
+        async def disable_channel_buttons(channel_id, channel_records):
+            async with semaphore:
+                channel = await self._get_channel_by_id(channel_id)
+                if not channel:
+                    logger.warning("Skipping %s habit check messages in missing channel %s.", len(channel_records), channel_id)
+                    return
+                for check_record in channel_records:
+                    try:
+                        await channel.get_partial_message(check_record.message_id).edit(view=disabled_view)
+                    except discord.HTTPException as e:
+                        logger.error("Could not disable buttons of message %s in channel %s: %s", check_record.message_id, channel_id, e)
+
+        await asyncio.gather(*(disable_channel_buttons(channel_id, channel_records) for channel_id, channel_records in records_by_channel.items()))
+
+        duration = time.perf_counter() - start_time
+        logger.info("Disabled buttons of %s habit check messages in %s channels in %.2fs.", len(check_records), len(records_by_channel), duration)
+        return duration
 
     async def _get_channel_by_id(self, channel_id):
         # Try to get the channel from the cache
@@ -138,10 +577,10 @@ class TrackingHandler:
             try:
                 channel = await self.guild.fetch_channel(channel_id)
             except discord.NotFound:
-                print(f"Channel with ID {channel_id} not found.")
+                logger.warning("Channel with ID %s not found.", channel_id)
             except discord.Forbidden:
-                print(f"Bot doesn't have permission to access channel {channel_id}.")
+                logger.warning("Bot doesn't have permission to access channel %s.", channel_id)
             except discord.HTTPException as e:
-                print(f"Failed to fetch channel {channel_id}: {e}")
+                logger.error("Failed to fetch channel %s: %s", channel_id, e)
         
         return channel
\ No newline at end of file
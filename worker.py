@@ -0,0 +1,67 @@
+import asyncio
+import os
+import signal
+import sqlite3
+import discord
+from monitoring import metrics
+from monitoring.logging_setup import configure_logging
+import logging
+logger = logging.getLogger('worker')
+
+
+def load_environment():
+    from dotenv import load_dotenv
+    dotenv_file = '.env' if os.environ['ENV'] == 'production' else '.env.dev'
+    load_dotenv(dotenv_path=dotenv_file, override=True)
+    os.environ['DISCORD_BOT_DB_PREFIX'] = os.path.basename(os.environ['DISCORD_BOT_DB_NAME']).split('.')[0]
+
+def database_is_ready(db_name):
+    """Whether the bot has downloaded and initialized the database, without creating the file."""
+    if not os.path.exists(db_name):
+        return False
+    try:
+        conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)
+        try:
+            return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'jobs'").fetchone() is not None
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+async def wait_for_database(db_name, poll_interval=5):
+    # Opening the database first would create an empty file, and the bot would then skip downloading the backup
+    while not database_is_ready(db_name):
+        logger.info("Waiting for the bot to initialize %s...", db_name)
+        await asyncio.sleep(poll_interval)
+
+async def run_workers(concurrency):
+    """
+    Run job workers with a REST-only Discord client.
+
+    The worker never connects to the gateway: it only performs REST calls, so it can run
+    next to the bot, as many times as needed, on the same database file.
+    """
+    from jobs.worker import JobWorker
+
+    await wait_for_database(os.environ['DISCORD_BOT_DB_NAME'])
+    client = discord.Client(intents=discord.Intents.none(), http_trace=metrics.discord_http_trace())
+    async with client:
+        await client.login(os.environ['DISCORD_BOT_TOKEN'])
+        workers = [JobWorker(client) for _ in range(concurrency)]
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, lambda: [worker.stop() for worker in workers])
+
+        try:
+            await metrics.start_metrics_server(os.environ.get('METRICS_HOST', '127.0.0.1'), int(os.environ.get('WORKER_METRICS_PORT', '8081')))
+        except OSError as e:
+            logger.error("Failed to start the metrics server: %s", e)
+
+        logger.info("Starting %s job workers.", concurrency)
+        await asyncio.gather(*(worker.run() for worker in workers))
+
+if __name__ == '__main__':
+    configure_logging()
+    load_environment()
+    asyncio.run(run_workers(int(os.environ.get('JOB_WORKER_CONCURRENCY', '1'))))